@@ -14,6 +14,7 @@ from typing import Any, Collection
 from flint.configuration import get_options_from_strategy
 from flint.exceptions import TarArchiveError
 from flint.logging import logger
+from flint.manifest import list_directory
 from flint.options import (
     ArchiveOptions,
     add_options_to_parser,
@@ -40,7 +41,7 @@ def resolve_glob_expressions(
 
     logger.info(f"Searching {base_path=}")
 
-    all_files = list(base_path.iterdir())
+    all_files = list(list_directory(directory=base_path))
     logger.info(f"{len(all_files)} total files and {len(file_re_patterns)} to consider")
 
     for reg_expression in file_re_patterns:
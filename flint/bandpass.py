@@ -11,6 +11,7 @@ from casacore.tables import table, taql
 from flint.calibrate.aocalibrate import AOSolutions, calibrate_apply_ms
 from flint.flagging import flag_ms_aoflagger
 from flint.logging import logger
+from flint.manifest import register_products
 from flint.ms import describe_ms, get_field_id_for_field, preprocess_askap_ms
 from flint.naming import create_ms_name
 from flint.options import MS
@@ -169,6 +170,7 @@ def extract_correct_bandpass_pointing(
     with table(f"{ms.path!s}") as tab:
         field_ms = taql(f"select * from $tab where FIELD_ID=={field_id}")
         field_ms.copy(str(out_path), deep=True)
+    register_products(out_path)
 
     return ms.with_options(path=out_path, beam=ms_summary.beam)
 
@@ -30,6 +30,7 @@ from flint.bptools.smoother import (
 )
 from flint.exceptions import PhaseOutlierFitError
 from flint.logging import logger
+from flint.manifest import list_directory, register_products
 from flint.ms import consistent_ms, get_beam_from_ms, remove_columns_from_ms
 from flint.naming import get_aocalibrate_output_path
 from flint.options import MS, BaseOptions
@@ -456,7 +457,11 @@ def find_existing_solutions(
         f"Searching {bandpass_directory} for existing measurement sets and solutions. "
     )
 
-    bandpass_mss = list(bandpass_directory.glob("*ms"))
+    # The listing is served by the manifest of the directory when it is current
+    bandpass_files = list_directory(directory=bandpass_directory)
+    bandpass_names = set(path.name for path in bandpass_files)
+
+    bandpass_mss = [path for path in bandpass_files if path.name.endswith("ms")]
     logger.info(f"Found {len(bandpass_mss)} bandpass measurement sets")
 
     solution_paths = [
@@ -470,7 +475,12 @@ def find_existing_solutions(
 
     # If not all the treasure could be found. At the moment this function will only
     # work if the bandpass solutions were made using the default values.
-    assert all([solution_path.exists() for solution_path in solution_paths]), (
+    assert all(
+        [
+            solution_path.name in bandpass_names or solution_path.exists()
+            for solution_path in solution_paths
+        ]
+    ), (
         f"Missing solution file constructed from scanning {bandpass_directory}. Check the directory. "
     )
 
@@ -726,7 +736,9 @@ def run_calibrate(calibrate_cmd: CalibrateCommand, container: Path) -> None:
             calibrate_cmd.ms.path.parent,
             calibrate_cmd.model.parent,
         ],
+        expected_outputs=calibrate_cmd.solution_path,
     )
+    register_products(calibrate_cmd.solution_path)
 
 
 def run_apply_solutions(apply_solutions_cmd: ApplySolutions, container: Path) -> None:
@@ -0,0 +1,402 @@
+"""A native implementation of a full-Jones StEFCal bandpass solver.
+
+This is intended to be an in-process alternative to the ``calibrate``
+program packaged with ``aocalibrate``. Rather than predicting a model
+itself, the solver requires that the model visibilities have already
+been inserted into a column of the measurement set (e.g. ``MODEL_DATA``
+via ``addmodel``).
+
+The measurement set is read in chunks of rows. For each baseline and
+channel the sufficient statistics of the least-squares problem are
+accumulated, namely
+
+    R_pq = sum_t V_pq (x) conj(M_pq)
+    S_pq = sum_t M_pq (x) conj(M_pq)
+
+where ``V`` is the 2x2 visibility matrix, ``M`` is the 2x2 model matrix
+and ``(x)`` is an outer product. Once accumulated the visibilities are
+no longer required, and the StEFCal iterations are carried out for all
+antennas and all channels at once. The Jones update for antenna ``p`` is
+
+    J_p = (sum_q V_pq J_q M_pq^H) (sum_q M_pq J_q^H J_q M_pq^H)^-1
+
+which is expressed entirely in terms of ``R`` and ``S``. Solutions are
+returned in the ``AOSolutions`` structure, and may be written to the
+ao-standard binary format consumed by ``applysolutions``.
+"""
+
+from __future__ import annotations
+
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import Any, NamedTuple
+
+import numpy as np
+from casacore.tables import table
+
+from flint.calibrate.aocalibrate import AOSolutions
+from flint.exceptions import MSError
+from flint.logging import logger
+from flint.ms import check_column_in_ms
+from flint.naming import get_aocalibrate_output_path
+from flint.options import MS, BaseOptions
+
+
+class StefcalOptions(BaseOptions):
+    """Options that control the native StEFCal bandpass solver"""
+
+    data_column: str = "DATA"
+    """The column containing the visibilities to calibrate"""
+    model_column: str = "MODEL_DATA"
+    """The column containing the model visibilities to calibrate against"""
+    minuv: float | None = None
+    """The minimum baseline length in meters to include in the solution. Equivalent to ``calibrate -minuv``"""
+    maxuv: float | None = None
+    """The maximum baseline length in meters to include in the solution. Equivalent to ``calibrate -maxuv``"""
+    max_iterations: int = 100
+    """The maximum number of StEFCal iterations to perform"""
+    tolerance: float = 1e-6
+    """Stop iterating once the fractional change of the Jones matrices falls below this level"""
+    chunk_size: int = 2000
+    """The number of rows to read from the measurement set at a time"""
+
+
+class StefcalStatistics(NamedTuple):
+    """The accumulated sufficient statistics of the StEFCal least-squares problem"""
+
+    vis_model: np.ndarray
+    """The sum of V_pq (x) conj(M_pq) for every ordered antenna pair. Shape is (nant, nant, nchan, 2, 2, 2, 2)"""
+    model_model: np.ndarray
+    """The sum of M_pq (x) conj(M_pq) for every ordered antenna pair. Shape is (nant, nant, nchan, 2, 2, 2, 2)"""
+    nant: int
+    """The number of antennas"""
+    nchan: int
+    """The number of channels"""
+    nrows: int
+    """The number of rows that contributed to the statistics"""
+
+
+class StefcalResult(NamedTuple):
+    """Result of the native StEFCal solver"""
+
+    jones: np.ndarray
+    """The solved Jones matrices. Shape is (nant, nchan, 2, 2)"""
+    iterations: int
+    """The number of iterations that were performed"""
+    converged: bool
+    """Whether the solver converged to the requested tolerance"""
+
+
+def _hermitian_pair_statistics(stats: np.ndarray) -> np.ndarray:
+    """Given the statistics accumulated for the (p,q) baseline, form
+    the statistics for the (q,p) ordering.
+
+    As V_qp = V_pq^H, the element R_qp[a,b,c,d] is conj(R_pq[b,a,d,c]).
+
+    Args:
+        stats (np.ndarray): Accumulated statistics with trailing shape (2, 2, 2, 2)
+
+    Returns:
+        np.ndarray: The statistics of the reversed antenna ordering
+    """
+    return np.conj(np.swapaxes(np.swapaxes(stats, -4, -3), -2, -1))
+
+
+def accumulate_stefcal_statistics(
+    ms: MS | Path, stefcal_options: StefcalOptions | None = None
+) -> StefcalStatistics:
+    """Read the data and model columns of a measurement set in chunks
+    and accumulate the sufficient statistics required by StEFCal.
+
+    Flagged visibilities, auto-correlations and baselines outside the
+    nominated uv-range do not contribute.
+
+    Args:
+        ms (Union[MS, Path]): The measurement set to read
+        stefcal_options (Optional[StefcalOptions], optional): Options controlling the columns and selection. If None the defaults are used. Defaults to None.
+
+    Raises:
+        MSError: Raised when a required column is missing or the data are not four polarisations
+
+    Returns:
+        StefcalStatistics: The accumulated statistics
+    """
+    ms = MS.cast(ms)
+    stefcal_options = stefcal_options if stefcal_options else StefcalOptions()
+
+    for column in (stefcal_options.data_column, stefcal_options.model_column):
+        if not check_column_in_ms(ms=ms, column=column):
+            raise MSError(f"{column=} not found in {ms.path}")
+
+    with table(str(ms.path / "ANTENNA"), ack=False) as ant_tab:
+        nant = len(ant_tab)
+
+    with table(str(ms.path), ack=False) as tab:
+        table_size = len(tab)
+        nchan, npol = tab.getcell(stefcal_options.data_column, 0).shape
+        if npol != 4:
+            raise MSError(f"Expected 4 polarisations, found {npol=} in {ms.path}")
+
+        stats_shape = (nant, nant, nchan, 2, 2, 2, 2)
+        vis_model = np.zeros(stats_shape, dtype=np.complex128)
+        model_model = np.zeros(stats_shape, dtype=np.complex128)
+
+        nrows = 0
+        for start_row in range(0, table_size, stefcal_options.chunk_size):
+            nrow = min(stefcal_options.chunk_size, table_size - start_row)
+            ant1 = tab.getcol("ANTENNA1", startrow=start_row, nrow=nrow)
+            ant2 = tab.getcol("ANTENNA2", startrow=start_row, nrow=nrow)
+            uvws = tab.getcol("UVW", startrow=start_row, nrow=nrow)
+
+            uv_dist = np.sqrt(np.sum(uvws[:, :2] ** 2, axis=1))
+            row_mask = ant1 != ant2
+            if stefcal_options.minuv is not None:
+                row_mask &= uv_dist >= stefcal_options.minuv
+            if stefcal_options.maxuv is not None:
+                row_mask &= uv_dist <= stefcal_options.maxuv
+
+            if not np.any(row_mask):
+                continue
+
+            data = tab.getcol(
+                stefcal_options.data_column, startrow=start_row, nrow=nrow
+            )[row_mask]
+            model = tab.getcol(
+                stefcal_options.model_column, startrow=start_row, nrow=nrow
+            )[row_mask]
+            flags = tab.getcol("FLAG", startrow=start_row, nrow=nrow)[row_mask]
+
+            # Flagged or non-finite visibilities contribute nothing
+            invalid = flags | ~np.isfinite(data) | ~np.isfinite(model)
+            data = np.where(invalid, 0.0, data).reshape(-1, nchan, 2, 2)
+            model = np.where(invalid, 0.0, model).reshape(-1, nchan, 2, 2)
+
+            vis_model_chunk = np.einsum("rfab,rfcd->rfabcd", data, np.conj(model))
+            model_model_chunk = np.einsum("rfab,rfcd->rfabcd", model, np.conj(model))
+
+            chunk_ant1, chunk_ant2 = ant1[row_mask], ant2[row_mask]
+            np.add.at(vis_model, (chunk_ant1, chunk_ant2), vis_model_chunk)
+            np.add.at(model_model, (chunk_ant1, chunk_ant2), model_model_chunk)
+            nrows += len(data)
+
+    # Fold in the reversed baseline ordering so that each antenna sees
+    # every other antenna regardless of how the MS is ordered
+    vis_model = vis_model + _hermitian_pair_statistics(np.swapaxes(vis_model, 0, 1))
+    model_model = model_model + _hermitian_pair_statistics(
+        np.swapaxes(model_model, 0, 1)
+    )
+
+    logger.info(
+        f"Accumulated statistics from {nrows} rows for {nant=} {nchan=} of {ms.path}"
+    )
+
+    return StefcalStatistics(
+        vis_model=vis_model,
+        model_model=model_model,
+        nant=nant,
+        nchan=nchan,
+        nrows=nrows,
+    )
+
+
+def solve_stefcal(
+    stefcal_statistics: StefcalStatistics,
+    max_iterations: int = 100,
+    tolerance: float = 1e-6,
+    initial_jones: np.ndarray | None = None,
+) -> StefcalResult:
+    """Solve for the full-Jones antenna gains of every channel at once
+    using the StEFCal alternating least-squares scheme.
+
+    Every second iteration the new estimate is averaged with the previous
+    one, which is the usual StEFCal prescription to avoid oscillating
+    between two solutions. Antenna/channel pairs without any valid data are
+    set to NaN.
+
+    Args:
+        stefcal_statistics (StefcalStatistics): The accumulated statistics to solve against
+        max_iterations (int, optional): The maximum number of iterations. Defaults to 100.
+        tolerance (float, optional): Fractional change in the Jones matrices to be considered converged. Defaults to 1e-6.
+        initial_jones (Optional[np.ndarray], optional): Initial Jones matrices of shape (nant, nchan, 2, 2). If None the identity is used. Defaults to None.
+
+    Returns:
+        StefcalResult: The solved Jones matrices
+    """
+    nant, nchan = stefcal_statistics.nant, stefcal_statistics.nchan
+    vis_model = stefcal_statistics.vis_model
+    model_model = stefcal_statistics.model_model
+
+    if initial_jones is None:
+        jones = np.zeros((nant, nchan, 2, 2), dtype=np.complex128)
+        jones[..., 0, 0] = 1.0
+        jones[..., 1, 1] = 1.0
+    else:
+        jones = np.array(initial_jones, dtype=np.complex128)
+
+    # Antenna/channel pairs without data would produce singular systems
+    valid = np.abs(np.einsum("pqfabab->pf", model_model)) > 0
+    identity = np.broadcast_to(np.eye(2, dtype=np.complex128), jones.shape)
+
+    # Arrange the statistics so each channel is a single matrix-vector
+    # product, i.e. (nchan, nant*2*2, nant*2*2) @ (nchan, nant*2*2)
+    def _as_channel_matrix(stats: np.ndarray) -> np.ndarray:
+        return stats.transpose(2, 0, 3, 5, 1, 4, 6).reshape(nchan, nant * 4, nant * 4)
+
+    def _contract(stats_matrix: np.ndarray, per_ant: np.ndarray) -> np.ndarray:
+        vector = per_ant.transpose(1, 0, 2, 3).reshape(nchan, nant * 4, 1)
+        product = np.matmul(stats_matrix, vector)
+        return product.reshape(nchan, nant, 2, 2).transpose(1, 0, 2, 3)
+
+    vis_model_matrix = _as_channel_matrix(vis_model)
+    model_model_matrix = _as_channel_matrix(model_model)
+
+    converged = False
+    iteration = 0
+    for iteration in range(1, max_iterations + 1):
+        jones_h_jones = np.matmul(np.conj(np.swapaxes(jones, -1, -2)), jones)
+        numerator = _contract(vis_model_matrix, jones)
+        denominator = _contract(model_model_matrix, jones_h_jones)
+        denominator = np.where(valid[..., None, None], denominator, identity)
+
+        new_jones = np.matmul(numerator, np.linalg.inv(denominator))
+        if iteration % 2 == 0:
+            new_jones = 0.5 * (new_jones + jones)
+
+        new_jones[~valid] = jones[~valid]
+        delta = float(np.linalg.norm(new_jones - jones)) / max(
+            float(np.linalg.norm(new_jones)), 1e-12
+        )
+        jones = new_jones
+
+        if delta < tolerance:
+            converged = True
+            break
+
+    logger.info(
+        f"StEFCal {'converged' if converged else 'did not converge'} after {iteration} iterations"
+    )
+    jones[~valid] = np.nan
+
+    return StefcalResult(jones=jones, iterations=iteration, converged=converged)
+
+
+def stefcal_bandpass_ms(
+    ms: MS | Path,
+    solution_path: Path | None = None,
+    stefcal_options: StefcalOptions | None = None,
+    update_stefcal_options: dict[str, Any] | None = None,
+) -> AOSolutions:
+    """Derive full-Jones bandpass solutions for a measurement set using the
+    native StEFCal solver and write them to an ao-style solutions file.
+
+    The model visibilities need to already be present in the measurement set.
+
+    Args:
+        ms (Union[MS, Path]): The measurement set to calibrate
+        solution_path (Optional[Path], optional): The output path of the solutions file. If None the same name the ``calibrate`` program would use is generated. Defaults to None.
+        stefcal_options (Optional[StefcalOptions], optional): The options to use. If None the defaults are used. Defaults to None.
+        update_stefcal_options (Optional[Dict[str, Any]], optional): Additional options to update ``stefcal_options`` with. Defaults to None.
+
+    Returns:
+        AOSolutions: The solutions that were written
+    """
+    ms = MS.cast(ms)
+    stefcal_options = stefcal_options if stefcal_options else StefcalOptions()
+    if update_stefcal_options:
+        stefcal_options = stefcal_options.with_options(**update_stefcal_options)
+
+    if solution_path is None:
+        solution_path = get_aocalibrate_output_path(
+            ms_path=ms.path, include_preflagger=False, include_smoother=False
+        )
+
+    logger.info(f"Solving for bandpass of {ms.path} with {stefcal_options=}")
+    stefcal_statistics = accumulate_stefcal_statistics(
+        ms=ms, stefcal_options=stefcal_options
+    )
+    stefcal_result = solve_stefcal(
+        stefcal_statistics=stefcal_statistics,
+        max_iterations=stefcal_options.max_iterations,
+        tolerance=stefcal_options.tolerance,
+    )
+
+    nant, nchan = stefcal_statistics.nant, stefcal_statistics.nchan
+    bandpass = stefcal_result.jones.reshape(1, nant, nchan, 4)
+    ao_sols = AOSolutions(
+        path=solution_path,
+        nsol=1,
+        nant=nant,
+        nchan=nchan,
+        npol=4,
+        bandpass=bandpass,
+    )
+    ao_sols.save(output_path=solution_path)
+
+    return ao_sols
+
+
+def get_parser() -> ArgumentParser:
+    parser = ArgumentParser(
+        description="Derive full-Jones bandpass solutions with a native StEFCal solver"
+    )
+
+    parser.add_argument(
+        "ms", type=Path, help="The measurement set with data and model columns"
+    )
+    parser.add_argument(
+        "--solution-path",
+        type=Path,
+        default=None,
+        help="Output path of the ao-style solutions file. If unset a default name is generated. ",
+    )
+    parser.add_argument(
+        "--data-column", type=str, default="DATA", help="The column to calibrate"
+    )
+    parser.add_argument(
+        "--model-column",
+        type=str,
+        default="MODEL_DATA",
+        help="The column with the model visibilities",
+    )
+    parser.add_argument(
+        "--minuv",
+        type=float,
+        default=None,
+        help="The minimum baseline length in meters to include",
+    )
+    parser.add_argument(
+        "--maxuv",
+        type=float,
+        default=None,
+        help="The maximum baseline length in meters to include",
+    )
+    parser.add_argument(
+        "--max-iterations",
+        type=int,
+        default=100,
+        help="The maximum number of iterations to perform",
+    )
+
+    return parser
+
+
+def cli() -> None:
+    parser = get_parser()
+
+    args = parser.parse_args()
+
+    stefcal_bandpass_ms(
+        ms=args.ms,
+        solution_path=args.solution_path,
+        stefcal_options=StefcalOptions(
+            data_column=args.data_column,
+            model_column=args.model_column,
+            minuv=args.minuv,
+            maxuv=args.maxuv,
+            max_iterations=args.max_iterations,
+        ),
+    )
+
+
+if __name__ == "__main__":
+    cli()
@@ -2,23 +2,25 @@
 
 from __future__ import annotations
 
+import json
 from pathlib import Path
+from subprocess import CalledProcessError
+from typing import Collection, NamedTuple
 
 from flint.logging import logger
-from flint.sclient import singularity_wrapper
+from flint.sclient import ExecutionBackend, run_singularity_command, singularity_wrapper
 from flint.utils import remove_files_folders
 
 
-def args_to_casa_task_string(task: str, **kwargs) -> str:
-    """Given a set of arguments, convert them to a string that can
-    be used to run the corresponding CASA task that can be passed
-    via ``casa -c`` for execution
+def args_to_casa_task_call(task: str, **kwargs) -> str:
+    """Given a set of arguments, convert them to a python style call of
+    the corresponding CASA task, e.g. ``gaincal(vis='a.ms',solint='60s')``
 
     Args:
         task (str): The name of the task that will be executed
 
     Returns:
-        str: The formatted string that will be given to CASA for execution
+        str: The formatted task call
     """
     command = []
     for k, v in kwargs.items():
@@ -31,11 +33,252 @@ def args_to_casa_task_string(task: str, **kwargs) -> str:
             arg = rf"{k}={v}"
         command.append(arg)
 
-    task_command = rf"casa -c {task}(" + ",".join(command) + r")"
+    return rf"{task}(" + ",".join(command) + r")"
+
+
+def args_to_casa_task_string(task: str, **kwargs) -> str:
+    """Given a set of arguments, convert them to a string that can
+    be used to run the corresponding CASA task that can be passed
+    via ``casa -c`` for execution
+
+    Args:
+        task (str): The name of the task that will be executed
+
+    Returns:
+        str: The formatted string that will be given to CASA for execution
+    """
+    task_command = r"casa -c " + args_to_casa_task_call(task=task, **kwargs)
 
     return task_command
 
 
+class CasaTask(NamedTuple):
+    """A single CASA task call queued in a ``CasaSession``"""
+
+    task: str
+    """The name of the CASA task"""
+    call: str
+    """The python call of the task that will be executed"""
+    log_path: Path
+    """The CASA log file the task will write to"""
+
+
+class CasaTaskResult(NamedTuple):
+    """The outcome of a CASA task executed in a ``CasaSession``"""
+
+    task: str
+    """The name of the CASA task"""
+    call: str
+    """The python call of the task that was executed"""
+    return_code: int
+    """Zero on success, one if the task raised an error, and negative one if the task was not run"""
+    log_path: Path
+    """The CASA log file of the task"""
+    error: str | None = None
+    """The traceback of the error raised by the task, if any"""
+    elapsed_seconds: float | None = None
+    """How long the task took to run"""
+
+
+_CASA_SESSION_HEADER = """import json
+import time
+import traceback
+
+_results = []
+_failed = False
+
+
+def _record(task, return_code, error, start, log_path):
+    _results.append(
+        dict(
+            task=task,
+            return_code=return_code,
+            error=error,
+            elapsed_seconds=time.time() - start,
+            log_path=log_path,
+        )
+    )
+    with open({results_path!r}, "w") as out_file:
+        json.dump(_results, out_file)
+
+"""
+
+_CASA_SESSION_TASK = """
+if not ({stop_on_error} and _failed):
+    _start = time.time()
+    casalog.setlogfile({log_path!r})
+    try:
+        {call}
+        _record({task!r}, 0, None, _start, {log_path!r})
+    except Exception:
+        _failed = True
+        _record({task!r}, 1, traceback.format_exc(), _start, {log_path!r})
+"""
+
+
+class CasaSession:
+    """Queue a series of CASA tasks and execute them in a single CASA process
+    within a single container launch. This avoids paying the CASA start-up
+    cost for each task.
+
+    The queued tasks are written to a generated python script that is passed
+    to ``casa -c``. Each task writes to its own CASA log file, and the return
+    code of each task is recorded by the script.
+
+    Example:
+        >>> session = CasaSession(casa_container=casa_container, work_dir=ms_path.parent)
+        >>> session.add("gaincal", vis=str(ms_path), caltable=str(cal_table))
+        >>> session.add("applycal", vis=str(ms_path), gaintable=str(cal_table))
+        >>> results = session.run()
+    """
+
+    def __init__(
+        self,
+        casa_container: Path,
+        work_dir: Path,
+        name: str = "casa_session",
+        bind_dirs: Collection[Path] | None = None,
+        stop_on_error: bool = True,
+        execution_backend: ExecutionBackend | None = None,
+    ) -> None:
+        """Create a new session
+
+        Args:
+            casa_container (Path): Container with the CASA tooling
+            work_dir (Path): Directory the generated script, results and log files are written to
+            name (str, optional): Prefix of the generated files. Should be unique among concurrent sessions in the same ``work_dir``. Defaults to "casa_session".
+            bind_dirs (Optional[Collection[Path]], optional): Additional directories to bind into the container. Defaults to None.
+            stop_on_error (bool, optional): If True, tasks queued after a failed task are not run. Defaults to True.
+            execution_backend (Optional[ExecutionBackend], optional): Run CASA in the container or natively. See ``run_singularity_command``. Defaults to None.
+        """
+        self.casa_container = casa_container
+        self.work_dir = Path(work_dir)
+        self.name = name
+        self.bind_dirs = list(bind_dirs) if bind_dirs else []
+        self.stop_on_error = stop_on_error
+        self.execution_backend = execution_backend
+        self.tasks: list[CasaTask] = []
+
+    @property
+    def script_path(self) -> Path:
+        """The path of the generated CASA script"""
+        return self.work_dir / f"{self.name}.casa_session.py"
+
+    @property
+    def results_path(self) -> Path:
+        """The path of the results file written by the CASA script"""
+        return self.work_dir / f"{self.name}.casa_session.json"
+
+    def add(self, task: str, **kwargs) -> CasaTask:
+        """Queue a CASA task to run in this session
+
+        Args:
+            task (str): The name of the CASA task. All ``**kwargs`` are passed to the task.
+
+        Returns:
+            CasaTask: The queued task
+        """
+        log_path = self.work_dir / f"{self.name}.{len(self.tasks):02d}.{task}.log"
+        casa_task = CasaTask(
+            task=task,
+            call=args_to_casa_task_call(task=task, **kwargs),
+            log_path=log_path,
+        )
+        logger.info(f"Queued {casa_task.call=}")
+        self.tasks.append(casa_task)
+
+        return casa_task
+
+    def generate_script(self) -> str:
+        """Create the python script that executes the queued tasks
+
+        Returns:
+            str: The script to pass to ``casa -c``
+        """
+        script = _CASA_SESSION_HEADER.format(results_path=str(self.results_path))
+        for casa_task in self.tasks:
+            script += _CASA_SESSION_TASK.format(
+                stop_on_error=self.stop_on_error,
+                log_path=str(casa_task.log_path),
+                call=casa_task.call,
+                task=casa_task.task,
+            )
+
+        return script
+
+    def run(self, cleanup: bool = True) -> list[CasaTaskResult]:
+        """Execute all queued tasks in a single CASA process
+
+        Args:
+            cleanup (bool, optional): Remove the generated script and results file once the results have been read. The CASA logs are kept. Defaults to True.
+
+        Returns:
+            list[CasaTaskResult]: The outcome of each task, in the order they were queued
+        """
+        if len(self.tasks) == 0:
+            logger.info("No CASA tasks queued. Nothing to run. ")
+            return []
+
+        self.script_path.write_text(self.generate_script())
+        remove_files_folders(self.results_path)
+
+        logger.info(
+            f"Running {len(self.tasks)} CASA tasks in a single session via {self.script_path}"
+        )
+        try:
+            run_singularity_command(
+                image=self.casa_container,
+                command=f"casa -c {self.script_path!s}",
+                bind_dirs=[self.work_dir, *self.bind_dirs],
+                expected_outputs=self.results_path,
+                execution_backend=self.execution_backend,
+            )
+        except CalledProcessError as e:
+            logger.error(f"CASA session {self.name} exited with an error: {e}")
+
+        recorded = (
+            json.loads(self.results_path.read_text())
+            if self.results_path.exists()
+            else []
+        )
+
+        results = []
+        for idx, casa_task in enumerate(self.tasks):
+            if idx < len(recorded):
+                result = CasaTaskResult(
+                    task=casa_task.task,
+                    call=casa_task.call,
+                    return_code=recorded[idx]["return_code"],
+                    log_path=casa_task.log_path,
+                    error=recorded[idx]["error"],
+                    elapsed_seconds=recorded[idx]["elapsed_seconds"],
+                )
+            else:
+                result = CasaTaskResult(
+                    task=casa_task.task,
+                    call=casa_task.call,
+                    return_code=-1,
+                    log_path=casa_task.log_path,
+                )
+
+            if result.return_code == 0:
+                logger.info(
+                    f"{result.task} ({idx + 1}/{len(self.tasks)}) succeeded in {result.elapsed_seconds:.1f}s, log {result.log_path}"
+                )
+            else:
+                logger.warning(
+                    f"{result.task} ({idx + 1}/{len(self.tasks)}) has {result.return_code=}, log {result.log_path}"
+                )
+                if result.error:
+                    logger.warning(result.error)
+            results.append(result)
+
+        if cleanup:
+            remove_files_folders(self.script_path, self.results_path)
+
+        return results
+
+
 # TODO There should be a general casa_command type function that accepts the task as a keyword
 # so that each casa task does not need an extra function
 
@@ -50,7 +293,7 @@ def mstransform(**kwargs) -> str:
         output_ms (str): Path of the output measurement set produced by the transform
 
     Returns:
-        str: The ``mstransform`` string
+        str: The ``mstransform`` command. The decorated task executes it and returns its ``ResourceUsage``
     """
     mstransform_str = args_to_casa_task_string(task="mstransform", **kwargs)
     logger.info(f"{mstransform_str=}")
@@ -63,7 +306,7 @@ def cvel(**kwargs) -> str:
     """Generate the CASA cvel command
 
     Returns:
-        str: The command to execute
+        str: The ``cvel`` command. The decorated task executes it and returns its ``ResourceUsage``
     """
     cvel_str = args_to_casa_task_string(task="cvel", **kwargs)
     logger.info(f"{cvel_str=}")
@@ -76,7 +319,7 @@ def applycal(**kwargs) -> str:
     """Generate the CASA applycal command
 
     Returns:
-        str: The command to execute
+        str: The ``applycal`` command. The decorated task executes it and returns its ``ResourceUsage``
     """
     applycal_str = args_to_casa_task_string(task="applycal", **kwargs)
     logger.info(f"{applycal_str=}")
@@ -89,7 +332,7 @@ def gaincal(**kwargs) -> str:
     """Generate the CASA gaincal command
 
     Returns:
-        str: The command to execute
+        str: The ``gaincal`` command. The decorated task executes it and returns its ``ResourceUsage``
     """
     gaincal_str = args_to_casa_task_string(task="gaincal", **kwargs)
     logger.info(f"{gaincal_str=}")
@@ -119,6 +362,7 @@ def copy_with_mstranform(casa_container: Path, ms_path: Path) -> Path:
         outputvis=str(transform_ms),
         createmms=False,
         datacolumn="all",
+        expected_outputs=transform_ms / "table.dat",
     )
 
     logger.info(f"Successfully created the transformed measurement set {transform_ms}.")
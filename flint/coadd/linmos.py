@@ -10,6 +10,7 @@ import numpy as np
 from astropy.io import fits
 
 from flint.logging import logger
+from flint.manifest import register_products
 from flint.naming import LinmosNames, create_linmos_names, extract_beam_from_name
 from flint.options import BaseOptions, add_options_to_parser, create_options_from_parser
 from flint.sclient import run_singularity_command
@@ -667,7 +668,16 @@ def linmos_images(
         bind_dirs.append(linmos_options.holofile.absolute().parent)
 
     run_singularity_command(
-        image=container, command=linmos_cmd_str, bind_dirs=bind_dirs
+        image=container,
+        command=linmos_cmd_str,
+        bind_dirs=bind_dirs,
+        expected_outputs=(linmos_names.image_fits, linmos_names.weight_fits),
+        output_log_path=Path(f"{linmos_options.base_output_name}.linmos.log"),
+    )
+    register_products(
+        linmos_names.image_fits,
+        linmos_names.weight_fits,
+        linmos_parset_summary.parset_path,
     )
 
     linmos_result = LinmosResult(
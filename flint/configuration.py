@@ -13,12 +13,14 @@ from typing import Any
 
 import yaml
 
+from flint.contsub import ImageContsubOptions
 from flint.imager.wsclean import WSCleanOptions
 from flint.logging import logger
 from flint.masking import MaskingOptions
 from flint.naming import add_timestamp_to_path
 from flint.options import ArchiveOptions
 from flint.selfcal.casa import GainCalOptions
+from flint.selfcal.convergence import SelfcalConvergenceOptions
 from flint.source_finding.aegean import AegeanOptions, BANEOptions
 
 # TODO: It feels like that the standard of this strategy file should
@@ -40,6 +42,8 @@ MODE_OPTIONS_MAPPING = {
     "archive": ArchiveOptions,
     "bane": BANEOptions,
     "aegean": AegeanOptions,
+    "convergence": SelfcalConvergenceOptions,
+    "imcontsub": ImageContsubOptions,
 }
 POLARISATION_MAPPING = {
     "total": "i",
@@ -0,0 +1,425 @@
+"""Image-plane continuum subtraction of spectral cubes.
+
+Rather than predicting a continuum model into and subtracting it from the
+visibilities of each measurement set, the continuum is removed from a cube
+that has already been imaged. A low order polynomial is fit along the
+frequency axis of every pixel, and subtracted. Channels may be excluded from
+the fit (e.g. those expected to contain line emission), non-finite values are
+ignored, and channels that deviate from the fit by more than some number of
+robust standard deviations are iteratively clipped.
+
+The cube is read through a memory map in spatial tiles, each of which holds
+every channel of a block of pixels, and tiles are fit in a pool of threads.
+The continuum-subtracted cube and the continuum model cube are allocated at
+their final size and written through memory maps, so neither is ever held in
+memory in full.
+
+Since a polynomial can not model a change of resolution with frequency, the
+channels of the cube should first be convolved to a common resolution.
+"""
+
+from __future__ import annotations
+
+import warnings
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from time import perf_counter
+from typing import NamedTuple
+
+import numpy as np
+from astropy.io import fits
+
+from flint.cube import allocate_fits_file
+from flint.logging import logger
+from flint.manifest import register_products
+from flint.options import BaseOptions
+from flint.utils import get_thread_budget
+
+SPECTRAL_CTYPES = ("FREQ", "CHAN")
+"""Axis types that may describe the spectral axis of a cube, in order of preference"""
+
+
+class ImageContsubOptions(BaseOptions):
+    """Options that control the image-plane continuum subtraction of a cube"""
+
+    poly_order: int = 1
+    """The order of the polynomial fit along the frequency axis of each pixel"""
+    sigma_clip: float | None = 3.0
+    """Channels whose residual from the fit exceeds this many robust standard deviations are excluded from the next fit. If None no clipping is performed"""
+    max_iterations: int = 3
+    """The largest number of times the polynomial is refit after clipping"""
+    exclude_channels: list[tuple[int, int]] | None = None
+    """Ranges of channels, lower inclusive and upper exclusive, excluded from the fit (e.g. those with known line emission)"""
+    tile_size: int = 128
+    """The width and height, in pixels, of the spatial tiles fit at a time"""
+    max_workers: int | None = None
+    """The number of threads used to fit tiles. If None the thread budget is used (see ``flint.utils.get_thread_budget``)"""
+
+
+class ImageContsubResult(NamedTuple):
+    """The products of the image-plane continuum subtraction of a cube"""
+
+    cube: Path
+    """The cube the continuum was fit to"""
+    contsub_cube: Path
+    """The continuum-subtracted cube"""
+    model_cube: Path
+    """The continuum model cube"""
+    elapsed_seconds: float
+    """The wall time spent fitting and writing the cubes"""
+
+
+def get_spectral_axis(header: fits.Header) -> tuple[int, np.ndarray]:
+    """Find the spectral axis of a cube and the coordinate of each of its
+    channels. A ``FREQ`` axis is preferred, otherwise a ``CHAN`` axis is used.
+
+    Args:
+        header (fits.Header): The header of the cube
+
+    Raises:
+        ValueError: Raised when there is no spectral axis
+
+    Returns:
+        tuple[int, np.ndarray]: The numpy index of the spectral axis, and the coordinate of each channel
+    """
+    naxis = header["NAXIS"]
+    for ctype in SPECTRAL_CTYPES:
+        for axis in range(1, naxis + 1):
+            if str(header.get(f"CTYPE{axis}", "")).strip().upper() != ctype:
+                continue
+            channels = np.arange(header[f"NAXIS{axis}"], dtype=float)
+            coordinates = header.get(f"CRVAL{axis}", 0.0) + (
+                channels + 1 - header.get(f"CRPIX{axis}", 1.0)
+            ) * header.get(f"CDELT{axis}", 1.0)
+            return naxis - axis, coordinates
+
+    raise ValueError(f"No spectral axis in header, expected one of {SPECTRAL_CTYPES}")
+
+
+def get_channel_mask(
+    nchan: int, exclude_channels: list[tuple[int, int]] | None = None
+) -> np.ndarray:
+    """Create a mask of the channels that may be used in the fit
+
+    Args:
+        nchan (int): The number of channels
+        exclude_channels (Optional[list[tuple[int, int]]], optional): Ranges of channels, lower inclusive and upper exclusive, to exclude. Defaults to None.
+
+    Returns:
+        np.ndarray: True for channels that are used
+    """
+    channel_mask = np.ones(nchan, dtype=bool)
+    for start, end in exclude_channels or []:
+        channel_mask[start:end] = False
+
+    return channel_mask
+
+
+def _fit_polynomial(
+    vander: np.ndarray, spectra: np.ndarray, weights: np.ndarray
+) -> np.ndarray:
+    """Least-squares fit of the columns of a Vandermonde matrix to each
+    spectrum. Spectra with too few weighted channels have a NaN model."""
+    nterms = vander.shape[1]
+    normal = np.einsum("ci,cj,cp->pij", vander, vander, weights)
+    rhs = np.einsum("ci,cp->pi", vander, weights * spectra)
+
+    coefficients = np.full((spectra.shape[1], nterms), np.nan)
+    solvable = weights.sum(axis=0) >= nterms
+    if np.any(solvable):
+        coefficients[solvable] = np.linalg.solve(
+            normal[solvable], rhs[solvable][..., None]
+        )[..., 0]
+
+    return vander @ coefficients.T
+
+
+def fit_continuum(
+    spectra: np.ndarray,
+    coordinates: np.ndarray,
+    contsub_options: ImageContsubOptions,
+    channel_mask: np.ndarray | None = None,
+) -> np.ndarray:
+    """Fit a polynomial continuum to a set of spectra, with iterative
+    sigma-clipping of outlying channels.
+
+    Args:
+        spectra (np.ndarray): The spectra to fit, with shape (nchan, npixels)
+        coordinates (np.ndarray): The frequency, or channel, of each channel
+        contsub_options (ImageContsubOptions): Options that describe the fit
+        channel_mask (Optional[np.ndarray], optional): True for channels that may be used in the fit. If None all are. Defaults to None.
+
+    Returns:
+        np.ndarray: The continuum model of each spectrum, with the same shape as ``spectra``. Spectra that could not be fit are NaN.
+    """
+    nchan = spectra.shape[0]
+    # Normalise the coordinates to keep the normal equations well conditioned
+    span = np.ptp(coordinates)
+    x = (coordinates - np.mean(coordinates)) / (span / 2.0 if span > 0 else 1.0)
+    vander = np.polynomial.polynomial.polyvander(x, contsub_options.poly_order)
+
+    valid = np.isfinite(spectra)
+    if channel_mask is not None:
+        valid &= channel_mask.reshape(nchan, 1)
+    spectra = np.where(valid, spectra, 0.0).astype(float)
+
+    weights = valid.astype(float)
+    model = _fit_polynomial(vander=vander, spectra=spectra, weights=weights)
+    if contsub_options.sigma_clip is None:
+        return model
+
+    for _ in range(contsub_options.max_iterations):
+        residual = np.where(weights > 0, spectra - model, np.nan)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            median = np.nanmedian(residual, axis=0)
+            std = 1.4826 * np.nanmedian(np.abs(residual - median), axis=0)
+        keep = valid & (
+            (np.abs(residual - median) <= contsub_options.sigma_clip * std) | ~(std > 0)
+        )
+        if np.array_equal(keep, weights > 0):
+            break
+        weights = keep.astype(float)
+        model = _fit_polynomial(vander=vander, spectra=spectra, weights=weights)
+
+    return model
+
+
+def _get_tiles(ny: int, nx: int, tile_size: int) -> list[tuple[slice, slice]]:
+    return [
+        (slice(y, min(y + tile_size, ny)), slice(x, min(x + tile_size, nx)))
+        for y in range(0, ny, tile_size)
+        for x in range(0, nx, tile_size)
+    ]
+
+
+def _subtract_tile(
+    tile: tuple[slice, slice],
+    data: np.ndarray,
+    contsub_cube: np.ndarray,
+    model_cube: np.ndarray,
+    spectral_axis: int,
+    coordinates: np.ndarray,
+    contsub_options: ImageContsubOptions,
+    channel_mask: np.ndarray,
+) -> None:
+    """Fit the continuum of every pixel of a spatial tile, and write the
+    model and continuum-subtracted spectra into the output cubes"""
+    tile_data = np.moveaxis(np.asarray(data[..., tile[0], tile[1]]), spectral_axis, 0)
+    model = fit_continuum(
+        spectra=tile_data.reshape(len(coordinates), -1),
+        coordinates=coordinates,
+        contsub_options=contsub_options,
+        channel_mask=channel_mask,
+    ).reshape(tile_data.shape)
+
+    model_cube[..., tile[0], tile[1]] = np.moveaxis(model, 0, spectral_axis)
+    contsub_cube[..., tile[0], tile[1]] = np.moveaxis(
+        tile_data - model, 0, spectral_axis
+    )
+
+
+def subtract_continuum_from_cube(
+    cube_path: Path,
+    contsub_cube_path: Path | None = None,
+    model_cube_path: Path | None = None,
+    contsub_options: ImageContsubOptions | None = None,
+) -> ImageContsubResult:
+    """Fit and subtract a polynomial continuum along the frequency axis of
+    every pixel of a cube. The cube is processed in spatial tiles, which are
+    read from and written to memory maps.
+
+    Args:
+        cube_path (Path): The cube to continuum subtract. Its last two axes should be spatial.
+        contsub_cube_path (Optional[Path], optional): The continuum-subtracted cube to create. If None the suffix of ``cube_path`` is replaced by ``.imcontsub.fits``. Defaults to None.
+        model_cube_path (Optional[Path], optional): The continuum model cube to create. If None the suffix of ``cube_path`` is replaced by ``.contmodel.fits``. Defaults to None.
+        contsub_options (Optional[ImageContsubOptions], optional): Options that describe the fit. If None the defaults are used. Defaults to None.
+
+    Raises:
+        ValueError: Raised when the cube has no spectral axis, or too few channels to fit
+
+    Returns:
+        ImageContsubResult: The continuum-subtracted and model cubes
+    """
+    cube_path = Path(cube_path)
+    contsub_cube_path = (
+        Path(contsub_cube_path)
+        if contsub_cube_path
+        else cube_path.with_suffix(".imcontsub.fits")
+    )
+    model_cube_path = (
+        Path(model_cube_path)
+        if model_cube_path
+        else cube_path.with_suffix(".contmodel.fits")
+    )
+    contsub_options = contsub_options if contsub_options else ImageContsubOptions()
+
+    start_time = perf_counter()
+    with fits.open(cube_path, memmap=True) as cube_hdul:
+        header = cube_hdul[0].header
+        spectral_axis, coordinates = get_spectral_axis(header=header)
+        nchan = len(coordinates)
+        channel_mask = get_channel_mask(
+            nchan=nchan, exclude_channels=contsub_options.exclude_channels
+        )
+        if channel_mask.sum() <= contsub_options.poly_order:
+            raise ValueError(
+                f"{channel_mask.sum()} channels can not be fit with {contsub_options.poly_order=}"
+            )
+        if header.get("CASAMBM", False):
+            logger.warning(
+                f"{cube_path} has a different restoring beam per channel, the continuum will not be fully removed"
+            )
+
+        output_header = header.copy()
+        output_header["BITPIX"] = -32
+        for key in ("BSCALE", "BZERO"):
+            output_header.remove(key, ignore_missing=True)
+        data = cube_hdul[0].data
+        contsub_cube = allocate_fits_file(
+            output_path=contsub_cube_path, header=output_header
+        )
+        model_cube = allocate_fits_file(
+            output_path=model_cube_path, header=output_header
+        )
+
+        tiles = _get_tiles(
+            ny=data.shape[-2], nx=data.shape[-1], tile_size=contsub_options.tile_size
+        )
+        logger.info(
+            f"Fitting order {contsub_options.poly_order} continuum to {nchan} channels of {cube_path} in {len(tiles)} tiles"
+        )
+
+        try:
+            with ThreadPoolExecutor(
+                max_workers=contsub_options.max_workers
+                if contsub_options.max_workers
+                else get_thread_budget()
+            ) as executor:
+                # Iterate over the results so any exception is raised
+                subtract_tile = partial(
+                    _subtract_tile,
+                    data=data,
+                    contsub_cube=contsub_cube,
+                    model_cube=model_cube,
+                    spectral_axis=spectral_axis,
+                    coordinates=coordinates,
+                    contsub_options=contsub_options,
+                    channel_mask=channel_mask,
+                )
+                for _ in executor.map(subtract_tile, tiles):
+                    pass
+            contsub_cube.flush()
+            model_cube.flush()
+        finally:
+            del contsub_cube, model_cube, data
+
+        # Carry over any extensions, e.g. a table of the restoring beams
+        for extension in cube_hdul[1:]:
+            for output_path in (contsub_cube_path, model_cube_path):
+                fits.append(output_path, data=extension.data, header=extension.header)
+
+    register_products(contsub_cube_path, model_cube_path)
+
+    contsub_result = ImageContsubResult(
+        cube=cube_path,
+        contsub_cube=contsub_cube_path,
+        model_cube=model_cube_path,
+        elapsed_seconds=perf_counter() - start_time,
+    )
+    logger.info(
+        f"Wrote {contsub_cube_path} and {model_cube_path} in {contsub_result.elapsed_seconds:.2f}s"
+    )
+
+    return contsub_result
+
+
+def get_parser() -> ArgumentParser:
+    parser = ArgumentParser(
+        description="Subtract a polynomial continuum fit along the frequency axis of each pixel of a cube"
+    )
+
+    parser.add_argument("cube", type=Path, help="The cube to continuum subtract")
+    parser.add_argument(
+        "--contsub-cube",
+        type=Path,
+        default=None,
+        help="The continuum-subtracted cube to create",
+    )
+    parser.add_argument(
+        "--model-cube",
+        type=Path,
+        default=None,
+        help="The continuum model cube to create",
+    )
+    parser.add_argument(
+        "--poly-order",
+        type=int,
+        default=1,
+        help="The order of the polynomial fit to each pixel",
+    )
+    parser.add_argument(
+        "--sigma-clip",
+        type=float,
+        default=3.0,
+        help="Clip channels that deviate from the fit by this many robust standard deviations",
+    )
+    parser.add_argument(
+        "--max-iterations",
+        type=int,
+        default=3,
+        help="The largest number of times the fit is repeated after clipping",
+    )
+    parser.add_argument(
+        "--exclude-channels",
+        type=int,
+        nargs=2,
+        action="append",
+        default=None,
+        metavar=("START", "END"),
+        help="A range of channels, lower inclusive and upper exclusive, excluded from the fit. May be given multiple times",
+    )
+    parser.add_argument(
+        "--tile-size",
+        type=int,
+        default=128,
+        help="The width and height, in pixels, of the tiles fit at a time",
+    )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=None,
+        help="The number of threads used to fit tiles",
+    )
+
+    return parser
+
+
+def cli() -> None:
+    parser = get_parser()
+
+    args = parser.parse_args()
+
+    subtract_continuum_from_cube(
+        cube_path=args.cube,
+        contsub_cube_path=args.contsub_cube,
+        model_cube_path=args.model_cube,
+        contsub_options=ImageContsubOptions(
+            poly_order=args.poly_order,
+            sigma_clip=args.sigma_clip,
+            max_iterations=args.max_iterations,
+            exclude_channels=(
+                [tuple(channels) for channels in args.exclude_channels]
+                if args.exclude_channels
+                else None
+            ),
+            tile_size=args.tile_size,
+            max_workers=args.max_workers,
+        ),
+    )
+
+
+if __name__ == "__main__":
+    cli()
@@ -18,6 +18,7 @@ from racs_tools import beamcon_2D, beamcon_3D
 from radio_beam import Beam, Beams
 
 from flint.logging import logger
+from flint.manifest import register_products
 
 warnings.simplefilter("ignore", FITSFixedWarning)
 
@@ -256,6 +257,8 @@ def convolve_images(
             logger.info(f"Copying {original_path=} {copy_path=}")
             copyfile(original_path, copy_path)
 
+        register_products(*conv_image_paths)
+
         return conv_image_paths
 
     radio_beam = Beam(
@@ -306,6 +309,8 @@ def convolve_images(
 
         return_conv_image_paths.append(convol_output_path)
 
+    register_products(*return_conv_image_paths)
+
     return return_conv_image_paths
 
 
@@ -0,0 +1,471 @@
+"""Assemble single channel FITS images into a cube.
+
+The cube is written with its axes in the order expected by the yandasoft
+``linmos`` task, ``(FREQ, STOKES, DEC, RA)`` in numpy order. The output file
+is allocated at its final size once, with a header built from the first
+image, and each channel image is then written directly into its plane through
+a memory map. Only a single plane is held in memory at a time, and the cube is
+written only once.
+
+Should the restoring beam differ between channels a CASA style ``BEAMS``
+table is appended as a second extension.
+
+A cube may also be filled incrementally, with ``write_plane_to_cube`` called
+as each channel image becomes available (e.g. by separate processes as each
+channel is co-added), followed by a single ``finalise_cube``. The cube is
+allocated by whichever channel arrives first, and access is serialised with a
+lock file. Blank header cards are reserved so the header may be finalised in
+place without rewriting the data. A cube left behind by an earlier run (e.g.
+one already finalised) is replaced rather than written into.
+"""
+
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import Collection, NamedTuple
+
+import astropy.units as u
+import numpy as np
+from astropy.io import fits
+from astropy.table import Table
+
+from flint.logging import logger
+from flint.manifest import register_products
+from flint.utils import file_lock
+
+FITS_DTYPES = {8: "u1", 16: ">i2", 32: ">i4", 64: ">i8", -32: ">f4", -64: ">f8"}
+"""Mapping of the FITS BITPIX to the numpy data type stored on disk"""
+FITS_BLOCK_SIZE = 2880
+"""Size in bytes that the header and data of a FITS HDU are padded to"""
+AXIS_KEYS = ("CTYPE", "CRPIX", "CRVAL", "CDELT", "CUNIT")
+"""The per-axis header keys that are moved when reordering axes"""
+RESERVED_HEADER_CARDS = 36
+"""Blank cards reserved in the header of an incrementally written cube, so it may be updated in place"""
+
+
+class ChannelImage(NamedTuple):
+    """Properties of a single channel image that is placed into a cube"""
+
+    path: Path
+    """Path to the image"""
+    freq_hz: float
+    """The frequency of the channel, in Hz"""
+    beam: tuple[float, float, float] | None
+    """The restoring beam (BMAJ, BMIN, BPA) in degrees, or None if not in the header"""
+
+
+def _get_axis(header: fits.Header, ctype: str) -> int:
+    for axis in range(1, header["NAXIS"] + 1):
+        if str(header.get(f"CTYPE{axis}", "")).strip().upper() == ctype:
+            return axis
+    raise ValueError(f"No {ctype} axis in header")
+
+
+def read_channel_image(image_path: Path) -> ChannelImage:
+    """Read the frequency and restoring beam of a channel image from its header
+
+    Args:
+        image_path (Path): The channel image to inspect
+
+    Raises:
+        ValueError: Raised when the image has no FREQ axis
+
+    Returns:
+        ChannelImage: The frequency and beam of the image
+    """
+    header = fits.getheader(image_path)
+    freq_axis = _get_axis(header=header, ctype="FREQ")
+    freq_hz = header[f"CRVAL{freq_axis}"] + (
+        1 - header.get(f"CRPIX{freq_axis}", 1.0)
+    ) * header.get(f"CDELT{freq_axis}", 0.0)
+
+    beam = (
+        (float(header["BMAJ"]), float(header["BMIN"]), float(header["BPA"]))
+        if "BMAJ" in header
+        else None
+    )
+
+    return ChannelImage(path=Path(image_path), freq_hz=float(freq_hz), beam=beam)
+
+
+def create_cube_header(
+    template_header: fits.Header,
+    freqs_hz: np.ndarray,
+    beams: list[tuple[float, float, float] | None],
+) -> fits.Header:
+    """Create the header of a cube with ``STOKES`` as the third axis and
+    ``FREQ`` as the fourth. Evenly spaced frequencies are encoded in the
+    ``FREQ`` axis, otherwise it is replaced by a ``CHAN`` axis.
+
+    Args:
+        template_header (fits.Header): Header of a channel image, with RA, DEC, FREQ and STOKES axes
+        freqs_hz (np.ndarray): The sorted frequencies of the channels
+        beams (list[Optional[tuple[float, float, float]]]): Restoring beam of each channel
+
+    Raises:
+        ValueError: Raised when the template does not have four axes, including FREQ and STOKES
+
+    Returns:
+        fits.Header: The header of the cube
+    """
+    if template_header["NAXIS"] != 4:
+        raise ValueError(f"Expected 4 axes, got {template_header['NAXIS']=}")
+
+    header = template_header.copy()
+    freq_axis = _get_axis(header=template_header, ctype="FREQ")
+    stokes_axis = _get_axis(header=template_header, ctype="STOKES")
+
+    for new_axis, old_axis in ((3, stokes_axis), (4, freq_axis)):
+        header[f"NAXIS{new_axis}"] = template_header[f"NAXIS{old_axis}"]
+        for key in AXIS_KEYS:
+            if f"{key}{old_axis}" in template_header:
+                header[f"{key}{new_axis}"] = template_header[f"{key}{old_axis}"]
+            else:
+                header.remove(f"{key}{new_axis}", ignore_missing=True)
+
+    header["NAXIS4"] = len(freqs_hz)
+    header["CRPIX4"] = 1.0
+    header["CRVAL4"] = float(freqs_hz[0])
+    header["CDELT4"] = float(np.median(np.diff(freqs_hz))) if len(freqs_hz) > 1 else 1.0
+    header["CUNIT4"] = "Hz"
+    if len(freqs_hz) > 2 and np.diff(freqs_hz).std() >= 1e-4:
+        logger.warning("Frequencies are not evenly spaced, using a CHAN axis")
+        header["CTYPE4"] = "CHAN"
+        header["CRVAL4"] = 1.0
+        header["CDELT4"] = 1.0
+        header.remove("CUNIT4")
+
+    for key in ("BSCALE", "BZERO"):
+        header.remove(key, ignore_missing=True)
+
+    _set_header_beams(header=header, beams=beams)
+
+    return header
+
+
+def _set_header_beams(
+    header: fits.Header, beams: list[tuple[float, float, float] | None]
+) -> None:
+    """Describe the restoring beams of the channels of a cube in its header. A
+    single beam is kept as BMAJ/BMIN/BPA, otherwise CASAMBM indicates a beam table."""
+    known_beams = [beam for beam in beams if beam is not None]
+    single_beam = len(known_beams) == len(beams) and all(
+        np.allclose(beam, known_beams[0]) for beam in known_beams
+    )
+    if known_beams and single_beam:
+        for key, value in zip(("BMAJ", "BMIN", "BPA"), known_beams[0]):
+            header[key] = value
+    elif known_beams:
+        for key in ("BMAJ", "BMIN", "BPA"):
+            header.remove(key, ignore_missing=True)
+        header["CASAMBM"] = True
+        header["COMMENT"] = "The PSF in each image plane varies."
+        header["COMMENT"] = (
+            "Full beam information is stored in the second FITS extension."
+        )
+    if known_beams and "EXTEND" not in header:
+        header.set("EXTEND", True, after=f"NAXIS{header['NAXIS']}")
+
+
+def create_beam_table(
+    beams: list[tuple[float, float, float] | None],
+) -> fits.BinTableHDU:
+    """Create a CASA style table of the restoring beam of each channel of a
+    single Stokes cube. Unknown or zero sized beams are recorded as the smallest
+    positive float32.
+
+    Args:
+        beams (list[Optional[tuple[float, float, float]]]): Restoring beam (BMAJ, BMIN, BPA) of each channel, in degrees
+
+    Returns:
+        fits.BinTableHDU: The beam table extension
+    """
+    tiny = float(np.finfo(np.float32).tiny)
+    beam_values = np.array(
+        [
+            beam if beam is not None and beam[0] > 0 and beam[1] > 0 else (np.nan,) * 3
+            for beam in beams
+        ],
+        dtype=float,
+    )
+    beam_table = Table(
+        data=[
+            np.nan_to_num(beam_values[:, 0] * 3600.0, nan=tiny),
+            np.nan_to_num(beam_values[:, 1] * 3600.0, nan=tiny),
+            np.nan_to_num(beam_values[:, 2], nan=tiny),
+            np.arange(len(beams)),
+            np.zeros(len(beams)),
+        ],
+        names=["BMAJ", "BMIN", "BPA", "CHAN", "POL"],
+        dtype=["f4", "f4", "f4", "i4", "i4"],
+    )
+    beam_table["BMAJ"].unit = u.arcsec
+    beam_table["BMIN"].unit = u.arcsec
+    beam_table["BPA"].unit = u.deg
+
+    table_hdu = fits.table_to_hdu(beam_table)
+    table_hdu.header["EXTNAME"] = "BEAMS"
+    table_hdu.header["NCHAN"] = len(beams)
+    table_hdu.header["NPOL"] = 1
+
+    return table_hdu
+
+
+def allocate_fits_file(output_path: Path, header: fits.Header) -> np.memmap:
+    """Write a header and allocate the (zeroed) data of a FITS file at its
+    final size, returning a writable memory map of the data.
+
+    Args:
+        output_path (Path): The file to create. An existing file is overwritten.
+        header (fits.Header): The primary header, which describes the data shape and type
+
+    Returns:
+        np.memmap: The data of the file, in numpy axis order
+    """
+    shape = tuple(header[f"NAXIS{axis}"] for axis in range(header["NAXIS"], 0, -1))
+    dtype = np.dtype(FITS_DTYPES[header["BITPIX"]])
+
+    header_bytes = header.tostring().encode("ascii")
+    data_size = int(np.prod(shape)) * dtype.itemsize
+    padded_data_size = -(-data_size // FITS_BLOCK_SIZE) * FITS_BLOCK_SIZE
+
+    with open(output_path, "wb") as out_file:
+        out_file.write(header_bytes)
+        # Extending the file fills it with zeros, which is also the FITS padding
+        out_file.truncate(len(header_bytes) + padded_data_size)
+
+    return np.memmap(
+        output_path, dtype=dtype, mode="r+", offset=len(header_bytes), shape=shape
+    )
+
+
+def write_cube_from_images(
+    image_paths: Collection[Path], output_cube: Path
+) -> u.Quantity:
+    """Combine a set of single channel images into a cube, ordered by
+    frequency, with axes ``(FREQ, STOKES, DEC, RA)`` in numpy order.
+
+    Args:
+        image_paths (Collection[Path]): The channel images, each with the same shape and a single FREQ and STOKES plane
+        output_cube (Path): The cube to create. An existing file is overwritten.
+
+    Raises:
+        ValueError: Raised when the images do not share the same shape
+
+    Returns:
+        u.Quantity: The sorted frequencies of the channels of the cube
+    """
+    channel_images = sorted(
+        (read_channel_image(image_path=Path(p)) for p in image_paths),
+        key=lambda channel_image: channel_image.freq_hz,
+    )
+    freqs_hz = np.array([channel_image.freq_hz for channel_image in channel_images])
+    beams = [channel_image.beam for channel_image in channel_images]
+
+    header = create_cube_header(
+        template_header=fits.getheader(channel_images[0].path),
+        freqs_hz=freqs_hz,
+        beams=beams,
+    )
+    logger.info(f"Writing {len(channel_images)} channel images to {output_cube}")
+    cube = allocate_fits_file(output_path=Path(output_cube), header=header)
+    plane_shape = cube.shape[1:]
+
+    try:
+        for channel, channel_image in enumerate(channel_images):
+            plane = fits.getdata(channel_image.path, memmap=False)
+            if plane.size != np.prod(plane_shape):
+                raise ValueError(
+                    f"{channel_image.path} has shape {plane.shape}, expected {plane_shape}"
+                )
+            cube[channel] = plane.reshape(plane_shape)
+            del plane
+        cube.flush()
+    finally:
+        del cube
+
+    if "CASAMBM" in header:
+        logger.info(f"Appending beam table to {output_cube}")
+        table_hdu = create_beam_table(beams=beams)
+        fits.append(output_cube, data=table_hdu.data, header=table_hdu.header)
+
+    register_products(Path(output_cube))
+
+    return freqs_hz * u.Hz
+
+
+def _get_lock_path(output_cube: Path) -> Path:
+    return Path(f"{output_cube}.lock")
+
+
+def _get_beams_path(output_cube: Path) -> Path:
+    return Path(f"{output_cube}.beams.json")
+
+
+def _get_mismatched_header_keys(
+    header: fits.Header, expected_header: fits.Header
+) -> list[str]:
+    """The keys describing the shape and axes of a cube that differ from those expected"""
+    keys = ["NAXIS"] + [
+        f"{key}{axis}"
+        for axis in range(1, expected_header["NAXIS"] + 1)
+        for key in ("NAXIS", *AXIS_KEYS)
+    ]
+    mismatched = []
+    for key in keys:
+        value, expected_value = header.get(key), expected_header.get(key)
+        if isinstance(expected_value, float) and isinstance(value, (int, float)):
+            if not np.isclose(value, expected_value, rtol=1e-9, atol=0.0):
+                mismatched.append(key)
+        elif value != expected_value:
+            mismatched.append(key)
+
+    return mismatched
+
+
+def write_plane_to_cube(
+    image_path: Path,
+    output_cube: Path,
+    channel: int,
+    freqs_hz: Collection[float],
+) -> Path:
+    """Write a single channel image into its plane of a cube, which has axes
+    ``(FREQ, STOKES, DEC, RA)`` in numpy order. Should the cube not yet exist it
+    is allocated with a plane for every frequency, using the header of the image
+    as a template. Planes may be written in any order and by separate processes.
+    Once all planes are written ``finalise_cube`` should be called.
+
+    An existing cube is only written into if planes are still being written to
+    it (i.e. it has a record of the beams of its written planes), and it must
+    match the header expected for the image and frequencies. Any other existing
+    cube, such as one finalised by an earlier run, is replaced.
+
+    Args:
+        image_path (Path): The single channel image to write
+        output_cube (Path): The cube being written
+        channel (int): The index of the plane to write to
+        freqs_hz (Collection[float]): The frequency of every channel of the cube, in Hz
+
+    Raises:
+        ValueError: Raised when the image does not have the shape of a plane of the cube, or the cube being written does not match the image and frequencies
+
+    Returns:
+        Path: The cube written to
+    """
+    output_cube = Path(output_cube)
+    channel_image = read_channel_image(image_path=image_path)
+    plane = fits.getdata(image_path, memmap=False)
+    header = create_cube_header(
+        template_header=fits.getheader(image_path),
+        freqs_hz=np.array(freqs_hz, dtype=float),
+        beams=[None] * len(freqs_hz),
+    )
+    beams_path = _get_beams_path(output_cube=output_cube)
+
+    with file_lock(lock_path=_get_lock_path(output_cube=output_cube)):
+        if output_cube.exists() and not beams_path.exists():
+            logger.warning(
+                f"{output_cube} exists but is not having planes written, replacing it"
+            )
+            output_cube.unlink()
+
+        if output_cube.exists():
+            mismatched = _get_mismatched_header_keys(
+                header=fits.getheader(output_cube), expected_header=header
+            )
+            if mismatched:
+                raise ValueError(
+                    f"{output_cube} does not match {image_path} and {len(freqs_hz)} channels, differing in {mismatched}"
+                )
+        else:
+            for _ in range(RESERVED_HEADER_CARDS):
+                header.add_blank()
+            logger.info(f"Allocating {output_cube} for {len(freqs_hz)} channels")
+            cube = allocate_fits_file(output_path=output_cube, header=header)
+            cube.flush()
+            del cube
+            register_products(output_cube)
+
+        with fits.open(output_cube, mode="update", memmap=True) as cube_hdul:
+            cube = cube_hdul[0].data
+            plane_shape = cube.shape[1:]
+            if plane.size != np.prod(plane_shape):
+                raise ValueError(
+                    f"{image_path} has shape {plane.shape}, expected {plane_shape}"
+                )
+            cube[channel] = plane.reshape(plane_shape)
+            del cube
+
+        beams = json.loads(beams_path.read_text()) if beams_path.exists() else {}
+        beams[str(channel)] = channel_image.beam
+        beams_path.write_text(json.dumps(beams))
+
+    logger.info(f"Wrote {image_path} to {channel=} of {output_cube}")
+
+    return output_cube
+
+
+def finalise_cube(output_cube: Path) -> Path:
+    """Finalise a cube filled by ``write_plane_to_cube``. The restoring beams of
+    the channels are recorded in the header, or in an appended beam table should
+    they differ. Planes that were never written are blanked.
+
+    Args:
+        output_cube (Path): The cube to finalise
+
+    Raises:
+        ValueError: Raised when the cube has already been finalised
+
+    Returns:
+        Path: The finalised cube
+    """
+    output_cube = Path(output_cube)
+    beams_path = _get_beams_path(output_cube=output_cube)
+
+    with file_lock(lock_path=_get_lock_path(output_cube=output_cube)):
+        written_beams = (
+            json.loads(beams_path.read_text()) if beams_path.exists() else {}
+        )
+
+        with fits.open(output_cube, mode="update", memmap=True) as cube_hdul:
+            header = cube_hdul[0].header
+            # Beams are only described once the cube is finalised
+            if "BEAMS" in cube_hdul or (
+                not beams_path.exists() and ("BMAJ" in header or "CASAMBM" in header)
+            ):
+                raise ValueError(f"{output_cube} has already been finalised")
+            nchan = header["NAXIS4"]
+            beams = [
+                tuple(written_beams[str(channel)])
+                if written_beams.get(str(channel))
+                else None
+                for channel in range(nchan)
+            ]
+
+            missing = [
+                channel for channel in range(nchan) if str(channel) not in written_beams
+            ]
+            if missing:
+                logger.warning(
+                    f"{len(missing)} channels not written, blanking {missing=}"
+                )
+                cube = cube_hdul[0].data
+                for channel in missing:
+                    cube[channel] = np.nan
+                del cube
+
+            _set_header_beams(header=header, beams=beams)  # type: ignore[arg-type]
+            multiple_beams = header.get("CASAMBM", False)
+
+        if multiple_beams:
+            logger.info(f"Appending beam table to {output_cube}")
+            table_hdu = create_beam_table(beams=beams)  # type: ignore[arg-type]
+            fits.append(output_cube, data=table_hdu.data, header=table_hdu.header)
+
+        beams_path.unlink(missing_ok=True)
+
+    _get_lock_path(output_cube=output_cube).unlink(missing_ok=True)
+    logger.info(f"Finalised {output_cube}")
+
+    return output_cube
@@ -213,7 +213,10 @@ def run_aoflagger_cmd(aoflagger_cmd: AOFlaggerCommand, container: Path) -> None:
         bind_dirs.append(aoflagger_cmd.strategy_file)
 
     run_singularity_command(
-        image=container.absolute(), command=aoflagger_cmd.cmd, bind_dirs=bind_dirs
+        image=container.absolute(),
+        command=aoflagger_cmd.cmd,
+        bind_dirs=bind_dirs,
+        output_log_path=aoflagger_cmd.ms_path.with_suffix(".aoflagger.log"),
     )
 
 
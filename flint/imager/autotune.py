@@ -0,0 +1,503 @@
+"""Tune the parallelism related options of wsclean for a type of node.
+
+Short, bounded wsclean trials are run against a small subset of a
+measurement set across a grid of settings. The fastest configuration is
+persisted to a JSON file, keyed by the class of host, the image size and
+the number of output channels, and is used by ``wsclean_imager`` whenever
+the strategy does not set these options itself.
+"""
+
+from __future__ import annotations
+
+import json
+import multiprocessing
+import re
+import resource
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from pathlib import Path
+from socket import gethostname
+from time import monotonic, time
+from typing import Any, NamedTuple
+
+import numpy as np
+from casacore.tables import table
+
+from flint.imager.wsclean import WSCleanOptions, wsclean_imager
+from flint.logging import logger
+from flint.options import MS, BaseOptions
+from flint.utils import (
+    file_lock,
+    get_allocated_cores,
+    get_environment_variable,
+    remove_files_folders,
+)
+
+TUNING_PATH_ENVIRONMENT_VARIABLE = "FLINT_WSCLEAN_TUNING_PATH"
+"""Environment variable with the path of the JSON file tuned wsclean configurations are persisted to"""
+HOST_CLASS_ENVIRONMENT_VARIABLE = "FLINT_HOST_CLASS"
+"""Environment variable that, when set, overrides the host class derived from the hostname"""
+TUNED_WSCLEAN_OPTIONS = ("parallel_deconvolution", "parallel_gridding", "abs_mem", "j")
+"""The ``WSCleanOptions`` that are tuned"""
+
+
+class WSCleanTuningOptions(BaseOptions):
+    """Options that control the grid of wsclean trials"""
+
+    parallel_deconvolution: tuple[int | None, ...] = (None, 4096, 2048)
+    """Values of ``parallel_deconvolution`` to trial. Sub-images at least as large as the image are skipped."""
+    parallel_gridding: tuple[int | None, ...] = (None, 2, 4)
+    """Values of ``parallel_gridding`` to trial"""
+    abs_mem: tuple[int, ...] = (100,)
+    """Values of ``abs_mem`` to trial"""
+    j: tuple[int | None, ...] = (None,)
+    """Values of ``j`` to trial. ``None`` is the thread budget of the node."""
+    max_timesteps: int = 4
+    """The number of integrations copied into the subset measurement set the trials image"""
+    niter: int = 200
+    """Bounds the number of minor cycle iterations of each trial"""
+    max_memory_kb: int | None = None
+    """Configurations that peak above this resident memory are not selected"""
+
+
+class WSCleanTrial(NamedTuple):
+    """The outcome of a single wsclean trial"""
+
+    settings: dict[str, Any]
+    """The tuned options used in the trial"""
+    success: bool
+    """Whether wsclean completed"""
+    wall_time: float
+    """Elapsed time of the trial, in seconds"""
+    max_rss_kb: int
+    """Peak resident memory of wsclean, in kilobytes"""
+    throughput: float
+    """Visibilities imaged per second"""
+
+
+class WSCleanTuningResult(NamedTuple):
+    """The tuned configuration for a type of node and image"""
+
+    key: str
+    """The host class, image size and channel count the configuration applies to"""
+    options: dict[str, Any]
+    """The best settings of the tuned options"""
+    trials: tuple[WSCleanTrial, ...]
+    """All trials that were run"""
+
+
+def get_host_class() -> str:
+    """Describe the type of node this process runs on. The host name with
+    its digits removed (e.g. ``nid001234`` becomes ``nid``) and the number
+    of allocated cores are used, unless ``FLINT_HOST_CLASS`` is set.
+
+    Returns:
+        str: The class of the host
+    """
+    host_class = get_environment_variable(HOST_CLASS_ENVIRONMENT_VARIABLE)
+    if host_class:
+        return host_class
+
+    hostname = gethostname().split(".")[0]
+    return f"{re.sub(r'[0-9]+', '', hostname) or 'host'}-{get_allocated_cores()}c"
+
+
+def get_tuning_key(size: int, channels_out: int, host_class: str | None = None) -> str:
+    """Create the key that a tuned configuration is stored under
+
+    Args:
+        size (int): The size of the image in pixels
+        channels_out (int): The number of output channels
+        host_class (Optional[str], optional): The class of host. If None ``get_host_class`` is used. Defaults to None.
+
+    Returns:
+        str: The key of the configuration
+    """
+    host_class = host_class if host_class else get_host_class()
+    return f"{host_class}/size{size}/channels{channels_out}"
+
+
+def _get_tuning_path(tuning_path: Path | None) -> Path | None:
+    if tuning_path is not None:
+        return Path(tuning_path)
+
+    value = get_environment_variable(TUNING_PATH_ENVIRONMENT_VARIABLE)
+    return Path(value) if value else None
+
+
+def _load_tuning_file(tuning_path: Path) -> dict[str, Any]:
+    if not tuning_path.exists():
+        return {}
+
+    try:
+        return json.loads(tuning_path.read_text())
+    except ValueError:
+        logger.warning(f"Unable to read {tuning_path}, ignoring. ")
+        return {}
+
+
+def save_tuning_result(
+    tuning_result: WSCleanTuningResult, tuning_path: Path | None = None
+) -> Path:
+    """Persist a tuned configuration, replacing any earlier configuration
+    with the same key.
+
+    Args:
+        tuning_result (WSCleanTuningResult): The configuration to persist
+        tuning_path (Optional[Path], optional): The JSON file to write to. If None ``FLINT_WSCLEAN_TUNING_PATH`` is used. Defaults to None.
+
+    Raises:
+        ValueError: Raised if no tuning file is specified
+
+    Returns:
+        Path: The tuning file written to
+    """
+    tuning_path = _get_tuning_path(tuning_path=tuning_path)
+    if tuning_path is None:
+        raise ValueError(
+            f"No tuning path provided and {TUNING_PATH_ENVIRONMENT_VARIABLE} unset"
+        )
+
+    tuning_path.parent.mkdir(parents=True, exist_ok=True)
+    with file_lock(lock_path=tuning_path.with_suffix(".lock")):
+        tunings = _load_tuning_file(tuning_path=tuning_path)
+        tunings[tuning_result.key] = dict(
+            options=tuning_result.options,
+            time=time(),
+            trials=[trial._asdict() for trial in tuning_result.trials],
+        )
+        tuning_path.write_text(json.dumps(tunings, indent=2))
+
+    logger.info(
+        f"Saved {tuning_result.options} as {tuning_result.key} in {tuning_path}"
+    )
+
+    return tuning_path
+
+
+def load_tuned_wsclean_options(
+    size: int,
+    channels_out: int,
+    tuning_path: Path | None = None,
+    host_class: str | None = None,
+) -> dict[str, Any] | None:
+    """Load the persisted configuration for this type of node and image
+
+    Args:
+        size (int): The size of the image in pixels
+        channels_out (int): The number of output channels
+        tuning_path (Optional[Path], optional): The JSON file configurations are persisted to. If None ``FLINT_WSCLEAN_TUNING_PATH`` is used. Defaults to None.
+        host_class (Optional[str], optional): The class of host. If None ``get_host_class`` is used. Defaults to None.
+
+    Returns:
+        Optional[Dict[str, Any]]: The tuned options, or None if there are none
+    """
+    tuning_path = _get_tuning_path(tuning_path=tuning_path)
+    if tuning_path is None:
+        return None
+
+    key = get_tuning_key(size=size, channels_out=channels_out, host_class=host_class)
+    entry = _load_tuning_file(tuning_path=tuning_path).get(key)
+
+    return dict(entry["options"]) if entry else None
+
+
+def apply_tuned_wsclean_options(
+    wsclean_options: WSCleanOptions,
+    set_options: dict[str, Any] | None = None,
+    tuning_path: Path | None = None,
+) -> WSCleanOptions:
+    """Update the tuned options of a ``WSCleanOptions`` with the persisted
+    configuration, if there is one. Options that have been explicitly set
+    are left untouched.
+
+    Args:
+        wsclean_options (WSCleanOptions): The options to update
+        set_options (Optional[Dict[str, Any]], optional): The options that were explicitly set, e.g. by the strategy. Defaults to None.
+        tuning_path (Optional[Path], optional): The JSON file configurations are persisted to. If None ``FLINT_WSCLEAN_TUNING_PATH`` is used. Defaults to None.
+
+    Returns:
+        WSCleanOptions: The updated options
+    """
+    set_options = set_options if set_options else {}
+    unset_options = [key for key in TUNED_WSCLEAN_OPTIONS if key not in set_options]
+    if not unset_options:
+        return wsclean_options
+
+    tuned_options = load_tuned_wsclean_options(
+        size=wsclean_options.size,
+        channels_out=wsclean_options.channels_out,
+        tuning_path=tuning_path,
+    )
+    if not tuned_options:
+        return wsclean_options
+
+    update_options = {
+        key: value for key, value in tuned_options.items() if key in unset_options
+    }
+    logger.info(f"Using tuned wsclean options {update_options}")
+
+    return wsclean_options.with_options(**update_options)
+
+
+def create_subset_ms(ms: MS, output_path: Path, max_timesteps: int = 4) -> MS:
+    """Copy the first few integrations of a measurement set into a new
+    measurement set, including its sub-tables
+
+    Args:
+        ms (MS): The measurement set to copy from
+        output_path (Path): Path of the new measurement set
+        max_timesteps (int, optional): The number of integrations to copy. Defaults to 4.
+
+    Returns:
+        MS: The subset measurement set
+    """
+    ms = MS.cast(ms)
+    with table(str(ms.path), ack=False) as tab:
+        times = np.unique(tab.getcol("TIME"))
+        last_time = float(times[min(max_timesteps, len(times)) - 1])
+        with tab.query(f"TIME <= {last_time!r}") as subset:
+            logger.info(f"Copying {len(subset)} rows of {ms.path} to {output_path}")
+            subset.copy(str(output_path), deep=True)
+
+    return ms.with_options(path=output_path)
+
+
+def _run_wsclean_trial(
+    ms: MS,
+    wsclean_container: Path,
+    update_wsclean_options: dict[str, Any],
+) -> tuple[float, int]:
+    """Image in a fresh process, so the peak memory of its children is
+    that of this wsclean invocation alone"""
+    start = monotonic()
+    wsclean_imager(
+        ms=ms,
+        wsclean_container=wsclean_container,
+        update_wsclean_options=update_wsclean_options,
+        make_cube_from_subbands=False,
+    )
+    wall_time = monotonic() - start
+
+    return wall_time, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+
+
+def get_trial_settings(
+    size: int, tuning_options: WSCleanTuningOptions
+) -> list[dict[str, Any]]:
+    """Create the grid of settings to trial
+
+    Args:
+        size (int): The size of the image in pixels
+        tuning_options (WSCleanTuningOptions): The values to trial
+
+    Returns:
+        List[Dict[str, Any]]: Each set of tuned options to trial
+    """
+    parallel_deconvolution = [
+        value
+        for value in tuning_options.parallel_deconvolution
+        if value is None or value < size
+    ]
+    return [
+        dict(zip(TUNED_WSCLEAN_OPTIONS, values))
+        for values in product(
+            parallel_deconvolution,
+            tuning_options.parallel_gridding,
+            tuning_options.abs_mem,
+            tuning_options.j,
+        )
+    ]
+
+
+def select_best_trial(
+    trials: list[WSCleanTrial] | tuple[WSCleanTrial, ...],
+    max_memory_kb: int | None = None,
+) -> WSCleanTrial | None:
+    """Select the trial with the highest throughput. Ties are broken by
+    the lowest peak memory.
+
+    Args:
+        trials (Union[List[WSCleanTrial], Tuple[WSCleanTrial, ...]]): The trials to consider
+        max_memory_kb (Optional[int], optional): Trials that peak above this memory are not considered. Defaults to None.
+
+    Returns:
+        Optional[WSCleanTrial]: The best trial, None if no trial is suitable
+    """
+    candidates = [
+        trial
+        for trial in trials
+        if trial.success
+        and (max_memory_kb is None or trial.max_rss_kb <= max_memory_kb)
+    ]
+    if not candidates:
+        return None
+
+    return max(candidates, key=lambda trial: (trial.throughput, -trial.max_rss_kb))
+
+
+def tune_wsclean(
+    ms: Path | MS,
+    wsclean_container: Path,
+    work_dir: Path,
+    update_wsclean_options: dict[str, Any] | None = None,
+    tuning_options: WSCleanTuningOptions | None = None,
+    tuning_path: Path | None = None,
+) -> WSCleanTuningResult:
+    """Run wsclean trials across a grid of parallelism settings against a
+    subset of a measurement set, and persist the fastest configuration for
+    this type of node, image size and channel count.
+
+    Args:
+        ms (Union[Path, MS]): The measurement set to draw the subset from
+        wsclean_container (Path): Path to the container with wsclean installed
+        work_dir (Path): Directory the subset measurement set and trial images are written to. These are removed afterwards.
+        update_wsclean_options (Optional[Dict[str, Any]], optional): Options that the trials image with, e.g. the size and channels of the imaging to tune for. Defaults to None.
+        tuning_options (Optional[WSCleanTuningOptions], optional): The grid of settings to trial. Defaults to None.
+        tuning_path (Optional[Path], optional): The JSON file to persist the configuration to. If None ``FLINT_WSCLEAN_TUNING_PATH`` is used, and if that is unset the configuration is not persisted. Defaults to None.
+
+    Returns:
+        WSCleanTuningResult: The best configuration and all trials
+    """
+    ms = MS.cast(ms)
+    ms = ms if ms.column else ms.with_options(column="DATA")
+    tuning_options = tuning_options if tuning_options else WSCleanTuningOptions()
+    wsclean_options = WSCleanOptions().with_options(**(update_wsclean_options or {}))
+
+    work_dir = Path(work_dir)
+    work_dir.mkdir(parents=True, exist_ok=True)
+    subset_ms = create_subset_ms(
+        ms=ms,
+        output_path=work_dir / f"tune_{ms.path.name}",
+        max_timesteps=tuning_options.max_timesteps,
+    )
+    with table(str(subset_ms.path), ack=False) as tab:
+        visibilities = len(tab) * tab.getcell("DATA", 0).shape[0]
+
+    trial_settings = get_trial_settings(
+        size=wsclean_options.size, tuning_options=tuning_options
+    )
+    logger.info(f"Running {len(trial_settings)} wsclean trials on {subset_ms.path}")
+
+    trials = []
+    spawn_context = multiprocessing.get_context("spawn")
+    for idx, settings in enumerate(trial_settings):
+        logger.info(f"Trial {idx + 1} of {len(trial_settings)}: {settings}")
+        trial_options = {
+            **wsclean_options._asdict(),
+            **settings,
+            "niter": min(wsclean_options.niter, tuning_options.niter),
+            "temp_dir": None,
+        }
+        try:
+            with ProcessPoolExecutor(max_workers=1, mp_context=spawn_context) as pool:
+                wall_time, max_rss_kb = pool.submit(
+                    _run_wsclean_trial,
+                    subset_ms,
+                    wsclean_container,
+                    trial_options,
+                ).result()
+            trial = WSCleanTrial(
+                settings=settings,
+                success=True,
+                wall_time=wall_time,
+                max_rss_kb=max_rss_kb,
+                throughput=visibilities / wall_time,
+            )
+        except Exception as e:
+            logger.warning(f"Trial with {settings} failed: {e}")
+            trial = WSCleanTrial(
+                settings=settings,
+                success=False,
+                wall_time=0.0,
+                max_rss_kb=0,
+                throughput=0.0,
+            )
+        logger.info(f"{trial}")
+        trials.append(trial)
+
+        for path in work_dir.iterdir():
+            if path != subset_ms.path:
+                remove_files_folders(path)
+
+    remove_files_folders(subset_ms.path)
+
+    best_trial = select_best_trial(
+        trials=trials, max_memory_kb=tuning_options.max_memory_kb
+    )
+    tuning_result = WSCleanTuningResult(
+        key=get_tuning_key(
+            size=wsclean_options.size, channels_out=wsclean_options.channels_out
+        ),
+        options=best_trial.settings if best_trial else {},
+        trials=tuple(trials),
+    )
+
+    if best_trial is None:
+        logger.warning("No successful wsclean trial, nothing to persist. ")
+    elif _get_tuning_path(tuning_path=tuning_path):
+        save_tuning_result(tuning_result=tuning_result, tuning_path=tuning_path)
+
+    return tuning_result
+
+
+def get_parser() -> ArgumentParser:
+    parser = ArgumentParser(description=__doc__)
+
+    parser.add_argument(
+        "ms", type=Path, help="The measurement set to draw the trial subset from"
+    )
+    parser.add_argument(
+        "--wsclean-container",
+        type=Path,
+        required=True,
+        help="Path to a singularity container with wsclean installed",
+    )
+    parser.add_argument(
+        "--work-dir",
+        type=Path,
+        default=Path("wsclean_tuning"),
+        help="Directory to run the trials in",
+    )
+    parser.add_argument(
+        "--tuning-path",
+        type=Path,
+        default=None,
+        help=f"The JSON file to persist the configuration to. Defaults to ${TUNING_PATH_ENVIRONMENT_VARIABLE}",
+    )
+    parser.add_argument(
+        "--size", type=int, default=None, help="The image size to tune for"
+    )
+    parser.add_argument(
+        "--channels-out",
+        type=int,
+        default=None,
+        help="The number of output channels to tune for",
+    )
+
+    return parser
+
+
+def cli() -> None:
+    parser = get_parser()
+
+    args = parser.parse_args()
+
+    update_wsclean_options = {
+        key: value
+        for key, value in dict(size=args.size, channels_out=args.channels_out).items()
+        if value is not None
+    }
+    tuning_result = tune_wsclean(
+        ms=args.ms,
+        wsclean_container=args.wsclean_container,
+        work_dir=args.work_dir,
+        update_wsclean_options=update_wsclean_options,
+        tuning_path=args.tuning_path,
+    )
+    logger.info(f"Best configuration for {tuning_result.key}: {tuning_result.options}")
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,260 @@
+"""Turn the streamed output of ``wsclean`` into structured progress events.
+
+``wsclean`` announces each stage of imaging with a banner line (e.g.
+``== Constructing PSF ==`` or ``== Deconvolving (3) ==``), reports the peak
+residual as the minor cycle progresses (``Iteration 1200, scale 0 px : 1.2
+mJy at 10,20``) and finishes with a summary of the time spent inverting,
+predicting and deconvolving. ``WSCleanProgressParser`` is fed each line of
+output and builds a timeline of events from these, which may also be written
+as JSON-lines as they happen. This profiles each imaging run without having
+to re-run anything.
+"""
+
+from __future__ import annotations
+
+import json
+import re
+from pathlib import Path
+from time import monotonic
+from typing import Any, Callable, Literal, NamedTuple, TextIO
+
+from flint.logging import logger
+
+ProgressKind = Literal[
+    "phase_start", "phase_end", "major_iteration", "clean_iteration", "summary"
+]
+"""The kinds of progress events"""
+
+PHASE_PATTERNS: tuple[tuple[str, re.Pattern], ...] = (
+    ("reordering", re.compile(r"^Reordering .* into")),
+    ("psf", re.compile(r"==\s*Constructing PSF\s*==")),
+    ("inversion", re.compile(r"==\s*Constructing image\s*==")),
+    ("deconvolution", re.compile(r"==\s*Deconvolving \((?P<major>\d+)\)\s*==")),
+    ("prediction", re.compile(r"==\s*Converting model image to visibilities\s*==")),
+    ("restoring", re.compile(r"^Rendering sources to restored image")),
+)
+"""Lines that mark the start of a phase of wsclean, in the order they usually appear"""
+CLEAN_ITERATION_PATTERN = re.compile(
+    r"Iteration\s+(?P<iteration>\d+)(?:,\s*scale\s+\d+\s*px)?\s*:\s*"
+    r"(?P<peak>[-+]?[\d.]+(?:[eE][-+]?\d+)?)\s*(?P<unit>KJy|Jy|mJy|µJy|uJy|nJy)"
+)
+"""A minor cycle progress line, reporting the number of components and current peak residual"""
+CLEAN_STOP_PATTERN = re.compile(
+    r"Stopped on peak\s+(?P<peak>[-+]?[\d.]+(?:[eE][-+]?\d+)?)\s*(?P<unit>KJy|Jy|mJy|µJy|uJy|nJy)"
+)
+"""The line reporting the peak residual at the end of a minor cycle"""
+SUMMARY_PATTERN = re.compile(
+    r"(?P<phase>Inversion|prediction|deconvolution):\s*(?P<hours>\d+):(?P<minutes>\d+):(?P<seconds>[\d.]+)"
+)
+"""The time spent per phase, as summarised by wsclean once it has finished"""
+FLUX_UNITS = {"KJy": 1e3, "Jy": 1.0, "mJy": 1e-3, "µJy": 1e-6, "uJy": 1e-6, "nJy": 1e-9}
+"""Scaling of the flux units wsclean reports to Jy"""
+
+
+class WSCleanProgressEvent(NamedTuple):
+    """A single event in the progress of a wsclean run"""
+
+    kind: ProgressKind
+    """The type of event"""
+    elapsed_seconds: float
+    """Seconds since the first line of output was seen"""
+    phase: str | None = None
+    """The phase of wsclean the event belongs to"""
+    major_iteration: int | None = None
+    """The major iteration being performed"""
+    component_count: int | None = None
+    """The number of minor cycle iterations (clean components) performed so far"""
+    peak_residual_jy: float | None = None
+    """The current peak residual, in Jy"""
+    duration_seconds: float | None = None
+    """For ``phase_end`` and ``summary`` events, the time spent in the phase"""
+
+    def to_dict(self) -> dict[str, Any]:
+        """Convert to a JSON serialisable dictionary"""
+        return self._asdict()
+
+
+def _to_jy(peak: str, unit: str) -> float:
+    return float(peak) * FLUX_UNITS[unit]
+
+
+class WSCleanProgressParser:
+    """Build a timeline of progress events from the lines wsclean outputs.
+    Instances are callable, and intended to be used as (part of) the stream
+    callback of ``run_singularity_command``.
+    """
+
+    def __init__(
+        self,
+        jsonl_path: Path | None = None,
+        clock: Callable[[], float] = monotonic,
+    ) -> None:
+        """Create a parser of wsclean output
+
+        Args:
+            jsonl_path (Optional[Path], optional): If provided each event is appended to this file as a JSON-line as it happens. It may also be set after creation, before the first line is parsed. Defaults to None.
+            clock (Callable[[], float], optional): Returns the current time in seconds. Defaults to ``time.monotonic``.
+        """
+        self.jsonl_path = Path(jsonl_path) if jsonl_path else None
+        self.clock = clock
+
+        self.events: list[WSCleanProgressEvent] = []
+        self._start: float | None = None
+        self._phase: str | None = None
+        self._phase_start: float = 0.0
+        self._major_iteration: int | None = None
+        self._component_count: int | None = None
+        self._jsonl_file: TextIO | None = None
+
+    @property
+    def timeline(self) -> tuple[WSCleanProgressEvent, ...]:
+        """The events seen so far"""
+        return tuple(self.events)
+
+    def _elapsed(self) -> float:
+        now = self.clock()
+        if self._start is None:
+            self._start = now
+        return now - self._start
+
+    def _add(self, event: WSCleanProgressEvent) -> None:
+        self.events.append(event)
+        if self.jsonl_path and self._jsonl_file is None:
+            self.jsonl_path.parent.mkdir(parents=True, exist_ok=True)
+            self._jsonl_file = open(self.jsonl_path, "a")
+        if self._jsonl_file:
+            self._jsonl_file.write(json.dumps(event.to_dict()) + "\n")
+            self._jsonl_file.flush()
+
+    def _end_phase(self, elapsed: float) -> None:
+        if self._phase is None:
+            return
+        self._add(
+            WSCleanProgressEvent(
+                kind="phase_end",
+                elapsed_seconds=elapsed,
+                phase=self._phase,
+                major_iteration=self._major_iteration,
+                duration_seconds=elapsed - self._phase_start,
+            )
+        )
+        self._phase = None
+
+    def _start_phase(self, phase: str, elapsed: float) -> None:
+        self._end_phase(elapsed=elapsed)
+        self._phase = phase
+        self._phase_start = elapsed
+        self._add(
+            WSCleanProgressEvent(
+                kind="phase_start",
+                elapsed_seconds=elapsed,
+                phase=phase,
+                major_iteration=self._major_iteration,
+            )
+        )
+
+    def __call__(self, line: str) -> None:
+        """Parse a single line of wsclean output
+
+        Args:
+            line (str): The line of output
+        """
+        elapsed = self._elapsed()
+        line = line.strip()
+
+        for phase, pattern in PHASE_PATTERNS:
+            match = pattern.search(line)
+            if match is None:
+                continue
+            if phase != self._phase:
+                self._end_phase(elapsed=elapsed)
+            if phase == "deconvolution":
+                self._major_iteration = int(match.group("major"))
+            if phase != self._phase:
+                self._start_phase(phase=phase, elapsed=elapsed)
+            if phase == "deconvolution":
+                self._add(
+                    WSCleanProgressEvent(
+                        kind="major_iteration",
+                        elapsed_seconds=elapsed,
+                        phase=phase,
+                        major_iteration=self._major_iteration,
+                        component_count=self._component_count,
+                    )
+                )
+            return
+
+        if match := CLEAN_ITERATION_PATTERN.search(line):
+            self._component_count = int(match.group("iteration"))
+            peak_residual_jy = _to_jy(match.group("peak"), match.group("unit"))
+        elif match := CLEAN_STOP_PATTERN.search(line):
+            peak_residual_jy = _to_jy(match.group("peak"), match.group("unit"))
+        else:
+            summaries = SUMMARY_PATTERN.findall(line)
+            for phase, hours, minutes, seconds in summaries:
+                self._add(
+                    WSCleanProgressEvent(
+                        kind="summary",
+                        elapsed_seconds=elapsed,
+                        phase=phase.lower(),
+                        duration_seconds=3600 * int(hours)
+                        + 60 * int(minutes)
+                        + float(seconds),
+                    )
+                )
+            return
+
+        self._add(
+            WSCleanProgressEvent(
+                kind="clean_iteration",
+                elapsed_seconds=elapsed,
+                phase=self._phase,
+                major_iteration=self._major_iteration,
+                component_count=self._component_count,
+                peak_residual_jy=peak_residual_jy,
+            )
+        )
+
+    def phase_durations(self) -> dict[str, float]:
+        """The total time spent in each phase, as measured from the output
+
+        Returns:
+            dict[str, float]: Seconds spent per phase
+        """
+        durations: dict[str, float] = {}
+        for event in self.events:
+            if event.kind == "phase_end" and event.phase:
+                durations[event.phase] = (
+                    durations.get(event.phase, 0.0) + event.duration_seconds  # type: ignore[operator]
+                )
+        return durations
+
+    def close(self) -> None:
+        """End the current phase, log the time spent per phase and close the JSON-lines file"""
+        if self._start is not None:
+            self._end_phase(elapsed=self._elapsed())
+        if self._jsonl_file:
+            self._jsonl_file.close()
+            self._jsonl_file = None
+
+        durations = self.phase_durations()
+        if durations:
+            logger.info(
+                "wsclean time per phase: "
+                + ", ".join(f"{phase}={secs:.1f}s" for phase, secs in durations.items())
+            )
+
+
+def load_wsclean_progress(jsonl_path: Path) -> tuple[WSCleanProgressEvent, ...]:
+    """Read the progress events written by a ``WSCleanProgressParser``
+
+    Args:
+        jsonl_path (Path): The JSON-lines file of progress events
+
+    Returns:
+        tuple[WSCleanProgressEvent, ...]: The events of the file
+    """
+    with open(jsonl_path) as in_file:
+        return tuple(
+            WSCleanProgressEvent(**json.loads(line)) for line in in_file if line.strip()
+        )
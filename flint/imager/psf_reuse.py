@@ -0,0 +1,278 @@
+"""Carry the PSF images of one wsclean run forward to a later run.
+
+Between rounds of self-calibration only the gains applied to the data change.
+The PSF depends on the uv-coverage, the flags and weights of the visibilities,
+and the image geometry and weighting options, so on the same beam it is
+typically identical from round to round. ``wsclean`` can skip gridding the PSF
+and read it from an earlier run with ``-reuse-psf <prefix>``.
+
+Here the PSF products of a run are kept alongside a small JSON file recording
+the ``wsclean`` options that shape the PSF and a token computed from the
+contents of the UVW, FLAG and weight columns. A later run only reuses the
+PSF when both match. As the token is computed from the column values (rather
+than the storage files, which each round of self-calibration rewrites) it is
+stable across the copies of a measurement set made by each round. Should a
+round flag additional data (e.g. when applying solutions that were flagged)
+the token changes and the PSF is gridded again.
+
+The columns are read in chunks of rows and hashed in full, so a change to
+the flags or weights of any row is seen. The token is computed once for
+each run of ``wsclean`` and used both to check and to record the PSF.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, NamedTuple
+
+import numpy as np
+from casacore.tables import table
+
+from flint.logging import logger
+from flint.options import MS
+from flint.utils import remove_files_folders
+
+if TYPE_CHECKING:
+    from flint.imager.wsclean import WSCleanOptions
+
+PSF_KEY_OPTIONS = (
+    "size",
+    "scale",
+    "channels_out",
+    "channel_range",
+    "weight",
+    "minuv_l",
+    "minuvw_m",
+    "maxw",
+    "gridder",
+    "nwlayers",
+    "wgridder_accuracy",
+    "no_small_inversion",
+    "join_channels",
+    "no_mf_weighting",
+    "beam_fitting_size",
+)
+"""The wsclean options that shape the PSF. These have to be unchanged for a PSF to be reused"""
+PSF_METADATA_SUFFIX = ".psf.json"
+"""Suffix added to the wsclean -name prefix of the file describing kept PSF products"""
+PSF_TOKEN_COLUMNS = ("UVW", "FLAG", "WEIGHT_SPECTRUM", "WEIGHT")
+"""The main table columns whose values the PSF depends on"""
+PSF_TOKEN_CHUNK_ROWS = 100_000
+"""The number of rows of the main table read at a time to compute the visibility token"""
+
+
+class PSFProducts(NamedTuple):
+    """Description of a set of PSF images kept for reuse"""
+
+    prefix: str
+    """The wsclean prefix of the PSF images, as provided to ``-reuse-psf``"""
+    psf_images: tuple[Path, ...]
+    """The PSF images themselves"""
+    key_options: dict[str, Any]
+    """The wsclean options that shaped the PSF"""
+    visibility_token: str
+    """Describes the uv-coverage, flags and weights of the imaged measurement set"""
+
+    def to_dict(self) -> dict[str, Any]:
+        """Convert to a JSON serialisable dictionary"""
+        return dict(
+            prefix=self.prefix,
+            psf_images=[str(psf_image) for psf_image in self.psf_images],
+            key_options=self.key_options,
+            visibility_token=self.visibility_token,
+        )
+
+
+def get_psf_metadata_path(prefix: str | Path) -> Path:
+    """The path of the file describing the PSF products of a wsclean run
+
+    Args:
+        prefix (Union[str, Path]): The wsclean -name prefix of the run
+
+    Returns:
+        Path: Location of the metadata file
+    """
+    return Path(f"{prefix!s}{PSF_METADATA_SUFFIX}")
+
+
+def get_psf_key_options(wsclean_options: WSCleanOptions) -> dict[str, Any]:
+    """Extract the wsclean options that shape the PSF
+
+    Args:
+        wsclean_options (WSCleanOptions): The options wsclean will be run with
+
+    Returns:
+        dict[str, Any]: The subset of options, JSON serialisable
+    """
+    options = wsclean_options._asdict()
+    return {
+        key: list(options[key]) if isinstance(options[key], tuple) else options[key]
+        for key in PSF_KEY_OPTIONS
+    }
+
+
+def get_visibility_token(ms: MS | Path, chunk_size: int = PSF_TOKEN_CHUNK_ROWS) -> str:
+    """Describe the values of the columns the PSF depends on. The token is
+    computed from every row of the uv-coordinates, flags and weights, and
+    the channel frequencies, of the measurement set. It is the same for
+    identical copies.
+
+    Args:
+        ms (Union[MS, Path]): The measurement set to inspect
+        chunk_size (int, optional): Number of rows read at a time. Defaults to PSF_TOKEN_CHUNK_ROWS.
+
+    Returns:
+        str: A hex digest describing the columns
+    """
+    ms = MS.cast(ms)
+
+    with table(str(ms.path / "SPECTRAL_WINDOW"), readonly=True, ack=False) as tab:
+        chan_freqs = tab.getcol("CHAN_FREQ")
+
+    digest = hashlib.sha256(np.ascontiguousarray(chan_freqs).tobytes())
+    with table(str(ms.path), readonly=True, ack=False) as tab:
+        nrows = tab.nrows()
+        digest.update(f"{nrows}".encode())
+        columns = [column for column in PSF_TOKEN_COLUMNS if column in tab.colnames()]
+        for column in columns:
+            digest.update(column.encode())
+            for start_row in range(0, nrows, chunk_size):
+                values = tab.getcol(
+                    column, startrow=start_row, nrow=min(chunk_size, nrows - start_row)
+                )
+                if values.dtype == bool:
+                    # Pack each row separately so the token does not depend on chunk_size
+                    values = np.packbits(values.reshape(values.shape[0], -1), axis=1)
+                digest.update(np.ascontiguousarray(values).tobytes())
+
+    return digest.hexdigest()
+
+
+def load_psf_products(metadata_path: Path) -> PSFProducts | None:
+    """Load the description of kept PSF products
+
+    Args:
+        metadata_path (Path): The metadata file written alongside the PSF images
+
+    Returns:
+        Optional[PSFProducts]: The kept PSF products, or None if the file is missing or malformed
+    """
+    try:
+        metadata = json.loads(Path(metadata_path).read_text())
+        return PSFProducts(
+            prefix=str(metadata["prefix"]),
+            psf_images=tuple(Path(p) for p in metadata["psf_images"]),
+            key_options=dict(metadata["key_options"]),
+            visibility_token=str(metadata["visibility_token"]),
+        )
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def record_psf_products(
+    prefix: str | Path,
+    ms: MS | Path,
+    wsclean_options: WSCleanOptions,
+    visibility_token: str | None = None,
+) -> Path | None:
+    """Describe the PSF images created by a wsclean run so that they may be
+    reused by a later run.
+
+    Args:
+        prefix (Union[str, Path]): The wsclean -name prefix, where the images now reside
+        ms (Union[MS, Path]): The measurement set that was imaged
+        wsclean_options (WSCleanOptions): The options wsclean was run with
+        visibility_token (Optional[str], optional): A token of the measurement set already computed with ``get_visibility_token``. If None it is computed. Defaults to None.
+
+    Returns:
+        Optional[Path]: The written metadata file, or None if no PSF images were found
+    """
+    # Imported here to avoid a circular import
+    from flint.imager.wsclean import get_wsclean_output_names
+
+    psf_images = get_wsclean_output_names(
+        prefix=str(prefix),
+        subbands=wsclean_options.channels_out,
+        output_types=("image", "psf"),
+        check_exists_when_adding=True,
+    ).psf
+    if not psf_images:
+        logger.warning(f"No PSF images found for {prefix=}, not recording")
+        return None
+
+    psf_products = PSFProducts(
+        prefix=str(prefix),
+        psf_images=tuple(psf_images),
+        key_options=get_psf_key_options(wsclean_options=wsclean_options),
+        visibility_token=(
+            visibility_token if visibility_token else get_visibility_token(ms=ms)
+        ),
+    )
+    metadata_path = get_psf_metadata_path(prefix=prefix)
+    metadata_path.write_text(json.dumps(psf_products.to_dict(), indent=2))
+    logger.info(f"Recorded {len(psf_images)} PSF images in {metadata_path}")
+
+    return metadata_path
+
+
+def check_psf_reuse(
+    psf_products: PSFProducts,
+    ms: MS | Path,
+    wsclean_options: WSCleanOptions,
+    visibility_token: str | None = None,
+) -> bool:
+    """Check whether kept PSF products are valid for a new wsclean run. The
+    image geometry and weighting options, and the uv-coverage, flags and
+    weights of the measurement set, all have to be unchanged.
+
+    Args:
+        psf_products (PSFProducts): The PSF products kept from an earlier run
+        ms (Union[MS, Path]): The measurement set about to be imaged
+        wsclean_options (WSCleanOptions): The options wsclean will be run with
+        visibility_token (Optional[str], optional): A token of the measurement set already computed with ``get_visibility_token``. If None it is computed. Defaults to None.
+
+    Returns:
+        bool: Whether the PSF products may be reused
+    """
+    missing = [p for p in psf_products.psf_images if not p.exists()]
+    if missing:
+        logger.info(f"PSF images {missing} no longer exist, not reusing")
+        return False
+
+    key_options = get_psf_key_options(wsclean_options=wsclean_options)
+    changed = {
+        key: (psf_products.key_options.get(key), value)
+        for key, value in key_options.items()
+        if psf_products.key_options.get(key) != value
+    }
+    if changed:
+        logger.info(f"PSF shaping options have changed, not reusing: {changed}")
+        return False
+
+    if visibility_token is None:
+        visibility_token = get_visibility_token(ms=ms)
+    if psf_products.visibility_token != visibility_token:
+        logger.info(
+            f"uv-coverage, flags or weights of {MS.cast(ms).path} have changed, not reusing PSF"
+        )
+        return False
+
+    logger.info(f"Reusing PSF images with {psf_products.prefix=}")
+    return True
+
+
+def remove_psf_products(metadata_path: Path) -> list[Path]:
+    """Remove kept PSF images and the file describing them
+
+    Args:
+        metadata_path (Path): The metadata file written alongside the PSF images
+
+    Returns:
+        list[Path]: The files that were removed
+    """
+    psf_products = load_psf_products(metadata_path=metadata_path)
+    psf_images = psf_products.psf_images if psf_products else ()
+
+    return remove_files_folders(*psf_images, metadata_path)
@@ -0,0 +1,391 @@
+"""A lightweight, native quick-look imager.
+
+This is not a replacement for ``wsclean``. It is intended to produce a low
+resolution, naturally weighted, dirty multi-frequency synthesis (MFS) image
+of a measurement set in seconds, so that problems with flagging or calibration
+can be spotted early without launching a container.
+
+To keep it quick the measurement set is read in chunks of rows, optionally
+keeping only every ``row_stride``-th row, and channels are averaged into
+blocks. The stokes-I visibilities (the average of the parallel hands) are
+gridded onto a regular ``uv``-grid with nearest-neighbour assignment, and
+inverted with an FFT. No w-term correction or deconvolution is performed.
+"""
+
+from __future__ import annotations
+
+from argparse import ArgumentParser
+from pathlib import Path
+from time import perf_counter
+from typing import NamedTuple
+
+import astropy.units as u
+import numpy as np
+from astropy.io import fits
+from casacore.tables import table
+
+from flint.exceptions import MSError
+from flint.logging import logger
+from flint.ms import (
+    check_column_in_ms,
+    get_freqs_from_ms,
+    get_parallel_hand_mask,
+    get_phase_dir_from_ms,
+)
+from flint.options import MS, BaseOptions
+
+SPEED_OF_LIGHT = 299792458.0
+"""The speed of light in meters per second"""
+
+
+class QuickLookOptions(BaseOptions):
+    """Options that control the native quick-look imager"""
+
+    data_column: str | None = None
+    """The column to image. If None the column nominated by the MS is used, falling back to ``DATA``"""
+    size: int = 512
+    """The number of pixels along each side of the image"""
+    cell_arcsec: float | None = None
+    """The size of a pixel in arcseconds. If None it is set to sample the longest gridded baseline by three pixels"""
+    max_uv_lambda: float | None = 5000.0
+    """Baselines longer than this, in wavelengths, are not gridded. If None all baselines that fit on the grid are used"""
+    row_stride: int = 1
+    """Only every ``row_stride``-th row of the measurement set is read"""
+    channel_average: int = 16
+    """The number of channels averaged together before gridding"""
+    chunk_size: int = 20000
+    """The number of rows read from the measurement set at a time"""
+
+
+class QuickLookResult(NamedTuple):
+    """Summary of a quick-look image"""
+
+    image_path: Path
+    """Path to the dirty image FITS file"""
+    ms: MS
+    """The measurement set that was imaged"""
+    cell_arcsec: float
+    """The pixel size of the image, in arcseconds"""
+    gridded_visibilities: int
+    """The number of averaged visibilities that were gridded"""
+    peak: float
+    """The peak value of the dirty image, in Jy/beam"""
+    rms: float
+    """A robust estimate of the noise of the dirty image, in Jy/beam"""
+    elapsed_seconds: float
+    """The wall time spent reading, gridding and writing the image"""
+
+
+def get_quicklook_image_path(ms_path: Path) -> Path:
+    """Generate the default output path of a quick-look image
+
+    Args:
+        ms_path (Path): The measurement set being imaged
+
+    Returns:
+        Path: The output path of the FITS image
+    """
+    return ms_path.with_suffix(".quicklook.fits")
+
+
+def get_quicklook_cell_arcsec(max_uv_lambda: float, oversample: float = 3.0) -> float:
+    """Derive a pixel size that samples the resolution of the longest baseline
+
+    Args:
+        max_uv_lambda (float): The longest baseline, in wavelengths
+        oversample (float, optional): The number of pixels across the resolution element. Defaults to 3.0.
+
+    Returns:
+        float: The pixel size, in arcseconds
+    """
+    return float((1.0 / (oversample * max_uv_lambda) * u.rad).to(u.arcsec).value)
+
+
+def grid_visibilities(
+    grid: np.ndarray,
+    u_lambda: np.ndarray,
+    v_lambda: np.ndarray,
+    vis: np.ndarray,
+    weights: np.ndarray,
+    cell_rad: float,
+) -> tuple[int, float]:
+    """Add visibilities, and their Hermitian conjugates, onto a ``uv``-grid
+    with nearest-neighbour assignment. The ``u`` axis is flipped so that the
+    right ascension of the resulting image decreases along its first axis.
+
+    Args:
+        grid (np.ndarray): The square, complex grid that is updated in place
+        u_lambda (np.ndarray): The u coordinate of each visibility, in wavelengths
+        v_lambda (np.ndarray): The v coordinate of each visibility, in wavelengths
+        vis (np.ndarray): The visibilities to grid, already multiplied by their weights
+        weights (np.ndarray): The weight of each visibility
+        cell_rad (float): The pixel size of the image, in radians
+
+    Returns:
+        tuple[int, float]: The number of visibilities gridded, and the sum of the weights placed on the grid
+    """
+    size = grid.shape[0]
+    delta_uv = 1.0 / (size * cell_rad)
+    centre = size // 2
+
+    iu = np.rint(-u_lambda / delta_uv).astype(int)
+    iv = np.rint(v_lambda / delta_uv).astype(int)
+    # Both (iu, iv) and its conjugate (-iu, -iv) must fit on the grid
+    on_grid = (np.abs(iu) < centre) & (np.abs(iv) < centre)
+    iu, iv, vis = iu[on_grid], iv[on_grid], vis[on_grid]
+
+    flat_grid = grid.reshape(-1)
+    for sign, values in ((1, vis), (-1, np.conj(vis))):
+        index = (centre + sign * iv) * size + (centre + sign * iu)
+        flat_grid += np.bincount(
+            index, weights=values.real, minlength=flat_grid.size
+        ) + 1j * np.bincount(index, weights=values.imag, minlength=flat_grid.size)
+
+    return int(np.sum(on_grid)), 2.0 * float(np.sum(weights[on_grid]))
+
+
+def create_quicklook_header(
+    ms: MS, size: int, cell_arcsec: float, freqs: np.ndarray
+) -> fits.Header:
+    """Create the FITS header of a quick-look image, with a SIN projection
+    centred on the phase direction of the measurement set.
+
+    Args:
+        ms (MS): The measurement set being imaged
+        size (int): The number of pixels along each side of the image
+        cell_arcsec (float): The pixel size, in arcseconds
+        freqs (np.ndarray): The frequencies that were imaged, in Hz
+
+    Returns:
+        fits.Header: The header describing the image
+    """
+    phase_dir = get_phase_dir_from_ms(ms=ms)
+    cell_deg = cell_arcsec / 3600.0
+
+    header = fits.Header()
+    header["BUNIT"] = "Jy/beam"
+    header["BTYPE"] = "Intensity"
+    header["CTYPE1"] = "RA---SIN"
+    header["CRPIX1"] = size // 2 + 1
+    header["CRVAL1"] = phase_dir.ra.deg
+    header["CDELT1"] = -cell_deg
+    header["CUNIT1"] = "deg"
+    header["CTYPE2"] = "DEC--SIN"
+    header["CRPIX2"] = size // 2 + 1
+    header["CRVAL2"] = phase_dir.dec.deg
+    header["CDELT2"] = cell_deg
+    header["CUNIT2"] = "deg"
+    header["CTYPE3"] = "FREQ"
+    header["CRPIX3"] = 1
+    header["CRVAL3"] = float(np.mean(freqs))
+    header["CDELT3"] = float(np.ptp(freqs)) if len(freqs) > 1 else 1.0
+    header["CUNIT3"] = "Hz"
+    header["CTYPE4"] = "STOKES"
+    header["CRPIX4"] = 1
+    header["CRVAL4"] = 1
+    header["CDELT4"] = 1
+    header["RADESYS"] = "FK5"
+    header["EQUINOX"] = 2000.0
+    header["ORIGIN"] = "flint quick-look imager"
+
+    return header
+
+
+def create_quicklook_image(
+    ms: MS | Path,
+    quicklook_options: QuickLookOptions | None = None,
+    output_path: Path | None = None,
+) -> QuickLookResult:
+    """Create a naturally weighted, dirty MFS image of a measurement set.
+
+    Each unflagged parallel-hand sample is given equal weight.
+
+    Args:
+        ms (Union[MS, Path]): The measurement set to image
+        quicklook_options (Optional[QuickLookOptions], optional): Options controlling the imaging. If None the defaults are used. Defaults to None.
+        output_path (Optional[Path], optional): Where to write the FITS image. If None it is derived from the measurement set name. Defaults to None.
+
+    Raises:
+        MSError: Raised when the data column is missing or nothing could be gridded
+
+    Returns:
+        QuickLookResult: The path to the image and some summary statistics
+    """
+    ms = MS.cast(ms)
+    quicklook_options = quicklook_options if quicklook_options else QuickLookOptions()
+    data_column = quicklook_options.data_column or ms.column or "DATA"
+    if not check_column_in_ms(ms=ms, column=data_column):
+        raise MSError(f"{data_column=} not found in {ms.path}")
+
+    output_path = output_path if output_path else get_quicklook_image_path(ms.path)
+    size = quicklook_options.size
+    stride = quicklook_options.row_stride
+    chunk_size = quicklook_options.chunk_size
+
+    start_time = perf_counter()
+    freqs = get_freqs_from_ms(ms=ms)
+    channel_starts = np.arange(0, len(freqs), quicklook_options.channel_average)
+    channel_counts = np.diff(np.append(channel_starts, len(freqs)))
+    block_freqs = np.add.reduceat(freqs, channel_starts) / channel_counts
+    parallel_hands = get_parallel_hand_mask(ms=ms)
+
+    with table(str(ms.path), readonly=True, ack=False) as tab:
+        nrows = tab.nrows()
+        selected_rows = int(np.ceil(nrows / stride))
+
+        cell_arcsec = quicklook_options.cell_arcsec
+        if cell_arcsec is None:
+            uvw = tab.getcol("UVW", rowincr=stride)
+            max_uv_lambda = np.max(np.hypot(uvw[:, 0], uvw[:, 1])) * (
+                np.max(freqs) / SPEED_OF_LIGHT
+            )
+            if quicklook_options.max_uv_lambda is not None:
+                max_uv_lambda = min(max_uv_lambda, quicklook_options.max_uv_lambda)
+            cell_arcsec = get_quicklook_cell_arcsec(max_uv_lambda=max_uv_lambda)
+        cell_rad = float((cell_arcsec * u.arcsec).to(u.rad).value)
+
+        logger.info(
+            f"Quick-look imaging {data_column=} of {ms.path}, {selected_rows} of {nrows} rows, "
+            f"{len(block_freqs)} channel blocks, {size=} {cell_arcsec=:.2f}"
+        )
+
+        grid = np.zeros((size, size), dtype=np.complex128)
+        total_weight = 0.0
+        gridded_visibilities = 0
+        for chunk_start in range(0, selected_rows, chunk_size):
+            read_kwargs = dict(
+                startrow=chunk_start * stride,
+                nrow=min(chunk_size, selected_rows - chunk_start),
+                rowincr=stride,
+            )
+            uvw = tab.getcol("UVW", **read_kwargs)
+            valid = ~tab.getcol("FLAG", **read_kwargs)[..., parallel_hands]
+            data = tab.getcol(data_column, **read_kwargs)[..., parallel_hands]
+            data = np.where(valid & np.isfinite(data), data, 0.0)
+
+            # Sum the stokes-I estimates of each channel block, and count them
+            vis = np.add.reduceat(data.sum(axis=-1), channel_starts, axis=1)
+            weights = np.add.reduceat(valid.sum(axis=-1), channel_starts, axis=1)
+
+            u_lambda = uvw[:, 0:1] * block_freqs[None, :] / SPEED_OF_LIGHT
+            v_lambda = uvw[:, 1:2] * block_freqs[None, :] / SPEED_OF_LIGHT
+            keep = weights > 0
+            if quicklook_options.max_uv_lambda is not None:
+                keep &= np.hypot(u_lambda, v_lambda) <= quicklook_options.max_uv_lambda
+
+            chunk_visibilities, chunk_weight = grid_visibilities(
+                grid=grid,
+                u_lambda=u_lambda[keep],
+                v_lambda=v_lambda[keep],
+                vis=vis[keep],
+                weights=weights[keep],
+                cell_rad=cell_rad,
+            )
+            gridded_visibilities += chunk_visibilities
+            total_weight += chunk_weight
+
+    if total_weight == 0:
+        raise MSError(f"No unflagged visibilities could be gridded from {ms.path}")
+
+    image = np.fft.fftshift(np.fft.ifft2(np.fft.ifftshift(grid))).real
+    image *= size * size / total_weight
+
+    header = create_quicklook_header(
+        ms=ms, size=size, cell_arcsec=cell_arcsec, freqs=block_freqs
+    )
+    logger.info(f"Writing quick-look image to {output_path}")
+    fits.writeto(
+        output_path,
+        data=image[None, None].astype(np.float32),
+        header=header,
+        overwrite=True,
+    )
+
+    median = np.median(image)
+    quicklook_result = QuickLookResult(
+        image_path=output_path,
+        ms=ms,
+        cell_arcsec=cell_arcsec,
+        gridded_visibilities=gridded_visibilities,
+        peak=float(np.max(image)),
+        rms=float(1.4826 * np.median(np.abs(image - median))),
+        elapsed_seconds=perf_counter() - start_time,
+    )
+    logger.info(
+        f"Quick-look image of {ms.path.name}: peak={quicklook_result.peak:.4f} rms={quicklook_result.rms:.5f} "
+        f"in {quicklook_result.elapsed_seconds:.2f}s"
+    )
+
+    return quicklook_result
+
+
+def get_parser() -> ArgumentParser:
+    parser = ArgumentParser(
+        description="Create a quick-look dirty image of a measurement set with a native gridder"
+    )
+
+    parser.add_argument("ms", type=Path, help="The measurement set to image")
+    parser.add_argument(
+        "--output-path",
+        type=Path,
+        default=None,
+        help="Path of the output FITS image. If unset it is derived from the measurement set name",
+    )
+    parser.add_argument(
+        "--data-column",
+        type=str,
+        default=None,
+        help="The column to image. Defaults to DATA",
+    )
+    parser.add_argument(
+        "--size", type=int, default=512, help="Number of pixels along each side"
+    )
+    parser.add_argument(
+        "--cell-arcsec",
+        type=float,
+        default=None,
+        help="Pixel size in arcseconds. If unset it is derived from the longest baseline",
+    )
+    parser.add_argument(
+        "--max-uv-lambda",
+        type=float,
+        default=5000.0,
+        help="Baselines longer than this, in wavelengths, are not gridded",
+    )
+    parser.add_argument(
+        "--row-stride",
+        type=int,
+        default=1,
+        help="Only every row-stride-th row of the measurement set is read",
+    )
+    parser.add_argument(
+        "--channel-average",
+        type=int,
+        default=16,
+        help="Number of channels averaged together before gridding",
+    )
+
+    return parser
+
+
+def cli() -> None:
+    parser = get_parser()
+
+    args = parser.parse_args()
+
+    create_quicklook_image(
+        ms=args.ms,
+        output_path=args.output_path,
+        quicklook_options=QuickLookOptions(
+            data_column=args.data_column,
+            size=args.size,
+            cell_arcsec=args.cell_arcsec,
+            max_uv_lambda=args.max_uv_lambda,
+            row_stride=args.row_stride,
+            channel_average=args.channel_average,
+        ),
+    )
+
+
+if __name__ == "__main__":
+    cli()
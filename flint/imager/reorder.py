@@ -0,0 +1,410 @@
+"""Management of the reordered visibility files created by ``wsclean``.
+
+Unless ``-no-reorder`` is used, ``wsclean`` begins by partitioning the
+measurement set into temporary reorder files. Since ``wsclean`` 3.5 these may
+be kept with ``-save-reordered`` and used by a later call with
+``-reuse-reordered``, skipping the reordering step.
+
+Here a cache directory holds one entry per set of reordered visibilities. The
+reordered files embed the visibilities, flags and weights, so an entry is keyed
+by a digest of the contents of those columns together with the ``wsclean``
+options that shape the reordered files (the data column, polarisation and
+channel selection). The path of the measurement set is not part of the key.
+Each self-calibration round images a measurement set with a new name, whether
+it was renamed, copied or linked to the previous round, and the entry is
+reused whenever the underlying columns are unchanged. The beams of an
+observation share the names and sizes of their storage files, but not their
+contents, so never share an entry. Should any of the columns be rewritten
+(e.g. by applying new gains to the data column) the digest changes and a new
+entry is created.
+
+Computing the digest reads the columns in full. It is kept in a small file
+within the measurement set alongside the sizes and modification times of the
+storage files it was computed from, and is only computed again once these
+change.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, NamedTuple
+
+import numpy as np
+from casacore.tables import table
+
+from flint.logging import logger
+from flint.manifest import RACY_MTIME_NS
+from flint.options import MS
+from flint.utils import (
+    file_lock,
+    get_environment_variable,
+    remove_files_folders,
+)
+
+if TYPE_CHECKING:
+    from flint.imager.wsclean import WSCleanOptions
+
+REORDER_CACHE_ENVIRONMENT_VARIABLE = "FLINT_WSCLEAN_REORDER_CACHE"
+"""Environment variable that, when set, is the directory wsclean reorder files are cached under"""
+REORDER_KEY_OPTIONS = ("data_column", "pol", "channels_out", "channel_range")
+"""The wsclean options that shape the reordered files, and are part of the key of a cache entry"""
+REORDER_METADATA_NAME = "flint_reorder.json"
+"""Name of the file describing a cache entry, written once wsclean has successfully used it"""
+REORDER_LOCK_NAME = ".flint_reorder_cache.lock"
+"""Name of the lock file used to coordinate access to the cache directory"""
+REORDER_DIGEST_NAME = ".flint_reorder_digest.json"
+"""Name of the file within a measurement set that keeps the digest of its columns"""
+REORDER_DIGEST_CHUNK_ROWS = 100_000
+"""The number of rows read at a time when computing the digest of a column"""
+
+
+class ReorderCacheEntry(NamedTuple):
+    """Description of a set of cached wsclean reorder files"""
+
+    directory: Path
+    """The directory holding the reorder files, passed to wsclean as ``-temp-dir``"""
+    ms_path: Path
+    """The measurement set that was reordered"""
+    key_options: dict[str, Any]
+    """The wsclean options that shaped the reordered files"""
+    column_token: str
+    """Describes the contents of the reordered columns when the entry was recorded"""
+
+    def to_dict(self) -> dict[str, Any]:
+        """Convert to a JSON serialisable dictionary"""
+        return dict(
+            directory=str(self.directory),
+            ms_path=str(self.ms_path),
+            key_options=self.key_options,
+            column_token=self.column_token,
+        )
+
+
+class ReorderCacheLookup(NamedTuple):
+    """The cache entry a wsclean call should use"""
+
+    directory: Path
+    """The directory to pass to wsclean as ``-temp-dir``"""
+    reuse: bool
+    """Whether the reorder files in ``directory`` are valid and may be reused. If False they should be saved"""
+
+
+def get_reorder_cache_directory(
+    reorder_cache: str | Path | None = None,
+) -> Path | None:
+    """Resolve the directory wsclean reorder files are cached under.
+
+    Args:
+        reorder_cache (Optional[Union[str, Path]], optional): The cache directory. A string starting with ``$`` is treated as an environment variable. If None the ``FLINT_WSCLEAN_REORDER_CACHE`` environment variable is used. Defaults to None.
+
+    Returns:
+        Optional[Path]: The cache directory, or None if caching is not enabled
+    """
+    if reorder_cache is None:
+        reorder_cache = get_environment_variable(REORDER_CACHE_ENVIRONMENT_VARIABLE)
+    elif isinstance(reorder_cache, str) and reorder_cache.startswith("$"):
+        reorder_cache = get_environment_variable(reorder_cache)
+
+    return Path(reorder_cache) if reorder_cache else None
+
+
+def get_reorder_key_options(wsclean_options: WSCleanOptions) -> dict[str, Any]:
+    """Extract the wsclean options that shape the reordered files
+
+    Args:
+        wsclean_options (WSCleanOptions): The options wsclean will be run with
+
+    Returns:
+        dict[str, Any]: The subset of options, JSON serialisable
+    """
+    options = wsclean_options._asdict()
+    return {
+        key: list(options[key]) if isinstance(options[key], tuple) else options[key]
+        for key in REORDER_KEY_OPTIONS
+    }
+
+
+def get_reorder_columns(ms: MS | Path, data_column: str) -> tuple[str, ...]:
+    """The columns of a measurement set whose values are captured in the reordered files
+
+    Args:
+        ms (Union[MS, Path]): The measurement set to inspect
+        data_column (str): The column being imaged
+
+    Returns:
+        tuple[str, ...]: The data column, flags and any weight columns
+    """
+    ms = MS.cast(ms)
+    with table(str(ms.path), readonly=True, ack=False) as tab:
+        colnames = tab.colnames()
+
+    return tuple(
+        column
+        for column in (data_column, "FLAG", "WEIGHT_SPECTRUM", "WEIGHT")
+        if column in colnames
+    )
+
+
+def _get_storage_description(ms: MS, columns: tuple[str, ...]) -> dict[str, Any]:
+    """Describe the storage files of a set of columns by their sizes and
+    modification times"""
+    with table(str(ms.path), readonly=True, ack=False) as tab:
+        nrows = tab.nrows()
+        sequence_numbers = sorted(
+            {tab.getdminfo(column)["SEQNR"] for column in columns}
+        )
+
+    storage_files = {}
+    for sequence_number in sequence_numbers:
+        storage_file_re = re.compile(rf"^table\.f{sequence_number}(?:\D|$)")
+        for storage_file in sorted(ms.path.iterdir()):
+            if not storage_file_re.match(storage_file.name):
+                continue
+            stat = storage_file.stat()
+            storage_files[storage_file.name] = [stat.st_size, stat.st_mtime_ns]
+
+    return dict(nrows=nrows, columns=list(columns), storage_files=storage_files)
+
+
+def get_column_digest(
+    ms: MS | Path, columns: tuple[str, ...], chunk_size: int = REORDER_DIGEST_CHUNK_ROWS
+) -> str:
+    """Compute a digest of the contents of a set of columns. Every row is read.
+
+    Args:
+        ms (Union[MS, Path]): The measurement set to inspect
+        columns (tuple[str, ...]): The columns to describe
+        chunk_size (int, optional): Number of rows read at a time. Defaults to REORDER_DIGEST_CHUNK_ROWS.
+
+    Returns:
+        str: A hex digest of the columns
+    """
+    ms = MS.cast(ms)
+    with table(str(ms.path), readonly=True, ack=False) as tab:
+        nrows = tab.nrows()
+        digest = hashlib.sha256(f"{nrows}".encode())
+        for column in columns:
+            digest.update(column.encode())
+            for start_row in range(0, nrows, chunk_size):
+                values = tab.getcol(
+                    column, startrow=start_row, nrow=min(chunk_size, nrows - start_row)
+                )
+                if values.dtype == bool:
+                    values = np.packbits(values.reshape(values.shape[0], -1), axis=1)
+                digest.update(np.ascontiguousarray(values).tobytes())
+
+    return digest.hexdigest()
+
+
+def get_column_token(ms: MS | Path, columns: tuple[str, ...]) -> str:
+    """Describe the contents of a set of columns. The token changes whenever
+    any of the values in the columns changes, but not when the measurement
+    set is renamed, copied or linked to.
+
+    The digest of the columns (see ``get_column_digest``) is kept within the
+    measurement set and reused while the sizes and modification times of
+    the storage files of the columns are unchanged.
+
+    Args:
+        ms (Union[MS, Path]): The measurement set to inspect
+        columns (tuple[str, ...]): The columns to describe
+
+    Returns:
+        str: A hex digest describing the columns
+    """
+    ms = MS.cast(ms)
+    storage = _get_storage_description(ms=ms, columns=columns)
+    digest_path = ms.path / REORDER_DIGEST_NAME
+
+    try:
+        kept = json.loads(digest_path.read_text())
+        if kept["storage"] == storage:
+            return str(kept["digest"])
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    logger.info(f"Computing the digest of {columns=} of {ms.path}")
+    digest = get_column_digest(ms=ms, columns=columns)
+
+    # Changes within the resolution of the modification time may go
+    # unnoticed, so recently modified columns are digested again next time
+    newest_mtime_ns = max(
+        (mtime_ns for _, mtime_ns in storage["storage_files"].values()), default=0
+    )
+    if time.time_ns() - newest_mtime_ns > RACY_MTIME_NS:
+        try:
+            digest_path.write_text(json.dumps(dict(storage=storage, digest=digest)))
+        except OSError as e:
+            logger.warning(f"Unable to keep the column digest of {ms.path}. {e}")
+
+    return digest
+
+
+def _get_entry_directory(
+    cache_directory: Path, column_token: str, key_options: dict[str, Any]
+) -> Path:
+    key = json.dumps(dict(column_token=column_token, **key_options), sort_keys=True)
+    key_hash = hashlib.sha256(key.encode()).hexdigest()[:16]
+    return cache_directory / f"reorder.{key_hash}"
+
+
+def _load_reorder_entry(metadata_path: Path) -> ReorderCacheEntry | None:
+    try:
+        metadata = json.loads(metadata_path.read_text())
+        return ReorderCacheEntry(
+            directory=Path(metadata["directory"]),
+            ms_path=Path(metadata["ms_path"]),
+            key_options=dict(metadata["key_options"]),
+            column_token=str(metadata["column_token"]),
+        )
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def lookup_reorder_cache(
+    cache_directory: Path, ms: MS | Path, wsclean_options: WSCleanOptions
+) -> ReorderCacheLookup:
+    """Find the cache entry for a wsclean call. Should a valid entry exist
+    its reorder files may be reused. Otherwise any stale files are removed
+    and an empty entry directory is prepared for wsclean to save into.
+
+    Entries are keyed by the contents of the imaged columns rather than the
+    path of the measurement set, so the measurement set of a later
+    self-calibration round whose columns are unchanged reuses the entry.
+
+    Args:
+        cache_directory (Path): The directory reorder files are cached under
+        ms (Union[MS, Path]): The measurement set being imaged
+        wsclean_options (WSCleanOptions): The options wsclean will be run with
+
+    Returns:
+        ReorderCacheLookup: The entry directory, and whether it may be reused
+    """
+    ms = MS.cast(ms)
+    key_options = get_reorder_key_options(wsclean_options=wsclean_options)
+    column_token = get_column_token(
+        ms=ms,
+        columns=get_reorder_columns(ms=ms, data_column=wsclean_options.data_column),
+    )
+    entry_directory = _get_entry_directory(
+        cache_directory=cache_directory,
+        column_token=column_token,
+        key_options=key_options,
+    )
+
+    cache_directory.mkdir(parents=True, exist_ok=True)
+    with file_lock(cache_directory / REORDER_LOCK_NAME):
+        entry = _load_reorder_entry(entry_directory / REORDER_METADATA_NAME)
+        if entry is not None:
+            # The token is recorded after wsclean has run, which should
+            # not have modified the columns it reordered
+            if entry.column_token == column_token:
+                logger.info(f"Reusing wsclean reorder files in {entry_directory}")
+                return ReorderCacheLookup(directory=entry_directory, reuse=True)
+            logger.info(
+                f"Columns of {ms.path} have changed, invalidating {entry_directory}"
+            )
+
+        if entry_directory.exists():
+            remove_files_folders(entry_directory)
+        entry_directory.mkdir(parents=True)
+
+    logger.info(f"wsclean reorder files will be saved to {entry_directory}")
+    return ReorderCacheLookup(directory=entry_directory, reuse=False)
+
+
+def record_reorder_cache_entry(
+    entry_directory: Path, ms: MS | Path, wsclean_options: WSCleanOptions
+) -> ReorderCacheEntry:
+    """Mark a cache entry as valid once wsclean has successfully saved
+    (or reused) reorder files in it. The column token is taken after wsclean
+    has finished.
+
+    Entries superseded by this one are removed. These are the entries of
+    the same measurement set made before its columns were rewritten, and
+    those whose measurement set has since been renamed or deleted.
+
+    Args:
+        entry_directory (Path): The entry directory passed to wsclean
+        ms (Union[MS, Path]): The measurement set that was imaged
+        wsclean_options (WSCleanOptions): The options wsclean was run with
+
+    Returns:
+        ReorderCacheEntry: The recorded entry
+    """
+    ms = MS.cast(ms)
+    entry = ReorderCacheEntry(
+        directory=entry_directory,
+        ms_path=ms.path.absolute(),
+        key_options=get_reorder_key_options(wsclean_options=wsclean_options),
+        column_token=get_column_token(
+            ms=ms,
+            columns=get_reorder_columns(ms=ms, data_column=wsclean_options.data_column),
+        ),
+    )
+
+    with file_lock(entry_directory.parent / REORDER_LOCK_NAME):
+        (entry_directory / REORDER_METADATA_NAME).write_text(
+            json.dumps(entry.to_dict(), indent=2)
+        )
+        _remove_superseded_entries(entry=entry)
+
+    return entry
+
+
+def _remove_superseded_entries(entry: ReorderCacheEntry) -> None:
+    """Remove the entries replaced by a newly recorded one. The cache lock
+    should be held."""
+    ms_path = entry.ms_path.resolve()
+    for other_directory in sorted(entry.directory.parent.iterdir()):
+        if not other_directory.is_dir() or other_directory == entry.directory:
+            continue
+        # Entries without metadata may be in use by a running wsclean
+        other = _load_reorder_entry(other_directory / REORDER_METADATA_NAME)
+        if other is None:
+            continue
+        if other.ms_path.exists() and other.ms_path.resolve() != ms_path:
+            continue
+        logger.info(f"Removing superseded wsclean reorder files in {other_directory}")
+        remove_files_folders(other_directory)
+
+
+def clear_reorder_cache(
+    cache_directory: Path, ms_parent: Path | None = None
+) -> list[Path]:
+    """Remove entries from the reorder cache. Entries whose measurement set
+    no longer exists are always removed.
+
+    Args:
+        cache_directory (Path): The directory reorder files are cached under
+        ms_parent (Optional[Path], optional): Only remove entries of measurement sets within this directory. If None all entries are removed. Defaults to None.
+
+    Returns:
+        list[Path]: The entry directories that were removed
+    """
+    if not cache_directory.exists():
+        return []
+
+    removed: list[Path] = []
+    with file_lock(cache_directory / REORDER_LOCK_NAME):
+        for entry_directory in sorted(cache_directory.iterdir()):
+            if not entry_directory.is_dir():
+                continue
+            entry = _load_reorder_entry(entry_directory / REORDER_METADATA_NAME)
+            if ms_parent is not None and (
+                # Entries without metadata may be in use by a running wsclean
+                entry is None
+                or (
+                    entry.ms_path.exists()
+                    and Path(ms_parent).absolute() not in entry.ms_path.parents
+                )
+            ):
+                continue
+            logger.info(f"Removing wsclean reorder cache entry {entry_directory}")
+            removed.extend(remove_files_folders(entry_directory))
+
+    return removed
@@ -21,19 +21,38 @@ from argparse import ArgumentParser
 from glob import glob
 from numbers import Number
 from pathlib import Path
-from typing import Any, Collection, NamedTuple
+from typing import Any, Callable, Collection, NamedTuple
 
 import numpy as np
-from astropy.io import fits
-from fitscube.combine_fits import combine_fits
 
+from flint.cube import write_cube_from_images
 from flint.exceptions import (
     AttemptRerunException,
     CleanDivergenceError,
     NamingException,
     NotSupportedError,
 )
+from flint.imager.progress import WSCleanProgressEvent, WSCleanProgressParser
+from flint.imager.psf_reuse import (
+    check_psf_reuse,
+    get_visibility_token,
+    load_psf_products,
+    record_psf_products,
+    remove_psf_products,
+)
+from flint.imager.reorder import (
+    get_reorder_cache_directory,
+    lookup_reorder_cache,
+    record_reorder_cache_entry,
+)
 from flint.logging import logger
+from flint.manifest import (
+    has_manifest,
+    query_products,
+    register_products,
+    remove_products,
+    rename_product,
+)
 from flint.naming import (
     create_image_cube_name,
     create_imaging_name_prefix,
@@ -46,9 +65,10 @@ from flint.options import (
     create_options_from_parser,
     options_to_dict,
 )
-from flint.sclient import run_singularity_command
+from flint.sclient import ExecutionBackend, run_singularity_command
 from flint.utils import (
     get_environment_variable,
+    get_thread_budget,
     hold_then_move_into,
     remove_files_folders,
 )
@@ -165,6 +185,8 @@ class WSCleanOptions(BaseOptions):
     """If not none, then this is the number of sub-regions wsclean will attempt to divide and clean"""
     parallel_gridding: int | None = None
     """If not none, then this is the number of channel images that will be gridded in parallel"""
+    j: int | None = None
+    """The number of threads wsclean may use. If None, the thread budget of the worker is used when available, otherwise wsclean uses all cores"""
     temp_dir: str | Path | None = None
     """The path to a temporary directory where files will be written. """
     pol: str = "i"
@@ -175,8 +197,20 @@ class WSCleanOptions(BaseOptions):
     """Image a channel range between a lower (inclusive) and upper (exclusive) bound"""
     no_reorder: bool = False
     """If True turn off the reordering of the MS at the beginning of wsclean"""
+    reuse_psf: Path | None = None
+    """Prefix of the PSF images of an earlier wsclean run. These are read instead of gridding the PSF"""
+    flint_reuse_psf: bool = False
+    """If True the PSF images are kept, and a later round of imaging on the same beam reuses them with ``-reuse-psf`` provided the image geometry, weighting and flags are unchanged"""
+    flint_reorder_cache: str | Path | None = None
+    """Directory under which wsclean reorder files are kept and reused while the imaged columns are unchanged. If None the ``FLINT_WSCLEAN_REORDER_CACHE`` environment variable is used. Requires wsclean 3.5 or later"""
     flint_no_log_wsclean_output: bool = False
     """If True do not log the wsclean output"""
+    flint_log_wsclean_summary: bool = True
+    """If True the full wsclean output is written to a log file alongside the images, and only a summary is logged"""
+    flint_execution_backend: ExecutionBackend | None = None
+    """Run wsclean in the container (``singularity``) or from the host (``native``). If None the ``FLINT_NATIVE_TOOLS`` environment variable decides"""
+    flint_wsclean_progress: bool = False
+    """If True the progress events of wsclean are written as JSON-lines alongside the images, see ``flint.imager.progress``"""
     no_mf_weighting: bool = False
     """Opposite of -ms-weighting; can be used to turn off MF weighting in -join-channels mode"""
 
@@ -188,7 +222,7 @@ class WSCleanResult(BaseOptions):
     """The constructede wsclean command that would be executed."""
     options: WSCleanOptions
     """The set of wslean options used for imaging"""
-    ms: MS
+    ms: MS | tuple[MS, ...]
     """The measurement sets that have been included in the wsclean command. """
     bind_dirs: tuple[Path, ...]
     """Paths that should be binded to when executing the command"""
@@ -200,6 +234,12 @@ class WSCleanResult(BaseOptions):
     """Will clean up the dirty images/psfs/residuals/models when the imaging has completed"""
     image_set: ImageSet | None = None
     """The set of images produced by wsclean"""
+    reorder_cache_directory: Path | None = None
+    """The reorder cache entry wsclean is directed to save reordered files to, or reuse them from"""
+    timeline: tuple[WSCleanProgressEvent, ...] | None = None
+    """The progress events parsed from the output of wsclean"""
+    psf_metadata: Path | None = None
+    """Describes the PSF images kept for reuse by a later round of imaging, see ``flint.imager.psf_reuse``"""
 
 
 def image_set_from_result(wsclean_result: WSCleanResult) -> ImageSet | None:
@@ -229,14 +269,11 @@ def combine_images_to_cube(
     output_cube_name = create_image_cube_name(image_prefix=Path(prefix), mode=mode)
 
     logger.info(f"Combining {len(images)} images. {images=}")
-    freqs = combine_fits(file_list=images, out_cube=output_cube_name)
-    rotate_cube(output_cube_name)
-
-    # Write out the hdu to preserve the beam table constructed in fitscube
-    logger.info(f"Writing {output_cube_name=}")
+    freqs = write_cube_from_images(image_paths=images, output_cube=output_cube_name)
 
     output_freqs_name = output_cube_name.with_suffix(".freqs_Hz.txt")
     np.savetxt(output_freqs_name, freqs.to("Hz").value)
+    register_products(output_freqs_name)
 
     if remove_original_images:
         remove_files_folders(*images)
@@ -416,7 +453,9 @@ def _rename_wsclean_title(name_str: str) -> str:
     logger.info(f"Renaming {name_str=} for qu components if necessary")
     name_str = re.sub(
         r"(\.qu)-([^-]+)-?([QU])?(\-(psf|image|dirty|model|residual)\.fits)",
-        lambda m: f".{m.group(3).lower() if m.group(3) else 'q'}-{m.group(2)}{m.group(4)}",
+        lambda m: (
+            f".{m.group(3).lower() if m.group(3) else 'q'}-{m.group(2)}{m.group(4)}"
+        ),
         name_str,
     )
 
@@ -464,6 +503,7 @@ def _rename_wsclean_file(
     if rename_file:
         logger.info(f"Renaming {input_path} to {new_path}")
         input_path.rename(new_path)
+        rename_product(old_path=input_path, new_path=new_path)
 
     return new_path
 
@@ -492,6 +532,19 @@ def _wsclean_output_callback(line: str) -> None:
         raise AttemptRerunException
 
 
+def _create_wsclean_stream_callback(
+    progress_parser: WSCleanProgressParser,
+) -> Callable[[str], None]:
+    """Combine the parsing of progress events with the detection of clean divergence
+    and errors that warrant a rerun"""
+
+    def _stream_callback(line: str) -> None:
+        progress_parser(line)
+        _wsclean_output_callback(line)
+
+    return _stream_callback
+
+
 # TODO: Update this function to also add int the source list
 def get_wsclean_output_names(  #
     prefix: str,
@@ -624,8 +677,17 @@ def delete_wsclean_outputs(
     Returns:
         List[Path]: The paths that were removed (or at least attempted to be removed)/
     """
+    recorded_paths = query_products(
+        directory=Path(prefix).parent,
+        kind=output_type,
+        name_prefix=f"{Path(prefix).name}-",
+    )
     # TODO: This glob needs to be replaced with something more explicit
-    paths = [Path(p) for p in glob(f"{prefix}-*{output_type}.fits")]
+    paths = (
+        list(recorded_paths)
+        if recorded_paths
+        else [Path(p) for p in glob(f"{prefix}-*{output_type}.fits")]
+    )
     logger.info(f"Found {len(paths)} matching {prefix=} and {output_type=}.")
     rm_paths: list[Path] = []
 
@@ -643,6 +705,8 @@ def delete_wsclean_outputs(
             except Exception as e:
                 logger.critical(f"Removing {path} failed: {e}")
 
+    remove_products(*rm_paths)
+
     return rm_paths
 
 
@@ -678,15 +742,20 @@ def wsclean_cleanup_files(
     return tuple(rm_files)
 
 
-def create_wsclean_name_argument(wsclean_options: WSCleanOptions, ms: MS) -> Path:
+def create_wsclean_name_argument(
+    wsclean_options: WSCleanOptions, ms: MS | Collection[MS]
+) -> Path:
     """Create the value that will be provided to wsclean -name argument. This has
     to be generated. Among things to consider is the desired output directory of imaging
     files. This by default will be alongside the measurement set. If a `temp_dir`
     has been specified then output files will be written here.
 
+    When multiple measurement sets are imaged jointly the output directory is
+    that of the first measurement set.
+
     Args:
         wsclean_options (WSCleanOptions): Set of wsclean options to consider
-        ms (MS): The measurement set to be imaged
+        ms (Union[MS, Collection[MS]]): The measurement set, or measurement sets, to be imaged
 
     Returns:
         Path: Value of the -name argument to provide to wsclean
@@ -697,12 +766,13 @@ def create_wsclean_name_argument(wsclean_options: WSCleanOptions, ms: MS) -> Pat
     # Construct the name property of the string
     pol = wsclean_options.pol
     channel_range = wsclean_options.channel_range
+    mss = _get_ms_tuple(ms=ms)
     name_prefix_str = create_imaging_name_prefix(
-        ms_path=ms.path, pol=pol, channel_range=channel_range
+        ms_path=[_ms.path for _ms in mss], pol=pol, channel_range=channel_range
     )
 
     # Now resolve the directory part
-    name_dir: Path | str | None = ms.path.parent
+    name_dir: Path | str | None = mss[0].path.parent
     temp_dir = wsclean_options_dict.get("temp_dir", None)
     if temp_dir:
         # Resolve if environment variable
@@ -720,6 +790,18 @@ def create_wsclean_name_argument(wsclean_options: WSCleanOptions, ms: MS) -> Pat
     return name_argument_path
 
 
+def _get_ms_tuple(ms: MS | Path | Collection[MS | Path]) -> tuple[MS, ...]:
+    """Cast a measurement set, or collection of measurement sets, to a tuple of MS"""
+    if isinstance(ms, (MS, Path, str)):
+        return (MS.cast(ms),)
+
+    mss = tuple(MS.cast(_ms) for _ms in ms)
+    if len(mss) == 0:
+        raise ValueError("At least one measurement set has to be provided")
+
+    return mss
+
+
 class ResolvedCLIResult(NamedTuple):
     """Mapping results to provide to wsclean"""
 
@@ -797,8 +879,9 @@ def _resolve_wsclean_key_value_to_cli_str(key: str, value: Any) -> ResolvedCLIRe
 
 
 def create_wsclean_cmd(
-    ms: MS,
+    ms: MS | Collection[MS],
     wsclean_options: WSCleanOptions,
+    threads: int | None = None,
 ) -> WSCleanResult:
     """Create a wsclean command from a WSCleanOptions container
 
@@ -806,15 +889,19 @@ def create_wsclean_cmd(
     exceptions being:
     #. the `-name` argument will be generated and supplied to the CLI string and will default to the parent directory and name of the supplied measurement set
     #. If `wsclean_options.temp_dir` is specified this directory is used in place of the measurement sets parent directory
+    #. If a reorder cache is configured (see `flint.imager.reorder`) `-temp-dir` is pointed at the cache entry of the measurement set, and `-save-reordered` or `-reuse-reordered` is added
+    #. The directory of the `reuse_psf` prefix is added to the bind directories
+    #. If multiple measurement sets are provided they are all imaged in a single wsclean call. Outputs are named after the fields they have in common (see `flint.naming.create_imaging_name_prefix`) and are placed alongside the first measurement set. The reorder cache is not used.
 
     If `container` is supplied to immediately execute this command then the
     output wsclean image products will be moved from the `temp-dir` to the
     same directory as the measurement set.
 
     Args:
-        ms (MS): The measurement set to be imaged
+        ms (Union[MS, Collection[MS]]): The measurement set, or measurement sets, to be imaged
         wsclean_options (WSCleanOptions): WSClean options to image with
         container (Optional[Path], optional): If a path to a container is provided the command is executed immediately. Defaults to None.
+        threads (Optional[int], optional): The number of threads wsclean should use, set as ``-j`` when ``wsclean_options.j`` is not already set. Defaults to None.
 
     Raises:
         ValueError: Raised when a option has not been successfully processed
@@ -827,13 +914,18 @@ def create_wsclean_cmd(
     # argument alongside the prefix in the WSCleanCMD. Also need to rename that, its a horrible
     # name for a variable and ship
 
+    if threads and wsclean_options.j is None:
+        wsclean_options = wsclean_options.with_options(j=threads)
+
     # Some options should also extend the singularity bind directories
     bind_dir_paths = []
 
+    mss = _get_ms_tuple(ms=ms)
+
     name_argument_path = create_wsclean_name_argument(
-        wsclean_options=wsclean_options, ms=ms
+        wsclean_options=wsclean_options, ms=mss
     )
-    move_directory = ms.path.parent
+    move_directory = mss[0].path.parent
     hold_directory: Path | None = Path(name_argument_path).parent
 
     wsclean_options_dict = wsclean_options._asdict()
@@ -862,10 +954,34 @@ def create_wsclean_cmd(
         msg = ", ".join([f"{t[0]} {t[1]}" for t in unknowns])
         raise ValueError(f"Unknown wsclean option types: {msg}")
 
+    reorder_cache_directory = get_reorder_cache_directory(
+        reorder_cache=wsclean_options.flint_reorder_cache
+    )
+    reorder_lookup = None
+    if reorder_cache_directory and len(mss) > 1:
+        logger.info("The reorder cache is not used when imaging multiple MSs jointly")
+    elif reorder_cache_directory and not wsclean_options.no_reorder:
+        reorder_lookup = lookup_reorder_cache(
+            cache_directory=reorder_cache_directory,
+            ms=mss[0],
+            wsclean_options=wsclean_options,
+        )
+        # The reorder files live in the cache entry, while the images are
+        # still created under the -name directory
+        cmds = [cmd for cmd in cmds if not cmd.startswith("-temp-dir ")]
+        cmds += [
+            f"-temp-dir {reorder_lookup.directory!s}",
+            "-reuse-reordered" if reorder_lookup.reuse else "-save-reordered",
+        ]
+        bind_dir_paths.append(reorder_lookup.directory)
+
+    if wsclean_options.reuse_psf:
+        bind_dir_paths.append(Path(wsclean_options.reuse_psf).parent)
+
     cmds += [f"-name {name_argument_path!s}"]
-    cmds += [f"{ms.path!s} "]
+    cmds += [" ".join(str(_ms.path) for _ms in mss) + " "]
 
-    bind_dir_paths.append(ms.path.parent)
+    bind_dir_paths.extend(_ms.path.parent for _ms in mss)
 
     cmd = "wsclean " + " ".join(cmds)
 
@@ -875,38 +991,18 @@ def create_wsclean_cmd(
     return WSCleanResult(
         cmd=cmd,
         options=wsclean_options,
-        ms=ms.with_options(model_column="MODEL_DATA"),
+        ms=(
+            mss[0].with_options(model_column="MODEL_DATA")
+            if len(mss) == 1
+            else tuple(_ms.with_options(model_column="MODEL_DATA") for _ms in mss)
+        ),
         bind_dirs=tuple(bind_dir_paths),
         move_hold_directories=(move_directory, hold_directory),
         image_prefix_str=str(name_argument_path),
+        reorder_cache_directory=reorder_lookup.directory if reorder_lookup else None,
     )
 
 
-def rotate_cube(output_cube_name) -> None:
-    logger.info(f"Rotating {output_cube_name=}")
-    # This changes the output cube to a shape of (chan, pol, dec, ra)
-    # which is what yandasoft linmos tasks like
-    with fits.open(output_cube_name, mode="update", memmap=True) as hdulist:
-        hdu = hdulist[0]
-        new_header = hdu.header
-        data_cube = hdu.data
-
-        tmp_header = new_header.copy()
-        # Need to swap NAXIS 3 and 4 to make LINMOS happy - booo
-        for a, b in ((3, 4), (4, 3)):
-            new_header[f"CTYPE{a}"] = tmp_header[f"CTYPE{b}"]
-            new_header[f"CRPIX{a}"] = tmp_header[f"CRPIX{b}"]
-            new_header[f"CRVAL{a}"] = tmp_header[f"CRVAL{b}"]
-            new_header[f"CDELT{a}"] = tmp_header[f"CDELT{b}"]
-            new_header[f"CUNIT{a}"] = tmp_header[f"CUNIT{b}"]
-
-        # Cube is currently STOKES, FREQ, RA, DEC - needs to be FREQ, STOKES, RA, DEC
-        data_cube = np.moveaxis(data_cube, 1, 0)
-        hdu.data = data_cube
-        hdu.header = new_header
-        hdulist.flush()
-
-
 def combine_image_set_to_cube(
     image_set: ImageSet,
     remove_original_images: bool = False,
@@ -951,15 +1047,15 @@ def combine_image_set_to_cube(
         )
 
         logger.info(f"Combining {len(subband_images)} images. {subband_images=}")
-        freqs = combine_fits(file_list=subband_images, out_cube=output_cube_name)
-
-        rotate_cube(output_cube_name)
-
-        # Write out the hdu to preserve the beam table constructed in fitscube
-        logger.info(f"Writing {output_cube_name=}")
+        # The cube is written directly in the (FREQ, STOKES, DEC, RA) order
+        # that linmos expects, one channel at a time
+        freqs = write_cube_from_images(
+            image_paths=subband_images, output_cube=Path(output_cube_name)
+        )
 
         output_freqs_name = Path(output_cube_name).with_suffix(".freqs_Hz.txt")
         np.savetxt(output_freqs_name, freqs.to("Hz").value)
+        register_products(output_freqs_name)
 
         image_set_dict[mode] = [Path(output_cube_name)] + [
             image for image in image_set_dict[mode] if image not in subband_images
@@ -1006,6 +1102,132 @@ def rename_wsclean_prefix_in_image_set(input_image_set: ImageSet) -> ImageSet:
     return output_image_set
 
 
+CHANNEL_BLOCK_PATTERN = re.compile(
+    r"\.ch(?P<start>[0-9]{4})-(?P<end>[0-9]{4})[-.](?P<subband>[0-9]{4}|MFS)(?=[-.])"
+)
+"""Identifies the channel range and sub-band of an image from a wsclean run over a block of channels"""
+
+
+def _rename_channel_block_file(
+    input_path: Path, rename_file: bool = False
+) -> tuple[str, Path]:
+    """Rename a sub-band image of a channel block (e.g. ``.ch0008-0016-0003-image.fits``)
+    to the name it would have if its channel was imaged alone (e.g. ``.ch0011-0012.image.fits``).
+
+    Args:
+        input_path (Path): The sub-band image to rename
+        rename_file (bool, optional): Whether the file should be moved / renamed. Defaults to False.
+
+    Raises:
+        NamingException: Raised when the channel block and sub-band can not be identified
+
+    Returns:
+        tuple[str, Path]: The sub-band (e.g. ``0003`` or ``MFS``) of the image and its new path
+    """
+    input_path = Path(input_path)
+    match = CHANNEL_BLOCK_PATTERN.search(input_path.name)
+    if match is None:
+        raise NamingException(f"No channel block found in {input_path=}")
+
+    subband = match.group("subband")
+    if subband == "MFS":
+        return subband, input_path
+
+    channel = int(match.group("start")) + int(subband)
+    new_name = (
+        input_path.name[: match.start()]
+        + f".ch{channel:04}-{channel + 1:04}"
+        + input_path.name[match.end() :]
+    )
+    new_path = input_path.parent / _rename_wsclean_title(name_str=new_name)
+
+    if rename_file:
+        logger.info(f"Renaming {input_path} to {new_path}")
+        input_path.rename(new_path)
+        rename_product(old_path=input_path, new_path=new_path)
+
+    return subband, new_path
+
+
+def split_wsclean_result_by_channel(
+    wsclean_result: WSCleanResult,
+    remove_mfs_images: bool = True,
+) -> list[WSCleanResult]:
+    """Split the result of imaging a contiguous block of channels (a ``channel_range``
+    with one output channel per input channel) into a result per channel. The sub-band
+    images are renamed to, and the results describe them as, what imaging each channel
+    on its own with ``channels_out=1`` would have produced.
+
+    The sub-band images must not have been combined into a cube.
+
+    Args:
+        wsclean_result (WSCleanResult): The result of imaging a block of channels
+        remove_mfs_images (bool, optional): Remove the MFS images formed over the block. Defaults to True.
+
+    Raises:
+        ValueError: Raised when the result is not of a block of channels each imaged separately
+
+    Returns:
+        list[WSCleanResult]: The results of each channel, in order of channel
+    """
+    options = wsclean_result.options
+    image_set = wsclean_result.image_set
+    if options.channel_range is None or image_set is None:
+        raise ValueError("A channel range and image set are required to split a result")
+
+    start, end = options.channel_range
+    if options.channels_out != end - start:
+        raise ValueError(
+            f"{options.channels_out=} does not match the {options.channel_range=}"
+        )
+    if options.channels_out == 1:
+        return [wsclean_result]
+
+    block_str = f".ch{start:04}-{end:04}"
+    channel_images: list[dict[str, list[Path]]] = [
+        {} for _ in range(options.channels_out)
+    ]
+    mfs_images: list[Path] = []
+    for mode in ("image", "residual", "dirty", "model", "psf"):
+        for image in getattr(image_set, mode) or []:
+            subband, new_path = _rename_channel_block_file(
+                input_path=image, rename_file=True
+            )
+            if subband == "MFS":
+                mfs_images.append(image)
+                continue
+            channel_images[int(subband)].setdefault(mode, []).append(new_path)
+
+    if remove_mfs_images and mfs_images:
+        remove_files_folders(*mfs_images)
+
+    channel_results = []
+    for channel_offset, images in enumerate(channel_images):
+        channel = start + channel_offset
+        channel_str = f".ch{channel:04}-{channel + 1:04}"
+        channel_results.append(
+            wsclean_result.with_options(
+                options=options.with_options(
+                    channel_range=(channel, channel + 1), channels_out=1
+                ),
+                image_prefix_str=(
+                    wsclean_result.image_prefix_str.replace(block_str, channel_str)
+                    if wsclean_result.image_prefix_str
+                    else None
+                ),
+                image_set=ImageSet(
+                    prefix=image_set.prefix.replace(block_str, channel_str),
+                    source_list=image_set.source_list,
+                    **images,
+                ),
+            )
+        )
+
+    logger.info(f"Split {block_str} into {len(channel_results)} channels")
+
+    return channel_results
+
+
 def _make_pols(pol_str: str) -> tuple[str, ...] | None:
     """Create a tuple of polarisations from a polarisation string
 
@@ -1029,10 +1251,15 @@ def run_wsclean_imager(
     wsclean_result: WSCleanResult,
     container: Path,
     make_cube_from_subbands: bool = True,
+    progress_parser: WSCleanProgressParser | None = None,
 ) -> ImageSet:
     """Run a provided wsclean command. Optionally will clean up files,
     including the dirty beams, psfs and other assorted things.
 
+    Each line of output is passed to a ``WSCleanProgressParser``. If the
+    ``flint_wsclean_progress`` option is set its events are also written to a
+    JSON-lines file alongside the images.
+
     An `ImageSet` is constructed that attempts to capture the output wsclean image products. If `image_prefix_str`
     is specified the image set will be created by (ordered by preference):
     #. Adding the `image_prefix_str` to the `move_directory`
@@ -1044,18 +1271,28 @@ def run_wsclean_imager(
         bind_dirs (Optional[Tuple[Path, ...]], optional): Additional directories to include when binding to the wsclean container. Defaults to None.
         move_hold_directories (Optional[Tuple[Path,Optional[Path]]], optional): The `move_directory` and `hold_directory` passed to the temporary context manager. If None no `hold_then_move_into` manager is used. Defaults to None.
         make_cube_from_subbands (bool, optional): Form a single FITS cube from the set of sub-band images wsclean produces. Defaults to False.
+        progress_parser (Optional[WSCleanProgressParser], optional): Parses the output of wsclean into a timeline of progress events. If None one is created. Defaults to None.
         image_prefix_str (Optional[str], optional): The name used to search for wsclean outputs. If None, it is guessed from the name and location of the MS. Defaults to None.
 
     Returns:
         ImageSet: The executed wsclean output products.
     """
 
-    ms = wsclean_result.ms
+    ms = _get_ms_tuple(ms=wsclean_result.ms)[0]
     single_channel = wsclean_result.options.channels_out == 1
     wsclean_cleanup = wsclean_result.cleanup
     bind_dirs = wsclean_result.bind_dirs
     move_hold_directories = wsclean_result.move_hold_directories
     image_prefix_str = wsclean_result.image_prefix_str
+    # PSF images are kept when they may be reused by a later round
+    cleanup_output_types = tuple(
+        output_type
+        for output_type in ("dirty", "psf", "model", "residual")
+        if not (output_type == "psf" and wsclean_result.options.flint_reuse_psf)
+    )
+
+    progress_parser = progress_parser if progress_parser else WSCleanProgressParser()
+    stream_callback = _create_wsclean_stream_callback(progress_parser=progress_parser)
 
     sclient_bind_dirs = [Path(ms.path).parent.absolute()]
     if bind_dirs:
@@ -1072,16 +1309,33 @@ def run_wsclean_imager(
             hold_directory=move_hold_directories[1],
         ) as directory:
             sclient_bind_dirs.append(directory)
-            run_singularity_command(
-                image=container,
-                command=wsclean_result.cmd,
-                bind_dirs=sclient_bind_dirs,
-                stream_callback_func=_wsclean_output_callback,
-                ignore_logging_output=wsclean_result.options.flint_no_log_wsclean_output,
+            output_log_path = (
+                Path(directory) / f"{Path(prefix).name}.wsclean.log"
+                if wsclean_result.options.flint_log_wsclean_summary
+                else None
             )
+            if wsclean_result.options.flint_wsclean_progress:
+                progress_parser.jsonl_path = (
+                    Path(directory) / f"{Path(prefix).name}.wsclean.progress.jsonl"
+                )
+            try:
+                run_singularity_command(
+                    image=container,
+                    command=wsclean_result.cmd,
+                    bind_dirs=sclient_bind_dirs,
+                    stream_callback_func=stream_callback,
+                    ignore_logging_output=wsclean_result.options.flint_no_log_wsclean_output,
+                    execution_backend=wsclean_result.options.flint_execution_backend,
+                    output_log_path=output_log_path,
+                    threads=wsclean_result.options.j,
+                )
+            finally:
+                progress_parser.close()
             if wsclean_cleanup:
                 rm_files = wsclean_cleanup_files(
-                    prefix=prefix, single_channel=single_channel
+                    prefix=prefix,
+                    output_types=cleanup_output_types,
+                    single_channel=single_channel,
                 )
                 logger.info(f"Removed {len(rm_files)} files")
                 # No need to attempt to clean up again once files have been moved
@@ -1094,22 +1348,73 @@ def run_wsclean_imager(
                 else None
             )
     else:
-        run_singularity_command(
-            image=container,
-            command=wsclean_result.cmd,
-            bind_dirs=sclient_bind_dirs,
-            stream_callback_func=_wsclean_output_callback,
-            ignore_logging_output=wsclean_result.options.flint_no_log_wsclean_output,
+        output_log_path = (
+            Path(f"{prefix}.wsclean.log")
+            if wsclean_result.options.flint_log_wsclean_summary
+            else None
+        )
+        if wsclean_result.options.flint_wsclean_progress:
+            progress_parser.jsonl_path = Path(f"{prefix}.wsclean.progress.jsonl")
+        try:
+            run_singularity_command(
+                image=container,
+                command=wsclean_result.cmd,
+                bind_dirs=sclient_bind_dirs,
+                stream_callback_func=stream_callback,
+                ignore_logging_output=wsclean_result.options.flint_no_log_wsclean_output,
+                execution_backend=wsclean_result.options.flint_execution_backend,
+                output_log_path=output_log_path,
+                threads=wsclean_result.options.j,
+            )
+        finally:
+            progress_parser.close()
+
+    if wsclean_result.reorder_cache_directory:
+        record_reorder_cache_entry(
+            entry_directory=wsclean_result.reorder_cache_directory,
+            ms=ms,
+            wsclean_options=wsclean_result.options,
         )
 
     # prefix should be set at this point
     assert prefix is not None, f"{prefix=}, which should not happen"
 
+    pols = _make_pols(pol_str=wsclean_result.options.pol)
+
+    # Record the outputs wsclean is known to write so later look ups need not scan the directory
+    if has_manifest(directory=Path(prefix).parent):
+        written_image_set = get_wsclean_output_names(
+            prefix=prefix,
+            subbands=wsclean_result.options.channels_out,
+            pols=pols,
+            check_exists_when_adding=True,
+        )
+        written_paths = [
+            path
+            for paths in (
+                written_image_set.image,
+                written_image_set.psf,
+                written_image_set.dirty,
+                written_image_set.model,
+                written_image_set.residual,
+            )
+            for path in paths or ()
+        ]
+        if wsclean_result.options.save_source_list:
+            source_list_path = get_wsclean_output_source_list_path(
+                name_path=prefix, pol=None
+            )
+            if source_list_path.exists():
+                written_paths.append(source_list_path)
+        register_products(*written_paths)
+
     if wsclean_cleanup:
         logger.info("Will clean up files created by wsclean. ")
-        rm_files = wsclean_cleanup_files(prefix=prefix, single_channel=single_channel)
-
-    pols = _make_pols(pol_str=wsclean_result.options.pol)
+        rm_files = wsclean_cleanup_files(
+            prefix=prefix,
+            output_types=cleanup_output_types,
+            single_channel=single_channel,
+        )
 
     image_set = get_wsclean_output_names(
         prefix=prefix,
@@ -1141,43 +1446,117 @@ def run_wsclean_imager(
 
 
 def wsclean_imager(
-    ms: Path | MS,
+    ms: Path | MS | Collection[Path | MS],
     wsclean_container: Path,
     update_wsclean_options: dict[str, Any] | None = None,
     make_cube_from_subbands: bool = True,
+    previous_result: WSCleanResult | None = None,
 ) -> WSCleanResult:
     """Create and run a wsclean imager command against a measurement set.
 
+    If ``flint_reuse_psf`` is set the PSF images are kept, and those of
+    ``previous_result`` are reused when the image geometry, weighting options,
+    uv-coverage, flags and weights are all unchanged.
+
+    Should a collection of measurement sets be provided (e.g. several SBIDs
+    of the same field, or several SPWs of a beam) they are imaged jointly in
+    a single wsclean call. Each has to have the same column elected for
+    imaging. PSF reuse is not supported when imaging jointly.
+
     Args:
-        ms (Union[Path,MS]): Path to the measurement set that will be imaged
+        ms (Union[Path,MS,Collection[Union[Path,MS]]]): Path to the measurement set, or measurement sets, that will be imaged
         wsclean_container (Path): Path to the container with wsclean installed
         update_wsclean_options (Optional[Dict[str, Any]], optional): Additional options to update the generated WscleanOptions with. Keys should be attributes of WscleanOptions. Defaults to None.
+        make_cube_from_subbands (bool, optional): Form a single FITS cube from the set of sub-band images wsclean produces. Defaults to True.
+        previous_result (Optional[WSCleanResult], optional): The result of an earlier round of imaging of the same beam, whose PSF images may be reused. Defaults to None.
+
+    Raises:
+        ValueError: Raised when jointly imaged measurement sets have different columns elected for imaging
 
     Returns:
-        WSCleanResult: _description_
+        WSCleanResult: The wsclean command that was run and the images it created
     """
-
-    # TODO: This should be expanded to support multiple measurement sets
-    ms = MS.cast(ms)
+    mss = _get_ms_tuple(ms=ms)
+    columns = {_ms.column for _ms in mss}
+    if len(columns) > 1:
+        raise ValueError(f"Measurement sets imaged jointly have different {columns=}")
+    ms = mss[0]
 
     wsclean_options = WSCleanOptions()
     if update_wsclean_options:
         logger.info("Updatting wsclean options with user-provided items. ")
         wsclean_options = wsclean_options.with_options(**update_wsclean_options)
 
+    # Imported here as the tuning module itself images with wsclean_imager
+    from flint.imager.autotune import apply_tuned_wsclean_options
+
+    wsclean_options = apply_tuned_wsclean_options(
+        wsclean_options=wsclean_options, set_options=update_wsclean_options
+    )
+
     assert ms.column is not None, "A MS column needs to be elected for imaging. "
     wsclean_options = wsclean_options.with_options(data_column=ms.column)
+
+    visibility_token = None
+    previous_psf_metadata = None
+    if wsclean_options.flint_reuse_psf and len(mss) > 1:
+        logger.info("PSF reuse is not supported when imaging multiple MSs jointly")
+        wsclean_options = wsclean_options.with_options(flint_reuse_psf=False)
+    if wsclean_options.flint_reuse_psf:
+        visibility_token = get_visibility_token(ms=ms)
+        psf_products = (
+            load_psf_products(metadata_path=previous_result.psf_metadata)
+            if previous_result and previous_result.psf_metadata
+            else None
+        )
+        if (
+            psf_products
+            and wsclean_options.reuse_psf is None
+            and check_psf_reuse(
+                psf_products=psf_products,
+                ms=ms,
+                wsclean_options=wsclean_options,
+                visibility_token=visibility_token,
+            )
+        ):
+            wsclean_options = wsclean_options.with_options(
+                reuse_psf=Path(psf_products.prefix)
+            )
+            previous_psf_metadata = previous_result.psf_metadata  # type: ignore[union-attr]
+
     wsclean_result = create_wsclean_cmd(
-        ms=ms,
+        ms=mss,
         wsclean_options=wsclean_options,
+        threads=get_thread_budget(),
     )
+    progress_parser = WSCleanProgressParser()
     image_set = run_wsclean_imager(
         wsclean_result=wsclean_result,
         container=wsclean_container,
         make_cube_from_subbands=make_cube_from_subbands,
+        progress_parser=progress_parser,
+    )
+    wsclean_result = wsclean_result.with_options(
+        image_set=image_set, timeline=progress_parser.timeline
     )
 
-    return wsclean_result.with_options(image_set=image_set)
+    if wsclean_options.flint_reuse_psf:
+        assert wsclean_result.image_prefix_str is not None
+        psf_metadata = record_psf_products(
+            prefix=wsclean_result.move_hold_directories[0]
+            / Path(wsclean_result.image_prefix_str).name,
+            ms=ms,
+            wsclean_options=wsclean_options,
+            visibility_token=visibility_token,
+        )
+        if psf_metadata is None:
+            # wsclean read the PSF without writing it out again
+            psf_metadata = previous_psf_metadata
+        elif previous_psf_metadata and previous_psf_metadata != psf_metadata:
+            remove_psf_products(metadata_path=previous_psf_metadata)
+        wsclean_result = wsclean_result.with_options(psf_metadata=psf_metadata)
+
+    return wsclean_result
 
 
 def get_parser() -> ArgumentParser:
@@ -1189,7 +1568,10 @@ def get_parser() -> ArgumentParser:
         "image", help="Attempt to run a wsclean command. "
     )
     wsclean_parser.add_argument(
-        "ms", type=Path, help="Path to a measurement set to image"
+        "ms",
+        type=Path,
+        nargs="+",
+        help="Path to a measurement set to image. Multiple measurement sets are imaged jointly",
     )
     wsclean_parser.add_argument(
         "-v", "--verbose", action="store_true", help="Extra output logging."
@@ -1218,13 +1600,13 @@ def cli() -> None:
 
             logger.setLevel(logging.DEBUG)
 
-        ms = MS(path=args.ms, column=args.data_column)
+        mss = [MS(path=ms_path, column=args.data_column) for ms_path in args.ms]
         wsclean_options: WSCleanOptions = create_options_from_parser(
             parser_namespace=args,
             options_class=WSCleanOptions,  # type: ignore
         )
         wsclean_imager(
-            ms=ms,
+            ms=mss,
             wsclean_container=args.wsclean_container,
             update_wsclean_options=wsclean_options._asdict(),
         )
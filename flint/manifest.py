@@ -0,0 +1,458 @@
+"""A manifest of the products flint creates within a directory.
+
+Finding products by globbing or listing a directory is expensive on shared
+parallel file systems, particularly for directories holding thousands of
+channel images. Instead, the directory of an SBID may hold a manifest that is
+updated whenever flint creates, renames or deletes a product, and that is
+queried in place of scanning the directory.
+
+The manifest is a journal of JSON-lines records kept in a ``.flint``
+sub-directory, so that updating it does not change the modification time of
+the directory itself. Records are appended under a lock, and the journal is
+periodically compacted into a snapshot that atomically replaces it. Each
+product is described by its name, its kind (e.g. ``ms``, ``image``,
+``linmos``), and the SBID, beam, self-calibration round, polarisation and
+channel extracted from its name.
+
+Products are only recorded in directories where a manifest has been created
+with ``create_manifest``, which the flows do for their output directory when
+their ``use_manifest`` option is set. Functions that query the manifest fall
+back to scanning the directory when there is none. A full listing of the directory is
+also cached in the manifest, and is only trusted while the modification time
+of the directory is unchanged.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+import time
+from pathlib import Path
+from typing import Any, NamedTuple
+
+from flint.logging import logger
+from flint.naming import processed_ms_format
+from flint.utils import file_lock
+
+MANIFEST_DIRECTORY_NAME = ".flint"
+"""Name of the sub-directory the manifest is kept in"""
+MANIFEST_NAME = "manifest.jsonl"
+"""Name of the journal of manifest records"""
+MANIFEST_LOCK_NAME = "manifest.lock"
+"""Name of the lock file used to coordinate updates to the manifest"""
+MANIFEST_COMPACT_MIN_RECORDS = 1000
+"""The journal is compacted once it holds this many records, and more than twice the number of products"""
+RACY_MTIME_NS = 2_000_000_000
+"""A directory modified this recently, in nanoseconds, is not trusted to be unchanged by a listing. Many file systems only record modification times to the second"""
+WSCLEAN_IMAGE_PATTERN = re.compile(
+    r"[-.](?P<image_type>image|residual|model|dirty|psf)\.fits$"
+)
+"""Identifies the image type of a wsclean image, before or after it has been renamed"""
+SUBBAND_PATTERN = re.compile(
+    r"[-.](?P<subband>MFS|[0-9]{4})[-.](?:(?:i|q|u|v|xx|yy|xy|yx)+[-.])?(?:image|residual|model|dirty|psf)\.fits$",
+    flags=re.IGNORECASE,
+)
+"""Identifies the sub-band of a wsclean image that was imaged with multiple output channels"""
+
+
+class ManifestEntry(NamedTuple):
+    """A product recorded in a manifest"""
+
+    name: str
+    """The name of the product within the directory of the manifest"""
+    kind: str
+    """The kind of product, e.g. ``ms``, ``image``, ``linmos``"""
+    sbid: int | None = None
+    """The SBID of the observation the product was derived from"""
+    beam: int | None = None
+    """The beam of the product"""
+    round: int | None = None
+    """The self-calibration round of the product"""
+    pol: str | None = None
+    """The polarisation of the product"""
+    channel: str | None = None
+    """The channel range (e.g. ``0011-0012``) or wsclean sub-band (e.g. ``0003``, ``MFS``) of the product"""
+
+    def to_dict(self) -> dict[str, Any]:
+        """Convert to a JSON serialisable dictionary"""
+        return self._asdict()
+
+
+class Manifest(NamedTuple):
+    """The products recorded in the manifest of a directory"""
+
+    directory: Path
+    """The directory the products are in"""
+    entries: dict[str, ManifestEntry]
+    """The recorded products, keyed by name"""
+    listing_mtime_ns: int | None = None
+    """The modification time of the directory when it was last listed in full. None if the listing is not trusted"""
+
+
+def get_manifest_path(directory: Path) -> Path:
+    """The path of the manifest journal of a directory
+
+    Args:
+        directory (Path): The directory holding the products
+
+    Returns:
+        Path: The manifest journal
+    """
+    return Path(directory) / MANIFEST_DIRECTORY_NAME / MANIFEST_NAME
+
+
+def _get_lock_path(directory: Path) -> Path:
+    return Path(directory) / MANIFEST_DIRECTORY_NAME / MANIFEST_LOCK_NAME
+
+
+def has_manifest(directory: Path) -> bool:
+    """Whether a manifest has been created for a directory
+
+    Args:
+        directory (Path): The directory holding the products
+
+    Returns:
+        bool: Whether there is a manifest
+    """
+    return get_manifest_path(directory=directory).exists()
+
+
+def infer_product_kind(name: str) -> str:
+    """Infer the kind of a product from its name
+
+    Args:
+        name (str): The name of the product
+
+    Returns:
+        str: The kind of product
+    """
+    if name.endswith(".ms"):
+        return "ms"
+    if name.endswith((".ms.zip", ".ms.tar")):
+        return "ms_archive"
+    if ".caltable" in name:
+        return "caltable"
+    if name.endswith(".bin") and ".aocalibrate" in name:
+        return "aocalibrate_solutions"
+    if name.endswith(".gains.npz"):
+        return "gain_solutions"
+    if name.endswith(".fits"):
+        if ".cube." in name:
+            return "cube"
+        if "linmos" in name:
+            return "linmos"
+        if name.endswith("weight.fits"):
+            return "weight"
+        if name.endswith(".conv.fits"):
+            return "convolved"
+        if match := WSCLEAN_IMAGE_PATTERN.search(name):
+            return match.group("image_type")
+        return "fits"
+
+    suffix = Path(name).suffix.lstrip(".")
+    return suffix if suffix else "other"
+
+
+def create_manifest_entry(path: Path, kind: str | None = None) -> ManifestEntry:
+    """Describe a product by the properties encoded in its name
+
+    Args:
+        path (Path): The product to describe
+        kind (Optional[str], optional): The kind of product. If None it is inferred from the name. Defaults to None.
+
+    Returns:
+        ManifestEntry: The description of the product
+    """
+    name = Path(path).name
+    components = processed_ms_format(in_name=name)
+
+    channel = None
+    if components and components.channel_range:
+        channel = "{:04d}-{:04d}".format(*components.channel_range)
+    elif match := SUBBAND_PATTERN.search(name):
+        channel = match.group("subband")
+
+    return ManifestEntry(
+        name=name,
+        kind=kind if kind else infer_product_kind(name=name),
+        sbid=int(components.sbid) if components else None,
+        beam=int(components.beam) if components and components.beam else None,
+        round=int(components.round) if components and components.round else None,
+        pol=components.pol if components else None,
+        channel=channel,
+    )
+
+
+def _replay_records(directory: Path, lines: list[str]) -> Manifest:
+    entries: dict[str, ManifestEntry] = {}
+    listing_mtime_ns = None
+    for line in lines:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        op = record["op"]
+        if op == "add":
+            entry = ManifestEntry(**record["entry"])
+            entries[entry.name] = entry
+        elif op == "remove":
+            entries.pop(record["name"], None)
+        elif op == "rename":
+            entries.pop(record["name"], None)
+            entry = ManifestEntry(**record["entry"])
+            entries[entry.name] = entry
+        elif op == "listing":
+            listing_mtime_ns = record["mtime_ns"]
+
+    return Manifest(
+        directory=Path(directory),
+        entries=entries,
+        listing_mtime_ns=listing_mtime_ns,
+    )
+
+
+def _write_snapshot(manifest: Manifest) -> None:
+    """Atomically replace the journal with a record of each product"""
+    manifest_path = get_manifest_path(directory=manifest.directory)
+    records: list[dict[str, Any]] = [
+        {"op": "add", "entry": entry.to_dict()} for entry in manifest.entries.values()
+    ]
+    records.append({"op": "listing", "mtime_ns": manifest.listing_mtime_ns})
+
+    temp_path = manifest_path.with_suffix(f".{os.getpid()}.tmp")
+    temp_path.write_text("".join(json.dumps(record) + "\n" for record in records))
+    os.replace(temp_path, manifest_path)
+
+
+def _load_locked(directory: Path) -> Manifest:
+    manifest_path = get_manifest_path(directory=directory)
+    lines = manifest_path.read_text().splitlines()
+    manifest = _replay_records(directory=directory, lines=lines)
+
+    if len(lines) >= MANIFEST_COMPACT_MIN_RECORDS and len(lines) > 2 * (
+        len(manifest.entries) + 1
+    ):
+        logger.debug(f"Compacting {manifest_path} of {len(lines)} records")
+        _write_snapshot(manifest=manifest)
+
+    return manifest
+
+
+def load_manifest(directory: Path) -> Manifest | None:
+    """Load the manifest of a directory
+
+    Args:
+        directory (Path): The directory holding the products
+
+    Returns:
+        Optional[Manifest]: The recorded products, or None if the directory has no manifest
+    """
+    directory = Path(directory)
+    if not has_manifest(directory=directory):
+        return None
+
+    with file_lock(lock_path=_get_lock_path(directory=directory)):
+        return _load_locked(directory=directory)
+
+
+def _append_records(directory: Path, records: list[dict[str, Any]]) -> None:
+    with file_lock(lock_path=_get_lock_path(directory=directory)):
+        with open(get_manifest_path(directory=directory), "a") as manifest_file:
+            manifest_file.write(
+                "".join(json.dumps(record) + "\n" for record in records)
+            )
+
+
+def _group_by_directory(paths: tuple[Path, ...]) -> dict[Path, list[Path]]:
+    grouped: dict[Path, list[Path]] = {}
+    for path in paths:
+        path = Path(path)
+        grouped.setdefault(path.parent, []).append(path)
+
+    return {
+        directory: directory_paths
+        for directory, directory_paths in grouped.items()
+        if has_manifest(directory=directory)
+    }
+
+
+def register_products(*paths: Path, kind: str | None = None) -> None:
+    """Record products that have been created. Products in a directory
+    without a manifest are ignored.
+
+    Args:
+        paths (Path): The products that were created
+        kind (Optional[str], optional): The kind of the products. If None it is inferred from each name. Defaults to None.
+    """
+    for directory, directory_paths in _group_by_directory(paths=paths).items():
+        _append_records(
+            directory=directory,
+            records=[
+                {"op": "add", "entry": create_manifest_entry(path, kind=kind).to_dict()}
+                for path in directory_paths
+            ],
+        )
+
+
+def remove_products(*paths: Path) -> None:
+    """Record products that have been deleted. Products in a directory
+    without a manifest are ignored.
+
+    Args:
+        paths (Path): The products that were deleted
+    """
+    for directory, directory_paths in _group_by_directory(paths=paths).items():
+        _append_records(
+            directory=directory,
+            records=[{"op": "remove", "name": path.name} for path in directory_paths],
+        )
+
+
+def rename_product(old_path: Path, new_path: Path) -> None:
+    """Record a product that has been renamed or moved
+
+    Args:
+        old_path (Path): The previous path of the product
+        new_path (Path): The new path of the product
+    """
+    old_path, new_path = Path(old_path), Path(new_path)
+    if old_path.parent != new_path.parent:
+        remove_products(old_path)
+        register_products(new_path)
+        return
+
+    if has_manifest(directory=old_path.parent):
+        _append_records(
+            directory=old_path.parent,
+            records=[
+                {
+                    "op": "rename",
+                    "name": old_path.name,
+                    "entry": create_manifest_entry(new_path).to_dict(),
+                }
+            ],
+        )
+
+
+def query_products(
+    directory: Path,
+    kind: str | None = None,
+    name_prefix: str | None = None,
+    sbid: int | None = None,
+    beam: int | None = None,
+    round: int | None = None,
+    pol: str | None = None,
+    channel: str | None = None,
+) -> tuple[Path, ...] | None:
+    """Find the recorded products of a directory that match all of the
+    provided properties
+
+    Args:
+        directory (Path): The directory holding the products
+        kind (Optional[str], optional): The kind of product. Defaults to None.
+        name_prefix (Optional[str], optional): The start of the name of the product. Defaults to None.
+        sbid (Optional[int], optional): The SBID of the product. Defaults to None.
+        beam (Optional[int], optional): The beam of the product. Defaults to None.
+        round (Optional[int], optional): The self-calibration round of the product. Defaults to None.
+        pol (Optional[str], optional): The polarisation of the product. Defaults to None.
+        channel (Optional[str], optional): The channel range or sub-band of the product. Defaults to None.
+
+    Returns:
+        Optional[tuple[Path, ...]]: The sorted matching products, or None if the directory has no manifest and should be scanned
+    """
+    manifest = load_manifest(directory=directory)
+    if manifest is None:
+        return None
+
+    properties = dict(
+        kind=kind, sbid=sbid, beam=beam, round=round, pol=pol, channel=channel
+    )
+    properties = {key: value for key, value in properties.items() if value is not None}
+
+    return tuple(
+        sorted(
+            manifest.directory / entry.name
+            for entry in manifest.entries.values()
+            if (name_prefix is None or entry.name.startswith(name_prefix))
+            and all(getattr(entry, key) == value for key, value in properties.items())
+        )
+    )
+
+
+def list_directory(directory: Path) -> tuple[Path, ...]:
+    """List the contents of a directory. Should the directory have a manifest
+    whose last full listing is still current (the modification time of the
+    directory is unchanged) the recorded products are returned without
+    scanning. Otherwise the directory is scanned and the manifest reconciled
+    with what was found.
+
+    Args:
+        directory (Path): The directory to list
+
+    Returns:
+        tuple[Path, ...]: The sorted contents of the directory
+    """
+    directory = Path(directory)
+    if not has_manifest(directory=directory):
+        return tuple(sorted(directory.iterdir()))
+
+    with file_lock(lock_path=_get_lock_path(directory=directory)):
+        manifest = _load_locked(directory=directory)
+        mtime_ns = directory.stat().st_mtime_ns
+        if (
+            manifest.listing_mtime_ns is not None
+            and manifest.listing_mtime_ns == mtime_ns
+        ):
+            logger.debug(f"Using manifest listing of {directory}")
+            return tuple(sorted(directory / name for name in manifest.entries))
+
+        names = [
+            path.name
+            for path in directory.iterdir()
+            if path.name != MANIFEST_DIRECTORY_NAME
+        ]
+        entries = {
+            name: (
+                manifest.entries[name]
+                if name in manifest.entries
+                else create_manifest_entry(directory / name)
+            )
+            for name in names
+        }
+        # Changes within the resolution of the modification time may go unnoticed
+        trusted = time.time_ns() - mtime_ns > RACY_MTIME_NS
+        logger.info(
+            f"Listed {len(names)} products in {directory}, {len(manifest.entries)} previously recorded"
+        )
+        _write_snapshot(
+            manifest=Manifest(
+                directory=directory,
+                entries=entries,
+                listing_mtime_ns=mtime_ns if trusted else None,
+            )
+        )
+
+    return tuple(sorted(directory / name for name in names))
+
+
+def create_manifest(directory: Path) -> Manifest:
+    """Create the manifest of a directory, recording everything already in it.
+    An existing manifest is reconciled with the contents of the directory.
+
+    Args:
+        directory (Path): The directory holding the products
+
+    Returns:
+        Manifest: The manifest of the directory
+    """
+    directory = Path(directory)
+    manifest_path = get_manifest_path(directory=directory)
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    manifest_path.touch(exist_ok=True)
+
+    list_directory(directory=directory)
+    manifest = load_manifest(directory=directory)
+    assert manifest is not None, f"{manifest_path=} was not created"
+    logger.info(f"Created manifest of {len(manifest.entries)} products in {directory}")
+
+    return manifest
@@ -27,6 +27,7 @@ from fixms.fix_ms_dir import fix_ms_dir
 
 from flint.casa import copy_with_mstranform
 from flint.logging import logger
+from flint.manifest import query_products, register_products, rename_product
 from flint.naming import create_ms_name
 from flint.options import MS
 from flint.utils import copy_directory, rsync_copy_directory
@@ -194,6 +195,25 @@ def get_freqs_from_ms(ms: MS | Path) -> np.ndarray:
     return freqs
 
 
+def get_parallel_hand_mask(ms: MS | Path) -> np.ndarray:
+    """Identify the parallel-hand correlations (XX, YY, RR or LL) of a
+    measurement set from its ``POLARIZATION`` table.
+
+    Args:
+        ms (Union[MS, Path]): Measurement set to inspect
+
+    Returns:
+        np.ndarray: Boolean mask along the correlation axis, True for the parallel-hands
+    """
+    ms = MS.cast(ms)
+
+    with table(f"{ms.path!s}/POLARIZATION", readonly=True, ack=False) as tab:
+        corr_types = tab.getcol("CORR_TYPE")[0]
+
+    # The casacore Stokes enumerations of RR, LL, XX and YY
+    return np.isin(corr_types, (5, 8, 9, 12))
+
+
 def get_phase_dir_from_ms(ms: MS | Path) -> SkyCoord:
     """Extract the phase direction from a measurement set.
 
@@ -406,6 +426,7 @@ def split_by_field(
 
             logger.info(f"Writing {out_path!s} for {split_name}")
             sub_ms.copy(str(out_path), deep=True)
+            register_products(out_path)
 
             out_mss.append(
                 MS(path=out_path, beam=get_beam_from_ms(out_path), column=column)
@@ -826,6 +847,7 @@ def copy_and_preprocess_casda_askap_ms(
     out_ms_path = output_directory / create_ms_name(ms_path=ms.path)
     logger.info(f"New MS name: {out_ms_path}")
     out_ms_path = copy_directory(input_directory=ms.path, output_directory=out_ms_path)
+    register_products(out_ms_path)
 
     ms = ms.with_options(path=out_ms_path)
 
@@ -897,6 +919,7 @@ def rename_ms_and_columns_for_selfcal(
 
     logger.info(f"Renaming {ms.path} to {target=}")
     ms.path.rename(target=target)
+    rename_product(old_path=ms.path, new_path=target)
 
     # Just some sanity in case None is passed through
     if not (corrected_data or data):
@@ -954,6 +977,10 @@ def find_mss(
     `*.ms` glob expression. An expected number of MSs can be enforced
     via the `expected_ms_count` option.
 
+    If the directory has a manifest (see `flint.manifest`) the recorded
+    measurement sets are used, falling back to the glob should the
+    manifest not hold the expected number of them.
+
     Args:
         mss_parent_path (Path): The parent directory that will be globbed to search for MSs.
         expected_ms_count (Optional[int], optional): The number of MSs that should be there. If None no check is performed. Defaults to 36.
@@ -967,9 +994,11 @@ def find_mss(
         f"{mss_parent_path!s} does not exist or is not a folder. "
     )
 
-    found_mss = tuple(
-        [MS.cast(ms_path) for ms_path in sorted(mss_parent_path.glob("*.ms"))]
-    )
+    ms_paths = query_products(directory=mss_parent_path, kind="ms")
+    if not ms_paths or (expected_ms_count and len(ms_paths) != expected_ms_count):
+        ms_paths = tuple(sorted(mss_parent_path.glob("*.ms")))
+
+    found_mss = tuple([MS.cast(ms_path) for ms_path in ms_paths])
 
     if expected_ms_count:
         assert len(found_mss) == expected_ms_count, (
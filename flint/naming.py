@@ -7,7 +7,7 @@ from __future__ import annotations
 import re
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Literal, NamedTuple, TypeVar
+from typing import Any, Collection, Literal, NamedTuple, TypeVar
 
 from flint.exceptions import NamingException
 from flint.logging import logger
@@ -110,8 +110,12 @@ def create_name_from_common_fields(
         and processed_components_dict[0][key] is not None
     }
 
+    # The sbid and field are required, but may differ across inputs (e.g. several
+    # SBIDs of the same field), in which case they are not part of the name
     name_path = create_path_from_processed_name_components(
-        processed_name_components=ProcessedNameComponents(**constant_fields),
+        processed_name_components=ProcessedNameComponents(
+            **{"sbid": None, "field": None, **constant_fields}
+        ),
         parent_path=parent,
     )
     constant_field_keys = list(constant_fields.keys())
@@ -181,23 +185,47 @@ def create_image_cube_name(
 
 
 def create_imaging_name_prefix(
-    ms_path: Path,
+    ms_path: Path | Collection[Path],
     pol: str | None = None,
     channel_range: tuple[int, int] | None = None,
 ) -> str:
     """Given a measurement set and a polarisation, create the naming prefix to be used
     by some imager
 
+    Should multiple measurement sets be imaged jointly the fields that are common
+    across all of them are used (see ``create_name_from_common_fields``). For
+    example, two SBIDs of the same field and beam would drop the ``SB`` field.
+    If the names are not in the ``flint`` processed format, or have no fields
+    in common, the name of the first measurement set is used with ``.joint``
+    appended.
+
     Args:
-        ms (Union[MS,Path]): The measurement set being considered
+        ms_path (Union[Path,Collection[Path]]): The measurement set, or measurement sets, being considered
         pol (Optional[str], optional): Whether a polarsation is being considered. Defaults to None.
         channel_range (Optional[Tuple[int,int]], optional): The channel range that is going to be imaged. Defaults to none.
 
     Returns:
         str: The constructed string name
     """
+    ms_paths = (
+        (Path(ms_path),)
+        if isinstance(ms_path, (str, Path))
+        else tuple(Path(p) for p in ms_path)
+    )
 
-    names = [ms_path.stem]
+    name = ms_paths[0].stem
+    if len(ms_paths) > 1:
+        try:
+            common_path = create_name_from_common_fields(in_paths=ms_paths)
+            # Without common fields the path is the parent directory
+            name = common_path.name if common_path != ms_paths[0].parent else ""
+        except ValueError:
+            name = ""
+        if not name:
+            name = f"{ms_paths[0].stem}.joint"
+            logger.info(f"No common fields across {len(ms_paths)} MSs, using {name=}")
+
+    names = [name]
     if pol:
         names.append(f"{pol.lower()}")
     if channel_range:
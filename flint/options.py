@@ -302,6 +302,8 @@ class BandpassOptions(BaseOptions):
     """Share channel flags from bandpass solutions between all antenna"""
     preflagger_jones_max_amplitude: float | None = None
     """Flag Jones matrix if any amplitudes with a Jones are above this value"""
+    use_manifest: bool = False
+    """Record the products created in the output directory in a manifest that is queried instead of scanning the directory. See ``flint.manifest``"""
 
 
 class AddModelSubtractFieldOptions(BaseOptions):
@@ -318,6 +320,8 @@ class AddModelSubtractFieldOptions(BaseOptions):
     """Path to the container with the calibrate software (including addmodel)"""
     addmodel_cluster_config: Path | None = None
     """Specify a new cluster configuration file different to the preferred on. If None, drawn from preferred cluster config"""
+    native_predict: bool = False
+    """Predict the ``wsclean`` source list with the native DFT predictor in ``flint.predict`` rather than the ``addmodel`` container"""
 
 
 class SubtractFieldOptions(BaseOptions):
@@ -346,12 +350,18 @@ class SubtractFieldOptions(BaseOptions):
     """Primary beam attenuation cutoff to use during linmos"""
     stagger_delay_seconds: float | None = None
     """The delay, in seconds, that should be used when submitting items in batches (e.g. looping over channels)"""
+    channel_block_size: int = 1
+    """Number of contiguous channels imaged by each wsclean call. Each channel of a block is still deconvolved independently, and the images are split back into one set per channel"""
+    image_contsub: bool = False
+    """Fit and subtract a polynomial continuum along the frequency axis of each pixel of the linmos cube. Settings are taken from the ``imcontsub`` mode of the imaging strategy"""
     attempt_subtract: bool = False
     """Attempt to subtract the model column from the nominated data column"""
     subtract_data_column: str = "DATA"
     """Should the continuum model be subtracted, where to store the output"""
     predict_wsclean_model: bool = False
     """Search for the continuum model produced by wsclean and subtract"""
+    use_manifest: bool = False
+    """Record the products created in the output directory in a manifest that is queried instead of scanning the directory. See ``flint.manifest``"""
 
 
 class FieldOptions(BaseOptions):
@@ -387,6 +397,8 @@ class FieldOptions(BaseOptions):
     """Number of required rouds of self-calibration and imaging to perform"""
     skip_selfcal_on_rounds: list[int] | None = None
     """Do not perform the derive and apply self-calibration solutions on these rounds"""
+    passthrough_skipped_selfcal: bool = False
+    """Rounds in ``skip_selfcal_on_rounds`` link to the previous measurement set rather than copying it"""
     zip_ms: bool = False
     """Whether to zip measurement sets once they are no longer required"""
     run_aegean: bool = False
@@ -429,6 +441,10 @@ class FieldOptions(BaseOptions):
     """Co-add cubes formed throughout imaging together. Cubes will be smoothed channel-wise to a common resolution. Only performed on final set of images"""
     update_model_data_with_source_list: bool = False
     """Attempt to update a MSs MODEL_DATA column with a source list (e.g. source list output from wsclean)"""
+    quicklook_images: bool = False
+    """Create a quick-look dirty image of each beam with the native imager in ``flint.imager.quicklook`` once it has been calibrated and preprocessed"""
+    use_manifest: bool = False
+    """Record the products created in the output directory in a manifest that is queried instead of scanning the directory. See ``flint.manifest``"""
 
 
 class PolFieldOptions(BaseOptions):
@@ -465,6 +481,8 @@ class PolFieldOptions(BaseOptions):
     """Path to a FLINT imaging yaml file that contains settings to use throughout imaging"""
     sbid_copy_path: Path | None = None
     """Path that final processed products will be copied into. If None no copying of file products is performed. See ArchiveOptions. """
+    use_manifest: bool = False
+    """Record the products created in the output directory in a manifest that is queried instead of scanning the directory. See ``flint.manifest``"""
 
 
 def dump_field_options_to_yaml(
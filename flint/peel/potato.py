@@ -454,6 +454,7 @@ def create_run_potato_config(
         image=potato_container,
         command=potato_config_command.command,
         bind_dirs=potato_config_command.config_path.parent,
+        expected_outputs=potato_config_command.config_path,
     )
 
     return potato_config_command
@@ -540,7 +541,9 @@ def create_run_potato_peel(
 
     # Now run the command and hope foe the best you silly pirate
     run_singularity_command(
-        image=potato_container, command=potato_peel_command.command, bind_dirs=bind_dirs
+        image=potato_container,
+        command=potato_peel_command.command,
+        bind_dirs=bind_dirs,
     )
 
     return potato_peel_command
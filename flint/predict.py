@@ -0,0 +1,526 @@
+"""A native direct Fourier transform (DFT) visibility predictor.
+
+This is intended to be an in-process alternative to ``addmodel`` (packaged
+with ``aocalibrate``) and ``crystalball``. A ``wsclean`` style source list
+(e.g. the output of ``wsclean -save-source-list``) is read, and each of its
+point and Gaussian components is evaluated against the ``UVW`` coordinates
+and frequencies of a measurement set. Model visibilities are computed
+for chunks of rows in a pool of threads, and written to the model column
+(``MODEL_DATA`` by default).
+
+The visibility of a component with flux ``S`` at direction cosines
+``(l, m, n)`` relative to the phase direction is
+
+    V(u, v, w) = S * exp(-2 pi i (u l + v m + w (n - 1)))
+
+where ``(u, v, w)`` are in wavelengths. Gaussian components are additionally
+tapered by the Fourier transform of their shape. The stokes-I model is
+inserted into the parallel-hand correlations, with the cross-hands set
+to zero.
+"""
+
+from __future__ import annotations
+
+import re
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from time import perf_counter
+from typing import Literal, NamedTuple
+
+import numpy as np
+from casacore.tables import makecoldesc, table
+
+from flint.exceptions import MSError
+from flint.logging import logger
+from flint.ms import (
+    get_freqs_from_ms,
+    get_parallel_hand_mask,
+    get_phase_dir_from_ms,
+)
+from flint.options import MS, BaseOptions
+from flint.utils import get_thread_budget
+
+SPEED_OF_LIGHT = 299792458.0
+"""The speed of light in meters per second"""
+FWHM_TO_SIGMA = 1.0 / np.sqrt(8.0 * np.log(2.0))
+"""Conversion factor between the FWHM and the standard deviation of a Gaussian"""
+
+
+class PredictOptions(BaseOptions):
+    """Options that control the native visibility predictor"""
+
+    model_column: str = "MODEL_DATA"
+    """The column the model visibilities are written to. It is created if it does not exist"""
+    mode: Literal["c", "a"] = "c"
+    """Whether the model visibilities are copied into (c) or added to (a) the model column. Matches the ``addmodel`` modes"""
+    row_chunk_size: int = 2000
+    """The number of rows of the measurement set that are predicted at a time"""
+    component_chunk_size: int = 32
+    """The number of sky model components evaluated at a time against a chunk of rows"""
+    max_workers: int | None = None
+    """The number of threads used to predict row chunks. If None the thread budget is used (see ``flint.utils.get_thread_budget``)"""
+
+
+class SourceList(NamedTuple):
+    """Components loaded from a ``wsclean`` style source list. Positions
+    and shapes are in radians."""
+
+    names: tuple[str, ...]
+    """The name of each component"""
+    ra: np.ndarray
+    """The right ascension of each component, in radians"""
+    dec: np.ndarray
+    """The declination of each component, in radians"""
+    flux: np.ndarray
+    """The stokes-I flux density of each component at its reference frequency, in Jy"""
+    spectral_terms: np.ndarray
+    """The spectral terms of each component, zero padded. Shape is (ncomponents, nterms)"""
+    logarithmic_si: np.ndarray
+    """Whether the spectral terms of each component describe a logarithmic polynomial"""
+    reference_frequency: np.ndarray
+    """The reference frequency of each component, in Hz"""
+    major_axis: np.ndarray
+    """The FWHM of the major axis of each component, in radians. Zero for point sources"""
+    minor_axis: np.ndarray
+    """The FWHM of the minor axis of each component, in radians. Zero for point sources"""
+    orientation: np.ndarray
+    """The position angle of the major axis, east of north, of each component, in radians"""
+
+    @property
+    def ncomponents(self) -> int:
+        """The number of components"""
+        return len(self.names)
+
+    @property
+    def is_gaussian(self) -> np.ndarray:
+        """Whether each component has a non-zero extent"""
+        return (self.major_axis > 0) | (self.minor_axis > 0)
+
+    def subset(self, index: slice | np.ndarray) -> SourceList:
+        """Select a subset of the components
+
+        Args:
+            index (Union[slice, np.ndarray]): The components to select
+
+        Returns:
+            SourceList: The selected components
+        """
+        names = tuple(np.array(self.names, dtype=object)[index])
+        return SourceList(
+            names,
+            *(getattr(self, field)[index] for field in self._fields[1:]),
+        )
+
+    def flux_at(self, freqs: np.ndarray) -> np.ndarray:
+        """Evaluate the flux density of each component at a set of frequencies.
+
+        With ``LogarithmicSI`` the flux is ``I * (f/f0)**(c0 + c1*log10(f/f0) + ...)``,
+        otherwise it is the ordinary polynomial ``I + c0*(f/f0 - 1) + c1*(f/f0 - 1)**2 + ...``.
+
+        Args:
+            freqs (np.ndarray): The frequencies, in Hz
+
+        Returns:
+            np.ndarray: The flux densities, in Jy. Shape is (ncomponents, nfreqs)
+        """
+        ratio = np.asarray(freqs)[None, :] / self.reference_frequency[:, None]
+
+        log_ratio = np.log10(ratio)
+        log_exponent = np.zeros_like(ratio)
+        linear_flux = np.repeat(self.flux[:, None], ratio.shape[1], axis=1)
+        for power, terms in enumerate(self.spectral_terms.T, start=1):
+            log_exponent += terms[:, None] * log_ratio**power
+            linear_flux += terms[:, None] * (ratio - 1.0) ** power
+
+        return np.where(
+            self.logarithmic_si[:, None],
+            self.flux[:, None] * 10.0**log_exponent,
+            linear_flux,
+        )
+
+
+class PredictResult(NamedTuple):
+    """Summary of a native prediction into a measurement set"""
+
+    ms: MS
+    """The measurement set with the model column set"""
+    components: int
+    """The number of components that were predicted"""
+    visibilities: int
+    """The number of visibilities (rows times channels) that were predicted"""
+    elapsed_seconds: float
+    """The wall time spent predicting and writing the visibilities"""
+
+    @property
+    def throughput(self) -> float:
+        """The number of component-visibility evaluations per second"""
+        return self.components * self.visibilities / max(self.elapsed_seconds, 1e-9)
+
+
+def _split_source_list_line(line: str) -> list[str]:
+    """Split a line on commas, ignoring commas within square brackets"""
+    return [
+        field.strip() for field in re.split(r",(?![^\[]*\])", line.strip().rstrip(","))
+    ]
+
+
+def parse_ra(ra: str) -> float:
+    """Convert a ``wsclean`` right ascension (``hh:mm:ss.s``) to radians
+
+    Args:
+        ra (str): The right ascension to convert
+
+    Returns:
+        float: The right ascension in radians
+    """
+    sign = -1.0 if ra.strip().startswith("-") else 1.0
+    hours, minutes, seconds = (abs(float(part)) for part in ra.split(":"))
+    return sign * np.deg2rad(15.0 * (hours + minutes / 60.0 + seconds / 3600.0))
+
+
+def parse_dec(dec: str) -> float:
+    """Convert a ``wsclean`` declination (``dd.mm.ss.s``) to radians
+
+    Args:
+        dec (str): The declination to convert
+
+    Returns:
+        float: The declination in radians
+    """
+    sign = -1.0 if dec.strip().startswith("-") else 1.0
+    parts = dec.replace(":", ".").split(".")
+    degrees, minutes = abs(float(parts[0])), float(parts[1])
+    seconds = float(".".join(parts[2:]))
+    return sign * np.deg2rad(degrees + minutes / 60.0 + seconds / 3600.0)
+
+
+def load_wsclean_source_list(source_list_path: Path) -> SourceList:
+    """Read the components of a ``wsclean`` style source list. This is
+    the format used by ``wsclean -save-source-list`` and the ``calibrate``
+    and ``addmodel`` programs.
+
+    Args:
+        source_list_path (Path): The source list to read
+
+    Raises:
+        ValueError: Raised when the format line is missing or a component type is not known
+
+    Returns:
+        SourceList: The loaded components
+    """
+    logger.info(f"Loading components from {source_list_path}")
+    with open(source_list_path) as in_file:
+        lines = [
+            line.strip()
+            for line in in_file
+            if line.strip() and not line.strip().startswith("#")
+        ]
+
+    if not lines or not lines[0].lower().startswith("format"):
+        raise ValueError(f"No format line found in {source_list_path}")
+
+    columns: list[str] = []
+    defaults: dict[str, str] = {}
+    for column in _split_source_list_line(lines[0].split("=", 1)[1]):
+        name, _, default = column.partition("=")
+        columns.append(name.strip())
+        if default:
+            defaults[name.strip()] = default.strip().strip("'\"")
+
+    rows = []
+    for line in lines[1:]:
+        values = _split_source_list_line(line)
+        row = dict(defaults)
+        row.update(
+            {column: value for column, value in zip(columns, values) if value != ""}
+        )
+        rows.append(row)
+
+    def _terms(row: dict[str, str]) -> list[float]:
+        terms = row.get("SpectralIndex", "[]").strip("[]")
+        return [float(term) for term in terms.split(",") if term.strip()]
+
+    component_types = [row["Type"].upper() for row in rows]
+    unknown_types = set(component_types) - {"POINT", "GAUSSIAN"}
+    if unknown_types:
+        raise ValueError(f"Unsupported component types {unknown_types}")
+
+    all_terms = [_terms(row) for row in rows]
+    nterms = max((len(terms) for terms in all_terms), default=0)
+    spectral_terms = np.zeros((len(rows), nterms))
+    for idx, terms in enumerate(all_terms):
+        spectral_terms[idx, : len(terms)] = terms
+
+    is_gaussian = np.array([comp_type == "GAUSSIAN" for comp_type in component_types])
+    arcsec_to_rad = np.deg2rad(1.0 / 3600.0)
+
+    def _shape(key: str) -> np.ndarray:
+        return np.array(
+            [float(row.get(key, 0.0) or 0.0) for row in rows], dtype=float
+        ) * is_gaussian.astype(float)
+
+    source_list = SourceList(
+        names=tuple(row.get("Name", "") for row in rows),
+        ra=np.array([parse_ra(row["Ra"]) for row in rows], dtype=float),
+        dec=np.array([parse_dec(row["Dec"]) for row in rows], dtype=float),
+        flux=np.array([float(row["I"]) for row in rows], dtype=float),
+        spectral_terms=spectral_terms,
+        logarithmic_si=np.array(
+            [row.get("LogarithmicSI", "true").lower() == "true" for row in rows],
+            dtype=bool,
+        ),
+        reference_frequency=np.array(
+            [float(row["ReferenceFrequency"]) for row in rows], dtype=float
+        ),
+        major_axis=_shape("MajorAxis") * arcsec_to_rad,
+        minor_axis=_shape("MinorAxis") * arcsec_to_rad,
+        orientation=np.deg2rad(_shape("Orientation")),
+    )
+    logger.info(
+        f"Loaded {source_list.ncomponents} components, {int(np.sum(is_gaussian))} Gaussian"
+    )
+
+    return source_list
+
+
+def get_lmn(
+    ra: np.ndarray, dec: np.ndarray, ra0: float, dec0: float
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Compute the direction cosines of positions relative to a phase direction
+
+    Args:
+        ra (np.ndarray): Right ascensions of the positions, in radians
+        dec (np.ndarray): Declinations of the positions, in radians
+        ra0 (float): Right ascension of the phase direction, in radians
+        dec0 (float): Declination of the phase direction, in radians
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray]: The l, m and n direction cosines
+    """
+    delta_ra = ra - ra0
+    l_coord = np.cos(dec) * np.sin(delta_ra)
+    m_coord = np.sin(dec) * np.cos(dec0) - np.cos(dec) * np.sin(dec0) * np.cos(delta_ra)
+    n_coord = np.sqrt(np.clip(1.0 - l_coord**2 - m_coord**2, 0.0, None))
+
+    return l_coord, m_coord, n_coord
+
+
+def predict_visibilities(
+    uvw: np.ndarray,
+    freqs: np.ndarray,
+    source_list: SourceList,
+    ra0: float,
+    dec0: float,
+    component_chunk_size: int = 32,
+) -> np.ndarray:
+    """Evaluate the stokes-I visibilities of a set of components with a DFT
+
+    Args:
+        uvw (np.ndarray): The UVW coordinates, in meters. Shape is (nrows, 3)
+        freqs (np.ndarray): The channel frequencies, in Hz
+        source_list (SourceList): The components to evaluate
+        ra0 (float): Right ascension of the phase direction, in radians
+        dec0 (float): Declination of the phase direction, in radians
+        component_chunk_size (int, optional): The number of components evaluated at a time. Defaults to 32.
+
+    Returns:
+        np.ndarray: The complex visibilities. Shape is (nrows, nfreqs)
+    """
+    vis = np.zeros((uvw.shape[0], len(freqs)), dtype=np.complex128)
+    wavenumbers = 2.0 * np.pi * freqs / SPEED_OF_LIGHT
+
+    for start in range(0, source_list.ncomponents, component_chunk_size):
+        components = source_list.subset(slice(start, start + component_chunk_size))
+        l_coord, m_coord, n_coord = get_lmn(
+            ra=components.ra, dec=components.dec, ra0=ra0, dec0=dec0
+        )
+        # Delays in meters, shape is (nrows, ncomponents)
+        delays = (
+            uvw[:, 0:1] * l_coord[None, :]
+            + uvw[:, 1:2] * m_coord[None, :]
+            + uvw[:, 2:3] * (n_coord[None, :] - 1.0)
+        )
+        # Shape is (nrows, ncomponents, nfreqs)
+        phasors = np.exp(-1j * delays[:, :, None] * wavenumbers[None, None, :])
+        fluxes = components.flux_at(freqs=freqs)
+
+        if np.any(components.is_gaussian):
+            # Project the baselines onto the major and minor axes of each component.
+            # The orientation is measured from north (m) through east (l).
+            sin_pa, cos_pa = (
+                np.sin(components.orientation),
+                np.cos(components.orientation),
+            )
+            u_major = uvw[:, 0:1] * sin_pa[None, :] + uvw[:, 1:2] * cos_pa[None, :]
+            u_minor = uvw[:, 0:1] * cos_pa[None, :] - uvw[:, 1:2] * sin_pa[None, :]
+            sigma_major = components.major_axis * FWHM_TO_SIGMA
+            sigma_minor = components.minor_axis * FWHM_TO_SIGMA
+            # Scaled by the squared wavenumber, i.e. 2 pi^2 (sigma u_lambda)^2
+            taper_exponent = -0.5 * (
+                (u_major * sigma_major[None, :]) ** 2
+                + (u_minor * sigma_minor[None, :]) ** 2
+            )
+            phasors *= np.exp(
+                taper_exponent[:, :, None] * wavenumbers[None, None, :] ** 2
+            )
+
+        vis += np.einsum("rkc,kc->rc", phasors, fluxes)
+
+    return vis
+
+
+def predict_model_into_ms(
+    ms: MS | Path,
+    source_list_path: Path,
+    predict_options: PredictOptions | None = None,
+) -> PredictResult:
+    """Predict the components of a ``wsclean`` source list into a measurement set.
+
+    The ``UVW`` column is read once. Chunks of rows are predicted in a pool of
+    threads, and written to the model column in order as they complete.
+
+    Args:
+        ms (Union[MS, Path]): The measurement set to predict into
+        source_list_path (Path): The ``wsclean`` style source list to predict
+        predict_options (Optional[PredictOptions], optional): Options controlling the prediction. If None the defaults are used. Defaults to None.
+
+    Raises:
+        MSError: Raised when adding to a model column that does not exist
+
+    Returns:
+        PredictResult: The updated measurement set and throughput of the prediction
+    """
+    ms = MS.cast(ms)
+    predict_options = predict_options if predict_options else PredictOptions()
+    model_column = predict_options.model_column
+
+    source_list = load_wsclean_source_list(source_list_path=source_list_path)
+    freqs = get_freqs_from_ms(ms=ms)
+    phase_dir = get_phase_dir_from_ms(ms=ms)
+    ra0, dec0 = phase_dir.ra.rad, phase_dir.dec.rad
+    parallel_hands = get_parallel_hand_mask(ms=ms)
+
+    start_time = perf_counter()
+    with table(str(ms.path), readonly=False, ack=False) as tab:
+        if model_column not in tab.colnames():
+            if predict_options.mode == "a":
+                raise MSError(f"Can not add to {model_column=}, not found in {ms.path}")
+            logger.info(f"Adding {model_column=}")
+            desc = makecoldesc("DATA", tab.getcoldesc("DATA"))
+            desc["name"] = model_column
+            tab.addcols(desc)
+            tab.flush()
+
+        uvw = tab.getcol("UVW")
+        nrows = len(uvw)
+        row_starts = list(range(0, nrows, predict_options.row_chunk_size))
+        logger.info(
+            f"Predicting {source_list.ncomponents} components into {nrows} rows and {len(freqs)} channels "
+            f"of {ms.path} in {len(row_starts)} chunks"
+        )
+
+        def _predict_chunk(row_start: int) -> np.ndarray:
+            return predict_visibilities(
+                uvw=uvw[row_start : row_start + predict_options.row_chunk_size],
+                freqs=freqs,
+                source_list=source_list,
+                ra0=ra0,
+                dec0=dec0,
+                component_chunk_size=predict_options.component_chunk_size,
+            )
+
+        max_workers = (
+            predict_options.max_workers
+            if predict_options.max_workers
+            else get_thread_budget()
+        )
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for row_start, stokes_i in zip(
+                row_starts, executor.map(_predict_chunk, row_starts)
+            ):
+                chunk_rows = stokes_i.shape[0]
+                if predict_options.mode == "a":
+                    model = tab.getcol(
+                        model_column, startrow=row_start, nrow=chunk_rows
+                    )
+                else:
+                    model = np.zeros(
+                        (chunk_rows, len(freqs), len(parallel_hands)),
+                        dtype=tab.getcell("DATA", 0).dtype,
+                    )
+                model[..., parallel_hands] += stokes_i[..., None]
+                tab.putcol(model_column, model, startrow=row_start, nrow=chunk_rows)
+
+        tab.flush()
+
+    predict_result = PredictResult(
+        ms=ms.with_options(model_column=model_column),
+        components=source_list.ncomponents,
+        visibilities=nrows * len(freqs),
+        elapsed_seconds=perf_counter() - start_time,
+    )
+    logger.info(
+        f"Predicted {predict_result.components} components into {predict_result.visibilities} visibilities "
+        f"in {predict_result.elapsed_seconds:.2f}s, {predict_result.throughput:.3e} component-visibilities per second"
+    )
+
+    return predict_result
+
+
+def get_parser() -> ArgumentParser:
+    parser = ArgumentParser(
+        description="Predict model visibilities from a wsclean source list with a native DFT"
+    )
+
+    parser.add_argument("ms", type=Path, help="The measurement set to predict into")
+    parser.add_argument(
+        "source_list", type=Path, help="The wsclean style source list to predict"
+    )
+    parser.add_argument(
+        "--model-column",
+        type=str,
+        default="MODEL_DATA",
+        help="The column the model visibilities are written to",
+    )
+    parser.add_argument(
+        "--mode",
+        choices=("c", "a"),
+        default="c",
+        help="Copy (c) the model into the column, or add (a) it to the existing column",
+    )
+    parser.add_argument(
+        "--row-chunk-size",
+        type=int,
+        default=2000,
+        help="The number of rows predicted at a time",
+    )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=None,
+        help="The number of threads used to predict row chunks",
+    )
+
+    return parser
+
+
+def cli() -> None:
+    parser = get_parser()
+
+    args = parser.parse_args()
+
+    predict_model_into_ms(
+        ms=args.ms,
+        source_list_path=args.source_list,
+        predict_options=PredictOptions(
+            model_column=args.model_column,
+            mode=args.mode,
+            row_chunk_size=args.row_chunk_size,
+            max_workers=args.max_workers,
+        ),
+    )
+
+
+if __name__ == "__main__":
+    cli()
@@ -6,13 +6,56 @@ operations.
 
 from __future__ import annotations
 
+from contextlib import ExitStack
 from pathlib import Path
 from typing import Any
 
 import yaml
 from prefect_dask import DaskTaskRunner
 
-from flint.utils import get_packaged_resource_path
+from flint.logging import logger
+from flint.sclient import instance_pool_requested, singularity_instance_pool
+from flint.utils import apply_thread_budget, get_packaged_resource_path
+
+WORKER_PRELOAD_MODULE = "flint.prefect.clusters"
+"""Module preloaded by dask workers, whose ``dask_setup`` is called as each worker starts"""
+
+_WORKER_CONTEXT = ExitStack()
+
+
+def dask_setup(worker: Any) -> None:
+    """Prepare a dask worker as it starts. This is called by dask for each
+    worker started with ``--preload flint.prefect.clusters``.
+
+    The thread budget of the worker is applied (see ``flint.utils.apply_thread_budget``),
+    so numerical code run by tasks in the worker process, and the tools
+    they launch, do not use more threads than the job was allocated.
+
+    Should the ``FLINT_SINGULARITY_INSTANCE_POOL`` environment variable be
+    set, the worker enters a ``singularity_instance_pool`` that is stopped by
+    ``dask_teardown`` as the worker closes, which happens when the cluster is
+    shut down at the end of a flow or the job is terminated.
+
+    Args:
+        worker (Any): The dask worker that is starting
+    """
+    logger.info(f"Setting up {worker=}")
+    apply_thread_budget()
+
+    if instance_pool_requested():
+        _WORKER_CONTEXT.enter_context(singularity_instance_pool())
+
+
+def dask_teardown(worker: Any) -> None:
+    """Clean up a dask worker as it closes, stopping any singularity
+    instances it started. This is called by dask for each worker started
+    with ``--preload flint.prefect.clusters``.
+
+    Args:
+        worker (Any): The dask worker that is closing
+    """
+    logger.info(f"Tearing down {worker=}")
+    _WORKER_CONTEXT.close()
 
 
 def get_cluster_spec(cluster: str | Path) -> dict[Any, Any]:
@@ -61,6 +104,9 @@ def get_dask_runner(
     """Creates and returns a DaskTaskRunner configured to established a SLURMCluster instance
     to manage a set of dask-workers. The SLURMCluster is currently configured only for Galaxy.
 
+    Workers of ``dask_jobqueue`` clusters are started with ``flint.prefect.clusters``
+    preloaded, which applies the thread budget of each worker (see ``dask_setup``).
+
     Keyword Args:
         cluster (Union[str,Path]): The cluster name that will be used to search for a cluster specification file.
                        This could be the name of a known cluster, or the name of a yaml file installed
@@ -75,6 +121,12 @@ def get_dask_runner(
     if extra_cluster_kwargs is not None:
         spec["cluster_kwargs"].update(extra_cluster_kwargs)
 
+    if str(spec.get("cluster_class", "")).startswith("dask_jobqueue"):
+        worker_extra_args = list(spec["cluster_kwargs"].get("worker_extra_args", []))
+        if WORKER_PRELOAD_MODULE not in worker_extra_args:
+            worker_extra_args.extend(["--preload", WORKER_PRELOAD_MODULE])
+        spec["cluster_kwargs"]["worker_extra_args"] = worker_extra_args
+
     task_runner = DaskTaskRunner(**spec)
 
     return task_runner
@@ -29,6 +29,8 @@ from flint.convol import (
     get_cube_common_beam,
 )
 from flint.flagging import flag_ms_aoflagger
+from flint.imager.quicklook import create_quicklook_image
+from flint.imager.reorder import clear_reorder_cache
 from flint.imager.wsclean import (
     ImageSet,
     WSCleanOptions,
@@ -62,6 +64,7 @@ from flint.options import FieldOptions, SubtractFieldOptions
 from flint.peel.potato import potato_peel
 from flint.prefect.common.utils import upload_image_as_artifact
 from flint.selfcal.casa import gaincal_applycal_ms
+from flint.selfcal.convergence import SelfcalConvergence, assess_selfcal_convergence
 from flint.source_finding.aegean import AegeanOutputs, run_bane_and_aegean
 from flint.summary import FieldSummary
 from flint.utils import (
@@ -91,8 +94,11 @@ task_convolve_images = task(convolve_images)
 task_split_and_get_image_set = task(split_and_get_image_set)
 task_image_set_from_result = task(image_set_from_result)
 task_combine_images_to_cube = task(combine_images_to_cube)
+task_assess_selfcal_convergence = task(assess_selfcal_convergence)
 task_merge_image_sets = task(merge_image_sets)
 task_merge_image_sets_from_results = task(merge_image_sets_from_results)
+task_create_quicklook_image = task(create_quicklook_image)
+task_clear_reorder_cache = task(clear_reorder_cache)
 
 # Tasks below are extracting componented from earlier stages, or are
 # otherwise doing something important
@@ -193,7 +199,8 @@ def task_run_bane_and_aegean(
     image: WSCleanResult | LinmosResult,
     aegean_container: Path,
     timelimit_seconds: int | float = 60 * 45,
-) -> AegeanOutputs:
+    convergence: SelfcalConvergence | None = None,
+) -> AegeanOutputs | None:
     """Run BANE and Aegean against a FITS image.
 
     Notes:
@@ -206,13 +213,18 @@ def task_run_bane_and_aegean(
         image (Union[WSCleanResult, LinmosResult]): The image that will be searched
         aegean_container (Path): Path to a singularity container containing BANE and aegean
         timelimit_seconds (Union[int,float], optional): The maximum amount of time, in seconds, before an exception is raised. Defaults to 45*60.
+        convergence (Optional[SelfcalConvergence], optional): The convergence state of the beam. If it has converged the image is not searched. Defaults to None.
 
     Raises:
         ValueError: Raised when ``image`` is not a supported type
 
     Returns:
-        AegeanOutputs: Output BANE and aegean products, including the RMS and BKG images
+        Optional[AegeanOutputs]: Output BANE and aegean products, including the RMS and BKG images. None if the beam has converged.
     """
+    if convergence and convergence.converged:
+        logger.info("Self-calibration has converged, not running BANE and aegean")
+        return None
+
     if isinstance(image, WSCleanResult):
         assert image.image_set is not None, "Image set attribute unset. "
         image_paths = image.image_set.image
@@ -248,11 +260,18 @@ def task_zip_ms(in_item: WSCleanResult) -> Path:
     Args:
         in_item (WSCleanResult): The inpute item with a ``.ms`` attribute of type ``MS``.
 
+    Raises:
+        ValueError: Raised when the ``.ms`` attribute is not a single ``MS``
+
     Returns:
         Path: Output path of the zipped measurement set
     """
     # TODO: This typing needs to be expanded
     ms = in_item.ms
+    if not isinstance(ms, MS):
+        raise ValueError(
+            f"Unsupported {type(ms)=} {ms=}. Likely multiple MS instances? This is not yet supported. "
+        )
 
     zipped_ms = zip_folder(in_path=ms.path)
 
@@ -269,6 +288,8 @@ def task_gaincal_applycal_ms(
     skip_selfcal: bool = False,
     rename_ms: bool = False,
     archive_cal_table: bool = False,
+    passthrough_skip: bool = False,
+    convergence: SelfcalConvergence | None = None,
 ) -> MS:
     """Perform self-calibration using CASA gaincal and applycal.
 
@@ -281,6 +302,8 @@ def task_gaincal_applycal_ms(
         skip_selfcal (bool, optional): Should this self-cal be skipped. If `True`, the a new MS is created but not calibrated the appropriate new name and returned.
         rename_ms (bool, optional): It `True` simply rename a MS and adjust columns appropriately (potentially deleting them) instead of copying the complete MS. If `True` `archive_input_ms` is ignored. Defaults to False.
         archive_cal_table (bool, optional): Archive the output calibration table in a tarball. Defaults to False.
+        passthrough_skip (bool, optional): If `True` a skipped round links to the input MS instead of copying it. Defaults to False.
+        convergence (Optional[SelfcalConvergence], optional): The convergence state of the beam. If it has converged the input MS is returned as is. Defaults to None.
 
     Raises:
         ValueError: Raised when a ``.ms`` attribute can not be obtained
@@ -297,6 +320,10 @@ def task_gaincal_applycal_ms(
             f"Unsupported {type(ms)=} {ms=}. Likely multiple MS instances? This is not yet supported. "
         )
 
+    if convergence and convergence.converged:
+        logger.info(f"Self-calibration of {ms=} has converged, not calibrating")
+        return ms
+
     return gaincal_applycal_ms(
         ms=ms,
         round=selfcal_round,
@@ -306,6 +333,7 @@ def task_gaincal_applycal_ms(
         skip_selfcal=skip_selfcal,
         rename_ms=rename_ms,
         archive_cal_table=archive_cal_table,
+        passthrough_skip=passthrough_skip,
     )
 
 
@@ -317,6 +345,8 @@ def task_wsclean_imager(
     fits_mask: FITSMaskNames | None = None,
     channel_range: tuple[int, int] | None = None,
     make_cube_from_subbands: bool = True,
+    previous_result: WSCleanResult | None = None,
+    convergence: SelfcalConvergence | None = None,
 ) -> WSCleanResult:
     """Run the wsclean imager against an input measurement set
 
@@ -326,12 +356,18 @@ def task_wsclean_imager(
         update_wsclean_options (Optional[Dict[str, Any]], optional): Options to update from the default wsclean options. Defaults to None.
         fits_mask (Optional[FITSMaskNames], optional): A path to a clean guard mask. Defaults to None.
         channel_range (Optional[Tuple[int,int]], optional): Add to the wsclean options the specific channel range to be imaged. Defaults to None.
+        previous_result (Optional[WSCleanResult], optional): The result of an earlier round of imaging whose PSF images may be reused, should ``flint_reuse_psf`` be set. Defaults to None.
+        convergence (Optional[SelfcalConvergence], optional): The convergence state of the beam. If it has converged ``previous_result`` is returned without imaging. Defaults to None.
 
     Returns:
         WSCleanResult: A resulting wsclean command and resulting meta-data
     """
     from flint.exceptions import CleanDivergenceError
 
+    if convergence and convergence.converged and previous_result:
+        logger.info("Self-calibration has converged, using the previous imaging result")
+        return previous_result
+
     ms = in_ms if isinstance(in_ms, MS) else in_ms.ms
 
     update_wsclean_options = (
@@ -351,6 +387,7 @@ def task_wsclean_imager(
             wsclean_container=wsclean_container,
             update_wsclean_options=update_wsclean_options,
             make_cube_from_subbands=make_cube_from_subbands,
+            previous_result=previous_result,
         )
     except CleanDivergenceError:
         # NOTE: If the cleaning failed retry with some larger images
@@ -380,6 +417,7 @@ def task_wsclean_imager(
             wsclean_container=wsclean_container,
             update_wsclean_options=update_wsclean_options,
             make_cube_from_subbands=make_cube_from_subbands,
+            previous_result=previous_result,
         )
 
 
@@ -1003,24 +1041,32 @@ def create_convolve_linmos_cubes(
 @task
 def task_create_image_mask_model(
     image: LinmosResult | ImageSet | WSCleanResult,
-    image_products: AegeanOutputs,
+    image_products: AegeanOutputs | None,
     update_masking_options: dict[str, Any] | None = None,
-) -> FITSMaskNames:
+    previous_mask: FITSMaskNames | None = None,
+    convergence: SelfcalConvergence | None = None,
+) -> FITSMaskNames | None:
     """Create a mask for an image, with the intention of providing it as a clean mask
     to an appropriate imager.
 
     Args:
         linmos_parset (LinmosResult): Linmos command and associated meta-data
-        image_products (AegeanOutputs): Images of the RMS and BKG
+        image_products (Optional[AegeanOutputs]): Images of the RMS and BKG. May only be None if the beam has converged.
         update_masking_options (Optional[Dict[str,Any]], optional): Updated options supplied to the default MaskingOptions. Defaults to None.
+        previous_mask (Optional[FITSMaskNames], optional): The mask created by an earlier round, which is carried forward should the beam have converged. Defaults to None.
+        convergence (Optional[SelfcalConvergence], optional): The convergence state of the beam. If it has converged ``previous_mask`` is returned without creating a new mask. Defaults to None.
 
 
     Raises:
         ValueError: Raised when ``image_products`` are not known
 
     Returns:
-        FITSMaskNames: Clean mask where all pixels below a S/N are masked
+        Optional[FITSMaskNames]: Clean mask where all pixels below a S/N are masked. If the beam has converged this is ``previous_mask``.
     """
+    if convergence and convergence.converged:
+        logger.info("Self-calibration has converged, using the previous clean mask")
+        return previous_mask
+
     if isinstance(image_products, AegeanOutputs):
         source_rms = image_products.rms
         source_bkg = image_products.bkg
@@ -10,6 +10,7 @@ from prefect import Task, task
 from flint.calibrate.aocalibrate import AddModelOptions, add_model
 from flint.imager.wsclean import WSCleanResult
 from flint.logging import logger
+from flint.options import MS
 
 P = ParamSpec("P")
 R = TypeVar("R")
@@ -22,6 +23,10 @@ def add_model_source_list_to_ms(
 ) -> WSCleanResult:
     logger.info("Updating MODEL_DATA with source list")
     ms = wsclean_command.ms
+    if not isinstance(ms, MS):
+        raise ValueError(
+            f"Unsupported {type(ms)=} {ms=}. Likely multiple MS instances? This is not yet supported. "
+        )
 
     assert wsclean_command.image_set is not None, (
         f"{wsclean_command.image_set=}, which is not allowed"
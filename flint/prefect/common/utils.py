@@ -4,7 +4,7 @@ from __future__ import annotations
 
 import base64
 from pathlib import Path
-from typing import Any, Callable, Iterable, ParamSpec, TypeVar
+from typing import Any, Callable, Iterable, ParamSpec, Sequence, TypeVar
 from uuid import UUID
 
 from prefect import task
@@ -57,6 +57,20 @@ def task_getattr(
     return getattr(item, attribute)
 
 
+@task
+def task_getitem(item: Sequence[T], index: int) -> T:
+    """Retrieve an item from a sequence, such as the list returned by a task
+
+    Args:
+        item (Sequence[T]): The sequence to index
+        index (int): The index of the item to retrieve
+
+    Returns:
+        T: The requested item
+    """
+    return item[index]
+
+
 @task
 def task_sorted(
     iterable: Iterable[T],
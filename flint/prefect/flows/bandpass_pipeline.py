@@ -27,6 +27,7 @@ from flint.calibrate.aocalibrate import (
 )
 from flint.flagging import flag_ms_aoflagger
 from flint.logging import logger
+from flint.manifest import create_manifest
 from flint.ms import preprocess_askap_ms, split_by_field
 from flint.naming import get_sbid_from_path
 from flint.options import (
@@ -155,6 +156,10 @@ def run_bandpass_stage(
         logger.info(f"Creating {output_split_bandpass_path!s}")
         output_split_bandpass_path.mkdir(parents=True)
 
+    if bandpass_options.use_manifest:
+        # Products are recorded so later searches of the directory avoid scanning it
+        create_manifest(directory=output_split_bandpass_path)
+
     calibrate_cmds: list[CalibrateCommand] = []
 
     extract_bandpass_mss = task_extract_correct_bandpass_pointing.map(
@@ -21,7 +21,9 @@ from flint.configuration import (
     get_options_from_strategy,
     load_and_copy_strategy,
 )
+from flint.imager.reorder import get_reorder_cache_directory
 from flint.logging import logger
+from flint.manifest import create_manifest
 from flint.masking import consider_beam_mask_round
 from flint.ms import find_mss
 from flint.naming import (
@@ -40,9 +42,12 @@ from flint.prefect.clusters import get_dask_runner
 from flint.prefect.common.imaging import (
     create_convol_linmos_images,
     create_convolve_linmos_cubes,
+    task_assess_selfcal_convergence,
+    task_clear_reorder_cache,
     task_copy_and_preprocess_casda_askap_ms,
     task_create_apply_solutions_cmd,
     task_create_image_mask_model,
+    task_create_quicklook_image,
     task_flag_ms_aoflagger,
     task_gaincal_applycal_ms,
     task_potato_peel,
@@ -64,6 +69,7 @@ from flint.prefect.common.utils import (
     task_update_field_summary,
     task_update_with_options,
 )
+from flint.selfcal.convergence import SelfcalConvergenceOptions
 from flint.selfcal.utils import consider_skip_selfcal_on_round
 
 
@@ -164,6 +170,9 @@ def process_science_fields(
     output_split_science_path = _check_create_output_split_science_path(
         science_path=science_path, split_path=split_path, check_exists=True
     )
+    if field_options.use_manifest:
+        # Products are recorded so later searches of the directory avoid scanning it
+        create_manifest(directory=output_split_science_path)
 
     dump_field_options_to_yaml(
         output_path=add_timestamp_to_path(
@@ -254,6 +263,11 @@ def process_science_fields(
     ).result()  # type: ignore
     logger.info(f"{field_summary=}")
 
+    if field_options.quicklook_images:
+        archive_wait_for.extend(
+            task_create_quicklook_image.map(ms=preprocess_science_mss)  # type: ignore
+        )
+
     if field_options.wsclean_container is None:
         logger.info("No wsclean container provided. Rerutning. ")
         return
@@ -344,6 +358,20 @@ def process_science_fields(
     # Set up the default value should the user activated mask option is not set
     fits_beam_masks = None
 
+    # Beams whose self-calibration has converged stop being calibrated, masked and imaged
+    beam_convergences = None
+    convergence_options = SelfcalConvergenceOptions(
+        **get_options_from_strategy(
+            strategy=strategy, mode="convergence", round_info=0, operation="selfcal"
+        )
+    )
+    if convergence_options.early_stop:
+        beam_convergences = task_assess_selfcal_convergence.map(
+            wsclean_result=wsclean_results,
+            selfcal_round=0,
+            convergence_options=unmapped(convergence_options),  # type: ignore
+        )
+
     for current_round in range(1, field_options.rounds + 1):
         with tags(f"selfcal-{current_round}"):
             final_round = current_round == field_options.rounds
@@ -366,14 +394,17 @@ def process_science_fields(
                 skip_selfcal=skip_gaincal_current_round,
                 rename_ms=field_options.rename_ms,
                 archive_cal_table=True,
+                passthrough_skip=field_options.passthrough_skipped_selfcal,
                 casa_container=field_options.casa_container,
                 update_gain_cal_options=unmapped(update_gain_options),
+                convergence=beam_convergences,
                 wait_for=[
                     field_summary
                 ],  # To make sure field summary is created with unzipped MSs
             )  # type: ignore
             stokes_v_mss = cal_mss
 
+            previous_fits_beam_masks = fits_beam_masks
             fits_beam_masks = None
             if consider_beam_mask_round(
                 current_round=current_round,
@@ -393,6 +424,7 @@ def process_science_fields(
                     task_run_bane_and_aegean.map(
                         image=wsclean_results,
                         aegean_container=unmapped(field_options.aegean_container),
+                        convergence=beam_convergences,
                     )
                     if (current_round >= 2 or not beam_aegean_outputs)
                     else beam_aegean_outputs
@@ -407,6 +439,8 @@ def process_science_fields(
                     image=wsclean_results,
                     image_products=beam_aegean_outputs,
                     update_masking_options=unmapped(update_masking_options),
+                    previous_mask=previous_fits_beam_masks,
+                    convergence=beam_convergences,
                 )  # type: ignore
 
             update_wsclean_options = get_options_from_strategy(
@@ -420,6 +454,8 @@ def process_science_fields(
                 wsclean_container=field_options.wsclean_container,
                 fits_mask=fits_beam_masks,
                 update_wsclean_options=unmapped(update_wsclean_options),
+                previous_result=wsclean_results,
+                convergence=beam_convergences,
             )
             wsclean_results = (
                 task_add_model_source_list_to_ms.map(
@@ -431,6 +467,23 @@ def process_science_fields(
             )
             archive_wait_for.extend(wsclean_results)
 
+            if beam_convergences is not None:
+                beam_convergences = task_assess_selfcal_convergence.map(
+                    wsclean_result=wsclean_results,
+                    selfcal_round=current_round,
+                    previous_convergence=beam_convergences,
+                    convergence_options=unmapped(  # type: ignore
+                        SelfcalConvergenceOptions(
+                            **get_options_from_strategy(
+                                strategy=strategy,
+                                mode="convergence",
+                                round_info=current_round,
+                                operation="selfcal",
+                            )
+                        )
+                    ),
+                )
+
             # Do source finding on the last round of self-cal'ed images
             if round == field_options.rounds and run_aegean:
                 task_run_bane_and_aegean.map(
@@ -517,6 +570,18 @@ def process_science_fields(
             wait_for=archive_wait_for,
         )
 
+    reorder_cache_directory = get_reorder_cache_directory(
+        reorder_cache=get_options_from_strategy(
+            strategy=strategy, mode="wsclean", round_info=0, operation="selfcal"
+        ).get("flint_reorder_cache")
+    )
+    if reorder_cache_directory:
+        task_clear_reorder_cache.submit(
+            cache_directory=reorder_cache_directory,
+            ms_parent=output_split_science_path,
+            wait_for=[*archive_wait_for, *wsclean_results],
+        )  # type: ignore
+
 
 def setup_run_process_science_field(
     cluster_config: str | Path,
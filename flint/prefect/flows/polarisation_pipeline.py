@@ -18,6 +18,7 @@ from flint.imager.wsclean import (
     WSCleanResult,
 )
 from flint.logging import logger
+from flint.manifest import create_manifest
 from flint.ms import find_mss
 from flint.naming import (
     CASDANameComponents,
@@ -68,6 +69,10 @@ def process_science_fields_pol(
         logger.info("No strategy provided. Returning.")
         return
 
+    if pol_field_options.use_manifest:
+        # Products are recorded so later searches of the directory avoid scanning it
+        create_manifest(directory=flint_ms_directory)
+
     # Get some placeholder names
     science_mss = list(
         find_mss(
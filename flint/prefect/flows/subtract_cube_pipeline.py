@@ -11,16 +11,20 @@ from __future__ import annotations
 
 from pathlib import Path
 from time import sleep
+from typing import Any
 
 import numpy as np
 from configargparse import ArgumentParser
-from fitscube.combine_fits import combine_fits
 from prefect import flow, task, unmapped
 
 from flint.coadd.linmos import LinmosResult
 from flint.configuration import get_options_from_strategy, load_and_copy_strategy
+from flint.contsub import ImageContsubOptions, subtract_continuum_from_cube
+from flint.cube import finalise_cube, write_plane_to_cube
 from flint.exceptions import FrequencyMismatchError
+from flint.imager.wsclean import split_wsclean_result_by_channel
 from flint.logging import logger
+from flint.manifest import create_manifest
 from flint.ms import (
     MS,
     consistent_ms_frequencies,
@@ -42,6 +46,7 @@ from flint.prefect.common.imaging import (
     task_get_common_beam_from_results,
     task_wsclean_imager,
 )
+from flint.prefect.common.utils import task_getitem
 
 
 # TODO: The wsclean pol mode conflicts with the addmodel one. Consider opens.
@@ -81,6 +86,7 @@ def _check_and_verify_options(
     if (
         addmodel_subtract_field_options
         and addmodel_subtract_field_options.attempt_addmodel
+        and not addmodel_subtract_field_options.native_predict
     ):
         assert addmodel_subtract_field_options.calibrate_container is not None, (
             "Calibrate container path is needede for addmodel"
@@ -176,7 +182,56 @@ def find_and_setup_mss(
     return science_mss
 
 
+def get_channel_blocks(channels: int, block_size: int = 1) -> list[tuple[int, int]]:
+    """Divide the channels of a measurement set into contiguous blocks, each
+    imaged by a single wsclean call. The last block may be smaller.
+
+    Args:
+        channels (int): The number of channels to image
+        block_size (int, optional): The number of channels in each block. Defaults to 1.
+
+    Raises:
+        ValueError: Raised when the block size is not positive
+
+    Returns:
+        list[tuple[int, int]]: The lower (inclusive) and upper (exclusive) channel of each block
+    """
+    if block_size < 1:
+        raise ValueError(f"{block_size=} should be a positive integer")
+
+    return [
+        (start, min(start + block_size, channels))
+        for start in range(0, channels, block_size)
+    ]
+
+
+def get_channel_block_wsclean_options(
+    wsclean_options: dict[str, Any], channel_block: tuple[int, int]
+) -> dict[str, Any]:
+    """Update the wsclean options used to image a single channel so that a
+    contiguous block of channels is imaged in one wsclean call. There is an
+    output image for every channel, and each is deconvolved independently as if
+    it were imaged on its own.
+
+    Args:
+        wsclean_options (dict[str, Any]): The wsclean options from the imaging strategy
+        channel_block (tuple[int, int]): The lower (inclusive) and upper (exclusive) channel of the block
+
+    Returns:
+        dict[str, Any]: The updated wsclean options
+    """
+    block_channels = channel_block[1] - channel_block[0]
+    block_wsclean_options = dict(wsclean_options, channels_out=block_channels)
+    if block_channels > 1:
+        block_wsclean_options.update(
+            join_channels=False, fit_spectral_pol=None, deconvolution_channels=None
+        )
+
+    return block_wsclean_options
+
+
 task_subtract_model_from_ms = task(subtract_model_from_data_column)
+task_split_wsclean_result_by_channel = task(split_wsclean_result_by_channel)
 
 
 @task
@@ -229,8 +284,23 @@ def task_addmodel_to_ms(
     ms: MS,
     addmodel_subtract_options: AddModelSubtractFieldOptions,
 ) -> MS:
+    """Predict model visibilities into a measurement set from the source list
+    produced by ``wsclean -save-source-list``. This is carried out by either
+    the ``addmodel`` program, or the native DFT predictor in ``flint.predict``
+    should ``native_predict`` be set.
+
+    Visibilities are predicted into the MS's ``MODEL_DATA`` column.
+
+    Args:
+        ms (MS): The measurement set where model visibilities will be predicted into.
+        addmodel_subtract_options (AddModelSubtractFieldOptions): Options around the prediction
+
+    Returns:
+        MS: An updated MS with the model column set
+    """
     from flint.calibrate.aocalibrate import AddModelOptions, add_model
     from flint.imager.wsclean import get_wsclean_output_source_list_path
+    from flint.predict import PredictOptions, predict_model_into_ms
 
     logger.info(f"Searching for wsclean source list for {ms.path}")
     for idx, pol in enumerate(addmodel_subtract_options.wsclean_pol_mode):
@@ -241,6 +311,16 @@ def task_addmodel_to_ms(
             f"{wsclean_source_list_path=} was requested, but does not exist"
         )
 
+        if addmodel_subtract_options.native_predict:
+            predict_model_into_ms(
+                ms=ms,
+                source_list_path=wsclean_source_list_path,
+                predict_options=PredictOptions(
+                    model_column="MODEL_DATA", mode="c" if idx == 0 else "a"
+                ),
+            )
+            continue
+
         # This should attempt to add model of different polarisations together.
         # But to this point it is a future proof and is not tested.
         addmodel_options = AddModelOptions(
@@ -261,53 +341,77 @@ def task_addmodel_to_ms(
     return ms.with_options(model_column="MODEL_DATA")
 
 
-@task
-def task_combine_all_linmos_images(
-    linmos_commands: list[LinmosResult],
-    remove_original_images: bool = False,
-    combine_weights: bool = False,
-) -> Path:
-    output_cube_path = Path("test.fits")
-
-    if combine_weights:
-        logger.info("Combining weight fits files")
-        images_to_combine = [
-            linmos_command.weight_fits for linmos_command in linmos_commands
-        ]
-        output_suffix = "weight"
-    else:
-        logger.info("Combining image fits files")
-        images_to_combine = [
-            linmos_command.image_fits for linmos_command in linmos_commands
-        ]
-        output_suffix = "linmos"
-
-    logger.info(f"Combining {len(images_to_combine)} FITS files together")
+def get_linmos_cube_names(
+    science_mss: tuple[MS, ...], pol: str = "i"
+) -> tuple[Path, Path]:
+    """Create the names of the cubes the per-channel linmos images and weights
+    are written to. These are based on the fields the measurement sets have in
+    common, and placed alongside them.
 
+    Args:
+        science_mss (tuple[MS, ...]): The measurement sets being imaged
+        pol (str, optional): The polarisation being imaged. Defaults to "i".
+
+    Returns:
+        tuple[Path, Path]: The image and weight cube names
+    """
     from flint.naming import create_image_cube_name, create_name_from_common_fields
 
-    assert len(images_to_combine) > 0, "No images to combine"
+    base_cube_path = create_name_from_common_fields(
+        in_paths=tuple(ms.path for ms in science_mss)
+    )
+    image_prefix = base_cube_path.parent / f"{base_cube_path.name}.{pol.lower()}"
 
-    base_cube_path = create_name_from_common_fields(in_paths=tuple(images_to_combine))
-    output_cube_path = create_image_cube_name(
-        image_prefix=base_cube_path, mode="contsub", suffix=output_suffix
+    return tuple(  # type: ignore[return-value]
+        Path(
+            create_image_cube_name(
+                image_prefix=image_prefix, mode="contsub", suffix=output_suffix
+            )
+        )
+        for output_suffix in ("linmos", "weight")
     )
 
-    _ = combine_fits(
-        file_list=images_to_combine,
-        out_cube=output_cube_path,
-        max_workers=4,
+
+@task
+def task_write_linmos_plane_to_cube(
+    linmos_result: LinmosResult,
+    output_cube: Path,
+    channel: int,
+    freqs_hz: list[float],
+    combine_weights: bool = False,
+    remove_original_images: bool = False,
+) -> Path:
+    """Write the linmos image, or weight image, of a single channel into its
+    plane of the output cube as soon as it is available
+
+    Args:
+        linmos_result (LinmosResult): The linmos of the channel
+        output_cube (Path): The cube being written, allocated by the first channel to arrive
+        channel (int): The index of the channel
+        freqs_hz (list[float]): The frequency of every channel of the cube
+        combine_weights (bool, optional): Write the weight image rather than the linmos image. Defaults to False.
+        remove_original_images (bool, optional): Remove the image once written to the cube. Defaults to False.
+
+    Returns:
+        Path: The cube written to
+    """
+    image = linmos_result.weight_fits if combine_weights else linmos_result.image_fits
+    write_plane_to_cube(
+        image_path=image, output_cube=output_cube, channel=channel, freqs_hz=freqs_hz
     )
 
     if remove_original_images:
-        logger.info(f"Removing original {len(images_to_combine)} images")
-        for image in images_to_combine:
-            logger.info(f"Removing {image=}")
-            assert isinstance(image, Path) and image.exists(), (
-                f"{image=} does not exist, but it should"
-            )
-            image.unlink()
-    return Path(output_cube_path)
+        logger.info(f"Removing {image=}")
+        assert isinstance(image, Path) and image.exists(), (
+            f"{image=} does not exist, but it should"
+        )
+        image.unlink()
+
+    return Path(output_cube)
+
+
+task_finalise_cube = task(finalise_cube)
+task_subtract_continuum_from_cube = task(subtract_continuum_from_cube)
 
 
 @flow
@@ -354,6 +458,10 @@ def flow_subtract_cube(
         crystalball_subtract_field_options=crystalball_subtract_field_options,
     )
 
+    if subtract_field_options.use_manifest:
+        # Products are recorded so later searches of the directory avoid scanning it
+        create_manifest(directory=science_path)
+
     # Find the MSs
     # - optionally untar?
     science_mss = find_and_setup_mss(
@@ -368,7 +476,10 @@ def flow_subtract_cube(
     logger.info(
         f"Considering {len(freqs_mhz)} frequencies from {len(science_mss)} channels, minimum {np.min(freqs_mhz)}-{np.max(freqs_mhz)}"
     )
-    if len(freqs_mhz) > 20 and subtract_field_options.stagger_delay_seconds is None:
+    if (
+        len(freqs_mhz) / subtract_field_options.channel_block_size > 20
+        and subtract_field_options.stagger_delay_seconds is None
+    ):
         logger.critical(
             f"{len(freqs_mhz)} channels and no stagger delay set! Consider setting a stagger delay"
         )
@@ -403,53 +514,104 @@ def flow_subtract_cube(
             update_tracked_column=True,
         )
 
-    channel_parset_list = []
-    for channel, freq_mhz in enumerate(freqs_mhz):
-        logger.info(f"Imaging {channel=} {freq_mhz=}")
-        channel_range = (channel, channel + 1)
-        channel_wsclean_cmds = task_wsclean_imager.with_options(retries=2).map(
+    channel_blocks = get_channel_blocks(
+        channels=len(freqs_mhz),
+        block_size=subtract_field_options.channel_block_size,
+    )
+    wsclean_options = get_options_from_strategy(
+        strategy=strategy,
+        mode="wsclean",
+        operation="subtractcube",
+    )
+
+    freqs_hz = list(freqs_mhz * 1e6)
+    linmos_cubes = get_linmos_cube_names(
+        science_mss=science_mss, pol=wsclean_options.get("pol", "i")
+    )
+
+    cube_writes = []
+    for channel_block in channel_blocks:
+        block_channels = channel_block[1] - channel_block[0]
+        logger.info(
+            f"Imaging {channel_block=} {freqs_mhz[channel_block[0]]}-{freqs_mhz[channel_block[1] - 1]} MHz"
+        )
+        block_wsclean_cmds = task_wsclean_imager.with_options(retries=2).map(
             in_ms=science_mss,
             wsclean_container=subtract_field_options.wsclean_container,
-            channel_range=unmapped(channel_range),
+            channel_range=unmapped(channel_block),
             update_wsclean_options=unmapped(
-                get_options_from_strategy(
-                    strategy=strategy,
-                    mode="wsclean",
-                    operation="subtractcube",
+                get_channel_block_wsclean_options(
+                    wsclean_options=wsclean_options, channel_block=channel_block
                 )
             ),
+            make_cube_from_subbands=unmapped(False),  # type: ignore
         )
-        channel_beam_shape = task_get_common_beam_from_results.submit(
-            wsclean_results=channel_wsclean_cmds,
-            cutoff=subtract_field_options.beam_cutoff,
-            filter_str="image.",
-        )
-        channel_parset = convolve_then_linmos(
-            wsclean_results=channel_wsclean_cmds,
-            beam_shape=channel_beam_shape,
-            linmos_suffix_str=None,
-            field_options=subtract_field_options,
-            convol_mode="image",
-            convol_filter="image.",
-            convol_suffix_str="optimal.conv",
-            trim_linmos_fits=False,  # This is necessary to ensure all images have same pixel-coordinates
-            remove_original_images=True,
-            cleanup_linmos=True,
-        )
-        channel_parset_list.append(channel_parset)
+        if block_channels == 1:
+            channels_wsclean_cmds = [block_wsclean_cmds]
+        else:
+            beam_channel_wsclean_cmds = task_split_wsclean_result_by_channel.map(
+                wsclean_result=block_wsclean_cmds
+            )
+            channels_wsclean_cmds = [
+                task_getitem.map(
+                    item=beam_channel_wsclean_cmds,
+                    index=unmapped(idx),  # type: ignore
+                )
+                for idx in range(block_channels)
+            ]
+
+        for channel, channel_wsclean_cmds in zip(
+            range(*channel_block), channels_wsclean_cmds
+        ):
+            channel_beam_shape = task_get_common_beam_from_results.submit(
+                wsclean_results=channel_wsclean_cmds,
+                cutoff=subtract_field_options.beam_cutoff,
+                filter_str="image.",
+            )
+            channel_parset = convolve_then_linmos(
+                wsclean_results=channel_wsclean_cmds,
+                beam_shape=channel_beam_shape,
+                linmos_suffix_str=None,
+                field_options=subtract_field_options,
+                convol_mode="image",
+                convol_filter="image.",
+                convol_suffix_str="optimal.conv",
+                trim_linmos_fits=False,  # This is necessary to ensure all images have same pixel-coordinates
+                remove_original_images=True,
+                cleanup_linmos=True,
+            )
+            # Each plane is written to the cubes as soon as its linmos finishes
+            for linmos_cube, combine_weights in zip(linmos_cubes, (False, True)):
+                cube_writes.append(
+                    task_write_linmos_plane_to_cube.submit(
+                        linmos_result=channel_parset,
+                        output_cube=linmos_cube,
+                        channel=channel,
+                        freqs_hz=freqs_hz,
+                        combine_weights=combine_weights,
+                        remove_original_images=True,
+                    )
+                )
 
         if subtract_field_options.stagger_delay_seconds:
             sleep(subtract_field_options.stagger_delay_seconds)
 
-    # 4 - cube concatenated each linmos field together to single file
-    task_combine_all_linmos_images.submit(
-        linmos_commands=channel_parset_list, remove_original_images=True
-    )
-    task_combine_all_linmos_images.submit(
-        linmos_commands=channel_parset_list,
-        remove_original_images=True,
-        combine_weights=True,
-    )
+    # 4 - finalise the cubes once every plane has been written
+    finalised_cubes = [
+        task_finalise_cube.submit(output_cube=linmos_cube, wait_for=cube_writes)  # type: ignore
+        for linmos_cube in linmos_cubes
+    ]
+
+    # 5 - optionally remove the continuum in the image plane
+    if subtract_field_options.image_contsub:
+        contsub_options = ImageContsubOptions(
+            **get_options_from_strategy(
+                strategy=strategy, mode="imcontsub", operation="subtractcube"
+            )
+        )
+        task_subtract_continuum_from_cube.submit(
+            cube_path=finalised_cubes[0], contsub_options=contsub_options
+        )
 
     return
 
@@ -2,16 +2,52 @@
 
 from __future__ import annotations
 
+import atexit
+import hashlib
+import json
+import os
+import re
+import resource
+import shlex
+import shutil
+import socket
+import subprocess
+import threading
+from collections import deque
+from contextlib import contextmanager
 from pathlib import Path
 from subprocess import CalledProcessError
-from time import sleep
-from typing import Callable, Collection
+from time import monotonic, sleep, time
+from typing import (
+    Any,
+    Callable,
+    Collection,
+    Generator,
+    Iterator,
+    Literal,
+    NamedTuple,
+    Protocol,
+)
 
 from spython.main import Client as sclient
 
 from flint.exceptions import AttemptRerunException
 from flint.logging import logger
-from flint.utils import get_job_info, log_job_environment
+from flint.utils import (
+    file_lock,
+    get_environment_variable,
+    get_job_info,
+    get_thread_environment,
+    log_job_environment,
+    wait_for_paths,
+)
+
+INSTANCE_POOL_ENVIRONMENT_VARIABLE = "FLINT_SINGULARITY_INSTANCE_POOL"
+"""Environment variable that, when set to a true-like value, enables the instance pool in each process"""
+NATIVE_TOOLS_ENVIRONMENT_VARIABLE = "FLINT_NATIVE_TOOLS"
+"""Environment variable listing the tools (comma separated executable names, or ``all``) that should run natively rather than in their container"""
+RESOURCE_USAGE_ENVIRONMENT_VARIABLE = "FLINT_RESOURCE_USAGE_PATH"
+"""Environment variable that, when set, is the JSON-lines file each container command's resource usage is appended to"""
 
 
 def pull_container(container_directory: Path, uri: str, file_name: str) -> Path:
@@ -41,40 +77,761 @@ def pull_container(container_directory: Path, uri: str, file_name: str) -> Path:
     return container_path
 
 
+class ResourceUsage(NamedTuple):
+    """Resources consumed by a single command executed in a container.
+
+    CPU times, peak memory and I/O are derived from the children of this
+    process, so are only meaningful when commands are not run concurrently
+    from multiple threads of the same process. Commands executed within a
+    pooled singularity instance (see ``SingularityInstancePool``) run
+    underneath the instance rather than this process, and are not fully
+    accounted for.
+    """
+
+    command: str
+    """The command that was executed"""
+    image: Path | None
+    """The container the command was executed in. None if executed natively"""
+    hostname: str
+    """The node the command was executed on"""
+    start_time: float
+    """Unix time the command was started"""
+    wall_time: float
+    """Elapsed time of the command, in seconds"""
+    user_time: float
+    """User CPU time of the command and its children, in seconds"""
+    system_time: float
+    """System CPU time of the command and its children, in seconds"""
+    max_rss_kb: int
+    """Peak resident set size of the largest process of the command, in kilobytes. This is the
+    peak over all reaped children of this process, so a small command following a large one reports the larger"""
+    read_bytes: int | None = None
+    """Bytes read from storage by the command, if the I/O counters in ``/proc`` are available"""
+    write_bytes: int | None = None
+    """Bytes written to storage by the command, if the I/O counters in ``/proc`` are available"""
+
+    def to_dict(self) -> dict[str, Any]:
+        """Convert to a JSON serialisable dictionary"""
+        return {
+            **self._asdict(),
+            "image": str(self.image) if self.image else None,
+        }
+
+
+class _UsageSnapshot(NamedTuple):
+    """Counters captured before a command is executed"""
+
+    start_time: float
+    start_monotonic: float
+    rusage: resource.struct_rusage
+    io: dict[str, int] | None
+
+
+def _read_proc_io() -> dict[str, int] | None:
+    """Read the I/O counters of this process. These include the counters
+    of children once they have been waited on.
+
+    Returns:
+        Optional[Dict[str, int]]: The counters, or None if they are unavailable
+    """
+    try:
+        with open("/proc/self/io") as io_file:
+            lines = io_file.readlines()
+    except OSError:
+        return None
+
+    counters = {}
+    for line in lines:
+        key, _, value = line.partition(":")
+        counters[key.strip()] = int(value)
+
+    return counters
+
+
+def _take_usage_snapshot() -> _UsageSnapshot:
+    return _UsageSnapshot(
+        start_time=time(),
+        start_monotonic=monotonic(),
+        rusage=resource.getrusage(resource.RUSAGE_CHILDREN),
+        io=_read_proc_io(),
+    )
+
+
+def get_resource_usage(
+    command: str, image: Path | None, usage_snapshot: _UsageSnapshot
+) -> ResourceUsage:
+    """Compute the resources used since a snapshot was taken
+    before a command was executed.
+
+    Args:
+        command (str): The command that was executed
+        image (Optional[Path]): The container the command was executed in. None if executed natively.
+        usage_snapshot (_UsageSnapshot): Counters captured before the command was executed
+
+    Returns:
+        ResourceUsage: The resources used by the command
+    """
+    rusage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    io = _read_proc_io()
+
+    read_bytes, write_bytes = None, None
+    if io is not None and usage_snapshot.io is not None:
+        read_bytes = io.get("read_bytes", 0) - usage_snapshot.io.get("read_bytes", 0)
+        write_bytes = io.get("write_bytes", 0) - usage_snapshot.io.get("write_bytes", 0)
+
+    return ResourceUsage(
+        command=command,
+        image=image,
+        hostname=socket.gethostname(),
+        start_time=usage_snapshot.start_time,
+        wall_time=monotonic() - usage_snapshot.start_monotonic,
+        user_time=rusage.ru_utime - usage_snapshot.rusage.ru_utime,
+        system_time=rusage.ru_stime - usage_snapshot.rusage.ru_stime,
+        max_rss_kb=rusage.ru_maxrss,
+        read_bytes=read_bytes,
+        write_bytes=write_bytes,
+    )
+
+
+_RESOURCE_USAGE_LOCK = threading.Lock()
+
+
+def append_resource_usage(resource_usage: ResourceUsage, output_path: Path) -> Path:
+    """Append a resource usage record as a single line to a JSON-lines file
+
+    Args:
+        resource_usage (ResourceUsage): The record to write
+        output_path (Path): The JSON-lines file to append to. It is created if needed.
+
+    Returns:
+        Path: The file written to
+    """
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+
+    line = json.dumps(resource_usage.to_dict()) + "\n"
+    with _RESOURCE_USAGE_LOCK, open(output_path, "a") as out_file:
+        out_file.write(line)
+
+    return output_path
+
+
+CONTAINER_CACHE_ENVIRONMENT_VARIABLE = "FLINT_CONTAINER_CACHE"
+"""Environment variable that, when set, is the node-local directory containers are staged into before being executed"""
+CONTAINER_CACHE_SIZE_ENVIRONMENT_VARIABLE = "FLINT_CONTAINER_CACHE_SIZE_GB"
+"""Environment variable that sets the size budget of the container cache, in gigabytes"""
+
+
+class ContainerCacheEntry(NamedTuple):
+    """Description of a container staged into a node-local cache"""
+
+    source: Path
+    """The original container on shared storage"""
+    path: Path
+    """The staged copy of the container"""
+    size: int
+    """Size of the container in bytes"""
+    source_mtime: float
+    """Modification time of ``source`` when it was staged"""
+    sha256: str
+    """Checksum of the container"""
+
+
+def _copy_with_checksum(source: Path, destination: Path) -> str:
+    sha256 = hashlib.sha256()
+    with open(source, "rb") as in_file, open(destination, "wb") as out_file:
+        while chunk := in_file.read(16 * 1024 * 1024):
+            sha256.update(chunk)
+            out_file.write(chunk)
+
+    return sha256.hexdigest()
+
+
+def _file_checksum(path: Path) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as in_file:
+        while chunk := in_file.read(16 * 1024 * 1024):
+            sha256.update(chunk)
+
+    return sha256.hexdigest()
+
+
+def _load_cache_entry(metadata_path: Path) -> ContainerCacheEntry | None:
+    try:
+        metadata = json.loads(metadata_path.read_text())
+        return ContainerCacheEntry(
+            source=Path(metadata["source"]),
+            path=Path(metadata["path"]),
+            size=int(metadata["size"]),
+            source_mtime=float(metadata["source_mtime"]),
+            sha256=str(metadata["sha256"]),
+        )
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _is_staged(
+    staged_path: Path, metadata_path: Path, image_stat: os.stat_result
+) -> bool:
+    """Whether an up to date copy of a container is in the cache"""
+    entry = _load_cache_entry(metadata_path=metadata_path)
+    return bool(
+        entry
+        and staged_path.exists()
+        and entry.size == image_stat.st_size
+        and entry.source_mtime == image_stat.st_mtime
+        and staged_path.stat().st_size == entry.size
+    )
+
+
+def evict_container_cache(
+    cache_directory: Path, max_cache_size: int, keep: Collection[Path] = ()
+) -> list[Path]:
+    """Remove the least recently used containers from a cache until it is within
+    its size budget. The last use of a container is tracked by the modification
+    time of its metadata file.
+
+    The cache lock should be held by the caller.
+
+    Args:
+        cache_directory (Path): The cache to evict containers from
+        max_cache_size (int): Size budget of the cache, in bytes
+        keep (Collection[Path], optional): Staged containers that should not be evicted. Defaults to ().
+
+    Returns:
+        List[Path]: The staged containers that were removed
+    """
+    keep = set(Path(k) for k in keep)
+    entries = []
+    for metadata_path in cache_directory.glob("*.sif.json"):
+        entry = _load_cache_entry(metadata_path=metadata_path)
+        if entry is None or not entry.path.exists():
+            continue
+        entries.append((metadata_path.stat().st_mtime, metadata_path, entry))
+
+    total_size = sum(entry.size for _, _, entry in entries)
+    removed = []
+    for _, metadata_path, entry in sorted(entries, key=lambda e: e[0]):
+        if total_size <= max_cache_size:
+            break
+        if entry.path in keep:
+            continue
+        logger.info(f"Evicting {entry.path} from the container cache")
+        entry.path.unlink(missing_ok=True)
+        metadata_path.unlink(missing_ok=True)
+        total_size -= entry.size
+        removed.append(entry.path)
+
+    return removed
+
+
+def stage_container(
+    image: Path, cache_directory: Path, max_cache_size: int | None = None
+) -> Path:
+    """Copy a container into a node-local cache, and return the path to
+    the staged copy. A container that has already been staged is reused,
+    provided the original has not changed since. Copies are verified by
+    their size and checksum.
+
+    The cache is guarded by a lock file in the cache directory, which is not
+    held while copying. A container staged by two tasks at once is copied
+    by both, and the first copy is kept. Should the cache grow beyond
+    ``max_cache_size`` the least recently used containers, other than the
+    one being staged, are evicted.
+
+    Args:
+        image (Path): The container on shared storage
+        cache_directory (Path): The node-local directory to stage containers into
+        max_cache_size (Optional[int], optional): Size budget of the cache in bytes. If None the cache is not limited. Defaults to None.
+
+    Returns:
+        Path: The staged container. If staging failed the original ``image`` is returned.
+    """
+    image = Path(image).resolve(strict=True)
+    cache_directory = Path(cache_directory)
+    cache_directory.mkdir(parents=True, exist_ok=True)
+
+    image_stat = image.stat()
+    path_hash = hashlib.sha256(image.as_posix().encode()).hexdigest()[:12]
+    staged_path = cache_directory / f"{path_hash}_{image.stem}.sif"
+    metadata_path = staged_path.with_suffix(".sif.json")
+
+    lock_path = cache_directory / ".flint_container_cache.lock"
+    with file_lock(lock_path=lock_path):
+        if _is_staged(
+            staged_path=staged_path, metadata_path=metadata_path, image_stat=image_stat
+        ):
+            logger.info(f"Using staged container {staged_path}")
+            # Mark as recently used
+            os.utime(metadata_path)
+            return staged_path
+
+        if max_cache_size is not None:
+            # Make room for the copy
+            evict_container_cache(
+                cache_directory=cache_directory,
+                max_cache_size=max(max_cache_size - image_stat.st_size, 0),
+                keep={staged_path},
+            )
+
+    # The lock is not held while copying, so that other containers may be
+    # used from the cache in the meantime
+    logger.info(f"Staging {image} to {staged_path}")
+    temp_path = staged_path.with_suffix(
+        f".sif.{os.getpid()}.{threading.get_ident()}.tmp"
+    )
+    try:
+        sha256 = _copy_with_checksum(source=image, destination=temp_path)
+        if temp_path.stat().st_size != image_stat.st_size or sha256 != (
+            _file_checksum(path=temp_path)
+        ):
+            raise OSError(f"Verification of the staged copy of {image} failed")
+    except OSError as e:
+        logger.warning(f"Failed to stage {image}, using the original. {e}")
+        temp_path.unlink(missing_ok=True)
+        return image
+
+    with file_lock(lock_path=lock_path):
+        if _is_staged(
+            staged_path=staged_path, metadata_path=metadata_path, image_stat=image_stat
+        ):
+            logger.info(f"{image} was staged concurrently, using {staged_path}")
+            temp_path.unlink(missing_ok=True)
+            os.utime(metadata_path)
+            return staged_path
+
+        temp_path.replace(staged_path)
+        entry = ContainerCacheEntry(
+            source=image,
+            path=staged_path,
+            size=image_stat.st_size,
+            source_mtime=image_stat.st_mtime,
+            sha256=sha256,
+        )
+        metadata_path.write_text(
+            json.dumps(
+                {**entry._asdict(), "source": str(image), "path": str(staged_path)}
+            )
+        )
+
+        if max_cache_size is not None:
+            evict_container_cache(
+                cache_directory=cache_directory,
+                max_cache_size=max_cache_size,
+                keep={staged_path},
+            )
+
+    return staged_path
+
+
+def get_staged_container(image: Path) -> Path:
+    """Return the container to execute, staging it into the node-local
+    cache when the ``FLINT_CONTAINER_CACHE`` environment variable is set.
+    The size budget of the cache is set by ``FLINT_CONTAINER_CACHE_SIZE_GB``.
+
+    Args:
+        image (Path): The container on shared storage
+
+    Returns:
+        Path: The staged container if caching is enabled, otherwise ``image``
+    """
+    cache_directory = get_environment_variable(CONTAINER_CACHE_ENVIRONMENT_VARIABLE)
+    if not cache_directory:
+        return image
+
+    cache_size = get_environment_variable(CONTAINER_CACHE_SIZE_ENVIRONMENT_VARIABLE)
+    max_cache_size = int(float(cache_size) * 1024**3) if cache_size else None
+
+    return stage_container(
+        image=image,
+        cache_directory=Path(os.path.expandvars(cache_directory)),
+        max_cache_size=max_cache_size,
+    )
+
+
+def _get_resource_usage_path(resource_usage_path: Path | None) -> Path | None:
+    if resource_usage_path is not None:
+        return Path(resource_usage_path)
+
+    value = get_environment_variable(RESOURCE_USAGE_ENVIRONMENT_VARIABLE)
+    return Path(value) if value else None
+
+
+class SingularityInstancePool:
+    """Start and reuse persistent singularity instances, so that repeated
+    commands against the same container do not each pay for the image
+    mount and namespace set up.
+
+    An instance is started for each unique combination of container and
+    bind directories, and commands are executed within it. Instances live
+    until ``stop_all`` is called.
+    """
+
+    def __init__(self, prefix: str = "flint") -> None:
+        """Create an empty pool
+
+        Args:
+            prefix (str, optional): Prefix of the instance names. The process ID is appended to ensure names are unique on a node. Defaults to "flint".
+        """
+        self.prefix = f"{prefix}_{os.getpid()}"
+        self.instances: dict[tuple[str, tuple[str, ...]], Any] = {}
+        self._lock = threading.Lock()
+        self._counter = 0
+
+    @staticmethod
+    def _key(image: Path, bind: Collection[str] | None) -> tuple[str, tuple[str, ...]]:
+        return (
+            image.resolve(strict=True).as_posix(),
+            tuple(sorted(set(bind))) if bind else (),
+        )
+
+    def get_instance(self, image: Path, bind: Collection[str] | None = None) -> Any:
+        """Get the running instance for a container and set of binds, starting it
+        if needed.
+
+        Args:
+            image (Path): The singularity container
+            bind (Optional[Collection[str]], optional): Resolved directories bound into the instance. Defaults to None.
+
+        Returns:
+            Any: The ``spython`` instance that commands may be executed in
+        """
+        key = self._key(image=image, bind=bind)
+        with self._lock:
+            if key not in self.instances:
+                name = f"{self.prefix}_{self._counter}"
+                self._counter += 1
+                options = ["--bind", ",".join(key[1])] if key[1] else None
+                logger.info(f"Starting singularity instance {name} of {key[0]}")
+                self.instances[key] = sclient.instance(
+                    key[0], name=name, options=options, quiet=True
+                )
+
+            return self.instances[key]
+
+    def discard(self, image: Path, bind: Collection[str] | None = None) -> None:
+        """Stop and forget the instance of a container and set of binds. The
+        next request would start a new instance.
+
+        Args:
+            image (Path): The singularity container
+            bind (Optional[Collection[str]], optional): Resolved directories bound into the instance. Defaults to None.
+        """
+        key = self._key(image=image, bind=bind)
+        with self._lock:
+            instance = self.instances.pop(key, None)
+        if instance is not None:
+            _stop_instance(instance=instance)
+
+    def stop_all(self) -> None:
+        """Stop all instances started by the pool"""
+        with self._lock:
+            instances = list(self.instances.values())
+            self.instances.clear()
+        for instance in instances:
+            _stop_instance(instance=instance)
+
+
+def _stop_instance(instance: Any) -> None:
+    try:
+        logger.info(f"Stopping singularity instance {instance.name}")
+        instance.stop()
+    except Exception as e:
+        logger.warning(f"Failed to stop {instance.name}: {e}")
+
+
+_INSTANCE_POOL: SingularityInstancePool | None = None
+
+
+def instance_pool_requested() -> bool:
+    """Whether the ``FLINT_SINGULARITY_INSTANCE_POOL`` environment variable
+    requests a singularity instance pool
+
+    Returns:
+        bool: True if the variable is set to a true-like value
+    """
+    value = get_environment_variable(INSTANCE_POOL_ENVIRONMENT_VARIABLE)
+    return value is not None and value.lower() in ("1", "true", "yes", "on")
+
+
+def get_instance_pool() -> SingularityInstancePool | None:
+    """Return the active singularity instance pool of this process, if any.
+
+    A pool is active within a ``singularity_instance_pool`` context, or when
+    the ``FLINT_SINGULARITY_INSTANCE_POOL`` environment variable is set to a
+    true-like value. Dask workers enter a ``singularity_instance_pool`` context
+    as they start when the variable is set, stopping the instances as the
+    worker closes (see ``flint.prefect.clusters.dask_setup``). Otherwise the
+    instances of a pool enabled by the variable are stopped when the process
+    exits.
+
+    Returns:
+        Optional[SingularityInstancePool]: The active pool, otherwise None
+    """
+    global _INSTANCE_POOL
+
+    if _INSTANCE_POOL is None:
+        if instance_pool_requested():
+            logger.info(f"{INSTANCE_POOL_ENVIRONMENT_VARIABLE} set. Enabling pool.")
+            _INSTANCE_POOL = SingularityInstancePool()
+            atexit.register(_INSTANCE_POOL.stop_all)
+
+    return _INSTANCE_POOL
+
+
+@contextmanager
+def singularity_instance_pool(
+    prefix: str = "flint",
+) -> Generator[SingularityInstancePool, None, None]:
+    """Enable a singularity instance pool for commands run through
+    ``run_singularity_command`` within this context. All instances are
+    stopped when the context exits.
+
+    Args:
+        prefix (str, optional): Prefix of the instance names. Defaults to "flint".
+
+    Yields:
+        Generator[SingularityInstancePool, None, None]: The active pool
+    """
+    global _INSTANCE_POOL
+
+    previous_pool = _INSTANCE_POOL
+    pool = SingularityInstancePool(prefix=prefix)
+    _INSTANCE_POOL = pool
+    try:
+        yield pool
+    finally:
+        pool.stop_all()
+        _INSTANCE_POOL = previous_pool
+
+
+class StreamedOutputHandler:
+    """Handle the lines of output streamed from a command. Every line is
+    written to a log file, and only a summary is forwarded to the logger:
+    the first and last lines, any line that looks like an error, and at
+    most one progress line per ``progress_interval`` seconds.
+
+    This keeps verbose tools (e.g. a deep wsclean clean) from producing a log
+    record, and an orchestration database write, for each line.
+    """
+
+    def __init__(
+        self,
+        log_path: Path,
+        head_lines: int = 20,
+        tail_lines: int = 20,
+        progress_interval: float = 30.0,
+        error_pattern: str = r"error|exception|traceback|fatal|abort",
+    ) -> None:
+        """Create a handler that writes the full output to ``log_path``
+
+        Args:
+            log_path (Path): The file the full output is written to. An existing file is overwritten.
+            head_lines (int, optional): Number of lines at the start of the output that are logged. Defaults to 20.
+            tail_lines (int, optional): Number of lines at the end of the output that are logged. Defaults to 20.
+            progress_interval (float, optional): Minimum number of seconds between logging the latest line as a progress update. Defaults to 30.0.
+            error_pattern (str, optional): Case insensitive regular expression of lines that are always logged. Defaults to r"error|exception|traceback|fatal|abort".
+        """
+        self.log_path = Path(log_path)
+        self.head_lines = head_lines
+        self.progress_interval = progress_interval
+        self.error_regex = re.compile(error_pattern, re.IGNORECASE)
+
+        self.total_lines = 0
+        self.logged_lines = 0
+        self._tail: deque[tuple[int, str]] = deque(maxlen=tail_lines)
+        self._last_logged_idx = -1
+        self._last_progress = monotonic()
+
+        self.log_path.parent.mkdir(parents=True, exist_ok=True)
+        self._log_file = open(self.log_path, "w")
+
+    def _log(self, idx: int, line: str) -> None:
+        logger.info(line)
+        self.logged_lines += 1
+        self._last_logged_idx = idx
+
+    def __call__(self, line: str) -> None:
+        """Handle a single line of output
+
+        Args:
+            line (str): The line of output, including any trailing new line
+        """
+        self._log_file.write(line)
+        idx = self.total_lines
+        self.total_lines += 1
+        line = line.rstrip()
+
+        now = monotonic()
+        if idx < self.head_lines or self.error_regex.search(line):
+            self._log(idx=idx, line=line)
+        elif now - self._last_progress >= self.progress_interval:
+            self._log(idx=idx, line=f"[progress, line {idx + 1}] {line}")
+            self._last_progress = now
+        else:
+            self._tail.append((idx, line))
+
+    def close(self) -> None:
+        """Log the last lines of output that have not already been logged,
+        and a summary of the number of lines that were suppressed"""
+        if self._log_file.closed:
+            return
+        self._log_file.close()
+
+        tail = [(idx, line) for idx, line in self._tail if idx > self._last_logged_idx]
+        suppressed = self.total_lines - self.logged_lines - len(tail)
+        if suppressed > 0:
+            logger.info(
+                f"... {suppressed} of {self.total_lines} lines not logged. Full output in {self.log_path}"
+            )
+        for idx, line in tail:
+            self._log(idx=idx, line=line)
+
+
+ExecutionBackend = Literal["singularity", "native"]
+"""How a command is executed. ``singularity`` runs it within the nominated container, ``native`` runs it directly on the host"""
+
+
+def get_execution_backend(
+    command: str, execution_backend: ExecutionBackend | None = None
+) -> ExecutionBackend:
+    """Resolve the backend a command should be executed with. An explicitly
+    nominated backend is always used. Otherwise, the command is executed
+    natively if its executable is listed in the ``FLINT_NATIVE_TOOLS``
+    environment variable (or that variable is ``all``), and in its
+    singularity container if not.
+
+    Args:
+        command (str): The command to be executed
+        execution_backend (Optional[ExecutionBackend], optional): An explicitly nominated backend. Defaults to None.
+
+    Returns:
+        ExecutionBackend: The backend to execute the command with
+    """
+    if execution_backend is not None:
+        if execution_backend not in ("singularity", "native"):
+            raise ValueError(f"Unknown {execution_backend=}")
+        return execution_backend
+
+    native_tools = get_environment_variable(NATIVE_TOOLS_ENVIRONMENT_VARIABLE)
+    if not native_tools:
+        return "singularity"
+
+    tools = [tool.strip() for tool in native_tools.split(",")]
+    executable = Path(command.split()[0]).name if command.strip() else ""
+    return "native" if "all" in tools or executable in tools else "singularity"
+
+
+def _execute_native(
+    command: str, environment: dict[str, str] | None = None
+) -> Iterator[str]:
+    """Execute a command on the host, yielding each line of the combined
+    stdout and stderr as it is produced.
+
+    Args:
+        command (str): The command to execute
+        environment (Optional[Dict[str, str]], optional): Additional environment variables to set for the command. Defaults to None.
+
+    Raises:
+        FileNotFoundError: Raised if the executable can not be found
+        CalledProcessError: Raised if the command returns a non-zero exit code
+
+    Yields:
+        Iterator[str]: Lines of output
+    """
+    cmd = command.split()
+    if shutil.which(cmd[0]) is None:
+        raise FileNotFoundError(f"The executable {cmd[0]} was not found on the PATH")
+
+    process = subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        universal_newlines=True,
+        env={**os.environ, **environment} if environment else None,
+    )
+    assert process.stdout is not None
+    finished = False
+    try:
+        yield from iter(process.stdout.readline, "")
+        finished = True
+    finally:
+        # Should the output be abandoned (e.g. a callback raised an
+        # error) make sure the command does not linger
+        if not finished and process.poll() is None:
+            process.kill()
+        process.stdout.close()
+        return_code = process.wait()
+
+    if return_code:
+        raise subprocess.CalledProcessError(return_code, shlex.join(cmd))
+
+
 def run_singularity_command(
-    image: Path,
+    image: Path | None,
     command: str,
     bind_dirs: Path | Collection[Path] | None = None,
     stream_callback_func: Callable | None = None,
     ignore_logging_output: bool = False,
     max_retries: int = 2,
-) -> None:
+    expected_outputs: Path | Collection[Path] | None = None,
+    expected_outputs_timeout: float = 30.0,
+    resource_usage_path: Path | None = None,
+    execution_backend: ExecutionBackend | None = None,
+    output_log_path: Path | None = None,
+    threads: int | None = None,
+) -> ResourceUsage:
     """Executes a command within the context of a nominated singularity
-    container
+    container, or natively on the host when the native execution backend
+    is selected (see ``get_execution_backend``).
 
     Args:
-        image (Path): The singularity container image to use
+        image (Optional[Path]): The singularity container image to use. Only optional when executing natively.
         command (str): The command to execute
         bind_dirs (Optional[Union[Path,Collection[Path]]], optional): Specifies a Path, or list of Paths, to bind to in the container. Defaults to None.
         stream_callback_func (Optional[Callable], optional): Provide a function that is applied to each line of output text when singularity is running and `stream=True`. IF provide it should accept a single (string) parameter. If None, nothing happens. Defaultds to None.
         ignore_logging_output (bool, optional): If `True` output from the executed singularity command is not logged. Defaults to False.
         max_reties (int, optional): If a callback handler is specified which raised an `AttemptRerunException`, this signifies how many attempts should be made. Defaults to 2.
+        expected_outputs (Optional[Union[Path,Collection[Path]]], optional): Files the command is expected to create, such as solution files or the ``table.dat`` of a new table. Once the command finishes these are polled until they exist with a stable size. Inputs modified in place already exist and should not be given. If None a fixed delay is used instead. Defaults to None.
+        expected_outputs_timeout (float, optional): Maximum number of seconds to wait for ``expected_outputs``. Defaults to 30.0.
+        resource_usage_path (Optional[Path], optional): A JSON-lines file the resource usage of the command is appended to. If None the ``FLINT_RESOURCE_USAGE_PATH`` environment variable is used, if set. Defaults to None.
+        execution_backend (Optional[ExecutionBackend], optional): Execute the command in its container (``singularity``) or directly on the host (``native``). If None the backend is resolved with ``get_execution_backend``. Defaults to None.
+        output_log_path (Optional[Path], optional): If provided the full output of the command is written to this file, and only a rate-limited summary is logged (see ``StreamedOutputHandler``). ``stream_callback_func`` still receives every line. Defaults to None.
+        threads (Optional[int], optional): If provided, the OpenMP and BLAS thread environment variables of the command are set to this (see ``get_thread_environment``). Thread options of the tool itself should be set in ``command``. Defaults to None.
+
+    If a ``SingularityInstancePool`` is active (see ``get_instance_pool``) the command is
+    executed in a persistent instance of ``image`` started with the same ``bind_dirs``.
 
     Raises:
         FileNotFoundError: Thrown when container image not found
         CalledProcessError: Thrown when the command into the container was not successful
+
+    Returns:
+        ResourceUsage: The command that was executed and the resources it used
     """
     if max_retries <= 0:
         raise ValueError("Too many retries")
 
-    if not image.exists():
+    backend = get_execution_backend(
+        command=command, execution_backend=execution_backend
+    )
+
+    if backend == "singularity" and (image is None or not image.exists()):
         raise FileNotFoundError(f"The singularity container {image} was not found. ")
 
-    logger.info(f"Running {command} in {image}")
+    logger.info(
+        f"Running {command} natively"
+        if backend == "native"
+        else f"Running {command} in {image}"
+    )
 
     job_info = log_job_environment()
+    thread_environment = get_thread_environment(threads=threads) if threads else None
+    if thread_environment:
+        logger.info(f"Setting {thread_environment=}")
+
     bind: None | list[str] = None
-    if bind_dirs:
+    if bind_dirs and backend == "singularity":
         logger.info("Preparing bind directories")
         if isinstance(bind_dirs, Path):
             bind_dirs = [bind_dirs]
@@ -89,39 +846,108 @@ def run_singularity_command(
 
         logger.info(f"Constructed singularity bindings: {bind}")
 
+    run_image: Path | None = None
+    instance_pool: SingularityInstancePool | None = None
+    if backend == "singularity":
+        assert image is not None
+        run_image = get_staged_container(image=image)
+
+        # Commands in a pooled instance use the binds the instance started with
+        instance_pool = get_instance_pool()
+        execute_image = (
+            instance_pool.get_instance(image=run_image, bind=bind)
+            if instance_pool
+            else run_image.resolve(strict=True).as_posix()
+        )
+
     try:
-        output = sclient.execute(
-            image=image.resolve(strict=True).as_posix(),
-            command=command.split(),
-            bind=bind,
-            return_result=True,
-            quiet=False,
-            stream=True,
-            stream_type="both",
+        usage_snapshot = _take_usage_snapshot()
+        output = (
+            _execute_native(command=command, environment=thread_environment)
+            if backend == "native"
+            else sclient.execute(
+                image=execute_image,
+                command=command.split(),
+                bind=None if instance_pool else bind,
+                return_result=True,
+                quiet=False,
+                stream=True,
+                stream_type="both",
+                options=(
+                    [
+                        "--env",
+                        ",".join(f"{k}={v}" for k, v in thread_environment.items()),
+                    ]
+                    if thread_environment
+                    else None
+                ),
+            )
         )
 
-        for line in output:
-            if not ignore_logging_output:
-                logger.info(line.rstrip())
-            if stream_callback_func:
-                stream_callback_func(line)
+        output_handler = (
+            StreamedOutputHandler(log_path=output_log_path)
+            if output_log_path and not ignore_logging_output
+            else None
+        )
+        try:
+            for line in output:
+                if output_handler:
+                    output_handler(line)
+                elif not ignore_logging_output:
+                    logger.info(line.rstrip())
+                if stream_callback_func:
+                    stream_callback_func(line)
+        finally:
+            if output_handler:
+                output_handler.close()
+            # Should the output be abandoned (e.g. a callback requested a
+            # rerun) closing it stops the command before anything else runs
+            if hasattr(output, "close"):
+                output.close()
 
-        # Sleep for a few moments. If the command created files (often they do), give the lustre a moment
-        # to properly register them. You dirty sea dog.
-        sleep(2.0)
+        resource_usage = get_resource_usage(
+            command=command,
+            image=image if backend == "singularity" else None,
+            usage_snapshot=usage_snapshot,
+        )
+        logger.info(
+            f"Command finished in {resource_usage.wall_time:.1f}s, "
+            f"user={resource_usage.user_time:.1f}s system={resource_usage.system_time:.1f}s "
+            f"max_rss={resource_usage.max_rss_kb}KB"
+        )
+        usage_path = _get_resource_usage_path(resource_usage_path=resource_usage_path)
+        if usage_path:
+            append_resource_usage(resource_usage=resource_usage, output_path=usage_path)
+
+        # If the command created files (often they do), give the lustre a moment
+        # to properly register them. You dirty sea dog. Without knowing what
+        # to look for, sleep for a few moments.
+        if expected_outputs is None:
+            sleep(2.0)
+        else:
+            wait_for_paths(paths=expected_outputs, timeout=expected_outputs_timeout)
     except AttemptRerunException as e:
         logger.info("A callback handler has raised an error. Attempting to rerun.")
         logger.info(f"{e=}")
-        run_singularity_command(
+        return run_singularity_command(
             image=image,
             command=command,
             bind_dirs=bind_dirs,
             stream_callback_func=stream_callback_func,
             ignore_logging_output=ignore_logging_output,
             max_retries=max_retries - 1,
+            expected_outputs=expected_outputs,
+            expected_outputs_timeout=expected_outputs_timeout,
+            resource_usage_path=resource_usage_path,
+            execution_backend=backend,
+            output_log_path=output_log_path,
+            threads=threads,
         )
 
     except CalledProcessError as e:
+        if instance_pool and run_image:
+            # Start afresh should the instance itself be the problem
+            instance_pool.discard(image=run_image, bind=bind)
         logger.error(f"Failed to run command: {command}")
         logger.error(f"Stdout: {e.stdout}")
         logger.error(f"Stderr: {e.stderr}")
@@ -132,41 +958,73 @@ def run_singularity_command(
 
         raise e
 
+    return resource_usage
+
+
+class SingularityTask(Protocol):
+    """A function decorated with ``singularity_wrapper``. It is called with the
+    arguments of ``run_singularity_command``, and any other keywords are used
+    to generate the command to execute."""
+
+    def __call__(
+        self,
+        container: Path | None,
+        bind_dirs: Path | Collection[Path] | None = None,
+        stream_callback_func: Callable | None = None,
+        ignore_logging_output: bool = False,
+        expected_outputs: Path | Collection[Path] | None = None,
+        resource_usage_path: Path | None = None,
+        execution_backend: ExecutionBackend | None = None,
+        output_log_path: Path | None = None,
+        threads: int | None = None,
+        **kwargs: Any,
+    ) -> ResourceUsage: ...
+
 
 def singularity_wrapper(
-    fn: Callable,
-) -> Callable:
+    fn: Callable[..., str],
+) -> SingularityTask:
     """A decorator function to around another function that when executed
     returns a command to execute within a container. The returned function has
     the arguments as ``run_singularity_command``, and any unused keywords are
     passed to the wrapped function.
 
     Args:
-        fn (Callable): The function that generates the command to execute
+        fn (Callable[..., str]): The function that generates the command to execute
 
     Returns:
-        Callable: Wrapper function
+        SingularityTask: Wrapper function, which executes the command and returns its ``ResourceUsage``
     """
 
     def wrapper(
-        container: Path,
+        container: Path | None,
         bind_dirs: Path | Collection[Path] | None = None,
         stream_callback_func: Callable | None = None,
         ignore_logging_output: bool = False,
+        expected_outputs: Path | Collection[Path] | None = None,
+        resource_usage_path: Path | None = None,
+        execution_backend: ExecutionBackend | None = None,
+        output_log_path: Path | None = None,
+        threads: int | None = None,
         **kwargs,
-    ) -> str:
+    ) -> ResourceUsage:
         """Function that can be used as a decorator on an input function. This function
         should generate and return a command that will be executed within the specified container.
 
         Args:
             fn (Callable): The function that generates a command to execute. All ``**kwargs`` are passed to this function
-            container (Path): Path to the container that will be usede to execute the generated command
+            container (Optional[Path]): Path to the container that will be usede to execute the generated command. Only optional when executing natively.
             bind_dirs (Optional[Union[Path,Collection[Path]]], optional): Specifies a Path, or list of Paths, to bind to in the container. Defaults to None.
             stream_callback_func (Optional[Callable], optional): Provide a function that is applied to each line of output text when singularity is running and `stream=True`. IF provide it should accept a single (string) parameter. If None, nothing happens. Defaultds to None.
             ignore_logging_output (bool, optional): If `True` output from the executed singularity command is not logged. Defaults to False.
+            expected_outputs (Optional[Union[Path,Collection[Path]]], optional): Files the command is expected to create. See ``run_singularity_command``. Defaults to None.
+            resource_usage_path (Optional[Path], optional): A JSON-lines file the resource usage of the command is appended to. See ``run_singularity_command``. Defaults to None.
+            execution_backend (Optional[ExecutionBackend], optional): Execute in the container or natively. See ``run_singularity_command``. Defaults to None.
+            output_log_path (Optional[Path], optional): Write the full output to this file and log a summary. See ``run_singularity_command``. Defaults to None.
+            threads (Optional[int], optional): Limit the OpenMP and BLAS threads of the command. See ``run_singularity_command``. Defaults to None.
 
         Returns:
-            str: The command that was executed
+            ResourceUsage: The command that was executed and the resources it used
         """
 
         task_str = fn(**kwargs)
@@ -176,14 +1034,17 @@ def singularity_wrapper(
         logger.info(f"wrapper {task_str=}")
         logger.info(f"wrapper {bind_dirs=}")
 
-        run_singularity_command(
+        return run_singularity_command(
             image=container,
             command=f"{task_str}",
             bind_dirs=bind_dirs,
             ignore_logging_output=ignore_logging_output,
             stream_callback_func=stream_callback_func,
+            expected_outputs=expected_outputs,
+            resource_usage_path=resource_usage_path,
+            execution_backend=execution_backend,
+            output_log_path=output_log_path,
+            threads=threads,
         )
 
-        return task_str
-
     return wrapper
@@ -6,24 +6,36 @@ This tooling is mostly centred on using gaincal from casatasks.
 from __future__ import annotations
 
 from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
 from shutil import copytree
-from typing import Any
+from typing import Any, Literal
 
+import numpy as np
 from casacore.tables import table
 
-from flint.casa import applycal, cvel, gaincal, mstransform
+from flint.casa import CasaSession, applycal, cvel, gaincal, mstransform
 from flint.exceptions import GainCalError, MSError
 from flint.flagging import nan_zero_extreme_flag_ms
 from flint.logging import logger
+from flint.manifest import register_products
 from flint.ms import rename_ms_and_columns_for_selfcal
 from flint.naming import get_selfcal_ms_name
 from flint.options import MS, BaseOptions
+from flint.sclient import ExecutionBackend
+from flint.selfcal.native import solve_and_apply_gains_ms
 from flint.selfcal.utils import (
     create_and_check_caltable_path,
+    create_passthrough_selfcal_ms,
     get_channel_ranges_given_nspws_for_ms,
 )
-from flint.utils import remove_files_folders, rsync_copy_directory, zip_folder
+from flint.utils import (
+    get_thread_budget,
+    remove_files_folders,
+    rsync_copy_directory,
+    zip_folder,
+)
 
 
 class GainCalOptions(BaseOptions):
@@ -48,6 +60,22 @@ class GainCalOptions(BaseOptions):
     will be used to craft an appropriate ``select_spw=`` interval range. If larger
     than one, ``gaincal`` will be carried out against each interval and results will
     be appended to a common solutions file. """
+    batch_casa_tasks: bool = False
+    """Run all ``gaincal`` and ``applycal`` tasks of a round in a single CASA process
+    and container launch. Not a gaincal option. """
+    max_workers: int | None = 1
+    """The maximum number of ``gaincal`` invocations across the ``nspw`` channel ranges
+    that run concurrently. If ``None`` the thread budget is used (see
+    ``flint.utils.get_thread_budget``). Not a
+    gaincal option. """
+    solver: Literal["casa", "native"] = "casa"
+    """The solver used to derive and apply the gains. ``casa`` uses the ``gaincal`` and
+    ``applycal`` tasks in a container, and ``native`` uses the in-process solver
+    in ``flint.selfcal.native``. Not a gaincal option. """
+    execution_backend: ExecutionBackend | None = None
+    """Run the CASA tasks in the container (``singularity``) or with a CASA installed
+    on the host (``native``). If ``None`` the ``FLINT_NATIVE_TOOLS`` environment
+    variable decides. Not a gaincal option. """
 
 
 def copy_and_clean_ms_casagain(
@@ -101,6 +129,7 @@ def copy_and_clean_ms_casagain(
             rsync_copy_directory(ms.path, out_ms_path)
 
         logger.info("Copying finished. ")
+        register_products(out_ms_path)
 
         # The casa gaincal and applycal tasks __really__ expect the input and output
         # column names to be DATA and CORRECTED_DATA. So, here we will go through the
@@ -179,6 +208,7 @@ def create_spws_in_ms(casa_container: Path, ms_path: Path, nspw: int) -> Path:
         createmms=False,
         datacolumn="all",
         combinespws=False,
+        expected_outputs=transform_ms / "table.dat",
     )
 
     logger.info(
@@ -215,6 +245,7 @@ def merge_spws_in_ms(casa_container: Path, ms_path: Path) -> Path:
         vis=str(ms_path),
         outputvis=str(cvel_ms_path),
         mode="channel_b",
+        expected_outputs=cvel_ms_path / "table.dat",
     )
 
     logger.info(f"Successfully merged spws in {cvel_ms_path}")
@@ -228,6 +259,155 @@ def merge_spws_in_ms(casa_container: Path, ms_path: Path) -> Path:
     return ms_path
 
 
+def gaincal_applycal_casa_session(
+    ms: MS,
+    casa_container: Path,
+    gain_cal_options: GainCalOptions,
+    channel_ranges: tuple[tuple[int, int], ...],
+) -> list[tuple[str, Path]]:
+    """Derive and apply gain solutions for each channel range through a
+    single ``CasaSession``, so that CASA is only started once irrespective
+    of the number of channel ranges. All ``gaincal`` tasks are queued first,
+    followed by the ``applycal`` tasks in the same order.
+
+    Args:
+        ms (MS): The measurement set to calibrate. The ``DATA`` column is calibrated into ``CORRECTED_DATA``.
+        casa_container (Path): A path to a singularity container with CASA tooling.
+        gain_cal_options (GainCalOptions): Options provided to gaincal
+        channel_ranges (tuple[tuple[int, int], ...]): The channel ranges to derive solutions for
+
+    Raises:
+        GainCalError: Raised when a task in the session fails or a calibration table is not created
+
+    Returns:
+        list[tuple[str, Path]]: The spw selection and calibration table of each channel range
+    """
+    session = CasaSession(
+        casa_container=casa_container,
+        work_dir=ms.path.parent,
+        name=ms.path.stem,
+        execution_backend=gain_cal_options.execution_backend,
+    )
+
+    spw_and_cal_tables = []
+    for channel_range in channel_ranges:
+        spw_str = f"0:{channel_range[0]}~{channel_range[1]}"
+        cal_table = create_and_check_caltable_path(ms=ms, channel_range=channel_range)
+        session.add(
+            "gaincal",
+            vis=str(ms.path),
+            caltable=str(cal_table),
+            spw=spw_str,
+            solint=gain_cal_options.solint,
+            gaintype=gain_cal_options.gaintype,
+            minsnr=gain_cal_options.minsnr,
+            calmode=gain_cal_options.calmode,
+            selectdata=gain_cal_options.selectdata,
+            uvrange=gain_cal_options.uvrange,
+        )
+        spw_and_cal_tables.append((spw_str, cal_table))
+
+    for spw_str, cal_table in spw_and_cal_tables:
+        session.add(
+            "applycal",
+            vis=str(ms.path),
+            gaintable=str(cal_table),
+            spw=spw_str,
+            flagbackup=False,
+        )
+
+    results = session.run()
+    failed = [result for result in results if result.return_code != 0]
+    if failed:
+        raise GainCalError(
+            f"{len(failed)} of {len(results)} CASA tasks failed for {ms.path}, see {failed[0].log_path}"
+        )
+
+    missing = [
+        cal_table for _, cal_table in spw_and_cal_tables if not cal_table.exists()
+    ]
+    if missing:
+        raise GainCalError(f"Gaincal failed for {ms.path}, {missing=}")
+
+    return spw_and_cal_tables
+
+
+def _gaincal_channel_range(
+    channel_range: tuple[int, int],
+    ms: MS,
+    casa_container: Path,
+    gain_cal_options: GainCalOptions,
+    threads: int,
+) -> tuple[str, Path]:
+    """Derive the solutions of a single channel range with gaincal"""
+    logger.info(f"Calibrating {ms.path} over {channel_range=}")
+    spw_str = f"0:{channel_range[0]}~{channel_range[1]}"
+    cal_table = create_and_check_caltable_path(ms=ms, channel_range=channel_range)
+
+    gaincal(
+        container=casa_container,
+        bind_dirs=(ms.path.parent, cal_table.parent),
+        vis=str(ms.path),
+        caltable=str(cal_table),
+        spw=spw_str,
+        solint=gain_cal_options.solint,
+        gaintype=gain_cal_options.gaintype,
+        minsnr=gain_cal_options.minsnr,
+        calmode=gain_cal_options.calmode,
+        selectdata=gain_cal_options.selectdata,
+        uvrange=gain_cal_options.uvrange,
+        expected_outputs=cal_table / "table.dat",
+        execution_backend=gain_cal_options.execution_backend,
+        threads=threads,
+    )
+
+    return spw_str, cal_table
+
+
+def gaincal_channel_ranges(
+    ms: MS,
+    casa_container: Path,
+    gain_cal_options: GainCalOptions,
+    channel_ranges: tuple[tuple[int, int], ...],
+) -> list[tuple[str, Path]]:
+    """Derive solutions for each channel range of a measurement set with
+    a separate gaincal task. The tasks only read from the measurement set,
+    so up to ``gain_cal_options.max_workers`` of them are run concurrently,
+    with the thread budget split evenly across them.
+
+    Args:
+        ms (MS): The measurement set to calibrate
+        casa_container (Path): A path to a singularity container with CASA tooling
+        gain_cal_options (GainCalOptions): Options provided to gaincal
+        channel_ranges (tuple[tuple[int, int], ...]): The start and end channel of each range to solve for
+
+    Returns:
+        list[tuple[str, Path]]: The spw selection and calibration table of each channel range, in the order of ``channel_ranges``
+    """
+    max_workers = min(
+        len(channel_ranges),
+        gain_cal_options.max_workers
+        if gain_cal_options.max_workers
+        else get_thread_budget(),
+    )
+    # Split the thread budget across the concurrent gaincal tasks
+    gaincal_threads = get_thread_budget(share=max_workers)
+    logger.info(
+        f"Running gaincal over {len(channel_ranges)} ranges with {max_workers=} and {gaincal_threads=}"
+    )
+    gaincal_channel_range = partial(
+        _gaincal_channel_range,
+        ms=ms,
+        casa_container=casa_container,
+        gain_cal_options=gain_cal_options,
+        threads=gaincal_threads,
+    )
+    # Results are yielded in the order of channel_ranges, regardless of
+    # the order the workers finish in
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(gaincal_channel_range, channel_ranges))
+
+
 def gaincal_applycal_ms(
     ms: MS,
     casa_container: Path,
@@ -239,6 +419,7 @@ def gaincal_applycal_ms(
     skip_selfcal: bool = False,
     rename_ms: bool = False,
     archive_cal_table: bool = False,
+    passthrough_skip: bool = False,
 ) -> MS:
     """Perform self-calibration using casa's gaincal and applycal tasks against
     an input measurement set.
@@ -250,10 +431,11 @@ def gaincal_applycal_ms(
         gain_cal_options (Optional[GainCalOptions], optional): Options provided to gaincal. Defaults to None.
         update_gain_cal_options (Optional[Dict[str, Any]], optional): Update the gain_cal_options with these. Defaults to None.
         archive_input_ms (bool, optional): If True, the input measurement set will be compressed into a single file. Defaults to False.
-        raise_error_on_fail (bool, optional): If gaincal does not converge raise en error. if False and gain cal fails return the input ms. Defaults to True.
+        raise_error_on_fail (bool, optional): If gaincal (or the native solver) does not converge raise en error. if False and gain cal fails return the input ms. Defaults to True.
         skip_selfcal (bool, optional): Should this self-cal be skipped. If `True`, the a new MS is created but not calibrated the appropriate new name and returned.
         rename_ms (bool, optional): It `True` simply rename a MS and adjust columns appropriately (potentially deleting them) instead of copying the complete MS. If `True` `archive_input_ms` is ignored. Defaults to False.
-        archive_cal_table (bool, optional): Archive the output calibration table in a tarball. Defaults to False.
+        archive_cal_table (bool, optional): Archive the output calibration table (or the solutions file of the native solver) in a tarball. Defaults to False.
+        passthrough_skip (bool, optional): If `True` and `skip_selfcal` is `True`, the new MS is a symbolic link to the input MS with the same nominated column, rather than a copy. `archive_input_ms` and `rename_ms` are not applied to a skipped round. Defaults to False.
 
     Raises:
         GainCallError: Raised when raise_error_on_fail is True and gaincal does not converge.
@@ -263,82 +445,126 @@ def gaincal_applycal_ms(
     """
     logger.info(f"Measurement set to be self-calibrated: ms={ms}")
 
-    assert casa_container.exists(), f"{casa_container=} does not exist. "
-
     if gain_cal_options is None:
         gain_cal_options = GainCalOptions()
     if update_gain_cal_options:
         logger.info(f"Updating gaincal options with: {update_gain_cal_options}")
         gain_cal_options = gain_cal_options.with_options(**update_gain_cal_options)
 
-    # TODO: If the skip_selfcal is True we should just symlink, maybe?
-    # Pirates like easy things though.
+    if skip_selfcal and passthrough_skip:
+        logger.info(f"{skip_selfcal=} and {passthrough_skip=}, linking the MS. ")
+        return create_passthrough_selfcal_ms(ms=ms, round=round)
+
+    if gain_cal_options.solver == "casa" and (
+        gain_cal_options.execution_backend != "native"
+    ):
+        assert casa_container.exists(), f"{casa_container=} does not exist. "
+
+    # A link to the measurement set of an earlier round was made by
+    # a skipped round. Operate on the real measurement set.
+    passthrough_link = ms.path if ms.path.is_symlink() else None
+    if passthrough_link:
+        ms = ms.with_options(path=ms.path.resolve())
+        logger.info(f"{passthrough_link} is a link, using {ms.path}")
+
     cal_ms = copy_and_clean_ms_casagain(ms=ms, round=round, rename_ms=rename_ms)
 
     # Archive straight after copying in case we skip the gaincal and return
     if archive_input_ms and not rename_ms:
         zip_folder(in_path=ms.path)
 
+    # The link would point to a renamed or archived measurement set
+    if passthrough_link and (rename_ms or archive_input_ms):
+        remove_files_folders(passthrough_link)
+
     # No need to do work me, hardy
     if skip_selfcal:
         logger.info(f"{skip_selfcal=}, not calibrating the MS. ")
         return cal_ms
 
+    if gain_cal_options.solver == "native":
+        logger.info("Using the native gain solver")
+        try:
+            gain_solutions = solve_and_apply_gains_ms(
+                ms=cal_ms,
+                gain_cal_options=gain_cal_options,
+                data_column="DATA",
+                output_column="CORRECTED_DATA",
+            )
+            if not np.isfinite(gain_solutions.gains).any():
+                raise GainCalError(f"No valid gain solutions for {cal_ms.path}")
+        except (GainCalError, MSError, ValueError) as e:
+            logger.critical(f"The native gain solver failed. {e}")
+            if raise_error_on_fail:
+                raise GainCalError(
+                    f"Native gain solver failed for {cal_ms.path}"
+                ) from e
+            return ms
+
+        if archive_cal_table:
+            zip_folder(in_path=gain_solutions.path)
+
+        return cal_ms.with_options(column="CORRECTED_DATA")
+
     # First, we collect the solutions for each of the requested SPW
-    spw_and_cal_tables = []
     channel_ranges = get_channel_ranges_given_nspws_for_ms(
         ms=cal_ms, nspw=gain_cal_options.nspw
     )
-    for idx, channel_range in enumerate(channel_ranges):
-        logger.info(f"Calibrating {idx + 1} of {len(channel_ranges)}, {channel_range=}")
-        spw_str = f"0:{channel_range[0]}~{channel_range[1]}"
-        cal_table = create_and_check_caltable_path(
-            ms=cal_ms, channel_range=channel_range
-        )
 
-        gaincal(
-            container=casa_container,
-            bind_dirs=(cal_ms.path.parent, cal_table.parent),
-            vis=str(cal_ms.path),
-            caltable=str(cal_table),
-            spw=spw_str,
-            solint=gain_cal_options.solint,
-            gaintype=gain_cal_options.gaintype,
-            minsnr=gain_cal_options.minsnr,
-            calmode=gain_cal_options.calmode,
-            selectdata=gain_cal_options.selectdata,
-            uvrange=gain_cal_options.uvrange,
-        )
-
-        if not cal_table.exists():
-            logger.critical(
-                "The calibration table was not created. Likely gaincal failed. "
+    if gain_cal_options.batch_casa_tasks:
+        try:
+            spw_and_cal_tables = gaincal_applycal_casa_session(
+                ms=cal_ms,
+                casa_container=casa_container,
+                gain_cal_options=gain_cal_options,
+                channel_ranges=channel_ranges,
             )
+        except GainCalError as e:
+            logger.critical(f"{e}")
             if raise_error_on_fail:
-                raise GainCalError(f"Gaincal failed for {cal_ms.path}")
-            else:
-                return ms
-
-        spw_and_cal_tables.append((spw_str, cal_table))
-
-    # Now apply each of the solutions to the corresponding SPW.
-    # Relying on the spw= channel selection to only be updating
-    # the visibilities in the existing CORRECTED_DATA column,
-    # not overwriting the entire column
-    for idx, (spw_str, cal_table) in enumerate(spw_and_cal_tables):
-        logger.info(
-            f"{idx + 1} of {len(spw_and_cal_tables)}, applying solutions for {spw_str}"
-        )
-        applycal(
-            container=casa_container,
-            bind_dirs=(cal_ms.path.parent, cal_table.parent),
-            vis=str(cal_ms.path),
-            gaintable=str(cal_table),
-            spw=spw_str,
-            flagbackup=False,
+                raise e
+            return ms
+    else:
+        spw_and_cal_tables = gaincal_channel_ranges(
+            ms=cal_ms,
+            casa_container=casa_container,
+            gain_cal_options=gain_cal_options,
+            channel_ranges=channel_ranges,
         )
 
-        if archive_cal_table:
+        for _, cal_table in spw_and_cal_tables:
+            if not cal_table.exists():
+                logger.critical(
+                    "The calibration table was not created. Likely gaincal failed. "
+                )
+                if raise_error_on_fail:
+                    raise GainCalError(f"Gaincal failed for {cal_ms.path}")
+                else:
+                    return ms
+
+        # Now apply each of the solutions to the corresponding SPW.
+        # Each applycal writes to the same CORRECTED_DATA column of the
+        # same MS, so these remain serial to avoid table lock contention.
+        # Relying on the spw= channel selection to only be updating
+        # the visibilities in the existing CORRECTED_DATA column,
+        # not overwriting the entire column
+        for idx, (spw_str, cal_table) in enumerate(spw_and_cal_tables):
+            logger.info(
+                f"{idx + 1} of {len(spw_and_cal_tables)}, applying solutions for {spw_str}"
+            )
+            applycal(
+                container=casa_container,
+                bind_dirs=(cal_ms.path.parent, cal_table.parent),
+                vis=str(cal_ms.path),
+                gaintable=str(cal_table),
+                spw=spw_str,
+                flagbackup=False,
+                execution_backend=gain_cal_options.execution_backend,
+                threads=get_thread_budget(),
+            )
+
+    if archive_cal_table:
+        for _, cal_table in spw_and_cal_tables:
             zip_folder(in_path=cal_table)
 
     flag_versions_table = cal_ms.path.with_suffix(".ms.flagversions")
@@ -0,0 +1,324 @@
+"""Assess whether the self-calibration of a beam has converged.
+
+After each round of self-calibration a handful of metrics are computed for a
+beam: the robust RMS of the MFS residual image, the peak brightness of the MFS
+restored image, and the scatter of the phases of the gain solutions derived in
+the round (from either the CASA ``gaincal`` tables or the ``.gains.npz`` file of
+the native solver). A round is considered converged when the fractional change
+of the residual RMS and peak brightness from the previous round, and the phase
+scatter, are inside the thresholds of ``SelfcalConvergenceOptions``. Once a beam
+has remained converged for ``patience`` consecutive rounds its later rounds of
+self-calibration and imaging may be skipped, with its last products carried
+forward.
+"""
+
+from __future__ import annotations
+
+import shutil
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import NamedTuple
+
+import numpy as np
+from astropy.io import fits
+from casacore.tables import table
+
+from flint.imager.wsclean import WSCleanResult
+from flint.logging import logger
+from flint.options import MS, BaseOptions
+from flint.selfcal.native import GainSolutions
+
+
+class SelfcalConvergenceOptions(BaseOptions):
+    """Thresholds used to decide whether the self-calibration of a beam has converged"""
+
+    early_stop: bool = False
+    """If True a beam stops self-calibrating once it has converged. If False all rounds are performed"""
+    residual_rms_fraction: float = 0.02
+    """Largest fractional change in the RMS of the MFS residual image between rounds"""
+    peak_flux_fraction: float = 0.02
+    """Largest fractional change in the peak brightness of the MFS restored image between rounds"""
+    phase_scatter_deg: float = 5.0
+    """Largest circular standard deviation, in degrees, of the phases of the gain solutions of a round"""
+    min_rounds: int = 1
+    """The number of self-calibration rounds that are always performed"""
+    patience: int = 1
+    """The number of consecutive converged rounds before a beam stops self-calibrating"""
+
+
+class ConvergenceMetrics(NamedTuple):
+    """Metrics describing the outcome of a round of self-calibration of a beam"""
+
+    selfcal_round: int
+    """The self-calibration round, where 0 is the imaging before any self-calibration"""
+    residual_rms: float | None = None
+    """Robust RMS of the MFS residual image, in Jy/beam"""
+    peak_flux: float | None = None
+    """Peak brightness of the MFS restored image, in Jy/beam"""
+    phase_scatter_deg: float | None = None
+    """Circular standard deviation of the phases of the gain solutions of the round, in degrees"""
+    converged: bool = False
+    """Whether the metrics of this round are inside the convergence thresholds"""
+
+
+class SelfcalConvergence(NamedTuple):
+    """The convergence state of the self-calibration of a beam"""
+
+    metrics: tuple[ConvergenceMetrics, ...] = ()
+    """Metrics of each assessed round, in order"""
+    converged: bool = False
+    """Whether the beam has converged and no further rounds should be performed"""
+
+
+def _get_mfs_image(images: list[Path] | None) -> Path | None:
+    if not images:
+        return None
+    mfs_images = [image for image in images if ".MFS." in image.name]
+    return mfs_images[0] if mfs_images else images[0]
+
+
+def get_image_rms_and_peak(image_path: Path) -> tuple[float, float]:
+    """Compute the robust RMS, from the median absolute deviation, and the
+    peak of the finite pixels of an image
+
+    Args:
+        image_path (Path): The FITS image to inspect
+
+    Returns:
+        tuple[float, float]: The RMS and peak of the image
+    """
+    data = fits.getdata(image_path)
+    data = data[np.isfinite(data)]
+    if data.size == 0:
+        return np.nan, np.nan
+
+    median = np.median(data)
+    rms = 1.4826 * np.median(np.abs(data - median))
+
+    return float(rms), float(np.max(data))
+
+
+def get_phase_scatter(gains: np.ndarray) -> float | None:
+    """Compute the circular standard deviation of the phases of complex gains.
+    Non-finite, zero and flagged (masked) gains are ignored.
+
+    Args:
+        gains (np.ndarray): Complex gains, optionally a masked array
+
+    Returns:
+        Optional[float]: The phase scatter in degrees, or None if there are no valid gains
+    """
+    gains = np.ma.compressed(gains)
+    gains = gains[np.isfinite(gains) & (np.abs(gains) > 0)]
+    if gains.size == 0:
+        return None
+
+    resultant = np.abs(np.mean(gains / np.abs(gains)))
+    return float(np.degrees(np.sqrt(-2.0 * np.log(np.clip(resultant, 1e-12, 1.0)))))
+
+
+def _read_casa_gains(cal_table: Path) -> np.ndarray:
+    with table(str(cal_table), ack=False) as tab:
+        return np.ma.masked_array(tab.getcol("CPARAM"), mask=tab.getcol("FLAG"))
+
+
+def read_gain_solutions(solutions_path: Path) -> np.ndarray:
+    """Read the complex gains of a set of solutions. Supported are the ``.npz``
+    files of the native solver and CASA ``gaincal`` tables, including either
+    archived into a tarball.
+
+    Args:
+        solutions_path (Path): The solutions to read
+
+    Returns:
+        np.ndarray: The complex gains, masked where flagged
+    """
+    solutions_path = Path(solutions_path)
+    if solutions_path.suffix == ".npz":
+        return GainSolutions.load(path=solutions_path).gains
+
+    if solutions_path.suffix != ".tar":
+        return _read_casa_gains(cal_table=solutions_path)
+
+    table_name = solutions_path.with_suffix("").name
+    with TemporaryDirectory() as temp_dir:
+        shutil.unpack_archive(solutions_path, temp_dir)
+        if table_name.endswith(".npz"):
+            npz_path = next(Path(temp_dir).rglob(table_name))
+            return GainSolutions.load(path=npz_path).gains
+        cal_table = next(
+            path for path in Path(temp_dir).rglob(table_name) if path.is_dir()
+        )
+        return _read_casa_gains(cal_table=cal_table)
+
+
+def find_gain_solutions(ms: MS | Path) -> tuple[Path, ...]:
+    """Find the gain solutions derived when self-calibrating a measurement set.
+    The ``.gains.npz`` file of the native solver is preferred, otherwise the
+    CASA ``gaincal`` tables of each spectral window are used. Either may
+    have been archived.
+
+    Args:
+        ms (Union[MS, Path]): The self-calibrated measurement set
+
+    Returns:
+        tuple[Path, ...]: The solutions found. This is empty if the round was skipped.
+    """
+    ms_path = MS.cast(ms).path
+    for native_solutions in (
+        ms_path.with_suffix(".gains.npz"),
+        ms_path.with_suffix(".gains.npz.tar"),
+    ):
+        if native_solutions.exists():
+            return (native_solutions,)
+
+    cal_table_name = ms_path.with_suffix(".caltable").name
+    return tuple(sorted(ms_path.parent.glob(f"{cal_table_name}*")))
+
+
+def get_convergence_metrics(
+    wsclean_result: WSCleanResult, selfcal_round: int
+) -> ConvergenceMetrics:
+    """Compute the convergence metrics of the imaging of a beam
+
+    Args:
+        wsclean_result (WSCleanResult): The imaging of the self-calibrated beam
+        selfcal_round (int): The self-calibration round that was performed
+
+    Returns:
+        ConvergenceMetrics: The metrics of the round, which are None when they can not be computed
+    """
+    image_set = wsclean_result.image_set
+    residual_image = _get_mfs_image(image_set.residual if image_set else None)
+    restored_image = _get_mfs_image(image_set.image if image_set else None)
+
+    residual_rms = (
+        get_image_rms_and_peak(image_path=residual_image)[0] if residual_image else None
+    )
+    peak_flux = (
+        get_image_rms_and_peak(image_path=restored_image)[1] if restored_image else None
+    )
+
+    phase_scatter_deg = None
+    if selfcal_round > 0 and isinstance(wsclean_result.ms, MS):
+        solutions = find_gain_solutions(ms=wsclean_result.ms)
+        if solutions:
+            gains = [
+                np.ma.ravel(read_gain_solutions(solutions_path=solution_path))
+                for solution_path in solutions
+            ]
+            phase_scatter_deg = get_phase_scatter(gains=np.ma.concatenate(gains))
+
+    return ConvergenceMetrics(
+        selfcal_round=selfcal_round,
+        residual_rms=residual_rms,
+        peak_flux=peak_flux,
+        phase_scatter_deg=phase_scatter_deg,
+    )
+
+
+def _fractional_change(current: float | None, previous: float | None) -> float | None:
+    if current is None or previous is None or not np.isfinite(previous) or not previous:
+        return None
+    return abs(current - previous) / abs(previous)
+
+
+def check_round_converged(
+    metrics: ConvergenceMetrics,
+    previous_metrics: ConvergenceMetrics | None,
+    convergence_options: SelfcalConvergenceOptions,
+) -> bool:
+    """Check whether the metrics of a round are inside the convergence thresholds.
+    Metrics that are not available are not considered, though at least one has
+    to be.
+
+    Args:
+        metrics (ConvergenceMetrics): The metrics of the current round
+        previous_metrics (Optional[ConvergenceMetrics]): The metrics of the previous round
+        convergence_options (SelfcalConvergenceOptions): The thresholds to compare against
+
+    Returns:
+        bool: Whether the round is converged
+    """
+    if previous_metrics is None:
+        return False
+
+    checks = []
+    rms_change = _fractional_change(metrics.residual_rms, previous_metrics.residual_rms)
+    if rms_change is not None:
+        checks.append(rms_change <= convergence_options.residual_rms_fraction)
+    peak_change = _fractional_change(metrics.peak_flux, previous_metrics.peak_flux)
+    if peak_change is not None:
+        checks.append(peak_change <= convergence_options.peak_flux_fraction)
+    if metrics.phase_scatter_deg is not None:
+        checks.append(
+            metrics.phase_scatter_deg <= convergence_options.phase_scatter_deg
+        )
+
+    logger.info(
+        f"Round {metrics.selfcal_round}: {rms_change=} {peak_change=} {metrics.phase_scatter_deg=}"
+    )
+
+    return len(checks) > 0 and all(checks)
+
+
+def assess_selfcal_convergence(
+    wsclean_result: WSCleanResult,
+    selfcal_round: int,
+    previous_convergence: SelfcalConvergence | None = None,
+    convergence_options: SelfcalConvergenceOptions | None = None,
+) -> SelfcalConvergence:
+    """Update the convergence state of a beam with the outcome of a round of
+    self-calibration. A beam that has already converged is not assessed again.
+
+    Args:
+        wsclean_result (WSCleanResult): The imaging of the beam after the round
+        selfcal_round (int): The self-calibration round that was performed, where 0 is the imaging before any self-calibration
+        previous_convergence (Optional[SelfcalConvergence], optional): The state after the previous round. Defaults to None.
+        convergence_options (Optional[SelfcalConvergenceOptions], optional): The convergence thresholds. If None the defaults are used. Defaults to None.
+
+    Returns:
+        SelfcalConvergence: The updated convergence state
+    """
+    convergence_options = (
+        convergence_options if convergence_options else SelfcalConvergenceOptions()
+    )
+    previous_convergence = (
+        previous_convergence if previous_convergence else SelfcalConvergence()
+    )
+    if previous_convergence.converged:
+        return previous_convergence
+
+    metrics = get_convergence_metrics(
+        wsclean_result=wsclean_result, selfcal_round=selfcal_round
+    )
+    metrics = metrics._replace(
+        converged=check_round_converged(
+            metrics=metrics,
+            previous_metrics=(
+                previous_convergence.metrics[-1]
+                if previous_convergence.metrics
+                else None
+            ),
+            convergence_options=convergence_options,
+        )
+    )
+    all_metrics = previous_convergence.metrics + (metrics,)
+
+    converged_rounds = 0
+    for round_metrics in reversed(all_metrics):
+        if not round_metrics.converged:
+            break
+        converged_rounds += 1
+
+    converged = (
+        convergence_options.early_stop
+        and selfcal_round >= convergence_options.min_rounds
+        and converged_rounds >= convergence_options.patience
+    )
+    if converged:
+        logger.info(
+            f"Self-calibration converged after round {selfcal_round} for {wsclean_result.image_prefix_str}"
+        )
+
+    return SelfcalConvergence(metrics=all_metrics, converged=converged)
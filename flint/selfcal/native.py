@@ -0,0 +1,501 @@
+"""A native, in-process antenna-based gain solver for self-calibration.
+
+This is an alternative to the CASA ``gaincal`` and ``applycal`` tasks. The
+measurement set is read once, a solution interval at a time. For each
+interval the scalar antenna gains of each polarisation are solved for with
+an StEFCal-style iteration against the model column, and the gains are
+immediately applied to produce the corrected data column.
+
+The solutions are saved to a simple ``numpy`` ``.npz`` file.
+"""
+
+from __future__ import annotations
+
+import re
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterable, NamedTuple
+
+import numpy as np
+from casacore.tables import makecoldesc, table
+
+from flint.exceptions import MSError
+from flint.logging import logger
+from flint.ms import check_column_in_ms
+from flint.options import MS
+from flint.selfcal.utils import get_channel_ranges_given_nspws
+
+if TYPE_CHECKING:
+    from flint.selfcal.casa import GainCalOptions
+
+SUPPORTED_CALMODES = ("p", "ap")
+SUPPORTED_GAINTYPES = ("G", "T")
+
+
+class GainSolutions(NamedTuple):
+    """Antenna based gain solutions derived by the native solver"""
+
+    path: Path
+    """Path of the solutions file"""
+    gains: np.ndarray
+    """Complex gains. Shape is (nsolint, nspw, nant, 2), where the last axis is the X and Y polarisation. Unsolved gains are NaN"""
+    times: np.ndarray
+    """The start and end time (MJD seconds) of each solution interval. Shape is (nsolint, 2)"""
+    channel_ranges: np.ndarray
+    """The inclusive start and end channel of each spectral window. Shape is (nspw, 2)"""
+    calmode: str
+    """The calibration mode the gains were solved with"""
+
+    @classmethod
+    def load(cls, path: Path) -> GainSolutions:
+        """Load a set of solutions written by ``GainSolutions.save``
+
+        Args:
+            path (Path): The file to load
+
+        Returns:
+            GainSolutions: The loaded solutions
+        """
+        with np.load(path) as sols:
+            return cls(
+                path=path,
+                gains=sols["gains"],
+                times=sols["times"],
+                channel_ranges=sols["channel_ranges"],
+                calmode=str(sols["calmode"]),
+            )
+
+    def save(self, output_path: Path | None = None) -> Path:
+        """Write the solutions to a ``numpy`` ``.npz`` file
+
+        Args:
+            output_path (Optional[Path], optional): Where to write the solutions. If None the ``path`` attribute is used. Defaults to None.
+
+        Returns:
+            Path: The path the solutions were written to
+        """
+        output_path = output_path if output_path else self.path
+        logger.info(f"Writing gain solutions to {output_path}")
+        # Use a file handle so numpy does not append an additional suffix
+        with open(output_path, "wb") as out_file:
+            np.savez(
+                out_file,
+                gains=self.gains,
+                times=self.times,
+                channel_ranges=self.channel_ranges,
+                calmode=np.array(self.calmode),
+            )
+
+        return output_path
+
+
+def solint_to_seconds(solint: str) -> float | None:
+    """Convert a CASA style solution interval into seconds.
+
+    Supported forms are ``inf``, ``int`` and a number with an optional
+    unit of ``s``, ``min`` or ``h``.
+
+    Args:
+        solint (str): The solution interval
+
+    Raises:
+        ValueError: Raised when the solution interval can not be interpreted
+
+    Returns:
+        Optional[float]: The interval in seconds. ``None`` indicates a single interval (``inf``), and ``0`` a solution per integration (``int``)
+    """
+    solint = solint.strip().lower()
+    if solint == "inf":
+        return None
+    if solint == "int":
+        return 0.0
+
+    res = re.fullmatch(r"([0-9]*\.?[0-9]+)\s*(s|min|h)?", solint)
+    if res is None:
+        raise ValueError(f"Unable to interpret {solint=}")
+
+    scale = {None: 1.0, "s": 1.0, "min": 60.0, "h": 3600.0}[res.group(2)]
+    return float(res.group(1)) * scale
+
+
+def uvrange_to_limits(uvrange: str) -> tuple[float | None, float | None]:
+    """Convert a CASA style uvrange selection in meters to a minimum and
+    maximum baseline length. Supported forms are ``>X``, ``<X`` and ``X~Y``,
+    with an optional unit of ``m`` or ``km``.
+
+    Args:
+        uvrange (str): The uvrange selection
+
+    Raises:
+        ValueError: Raised when the uvrange can not be interpreted
+
+    Returns:
+        Tuple[Optional[float], Optional[float]]: The minimum and maximum baseline length in meters
+    """
+    uvrange = uvrange.strip().lower()
+    if uvrange == "":
+        return None, None
+
+    number = r"([0-9]*\.?[0-9]+)"
+    res = re.fullmatch(rf"(>|<)?\s*{number}(?:\s*~\s*{number})?\s*(m|km)?", uvrange)
+    if res is None or (res.group(1) and res.group(3)):
+        raise ValueError(f"Unable to interpret {uvrange=}")
+
+    scale = 1000.0 if res.group(4) == "km" else 1.0
+    value = float(res.group(2)) * scale
+    if res.group(3):
+        return value, float(res.group(3)) * scale
+    if res.group(1) == "<":
+        return None, value
+
+    return value, None
+
+
+def solve_antenna_gains(
+    vis_model: np.ndarray,
+    model_model: np.ndarray,
+    calmode: str = "p",
+    refant: int = 0,
+    max_iterations: int = 50,
+    tolerance: float = 1e-6,
+) -> np.ndarray:
+    """Solve for scalar antenna gains with an StEFCal iteration. Any number
+    of independent problems may be solved at once along the leading axes.
+
+    Here the gain of antenna ``p`` is updated as
+
+        g_p = sum_q R_pq g_q / sum_q S_pq |g_q|^2
+
+    where ``R_pq`` is the sum of ``V_pq conj(M_pq)`` and ``S_pq`` the sum of
+    ``|M_pq|^2``. For phase-only solutions the amplitudes are normalised to
+    unity each iteration. Gains are phase referenced to ``refant``, and
+    antennas without valid data are NaN.
+
+    Args:
+        vis_model (np.ndarray): Accumulated ``V conj(M)`` of shape (..., nant, nant)
+        model_model (np.ndarray): Accumulated ``|M|^2`` of shape (..., nant, nant)
+        calmode (str, optional): Either ``p`` (phase only) or ``ap`` (amplitude and phase). Defaults to "p".
+        refant (int, optional): The antenna to phase reference to. Defaults to 0.
+        max_iterations (int, optional): Maximum number of iterations. Defaults to 50.
+        tolerance (float, optional): Fractional change in the gains to be considered converged. Defaults to 1e-6.
+
+    Raises:
+        ValueError: Raised if an unsupported ``calmode`` is provided
+
+    Returns:
+        np.ndarray: The complex gains of shape (..., nant)
+    """
+    if calmode not in SUPPORTED_CALMODES:
+        raise ValueError(f"{calmode=} not supported. Use one of {SUPPORTED_CALMODES}")
+
+    valid = np.sum(model_model, axis=-1) > 0
+    gains = np.ones(vis_model.shape[:-1], dtype=np.complex128)
+
+    for iteration in range(1, max_iterations + 1):
+        numerator = np.einsum("...pq,...q->...p", vis_model, gains)
+        denominator = np.einsum("...pq,...q->...p", model_model, np.abs(gains) ** 2)
+        new_gains = np.where(valid, numerator / np.where(valid, denominator, 1.0), 1.0)
+        if calmode == "p":
+            amplitude = np.abs(new_gains)
+            new_gains = np.where(amplitude > 0, new_gains / amplitude, 1.0)
+        if iteration % 2 == 0:
+            new_gains = 0.5 * (new_gains + gains)
+            if calmode == "p":
+                new_gains /= np.abs(new_gains)
+
+        delta = float(np.linalg.norm(new_gains - gains)) / max(
+            float(np.linalg.norm(new_gains)), 1e-12
+        )
+        gains = new_gains
+        if delta < tolerance:
+            break
+
+    logger.debug(f"Gain solutions finished after {iteration} iterations, {delta=}")
+
+    ref_gain = gains[..., refant : refant + 1]
+    gains = gains * np.conj(ref_gain) / np.abs(ref_gain)
+    gains[~valid] = np.nan
+
+    return gains
+
+
+def _contiguous(rows: np.ndarray) -> bool:
+    return len(rows) > 0 and rows[-1] - rows[0] + 1 == len(rows)
+
+
+def _get_rows(tab, column: str, rows: np.ndarray) -> np.ndarray:
+    """Read a column for a sorted set of row numbers, using a single
+    contiguous read where possible"""
+    if _contiguous(rows):
+        return tab.getcol(column, startrow=int(rows[0]), nrow=len(rows))
+    return tab.selectrows(rows).getcol(column)
+
+
+def _put_rows(tab, column: str, values: np.ndarray, rows: np.ndarray) -> None:
+    """Write a column for a sorted set of row numbers"""
+    if _contiguous(rows):
+        tab.putcol(column, values, startrow=int(rows[0]), nrow=len(rows))
+    else:
+        tab.selectrows(rows).putcol(column, values)
+
+
+def _group_rows_by_solint(
+    times: np.ndarray, solint_seconds: float | None
+) -> list[np.ndarray]:
+    """Split the rows of a measurement set into solution intervals
+
+    Args:
+        times (np.ndarray): The TIME of every row
+        solint_seconds (Optional[float]): Length of the interval. None is a single interval and 0 is per integration.
+
+    Returns:
+        List[np.ndarray]: Row numbers of each solution interval
+    """
+    if solint_seconds is None:
+        bins = np.zeros(len(times), dtype=int)
+    elif solint_seconds == 0:
+        bins = np.unique(times, return_inverse=True)[1]
+    else:
+        bins = np.floor((times - times.min()) / solint_seconds).astype(int)
+
+    order = np.argsort(bins, kind="stable")
+    splits = np.nonzero(np.diff(bins[order]))[0] + 1
+
+    return [np.sort(rows) for rows in np.split(order, splits)]
+
+
+def solve_and_apply_gains_ms(
+    ms: MS | Path,
+    gain_cal_options: GainCalOptions,
+    data_column: str = "DATA",
+    model_column: str = "MODEL_DATA",
+    output_column: str = "CORRECTED_DATA",
+    solutions_path: Path | None = None,
+    refant: int = 0,
+    chunk_size: int = 20000,
+) -> GainSolutions:
+    """Derive antenna-based gains against a model column for every solution
+    interval and apply them to create a corrected data column.
+
+    Rows of a solution interval are read in chunks of ``chunk_size``. When a
+    solution interval fits in a single chunk, the gains are applied to the
+    visibilities already in memory, so the data are only read once.
+
+    The ``solint``, ``calmode``, ``gaintype``, ``uvrange`` and ``nspw``
+    attributes of ``gain_cal_options`` are honoured. ``minsnr`` is not used.
+    Visibilities whose antennas have no valid solution are flagged.
+
+    Args:
+        ms (Union[MS, Path]): The measurement set to calibrate
+        gain_cal_options (GainCalOptions): Options describing the solutions to derive
+        data_column (str, optional): The column to calibrate. Defaults to "DATA".
+        model_column (str, optional): The column with the model visibilities. Defaults to "MODEL_DATA".
+        output_column (str, optional): The column the calibrated data are written to. Created if it does not exist. Defaults to "CORRECTED_DATA".
+        solutions_path (Optional[Path], optional): Where the solutions are written. If None a ``.gains.npz`` suffix is used alongside the MS. Defaults to None.
+        refant (int, optional): The antenna the phases are referenced to. Defaults to 0.
+        chunk_size (int, optional): Maximum number of rows read at a time. Defaults to 20000.
+
+    Raises:
+        MSError: Raised when a required column is missing
+        ValueError: Raised when the ``gaintype`` is not supported
+
+    Returns:
+        GainSolutions: The derived solutions
+    """
+    ms = MS.cast(ms)
+    if gain_cal_options.gaintype not in SUPPORTED_GAINTYPES:
+        raise ValueError(
+            f"{gain_cal_options.gaintype=} not supported. Use one of {SUPPORTED_GAINTYPES}"
+        )
+    for column in (data_column, model_column):
+        if not check_column_in_ms(ms=ms, column=column):
+            raise MSError(f"{column=} not found in {ms.path}")
+
+    solint_seconds = solint_to_seconds(gain_cal_options.solint)
+    minuv, maxuv = uvrange_to_limits(
+        gain_cal_options.uvrange if gain_cal_options.selectdata else ""
+    )
+    solutions_path = (
+        solutions_path if solutions_path else ms.path.with_suffix(".gains.npz")
+    )
+
+    with table(str(ms.path / "ANTENNA"), ack=False) as ant_tab:
+        nant = len(ant_tab)
+
+    with table(str(ms.path), readonly=False, ack=False) as tab:
+        if output_column not in tab.colnames():
+            logger.info(f"Adding {output_column=}")
+            desc = makecoldesc(data_column, tab.getcoldesc(data_column))
+            desc["name"] = output_column
+            tab.addcols(desc)
+            tab.flush()
+
+        nchan, npol = tab.getcell(data_column, 0).shape
+        if npol != 4:
+            raise MSError(f"Expected 4 polarisations, found {npol=} in {ms.path}")
+
+        channel_ranges = np.array(
+            get_channel_ranges_given_nspws(
+                num_channels=nchan, nspws=gain_cal_options.nspw
+            )
+        )
+        nspw = len(channel_ranges)
+        chan_to_spw = np.repeat(
+            np.arange(nspw), channel_ranges[:, 1] - channel_ranges[:, 0] + 1
+        )
+
+        solint_rows = _group_rows_by_solint(
+            times=tab.getcol("TIME"), solint_seconds=solint_seconds
+        )
+        logger.info(
+            f"Solving {len(solint_rows)} solution intervals with {nspw=} for {ms.path}"
+        )
+
+        all_gains = np.full((len(solint_rows), nspw, nant, 2), np.nan, dtype=complex)
+        all_times = np.zeros((len(solint_rows), 2))
+        for solint_idx, rows in enumerate(solint_rows):
+            chunks = [rows[i : i + chunk_size] for i in range(0, len(rows), chunk_size)]
+            vis_model = np.zeros((nspw, 2, nant, nant), dtype=np.complex128)
+            model_model = np.zeros((nspw, 2, nant, nant))
+            # Views of the sums indexed by the antennas of a baseline
+            vis_model_by_antenna = vis_model.transpose(2, 3, 0, 1)
+            model_model_by_antenna = model_model.transpose(2, 3, 0, 1)
+            cached_chunks: list[tuple[np.ndarray, ...]] = []
+            all_times[solint_idx] = (np.inf, -np.inf)
+
+            for chunk_rows in chunks:
+                ant1 = _get_rows(tab, "ANTENNA1", chunk_rows)
+                ant2 = _get_rows(tab, "ANTENNA2", chunk_rows)
+                uvws = _get_rows(tab, "UVW", chunk_rows)
+                times = _get_rows(tab, "TIME", chunk_rows)
+                data = _get_rows(tab, data_column, chunk_rows)
+                model = _get_rows(tab, model_column, chunk_rows)
+                flags = _get_rows(tab, "FLAG", chunk_rows)
+
+                all_times[solint_idx, 0] = min(all_times[solint_idx, 0], times.min())
+                all_times[solint_idx, 1] = max(all_times[solint_idx, 1], times.max())
+
+                uv_dist = np.sqrt(np.sum(uvws[:, :2] ** 2, axis=1))
+                row_mask = ant1 != ant2
+                if minuv is not None:
+                    row_mask &= uv_dist >= minuv
+                if maxuv is not None:
+                    row_mask &= uv_dist <= maxuv
+
+                # Only the parallel hands are used to solve for the gains
+                parallel = (data[..., (0, 3)], model[..., (0, 3)])
+                invalid = (
+                    flags[..., (0, 3)]
+                    | ~np.isfinite(parallel[0])
+                    | ~np.isfinite(parallel[1])
+                    | ~row_mask[:, None, None]
+                )
+                chunk_data = np.where(invalid, 0.0, parallel[0])
+                chunk_model = np.where(invalid, 0.0, parallel[1])
+
+                # Sum over the channels of each spectral window. Sums are
+                # accumulated into views with the indexed axis first
+                chunk_vis_model = np.zeros((len(chunk_rows), nspw, 2), dtype=complex)
+                chunk_model_model = np.zeros((len(chunk_rows), nspw, 2))
+                np.add.at(
+                    chunk_vis_model.transpose(1, 0, 2),
+                    chan_to_spw,
+                    (chunk_data * np.conj(chunk_model)).transpose(1, 0, 2),
+                )
+                np.add.at(
+                    chunk_model_model.transpose(1, 0, 2),
+                    chan_to_spw,
+                    (np.abs(chunk_model) ** 2).transpose(1, 0, 2),
+                )
+                if gain_cal_options.gaintype == "T":
+                    chunk_vis_model[:] = chunk_vis_model.sum(axis=-1, keepdims=True)
+                    chunk_model_model[:] = chunk_model_model.sum(axis=-1, keepdims=True)
+
+                # Both orderings of each baseline contribute to each antenna
+                baselines = (ant1.astype(np.intp), ant2.astype(np.intp))
+                reversed_baselines = (baselines[1], baselines[0])
+                np.add.at(vis_model_by_antenna, baselines, chunk_vis_model)
+                np.add.at(
+                    vis_model_by_antenna, reversed_baselines, np.conj(chunk_vis_model)
+                )
+                np.add.at(model_model_by_antenna, baselines, chunk_model_model)
+                np.add.at(model_model_by_antenna, reversed_baselines, chunk_model_model)
+
+                if len(chunks) == 1:
+                    cached_chunks.append((chunk_rows, ant1, ant2, data, flags))
+
+            # Autocorrelations have been excluded through the row mask
+            gains = solve_antenna_gains(
+                vis_model=vis_model,
+                model_model=model_model,
+                calmode=gain_cal_options.calmode,
+                refant=refant,
+            )
+            # gains are (nspw, npol, nant) -> (nspw, nant, npol)
+            all_gains[solint_idx] = gains.transpose(0, 2, 1)
+
+            apply_chunks: Iterable[tuple[np.ndarray, ...]] = cached_chunks or (
+                (
+                    chunk_rows,
+                    _get_rows(tab, "ANTENNA1", chunk_rows),
+                    _get_rows(tab, "ANTENNA2", chunk_rows),
+                    _get_rows(tab, data_column, chunk_rows),
+                    _get_rows(tab, "FLAG", chunk_rows),
+                )
+                for chunk_rows in chunks
+            )
+
+            for chunk_rows, ant1, ant2, data, flags in apply_chunks:
+                corrected, flags = _apply_gains(
+                    data=data,
+                    flags=flags,
+                    gains=all_gains[solint_idx][chan_to_spw],
+                    ant1=ant1,
+                    ant2=ant2,
+                )
+                _put_rows(tab, output_column, corrected.astype(data.dtype), chunk_rows)
+                _put_rows(tab, "FLAG", flags, chunk_rows)
+
+        tab.flush()
+
+    gain_solutions = GainSolutions(
+        path=solutions_path,
+        gains=all_gains,
+        times=all_times,
+        channel_ranges=channel_ranges,
+        calmode=gain_cal_options.calmode,
+    )
+    gain_solutions.save()
+
+    return gain_solutions
+
+
+def _apply_gains(
+    data: np.ndarray,
+    flags: np.ndarray,
+    gains: np.ndarray,
+    ant1: np.ndarray,
+    ant2: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Apply per-channel antenna gains to visibilities
+
+    Args:
+        data (np.ndarray): Visibilities of shape (nrow, nchan, 4)
+        flags (np.ndarray): Flags of shape (nrow, nchan, 4)
+        gains (np.ndarray): Gains of shape (nchan, nant, 2)
+        ant1 (np.ndarray): First antenna of each row
+        ant2 (np.ndarray): Second antenna of each row
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The corrected visibilities and updated flags
+    """
+    # Polarisations are ordered XX, XY, YX, YY
+    pol_a, pol_b = np.array([0, 0, 1, 1]), np.array([0, 1, 0, 1])
+    gains = gains.transpose(1, 0, 2)
+    gains_p = gains[ant1][..., pol_a]
+    gains_q = gains[ant2][..., pol_b]
+    denominator = gains_p * np.conj(gains_q)
+
+    bad = ~np.isfinite(denominator) | (denominator == 0)
+    corrected = data / np.where(bad, 1.0, denominator)
+
+    return corrected, flags | bad
@@ -9,6 +9,7 @@ from pathlib import Path
 
 from flint.logging import logger
 from flint.ms import get_freqs_from_ms
+from flint.naming import get_selfcal_ms_name
 from flint.options import MS
 from flint.utils import remove_files_folders
 
@@ -117,3 +118,39 @@ def consider_skip_selfcal_on_round(
     )
 
     return current_round in skip_selfcal_on_rounds
+
+
+def create_passthrough_selfcal_ms(ms: MS, round: int = 1) -> MS:
+    """Create the measurement set of a skipped self-calibration round
+    as a symbolic link to the input measurement set. No visibilities are
+    copied, and the nominated column of the input ``ms`` is retained, so
+    the next stage continues with the same data as the previous round.
+
+    Links are always made to the resolved measurement set, so consecutive
+    skipped rounds do not create a chain of links.
+
+    Args:
+        ms (MS): The measurement set of the previous round
+        round (int, optional): The self-calibration round being skipped. Defaults to 1.
+
+    Returns:
+        MS: The measurement set with the new round name, pointing to the input measurement set
+    """
+    ms = MS.cast(ms)
+    target_path = ms.path.resolve()
+    out_ms_path = get_selfcal_ms_name(in_ms_path=ms.path, round=round)
+
+    if out_ms_path.exists() or out_ms_path.is_symlink():
+        logger.warning(f"{out_ms_path} already exists. Removing it. ")
+        remove_files_folders(out_ms_path)
+
+    # Use a relative link when possible so moving the folder does not break things
+    link_target = (
+        Path(target_path.name)
+        if target_path.parent == out_ms_path.absolute().parent.resolve()
+        else target_path
+    )
+    logger.info(f"Linking {out_ms_path} to {link_target}")
+    out_ms_path.symlink_to(link_target, target_is_directory=True)
+
+    return ms.with_options(path=out_ms_path)
@@ -11,7 +11,8 @@ from astropy.io import fits
 from flint.exceptions import AttemptRerunException
 from flint.logging import logger
 from flint.naming import create_aegean_names
-from flint.sclient import run_singularity_command
+from flint.sclient import ExecutionBackend, run_singularity_command
+from flint.utils import get_thread_budget
 
 
 class BANEOptions(NamedTuple):
@@ -21,6 +22,8 @@ class BANEOptions(NamedTuple):
     """The step interval of each box, in pixels"""
     box_size: tuple[int, int] | None = (196, 196)
     """The size of the box in pixels"""
+    execution_backend: ExecutionBackend | None = None
+    """Run BANE in the container (``singularity``) or from the host (``native``). If None the ``FLINT_NATIVE_TOOLS`` environment variable decides"""
 
 
 class AegeanOptions(NamedTuple):
@@ -37,6 +40,8 @@ class AegeanOptions(NamedTuple):
     """The maximum number of components an island is allowed to have before it is ignored. """
     autoload: bool = True
     """Attempt to load precomputed background and rms maps. """
+    execution_backend: ExecutionBackend | None = None
+    """Run aegean in the container (``singularity``) or from the host (``native``). If None the ``FLINT_NATIVE_TOOLS`` environment variable decides"""
 
 
 class AegeanOutputs(NamedTuple):
@@ -114,7 +119,7 @@ def _get_aegean_command(
 def run_bane_and_aegean(
     image: Path,
     aegean_container: Path,
-    cores: int = 8,
+    cores: int | None = None,
     bane_options: BANEOptions | None = None,
     aegean_options: AegeanOptions | None = None,
 ) -> AegeanOutputs:
@@ -125,7 +130,7 @@ def run_bane_and_aegean(
     Args:
         image (Path): The input image that BANE will calculate a background and RMS map for
         aegean_container (Path): Path to a singularity container that was the AegeanTools packages installed.
-        cores (int, optional): The number of cores to allow BANE to use. Internally BANE will create a number of sub-processes. Defaults to 8.
+        cores (Optional[int], optional): The number of cores to allow BANE to use. Internally BANE will create a number of sub-processes. If None the thread budget of the worker is used (see ``get_thread_budget``). Defaults to None.
         bane_options (Optional[BANEOptions], optional): The options that are provided to BANE. If None defaults of BANEOptions are used. Defaults to None.
         aegean_options (Optional[AegeanOptions], optional): The options that are provided to Aegean. if None defaults of AegeanOptions are used. Defaults to None.
 
@@ -134,6 +139,9 @@ def run_bane_and_aegean(
     """
     bane_options = bane_options if bane_options else BANEOptions()
     aegean_options = aegean_options if aegean_options else AegeanOptions()
+    # BANE needs at least one stripe, which is one fewer than the cores
+    cores = cores if cores else max(get_thread_budget(), 2)
+    logger.info(f"BANE will use {cores=}")
 
     image = image.absolute()
     base_output = str(image.parent / image.stem)
@@ -152,13 +160,22 @@ def run_bane_and_aegean(
         command=bane_command_str,
         stream_callback_func=_bane_output_callback,
         bind_dirs=bind_dir,
+        expected_outputs=(aegean_names.bkg_image, aegean_names.rms_image),
+        execution_backend=bane_options.execution_backend,
+        # BANE and aegean parallelise over processes, so BLAS in each is single threaded
+        threads=1,
     )
 
     aegean_command = _get_aegean_command(
         image=image, base_output=base_output, aegean_options=aegean_options
     )
     run_singularity_command(
-        image=aegean_container, command=aegean_command, bind_dirs=bind_dir
+        image=aegean_container,
+        command=aegean_command,
+        bind_dirs=bind_dir,
+        expected_outputs=aegean_names.comp_cat,
+        execution_backend=aegean_options.execution_backend,
+        threads=1,
     )
 
     # These are the bane outputs
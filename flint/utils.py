@@ -5,25 +5,30 @@ for general usage.
 from __future__ import annotations
 
 import datetime
+import fcntl
 import os
 import shutil
 import signal
 import subprocess
+import time
 from contextlib import contextmanager
 from pathlib import Path
 from socket import gethostname
-from typing import Any, Generator, NamedTuple
+from typing import TYPE_CHECKING, Any, Collection, Generator, NamedTuple
 
 import astropy.units as u
 import numpy as np
 from astropy.coordinates import SkyCoord
 from astropy.io import fits
 from astropy.wcs import WCS
+from threadpoolctl import threadpool_limits
 
-from flint.convol import BeamShape
 from flint.exceptions import TimeLimitException
 from flint.logging import logger
 
+if TYPE_CHECKING:
+    from flint.convol import BeamShape
+
 # TODO: This Captain is aware that there is a common fits getheader between
 # a couple of functions that interact with tasks. Perhaps a common FITS properties
 # struct should be considered. The the astropy.io.fits.Header might be
@@ -57,6 +62,102 @@ def _signal_timelimit_handler(*args):
     raise TimeLimitException
 
 
+def get_path_size(path: Path) -> int:
+    """Get the size of a file, or the total size of all files within a directory.
+
+    Args:
+        path (Path): The file or directory to inspect
+
+    Returns:
+        int: Size in bytes
+    """
+    path = Path(path)
+    if not path.is_dir():
+        return path.stat().st_size
+
+    total_size = 0
+    for root, _, files in os.walk(path):
+        for file in files:
+            try:
+                total_size += (Path(root) / file).stat().st_size
+            except FileNotFoundError:
+                # Files may come and go while a tool is finishing up
+                continue
+
+    return total_size
+
+
+def wait_for_paths(
+    paths: Path | Collection[Path],
+    timeout: float = 30.0,
+    poll_interval: float = 0.1,
+) -> bool:
+    """Wait for a set of paths to exist and have a stable size. This is
+    intended to be used after an external tool has finished, to give a
+    shared filesystem (e.g. lustre) a chance to make its outputs visible.
+
+    A path is considered stable once its size is unchanged between two
+    consecutive polls.
+
+    Args:
+        paths (Union[Path, Collection[Path]]): The paths to wait for
+        timeout (float, optional): Maximum number of seconds to wait. Defaults to 30.0.
+        poll_interval (float, optional): Seconds between polling the paths. Defaults to 0.1.
+
+    Returns:
+        bool: True if all paths are visible and stable, False if the timeout was reached
+    """
+    paths = (
+        [Path(paths)] if isinstance(paths, (str, Path)) else [Path(p) for p in paths]
+    )
+
+    start_time = time.monotonic()
+    previous_sizes: dict[Path, int] = {}
+    pending = set(paths)
+    while True:
+        for path in list(pending):
+            if not path.exists():
+                continue
+            size = get_path_size(path=path)
+            if previous_sizes.get(path) == size:
+                pending.remove(path)
+            previous_sizes[path] = size
+
+        if not pending:
+            logger.debug(
+                f"{len(paths)} paths visible after {time.monotonic() - start_time:.2f}s"
+            )
+            return True
+
+        if time.monotonic() - start_time > timeout:
+            logger.warning(
+                f"Timed out after {timeout}s waiting for {sorted(str(p) for p in pending)}"
+            )
+            return False
+
+        time.sleep(poll_interval)
+
+
+@contextmanager
+def file_lock(lock_path: Path) -> Generator[None, None, None]:
+    """Hold an exclusive lock on a file for the duration of the context. This
+    may be used to coordinate processes that share a file system, e.g. several
+    tasks running on the same node. The lock file is created if needed.
+
+    Args:
+        lock_path (Path): The file used as the lock
+
+    Yields:
+        Generator[None, None, None]: Nothing, the lock is held within the context
+    """
+    with open(lock_path, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
 @contextmanager
 def timelimit_on_context(
     timelimit_seconds: int | float,
@@ -225,6 +326,100 @@ def get_environment_variable(
     return value
 
 
+def get_allocated_cores() -> int:
+    """Get the number of CPU cores allocated to this process. The
+    ``SLURM_CPUS_PER_TASK`` environment variable is used if set, otherwise
+    the CPU affinity of the process is inspected.
+
+    Returns:
+        int: The number of cores that may be used
+    """
+    slurm_cpus = get_environment_variable("SLURM_CPUS_PER_TASK")
+    if slurm_cpus is not None and slurm_cpus.isdigit() and int(slurm_cpus) > 0:
+        return int(slurm_cpus)
+
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+
+    return os.cpu_count() or 1
+
+
+THREAD_BUDGET_ENVIRONMENT_VARIABLE = "FLINT_THREAD_BUDGET"
+"""Environment variable that, when set, overrides the number of threads derived from the allocated cores"""
+THREAD_ENVIRONMENT_VARIABLES = (
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+)
+"""Environment variables that control the size of the thread pools of OpenMP, BLAS and friends"""
+
+
+def get_thread_budget(max_threads: int | None = None, share: int = 1) -> int:
+    """Get the number of threads a task should use. By default this is the
+    number of allocated cores (see ``get_allocated_cores``), which may be
+    overridden by the ``FLINT_THREAD_BUDGET`` environment variable.
+
+    Args:
+        max_threads (Optional[int], optional): An upper limit on the number of threads. Defaults to None.
+        share (int, optional): The number of concurrent consumers the budget is split across, e.g. the number of concurrent tool invocations. Defaults to 1.
+
+    Returns:
+        int: The number of threads to use, at least one
+    """
+    budget = get_environment_variable(THREAD_BUDGET_ENVIRONMENT_VARIABLE)
+    threads = (
+        int(budget)
+        if budget is not None and budget.isdigit() and int(budget) > 0
+        else get_allocated_cores()
+    )
+    threads = threads // max(share, 1)
+    if max_threads is not None:
+        threads = min(threads, max_threads)
+
+    return max(threads, 1)
+
+
+def get_thread_environment(threads: int) -> dict[str, str]:
+    """Create the environment variables that limit the thread pools of
+    OpenMP and BLAS libraries to ``threads``.
+
+    Args:
+        threads (int): The number of threads to use
+
+    Returns:
+        Dict[str, str]: The environment variables and their values
+    """
+    return {variable: str(threads) for variable in THREAD_ENVIRONMENT_VARIABLES}
+
+
+def apply_thread_budget(threads: int | None = None) -> dict[str, str]:
+    """Set the thread pool environment variables of this process to the thread
+    budget, and report the effective settings. These are inherited by child
+    processes. The thread pools of libraries already loaded into this process
+    (e.g. the BLAS of numpy) are limited to the budget as well. This should be
+    done as a worker starts (see ``flint.prefect.clusters.dask_setup``).
+
+    Args:
+        threads (Optional[int], optional): The number of threads. If None ``get_thread_budget`` is used. Defaults to None.
+
+    Returns:
+        Dict[str, str]: The environment variables that were set
+    """
+    threads = threads if threads else get_thread_budget()
+    thread_environment = get_thread_environment(threads=threads)
+    os.environ.update(thread_environment)
+    threadpool_limits(limits=threads)
+
+    logger.info(
+        f"Thread budget of {threads}: "
+        + ", ".join(f"{k}={v}" for k, v in thread_environment.items())
+    )
+
+    return thread_environment
+
+
 class SlurmInfo(NamedTuple):
     hostname: str
     """The hostname of the slurm job"""
@@ -300,6 +495,9 @@ def get_beam_shape(fits_path: Path) -> BeamShape | None:
         Optional[BeamShape]: Shape of the beam stored in the FITS image. None is returned if the beam is not found.
     """
 
+    # Imported here as flint.convol relies on the manifest, which relies on this module
+    from flint.convol import BeamShape
+
     header = fits.getheader(filename=fits_path)
 
     if not all([key in header for key in ("BMAJ", "BMIN", "BPA")]):
@@ -575,12 +773,27 @@ def zip_folder(
         Path: the path of the compressed zipped folder
     """
     in_path = Path(in_path)
+    if in_path.is_symlink():
+        # Archive what the link points to, e.g. a measurement set of a
+        # skipped self-calibration round, and remove the link
+        target_path = in_path.resolve()
+        logger.info(f"{in_path} is a link to {target_path}. Archiving the target. ")
+        in_path.unlink()
+        in_path = target_path
     out_zip = in_path if out_zip is None else out_zip
 
     if in_path.exists():
         logger.info(f"Zipping {in_path}.")
-        shutil.make_archive(str(out_zip), format=archive_format, base_dir=str(in_path))
+        archive_path = shutil.make_archive(
+            str(out_zip), format=archive_format, base_dir=str(in_path)
+        )
         remove_files_folders(in_path)
+
+        # Imported here as the manifest relies on this module (flint.manifest
+        # uses file_lock), so it can not be imported at the top of this module
+        from flint.manifest import register_products
+
+        register_products(Path(archive_path))
     else:
         logger.warning(f"{in_path=} does not exist... Not archiving. ")
 
@@ -668,6 +881,13 @@ def remove_files_folders(*paths_to_remove: Path) -> list[Path]:
     file: Path
     for file in paths_to_remove:
         file = Path(file)
+        if file.is_symlink():
+            # Only remove the link, never what it points to
+            logger.info(f"Removing link {file!s}")
+            file.unlink()
+            files_removed.append(file)
+            continue
+
         if not file.exists():
             logger.debug(f"{file} does not exist. Skipping, ")
             continue
@@ -681,6 +901,12 @@ def remove_files_folders(*paths_to_remove: Path) -> list[Path]:
 
         files_removed.append(file)
 
+    # Imported here as the manifest relies on this module (flint.manifest
+    # uses file_lock), so it can not be imported at the top of this module
+    from flint.manifest import remove_products
+
+    remove_products(*files_removed)
+
     return files_removed
 
 
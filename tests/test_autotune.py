@@ -0,0 +1,141 @@
+"""Tests around tuning the parallelism options of wsclean"""
+
+from __future__ import annotations
+
+import shutil
+from pathlib import Path
+
+import pytest
+from casacore.tables import table
+
+from flint.imager.autotune import (
+    WSCleanTrial,
+    WSCleanTuningOptions,
+    WSCleanTuningResult,
+    apply_tuned_wsclean_options,
+    create_subset_ms,
+    get_trial_settings,
+    get_tuning_key,
+    load_tuned_wsclean_options,
+    save_tuning_result,
+    select_best_trial,
+)
+from flint.imager.wsclean import WSCleanOptions
+from flint.options import MS
+from flint.utils import get_packaged_resource_path
+
+
+@pytest.fixture
+def ms_example(tmpdir):
+    ms_zip = Path(
+        get_packaged_resource_path(
+            package="flint.data.tests",
+            filename="SB39400.RACS_0635-31.beam0.small.ms.zip",
+        )
+    )
+    outpath = Path(tmpdir) / "39400"
+
+    shutil.unpack_archive(ms_zip, outpath)
+
+    ms_path = Path(outpath) / "SB39400.RACS_0635-31.beam0.small.ms"
+
+    return ms_path
+
+
+def _trial(throughput: float, max_rss_kb: int, success: bool = True) -> WSCleanTrial:
+    return WSCleanTrial(
+        settings=dict(parallel_gridding=int(throughput)),
+        success=success,
+        wall_time=1.0,
+        max_rss_kb=max_rss_kb,
+        throughput=throughput,
+    )
+
+
+def test_get_trial_settings():
+    """Sub-images larger than the image are not trialled"""
+    tuning_options = WSCleanTuningOptions(
+        parallel_deconvolution=(None, 4096, 512), parallel_gridding=(None, 4)
+    )
+    settings = get_trial_settings(size=2048, tuning_options=tuning_options)
+
+    assert len(settings) == 4
+    assert all(s["parallel_deconvolution"] in (None, 512) for s in settings)
+    assert set(settings[0].keys()) == {
+        "parallel_deconvolution",
+        "parallel_gridding",
+        "abs_mem",
+        "j",
+    }
+
+
+def test_select_best_trial():
+    """The fastest trial that fits in memory is selected"""
+    trials = [
+        _trial(throughput=10, max_rss_kb=100),
+        _trial(throughput=20, max_rss_kb=500),
+        _trial(throughput=30, max_rss_kb=50, success=False),
+    ]
+    assert select_best_trial(trials=trials).throughput == 20
+    assert select_best_trial(trials=trials, max_memory_kb=200).throughput == 10
+    assert select_best_trial(trials=trials, max_memory_kb=10) is None
+
+
+def test_save_and_apply_tuned_options(tmpdir):
+    """Tuned options are only applied when not explicitly set"""
+    tuning_path = Path(tmpdir) / "tuning" / "wsclean.json"
+    wsclean_options = WSCleanOptions(size=2048, channels_out=4)
+
+    assert (
+        load_tuned_wsclean_options(size=2048, channels_out=4, tuning_path=tuning_path)
+        is None
+    )
+
+    tuning_result = WSCleanTuningResult(
+        key=get_tuning_key(size=2048, channels_out=4),
+        options=dict(parallel_gridding=4, parallel_deconvolution=1024, abs_mem=50, j=8),
+        trials=(_trial(throughput=10, max_rss_kb=100),),
+    )
+    save_tuning_result(tuning_result=tuning_result, tuning_path=tuning_path)
+
+    loaded = load_tuned_wsclean_options(
+        size=2048, channels_out=4, tuning_path=tuning_path
+    )
+    assert loaded == tuning_result.options
+    assert (
+        load_tuned_wsclean_options(size=1024, channels_out=4, tuning_path=tuning_path)
+        is None
+    )
+
+    tuned = apply_tuned_wsclean_options(
+        wsclean_options=wsclean_options.with_options(parallel_gridding=2),
+        set_options=dict(parallel_gridding=2),
+        tuning_path=tuning_path,
+    )
+    assert tuned.parallel_gridding == 2
+    assert tuned.parallel_deconvolution == 1024
+    assert tuned.abs_mem == 50
+    assert tuned.j == 8
+
+    untuned = apply_tuned_wsclean_options(
+        wsclean_options=WSCleanOptions(size=1024),
+        tuning_path=tuning_path,
+    )
+    assert untuned == WSCleanOptions(size=1024)
+
+
+def test_create_subset_ms(ms_example, tmpdir):
+    """Only the first integrations are copied"""
+    output_path = Path(tmpdir) / "subset.ms"
+    subset_ms = create_subset_ms(
+        ms=MS(path=ms_example, column="DATA"), output_path=output_path, max_timesteps=1
+    )
+
+    assert subset_ms.path == output_path
+    assert subset_ms.column == "DATA"
+    with table(str(ms_example), ack=False) as tab:
+        first_time = tab.getcol("TIME").min()
+        first_rows = (tab.getcol("TIME") == first_time).sum()
+    with table(str(output_path), ack=False) as tab:
+        assert len(tab) == first_rows
+    assert (output_path / "ANTENNA").exists()
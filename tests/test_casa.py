@@ -2,9 +2,10 @@
 
 from __future__ import annotations
 
+import json
 from pathlib import Path
 
-from flint.casa import args_to_casa_task_string
+from flint.casa import CasaSession, args_to_casa_task_call, args_to_casa_task_string
 
 
 def test_args_to_casa_task_str():
@@ -38,3 +39,82 @@ def test_args_to_casa_task_str_arg_list():
 
     expected = "casa -c applycal(vis='/some/other/ship/visibility.ms',gaintable=('/jack/dataset1.ms','/jack/dataset2.ms'))"
     assert expected == applycal
+
+
+def test_args_to_casa_task_call():
+    """The task call should be the same as the casa string without the casa -c"""
+    call = args_to_casa_task_call(task="gaincal", vis="/jack/sparrow.ms", minsnr=0.0)
+    assert call == "gaincal(vis='/jack/sparrow.ms',minsnr=0.0)"
+    assert args_to_casa_task_string(
+        task="gaincal", vis="/jack/sparrow.ms", minsnr=0.0
+    ) == (f"casa -c {call}")
+
+
+def _execute_session_script(script: str, fail_task: str | None = None) -> None:
+    """Run a generated session script with stand-in casa tasks"""
+
+    class _CasaLog:
+        def setlogfile(self, path):
+            Path(path).write_text("log")
+
+    def _make_task(name):
+        def _task(**kwargs):
+            if name == fail_task:
+                raise RuntimeError(f"{name} has failed")
+
+        return _task
+
+    namespace = dict(
+        casalog=_CasaLog(),
+        gaincal=_make_task("gaincal"),
+        applycal=_make_task("applycal"),
+    )
+    exec(compile(script, "casa_session", "exec"), namespace)
+
+
+def test_casa_session_script(tmpdir):
+    """Ensure the generated script runs each task and records the results"""
+    work_dir = Path(tmpdir)
+    session = CasaSession(
+        casa_container=Path("/jack/casa.sif"), work_dir=work_dir, name="jack"
+    )
+    session.add("gaincal", vis=Path("/jack/sparrow.ms"), caltable="/jack/cal")
+    session.add("applycal", vis=Path("/jack/sparrow.ms"), gaintable=["/jack/cal"])
+
+    assert len(session.tasks) == 2
+    assert session.tasks[0].log_path == work_dir / "jack.00.gaincal.log"
+    assert session.script_path == work_dir / "jack.casa_session.py"
+
+    script = session.generate_script()
+    assert "gaincal(vis='/jack/sparrow.ms',caltable='/jack/cal')" in script
+    assert "applycal(vis='/jack/sparrow.ms',gaintable=('/jack/cal'))" in script
+
+    _execute_session_script(script=script)
+    results = json.loads(session.results_path.read_text())
+    assert [r["return_code"] for r in results] == [0, 0]
+    assert [r["task"] for r in results] == ["gaincal", "applycal"]
+    assert session.tasks[1].log_path.exists()
+
+
+def test_casa_session_script_stop_on_error(tmpdir):
+    """Tasks after a failure are not run when stop_on_error is set"""
+    for stop_on_error, expected in ((True, [1]), (False, [1, 0])):
+        session = CasaSession(
+            casa_container=Path("/jack/casa.sif"),
+            work_dir=Path(tmpdir),
+            name=f"jack_{stop_on_error}",
+            stop_on_error=stop_on_error,
+        )
+        session.add("gaincal", vis="/jack/sparrow.ms")
+        session.add("applycal", vis="/jack/sparrow.ms")
+
+        _execute_session_script(script=session.generate_script(), fail_task="gaincal")
+        results = json.loads(session.results_path.read_text())
+        assert [r["return_code"] for r in results] == expected
+        assert "gaincal has failed" in results[0]["error"]
+
+
+def test_casa_session_no_tasks(tmpdir):
+    """Nothing should be run if there are no tasks"""
+    session = CasaSession(casa_container=Path("/jack/casa.sif"), work_dir=Path(tmpdir))
+    assert session.run() == []
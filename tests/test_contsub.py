@@ -0,0 +1,177 @@
+"""Tests around the image-plane continuum subtraction of cubes"""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+import numpy as np
+import pytest
+from astropy.io import fits
+
+from flint.contsub import (
+    ImageContsubOptions,
+    fit_continuum,
+    get_channel_mask,
+    get_spectral_axis,
+    subtract_continuum_from_cube,
+)
+from flint.cube import create_beam_table
+
+NCHAN = 24
+LINE_CHANNELS = slice(10, 13)
+
+
+def _make_cube_data(
+    shape: tuple[int, int] = (30, 37), noise: float = 1e-3
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """A cube with a quadratic continuum per pixel, noise and a line in some pixels"""
+    rng = np.random.default_rng(42)
+    freqs_hz = 800e6 + np.arange(NCHAN) * 1e6
+    x = (freqs_hz - freqs_hz.mean()) / 20e6
+
+    coefficients = rng.uniform(-1, 1, size=(3, 1, *shape))
+    continuum = (
+        coefficients[0]
+        + coefficients[1] * x[:, None, None, None]
+        # Keep the curvature small enough to be fit by a first order polynomial
+        + 0.001 * coefficients[2] * x[:, None, None, None] ** 2
+    ).astype(np.float32)
+    data = continuum + rng.normal(scale=noise, size=continuum.shape).astype(np.float32)
+    data[LINE_CHANNELS, :, 5:10, 5:10] += 0.5
+
+    return freqs_hz, continuum, data
+
+
+def _write_cube(cube_path: Path, data: np.ndarray, freqs_hz: np.ndarray) -> Path:
+    header = fits.Header()
+    header["CTYPE1"] = "RA---SIN"
+    header["CTYPE2"] = "DEC--SIN"
+    header["CTYPE3"] = "STOKES"
+    header["CTYPE4"] = "FREQ"
+    header["CRPIX4"] = 1.0
+    header["CRVAL4"] = freqs_hz[0]
+    header["CDELT4"] = freqs_hz[1] - freqs_hz[0]
+    header["CASAMBM"] = True
+    fits.writeto(cube_path, data, header=header)
+
+    table_hdu = create_beam_table(beams=[(0.01, 0.01, 0.0)] * len(freqs_hz))
+    fits.append(cube_path, data=table_hdu.data, header=table_hdu.header)
+
+    return cube_path
+
+
+def test_get_spectral_axis():
+    header = fits.Header()
+    header["NAXIS"] = 4
+    header["NAXIS3"] = 1
+    header["NAXIS4"] = 3
+    header["CTYPE3"] = "STOKES"
+    header["CTYPE4"] = "CHAN"
+    header["CRVAL4"] = 1.0
+    header["CDELT4"] = 1.0
+
+    spectral_axis, coordinates = get_spectral_axis(header=header)
+    assert spectral_axis == 0
+    assert np.array_equal(coordinates, [1.0, 2.0, 3.0])
+
+    header["CTYPE4"] = "NOTFREQ"
+    with pytest.raises(ValueError):
+        get_spectral_axis(header=header)
+
+
+def test_get_channel_mask():
+    assert np.all(get_channel_mask(nchan=5))
+    assert np.array_equal(
+        get_channel_mask(nchan=6, exclude_channels=[(1, 3), (5, 10)]),
+        [True, False, False, True, True, False],
+    )
+
+
+def test_fit_continuum():
+    freqs_hz, continuum, data = _make_cube_data(shape=(12, 12))
+    spectra = data.reshape(NCHAN, -1)
+    expected = continuum.reshape(NCHAN, -1)
+    line_pixels = np.zeros((12, 12), dtype=bool)
+    line_pixels[5:10, 5:10] = True
+    line_pixels = line_pixels.ravel()
+
+    no_clip = ImageContsubOptions(sigma_clip=None)
+    model = fit_continuum(
+        spectra=spectra, coordinates=freqs_hz, contsub_options=no_clip
+    )
+    assert np.allclose(model[:, ~line_pixels], expected[:, ~line_pixels], atol=2e-3)
+    # The line biases the fit without clipping
+    assert not np.allclose(model[:, line_pixels], expected[:, line_pixels], atol=2e-3)
+
+    for contsub_options, channel_mask in (
+        (ImageContsubOptions(), None),
+        (
+            no_clip,
+            get_channel_mask(nchan=NCHAN, exclude_channels=[(10, 13)]),
+        ),
+    ):
+        model = fit_continuum(
+            spectra=spectra,
+            coordinates=freqs_hz,
+            contsub_options=contsub_options,
+            channel_mask=channel_mask,
+        )
+        assert np.allclose(model, expected, atol=2e-3)
+
+    # Too few channels for the fit
+    spectra[1:, 0] = np.nan
+    model = fit_continuum(
+        spectra=spectra, coordinates=freqs_hz, contsub_options=ImageContsubOptions()
+    )
+    assert np.all(np.isnan(model[:, 0]))
+    assert np.all(np.isfinite(model[:, 1:]))
+
+
+def test_subtract_continuum_from_cube(tmpdir):
+    freqs_hz, continuum, data = _make_cube_data()
+    data[3] = np.nan
+    cube_path = _write_cube(
+        cube_path=Path(tmpdir) / "SB39400.RACS_0635-31.i.linmos.cube.fits",
+        data=data,
+        freqs_hz=freqs_hz,
+    )
+
+    contsub_result = subtract_continuum_from_cube(
+        cube_path=cube_path,
+        contsub_options=ImageContsubOptions(tile_size=16, max_workers=2),
+    )
+    assert contsub_result.contsub_cube == Path(tmpdir) / (
+        "SB39400.RACS_0635-31.i.linmos.cube.imcontsub.fits"
+    )
+    assert contsub_result.model_cube == Path(tmpdir) / (
+        "SB39400.RACS_0635-31.i.linmos.cube.contmodel.fits"
+    )
+
+    with fits.open(contsub_result.contsub_cube) as contsub_hdul:
+        contsub = contsub_hdul[0].data
+        assert contsub.shape == data.shape
+        assert contsub_hdul[0].header["CRVAL4"] == freqs_hz[0]
+        assert len(contsub_hdul) == 2
+        assert np.all(np.isnan(contsub[3]))
+        assert np.allclose(contsub[LINE_CHANNELS, :, 5:10, 5:10], 0.5, atol=5e-3)
+
+    with fits.open(contsub_result.model_cube) as model_hdul:
+        model = model_hdul[0].data
+        assert len(model_hdul) == 2
+        assert np.allclose(
+            np.delete(model, 3, axis=0), np.delete(continuum, 3, axis=0), atol=2e-3
+        )
+        assert np.allclose(contsub + model, data, equal_nan=True, atol=1e-5)
+
+
+def test_subtract_continuum_from_cube_too_few_channels(tmpdir):
+    freqs_hz, _, data = _make_cube_data(shape=(4, 4))
+    cube_path = _write_cube(
+        cube_path=Path(tmpdir) / "cube.fits", data=data, freqs_hz=freqs_hz
+    )
+
+    with pytest.raises(ValueError):
+        subtract_continuum_from_cube(
+            cube_path=cube_path,
+            contsub_options=ImageContsubOptions(exclude_channels=[(1, NCHAN)]),
+        )
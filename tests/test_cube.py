@@ -0,0 +1,217 @@
+"""Tests around assembling channel images into a cube"""
+
+from __future__ import annotations
+
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+from astropy.io import fits
+from fitscube.combine_fits import combine_fits
+
+from flint.cube import (
+    create_cube_header,
+    finalise_cube,
+    read_channel_image,
+    write_cube_from_images,
+    write_plane_to_cube,
+)
+from flint.utils import get_packaged_resource_path
+
+
+@pytest.fixture
+def channel_images(tmpdir) -> list[Path]:
+    files = [
+        get_packaged_resource_path(
+            package="flint.data.tests",
+            filename=f"SB56659.RACS_0940-04.beam17.round3-000{i}-image.sub.fits",
+        )
+        for i in range(3)
+    ]
+    return [Path(shutil.copy(Path(f), Path(tmpdir))) for f in files]
+
+
+def test_read_channel_image(channel_images):
+    channel_image = read_channel_image(image_path=channel_images[1])
+    assert channel_image.path == channel_images[1]
+    assert np.isclose(channel_image.freq_hz, 826490740.74074)
+    assert channel_image.beam is not None
+    assert np.isclose(channel_image.beam[2], 124.340979106661)
+
+
+def test_write_cube_from_images(channel_images, tmpdir):
+    """The cube should be the same as combining with fitscube and moving the
+    frequency axis to be the slowest varying"""
+    output_cube = Path(tmpdir) / "cube.fits"
+    # Order of the inputs does not matter
+    freqs = write_cube_from_images(
+        image_paths=channel_images[::-1], output_cube=output_cube
+    )
+    assert np.allclose(
+        freqs.to("Hz").value, [808490740.740741, 826490740.74074, 844490740.74074]
+    )
+
+    reference_cube = Path(tmpdir) / "reference.fits"
+    combine_fits(file_list=channel_images, out_cube=reference_cube)
+
+    with fits.open(output_cube) as cube, fits.open(reference_cube) as reference:
+        header = cube[0].header
+        assert cube[0].data.shape == (3, 1, 10, 10)
+        assert np.array_equal(
+            cube[0].data, np.moveaxis(reference[0].data, 1, 0), equal_nan=True
+        )
+        assert header["CTYPE3"] == "STOKES"
+        assert header["CTYPE4"] == "FREQ"
+        assert header["CRVAL4"] == pytest.approx(808490740.740741)
+        assert header["CDELT4"] == pytest.approx(18e6)
+        assert header["CASAMBM"]
+        assert "BMAJ" not in header
+
+        assert cube[1].header["EXTNAME"] == "BEAMS"
+        for column in ("BMAJ", "BMIN", "BPA", "CHAN", "POL"):
+            assert np.array_equal(cube[1].data[column], reference[1].data[column])
+
+
+def test_write_cube_single_beam(channel_images, tmpdir):
+    """A constant beam is kept in the header, without a beam table"""
+    for image in channel_images:
+        with fits.open(image, mode="update") as hdul:
+            hdul[0].header["BMAJ"] = 0.005
+            hdul[0].header["BMIN"] = 0.004
+            hdul[0].header["BPA"] = 12.0
+
+    output_cube = Path(tmpdir) / "cube.fits"
+    write_cube_from_images(image_paths=channel_images, output_cube=output_cube)
+
+    with fits.open(output_cube) as cube:
+        assert len(cube) == 1
+        assert cube[0].header["BMAJ"] == 0.005
+        assert "CASAMBM" not in cube[0].header
+
+
+def test_create_cube_header_uneven_frequencies(channel_images):
+    header = fits.getheader(channel_images[0])
+    cube_header = create_cube_header(
+        template_header=header,
+        freqs_hz=np.array([1.0e9, 1.1e9, 1.3e9]),
+        beams=[None, None, None],
+    )
+    assert cube_header["CTYPE4"] == "CHAN"
+    assert "CUNIT4" not in cube_header
+    assert cube_header["NAXIS4"] == 3
+
+
+def test_write_cube_shape_mismatch(channel_images, tmpdir):
+    with fits.open(channel_images[2], mode="update") as hdul:
+        hdul[0].data = np.zeros((1, 1, 5, 5), dtype=np.float32)
+
+    with pytest.raises(ValueError):
+        write_cube_from_images(
+            image_paths=channel_images, output_cube=Path(tmpdir) / "cube.fits"
+        )
+
+
+def test_write_plane_to_cube(channel_images, tmpdir):
+    """Planes written in any order match the cube written in one go"""
+    output_cube = Path(tmpdir) / "incremental.fits"
+    freqs_hz = [read_channel_image(image_path=p).freq_hz for p in channel_images]
+
+    for channel in (2, 0, 1):
+        write_plane_to_cube(
+            image_path=channel_images[channel],
+            output_cube=output_cube,
+            channel=channel,
+            freqs_hz=freqs_hz,
+        )
+    size_before = output_cube.stat().st_size
+    finalise_cube(output_cube=output_cube)
+
+    # The header is finalised in place
+    assert output_cube.stat().st_size > size_before
+    assert not Path(f"{output_cube}.lock").exists()
+    assert not Path(f"{output_cube}.beams.json").exists()
+
+    reference_cube = Path(tmpdir) / "reference.fits"
+    write_cube_from_images(image_paths=channel_images, output_cube=reference_cube)
+    with fits.open(output_cube) as cube, fits.open(reference_cube) as reference:
+        assert np.array_equal(cube[0].data, reference[0].data, equal_nan=True)
+        assert cube[0].header["CASAMBM"]
+        assert "BMAJ" not in cube[0].header
+        assert cube[0].header["CRVAL4"] == reference[0].header["CRVAL4"]
+        for column in ("BMAJ", "BMIN", "BPA", "CHAN"):
+            assert np.array_equal(cube[1].data[column], reference[1].data[column])
+
+
+def test_finalise_cube_missing_channel(channel_images, tmpdir):
+    output_cube = Path(tmpdir) / "incremental.fits"
+    freqs_hz = [read_channel_image(image_path=p).freq_hz for p in channel_images]
+
+    for channel in (0, 2):
+        write_plane_to_cube(
+            image_path=channel_images[channel],
+            output_cube=output_cube,
+            channel=channel,
+            freqs_hz=freqs_hz,
+        )
+    finalise_cube(output_cube=output_cube)
+
+    with fits.open(output_cube) as cube:
+        data = cube[0].data
+        assert np.all(np.isnan(data[1]))
+        assert np.array_equal(
+            data[0], fits.getdata(channel_images[0])[0], equal_nan=True
+        )
+        assert cube[1].data["BMAJ"][1] == np.finfo(np.float32).tiny
+
+
+def test_write_plane_to_cube_rerun(channel_images, tmpdir):
+    """A cube left by an earlier run is replaced rather than written into"""
+    output_cube = Path(tmpdir) / "incremental.fits"
+    freqs_hz = [read_channel_image(image_path=p).freq_hz for p in channel_images]
+
+    # An earlier run with fewer channels that was finalised
+    write_plane_to_cube(
+        image_path=channel_images[0],
+        output_cube=output_cube,
+        channel=0,
+        freqs_hz=freqs_hz[:2],
+    )
+    finalise_cube(output_cube=output_cube)
+    with pytest.raises(ValueError):
+        finalise_cube(output_cube=output_cube)
+
+    for channel in range(len(channel_images)):
+        write_plane_to_cube(
+            image_path=channel_images[channel],
+            output_cube=output_cube,
+            channel=channel,
+            freqs_hz=freqs_hz,
+        )
+    finalise_cube(output_cube=output_cube)
+
+    with fits.open(output_cube) as cube:
+        assert len(cube) == 2
+        assert cube[0].header["NAXIS4"] == len(channel_images)
+        assert len(cube[1].data) == len(channel_images)
+        assert np.all(np.isfinite(cube[0].data[1]))
+
+
+def test_write_plane_to_cube_mismatch(channel_images, tmpdir):
+    """Planes of a cube being written must agree on its channels"""
+    output_cube = Path(tmpdir) / "incremental.fits"
+    freqs_hz = [read_channel_image(image_path=p).freq_hz for p in channel_images]
+
+    write_plane_to_cube(
+        image_path=channel_images[0],
+        output_cube=output_cube,
+        channel=0,
+        freqs_hz=freqs_hz,
+    )
+    with pytest.raises(ValueError):
+        write_plane_to_cube(
+            image_path=channel_images[1],
+            output_cube=output_cube,
+            channel=1,
+            freqs_hz=freqs_hz[:2],
+        )
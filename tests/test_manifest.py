@@ -0,0 +1,203 @@
+"""Tests around the manifest of products in a directory"""
+
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+from flint.archive import resolve_glob_expressions
+from flint.imager.wsclean import delete_wsclean_outputs, get_wsclean_output_names
+from flint.manifest import (
+    MANIFEST_COMPACT_MIN_RECORDS,
+    create_manifest,
+    create_manifest_entry,
+    get_manifest_path,
+    has_manifest,
+    list_directory,
+    load_manifest,
+    query_products,
+    register_products,
+    remove_products,
+    rename_product,
+)
+from flint.ms import find_mss
+
+
+def _set_old_mtime(directory: Path) -> None:
+    """Age a directory so its listing is trusted by the manifest"""
+    os.utime(directory, ns=(0, 1_000_000_000))
+
+
+def test_create_manifest_entry():
+    entry = create_manifest_entry(
+        Path("SB39400.RACS_0635-31.beam0.round2.i-0003-I-image.fits")
+    )
+    assert entry.kind == "image"
+    assert entry.sbid == 39400
+    assert entry.beam == 0
+    assert entry.round == 2
+    assert entry.pol == "i"
+    assert entry.channel == "0003"
+
+    entry = create_manifest_entry(
+        Path("SB39400.RACS_0635-31.beam1.round1.ch0000-0287.caltable")
+    )
+    assert entry.kind == "caltable"
+    assert entry.channel == "0000-0287"
+
+    assert create_manifest_entry(Path("SB39400.RACS_0635-31.beam10.ms")).kind == "ms"
+    assert create_manifest_entry(Path("notes.txt"), kind="log").kind == "log"
+
+
+def test_manifest_register_query_remove(tmpdir):
+    directory = Path(tmpdir)
+    for beam in range(3):
+        (directory / f"SB39400.RACS_0635-31.beam{beam}.ms").mkdir()
+
+    assert not has_manifest(directory=directory)
+    assert query_products(directory=directory, kind="ms") is None
+
+    manifest = create_manifest(directory=directory)
+    assert has_manifest(directory=directory)
+    assert len(manifest.entries) == 3
+    assert len(query_products(directory=directory, kind="ms")) == 3  # type: ignore
+
+    images = [
+        directory / f"SB39400.RACS_0635-31.beam{beam}.round1.i-MFS-image.fits"
+        for beam in range(3)
+    ]
+    for image in images:
+        image.touch()
+    register_products(*images)
+
+    assert query_products(directory=directory, kind="image", beam=1) == (images[1],)
+    assert query_products(directory=directory, round=1, channel="MFS") == tuple(images)
+
+    images[0].unlink()
+    remove_products(images[0])
+    assert query_products(directory=directory, kind="image") == tuple(images[1:])
+
+    renamed = images[1].with_name("SB39400.RACS_0635-31.beam1.round1.i.MFS.image.fits")
+    images[1].rename(renamed)
+    rename_product(old_path=images[1], new_path=renamed)
+    assert query_products(directory=directory, kind="image", beam=1) == (renamed,)
+
+    # Products outside a directory with a manifest are ignored
+    other = Path(tmpdir) / "other"
+    other.mkdir()
+    register_products(other / "SB39400.RACS_0635-31.beam0.ms")
+    assert query_products(directory=other) is None
+
+
+def test_manifest_compaction(tmpdir):
+    directory = Path(tmpdir)
+    create_manifest(directory=directory)
+
+    product = directory / "SB39400.RACS_0635-31.beam0.round1.i-MFS-image.fits"
+    for _ in range(MANIFEST_COMPACT_MIN_RECORDS // 2 + 1):
+        register_products(product)
+        remove_products(product)
+    register_products(product)
+
+    manifest_path = get_manifest_path(directory=directory)
+    assert len(manifest_path.read_text().splitlines()) > MANIFEST_COMPACT_MIN_RECORDS
+
+    manifest = load_manifest(directory=directory)
+    assert manifest is not None
+    assert list(manifest.entries) == [product.name]
+    assert len(manifest_path.read_text().splitlines()) == 2
+
+
+def test_list_directory(tmpdir):
+    directory = Path(tmpdir)
+    (directory / "SB39400.RACS_0635-31.beam0.ms").mkdir()
+    (directory / "notes.txt").touch()
+
+    # Without a manifest the directory is simply scanned
+    assert list_directory(directory=directory) == (
+        directory / "SB39400.RACS_0635-31.beam0.ms",
+        directory / "notes.txt",
+    )
+
+    create_manifest(directory=directory)
+    _set_old_mtime(directory=directory)
+    listing = list_directory(directory=directory)
+    assert len(listing) == 2
+    assert load_manifest(directory=directory).listing_mtime_ns == 1_000_000_000  # type: ignore
+
+    # Products recorded after the listing are reflected in it
+    manifest_only = directory / "recorded_but_not_created.txt"
+    register_products(manifest_only)
+    assert manifest_only in list_directory(directory=directory)
+
+    # A change to the directory means it is listed again
+    (directory / "new_file.txt").touch()
+    listing = list_directory(directory=directory)
+    assert directory / "new_file.txt" in listing
+    assert manifest_only not in listing
+    assert directory / ".flint" not in listing
+    assert query_products(directory=directory, kind="txt") == (
+        directory / "new_file.txt",
+        directory / "notes.txt",
+    )
+
+    assert resolve_glob_expressions(
+        base_path=directory, file_re_patterns=(r"new.*\.txt",)
+    ) == (directory / "new_file.txt",)
+
+
+def test_find_mss_with_manifest(tmpdir):
+    directory = Path(tmpdir)
+    for beam in range(4):
+        (directory / f"SB39400.RACS_0635-31.beam{beam}.ms").mkdir()
+    create_manifest(directory=directory)
+
+    assert len(find_mss(mss_parent_path=directory, expected_ms_count=4)) == 4
+
+    # Measurement sets made outside of flint are still found
+    (directory / "SB39400.RACS_0635-31.beam4.ms").mkdir()
+    assert len(find_mss(mss_parent_path=directory, expected_ms_count=5)) == 5
+
+
+def test_wsclean_outputs_with_manifest(tmpdir):
+    directory = Path(tmpdir)
+    create_manifest(directory=directory)
+    prefix = directory / "SB39400.RACS_0635-31.beam0.round1.i"
+
+    image_set = get_wsclean_output_names(
+        prefix=str(prefix), subbands=2, check_exists_when_adding=True
+    )
+    assert image_set.image == []
+
+    image_paths = [
+        Path(f"{prefix}-{subband}-image.fits") for subband in ("0000", "0001", "MFS")
+    ]
+    for image_path in image_paths:
+        image_path.touch()
+    register_products(*image_paths)
+
+    image_set = get_wsclean_output_names(
+        prefix=str(prefix), subbands=2, check_exists_when_adding=True
+    )
+    assert image_set.image == image_paths
+    assert image_set.psf == []
+
+    # Outputs that were not recorded are still found
+    psf_path = Path(f"{prefix}-MFS-psf.fits")
+    psf_path.touch()
+    image_set = get_wsclean_output_names(
+        prefix=str(prefix), subbands=2, check_exists_when_adding=True
+    )
+    assert image_set.psf == [psf_path]
+
+    # Recorded outputs are checked for on the file system
+    image_paths[0].unlink()
+    image_set = get_wsclean_output_names(
+        prefix=str(prefix), subbands=2, check_exists_when_adding=True
+    )
+    assert image_set.image == image_paths[1:]
+    image_paths[0].touch()
+
+    removed = delete_wsclean_outputs(prefix=str(prefix), output_type="image")
+    assert removed == image_paths[:2]
+    assert query_products(directory=directory, kind="image") == (image_paths[2],)
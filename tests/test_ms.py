@@ -19,6 +19,7 @@ from flint.ms import (
     consistent_channelwise_frequencies,
     copy_and_preprocess_casda_askap_ms,
     find_mss,
+    get_parallel_hand_mask,
     get_phase_dir_from_ms,
     remove_columns_from_ms,
     rename_ms_and_columns_for_selfcal,
@@ -469,3 +470,10 @@ def test_subtract_model_from_data_column_ms_column_new_column(tmpdir):
 
         data = tab.getcol("DATA")
         assert np.all(data == ones)
+
+
+def test_get_parallel_hand_mask(ms_example):
+    """The packaged MS has XX, XY, YX and YY correlations"""
+    mask = get_parallel_hand_mask(ms=ms_example)
+
+    assert np.all(mask == np.array([True, False, False, True]))
@@ -168,6 +168,37 @@ def test_create_imaging_name_prefix():
     assert name == "SB63789.EMU_1743-51.beam03.round4.ch0100-0108"
 
 
+def test_create_imaging_name_prefix_multiple_ms():
+    """Measurement sets imaged jointly are named after their common fields"""
+    ms_paths = [
+        Path("/Jack/Sparrow/SB63789.EMU_1743-51.beam03.round4.ms"),
+        Path("/Jack/Sparrow/SB63790.EMU_1743-51.beam03.round4.ms"),
+    ]
+    name = create_imaging_name_prefix(ms_path=ms_paths, pol="i")
+    assert name == "EMU_1743-51.beam03.round4.i"
+
+    name = create_imaging_name_prefix(ms_path=ms_paths[:1], pol="i")
+    assert name == "SB63789.EMU_1743-51.beam03.round4.i"
+
+    spw_paths = [
+        Path("/Jack/Sparrow/SB63789.EMU_1743-51.beam03.spw1.ms"),
+        Path("/Jack/Sparrow/SB63789.EMU_1743-51.beam03.spw2.ms"),
+    ]
+    name = create_imaging_name_prefix(ms_path=spw_paths, channel_range=(0, 8))
+    assert name == "SB63789.EMU_1743-51.beam03.ch0000-0008"
+
+    # Nothing in common, or not in the processed format
+    for paths in (
+        [
+            Path("/Jack/SB1.EMU_1743-51.beam03.ms"),
+            Path("/Jack/SB2.EMU_0000-51.beam04.ms"),
+        ],
+        [Path("/Jack/pirate.ms"), Path("/Jack/sparrow.ms")],
+    ):
+        name = create_imaging_name_prefix(ms_path=paths)
+        assert name == f"{paths[0].stem}.joint"
+
+
 def test_get_cube_fits_from_paths():
     """Identify the files that contain the cube field and are fits"""
     files = [
@@ -0,0 +1,343 @@
+"""Tests around the native DFT visibility predictor"""
+
+from __future__ import annotations
+
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+from astropy.coordinates import Angle, SkyCoord
+from casacore.tables import table
+
+from flint.exceptions import MSError
+from flint.ms import get_freqs_from_ms, get_phase_dir_from_ms
+from flint.predict import (
+    SPEED_OF_LIGHT,
+    PredictOptions,
+    SourceList,
+    get_lmn,
+    load_wsclean_source_list,
+    parse_dec,
+    parse_ra,
+    predict_model_into_ms,
+    predict_visibilities,
+)
+from flint.utils import get_packaged_resource_path
+
+
+@pytest.fixture
+def ms_example(tmpdir):
+    ms_zip = Path(
+        get_packaged_resource_path(
+            package="flint.data.tests",
+            filename="SB39400.RACS_0635-31.beam0.small.ms.zip",
+        )
+    )
+    outpath = Path(tmpdir) / "39400"
+
+    shutil.unpack_archive(ms_zip, outpath)
+
+    ms_path = Path(outpath) / "SB39400.RACS_0635-31.beam0.small.ms"
+
+    return ms_path
+
+
+def _make_source_list(
+    ra: float, dec: float, flux: float = 1.0, major: float = 0.0, minor: float = 0.0
+) -> SourceList:
+    return SourceList(
+        names=("s0",),
+        ra=np.array([ra]),
+        dec=np.array([dec]),
+        flux=np.array([flux]),
+        spectral_terms=np.zeros((1, 0)),
+        logarithmic_si=np.array([True]),
+        reference_frequency=np.array([1e9]),
+        major_axis=np.array([major]),
+        minor_axis=np.array([minor]),
+        orientation=np.array([0.0]),
+    )
+
+
+def _write_source_list(ms_path: Path, output_path: Path) -> Path:
+    """A point source at the phase centre and a Gaussian offset from it"""
+    phase_dir = get_phase_dir_from_ms(ms=ms_path)
+    ra_str, dec_str = phase_dir.to_string(style="hmsdms", sep=":", precision=4).split()
+    offset_ra = phase_dir.ra.to_string(unit="hourangle", sep=":", precision=4)
+    offset_dec = (
+        phase_dir.dec.deg + 0.2 if phase_dir.dec.deg > -89 else phase_dir.dec.deg
+    )
+    offset_dec_str = Angle(offset_dec, unit="deg").to_string(sep=":", precision=4)
+
+    with open(output_path, "w") as out_file:
+        out_file.write(
+            "Format = Name, Type, Ra, Dec, I, SpectralIndex, LogarithmicSI, "
+            "ReferenceFrequency='888500000.0', MajorAxis, MinorAxis, Orientation\n"
+        )
+        out_file.write(
+            f"s0,POINT,{ra_str},{dec_str.replace(':', '.')},2.0,[],true,,,,\n"
+        )
+        out_file.write(
+            f"s1,GAUSSIAN,{offset_ra},{offset_dec_str.replace(':', '.')},1.0,[-0.7],true,888500000.0,40,20,30,\n"
+        )
+
+    return output_path
+
+
+def test_parse_ra_dec():
+    assert np.isclose(parse_ra("12:00:00.0"), np.pi)
+    assert np.isclose(np.rad2deg(parse_ra("19:39:25.0261")), 294.85427541)
+    assert np.isclose(np.rad2deg(parse_dec("-63.42.45.625")), -63.71267361)
+    assert np.isclose(np.rad2deg(parse_dec("-00.30.00.0")), -0.5)
+    assert np.isclose(np.rad2deg(parse_dec("+10:30:00")), 10.5)
+
+
+def test_load_wsclean_source_list_packaged_model():
+    model_path = get_packaged_resource_path(
+        package="flint.data.models", filename="1934-638.calibrate.txt"
+    )
+    source_list = load_wsclean_source_list(source_list_path=model_path)
+
+    assert source_list.ncomponents == 1
+    assert source_list.names == ("s0",)
+    assert source_list.spectral_terms.shape == (1, 3)
+    assert np.isclose(source_list.reference_frequency[0], 888500000.0)
+    assert not np.any(source_list.is_gaussian)
+
+    flux = source_list.flux_at(freqs=np.array([888500000.0]))
+    assert np.isclose(flux[0, 0], 14.23058308)
+
+
+def test_load_wsclean_source_list(ms_example, tmpdir):
+    source_list_path = _write_source_list(
+        ms_path=ms_example, output_path=Path(tmpdir) / "model.txt"
+    )
+    source_list = load_wsclean_source_list(source_list_path=source_list_path)
+
+    assert source_list.ncomponents == 2
+    assert np.all(source_list.is_gaussian == np.array([False, True]))
+    # Default reference frequency from the format line
+    assert np.allclose(source_list.reference_frequency, 888500000.0)
+    assert np.isclose(np.rad2deg(source_list.major_axis[1]) * 3600, 40.0)
+    assert np.isclose(np.rad2deg(source_list.minor_axis[1]) * 3600, 20.0)
+    assert np.isclose(np.rad2deg(source_list.orientation[1]), 30.0)
+
+    subset = source_list.subset(slice(1, 2))
+    assert subset.names == ("s1",)
+    assert subset.ncomponents == 1
+
+
+def test_load_wsclean_source_list_no_format(tmpdir):
+    bad_path = Path(tmpdir) / "bad.txt"
+    bad_path.write_text("s0,POINT,00:00:00,00.00.00,1.0,[],true,1e9,,,\n")
+
+    with pytest.raises(ValueError):
+        load_wsclean_source_list(source_list_path=bad_path)
+
+
+def test_flux_at():
+    source_list = SourceList(
+        names=("log", "linear"),
+        ra=np.zeros(2),
+        dec=np.zeros(2),
+        flux=np.array([2.0, 2.0]),
+        spectral_terms=np.array([[-0.7, 0.1], [-1.0, 0.5]]),
+        logarithmic_si=np.array([True, False]),
+        reference_frequency=np.array([1e9, 1e9]),
+        major_axis=np.zeros(2),
+        minor_axis=np.zeros(2),
+        orientation=np.zeros(2),
+    )
+    freqs = np.array([0.5e9, 1e9, 2e9])
+    flux = source_list.flux_at(freqs=freqs)
+
+    ratio = freqs / 1e9
+    expected_log = 2.0 * ratio ** (-0.7 + 0.1 * np.log10(ratio))
+    expected_linear = 2.0 - 1.0 * (ratio - 1) + 0.5 * (ratio - 1) ** 2
+    assert np.allclose(flux[0], expected_log)
+    assert np.allclose(flux[1], expected_linear)
+
+
+def test_predict_point_source_offset():
+    """An offset point source is a pure phase gradient"""
+    rng = np.random.default_rng(42)
+    uvw = rng.uniform(-3000, 3000, size=(50, 3))
+    freqs = np.linspace(0.8e9, 1.0e9, 8)
+    ra0, dec0 = 1.0, -0.5
+
+    source_list = _make_source_list(ra=ra0 + 0.01, dec=dec0 - 0.02, flux=3.0)
+    vis = predict_visibilities(
+        uvw=uvw, freqs=freqs, source_list=source_list, ra0=ra0, dec0=dec0
+    )
+
+    l_coord, m_coord, n_coord = get_lmn(
+        ra=source_list.ra, dec=source_list.dec, ra0=ra0, dec0=dec0
+    )
+    delay = uvw @ np.array([l_coord[0], m_coord[0], n_coord[0] - 1.0])
+    expected = 3.0 * np.exp(
+        -2j * np.pi * delay[:, None] * freqs[None, :] / SPEED_OF_LIGHT
+    )
+
+    assert vis.shape == (50, 8)
+    assert np.allclose(vis, expected)
+
+
+def test_predict_gaussian_matches_sampled_points():
+    """A Gaussian component should be the sum of many point sources
+    tracing out its shape"""
+    rng = np.random.default_rng(42)
+    uvw = rng.uniform(-1000, 1000, size=(40, 3))
+    uvw[:, 2] = 0.0
+    freqs = np.array([1e9])
+    ra0, dec0 = 1.0, -0.5
+
+    arcsec = np.deg2rad(1.0 / 3600)
+    major, minor, pa = 40 * arcsec, 20 * arcsec, np.deg2rad(30.0)
+    gaussian = _make_source_list(ra=ra0, dec=dec0, major=major, minor=minor)
+    gaussian = gaussian._replace(orientation=np.array([pa]))
+    gaussian_vis = predict_visibilities(
+        uvw=uvw, freqs=freqs, source_list=gaussian, ra0=ra0, dec0=dec0
+    )
+
+    # Sample the Gaussian on a grid of east / north offsets
+    offsets = np.arange(-80, 81, 2) * arcsec
+    east, north = np.meshgrid(offsets, offsets)
+    along_major = east * np.sin(pa) + north * np.cos(pa)
+    along_minor = east * np.cos(pa) - north * np.sin(pa)
+    sigma_major = major / np.sqrt(8 * np.log(2))
+    sigma_minor = minor / np.sqrt(8 * np.log(2))
+    weights = np.exp(
+        -0.5 * ((along_major / sigma_major) ** 2 + (along_minor / sigma_minor) ** 2)
+    )
+    weights /= weights.sum()
+
+    npoints = weights.size
+    points = SourceList(
+        names=tuple(f"p{i}" for i in range(npoints)),
+        ra=ra0 + east.ravel() / np.cos(dec0),
+        dec=dec0 + north.ravel(),
+        flux=weights.ravel(),
+        spectral_terms=np.zeros((npoints, 0)),
+        logarithmic_si=np.ones(npoints, dtype=bool),
+        reference_frequency=np.full(npoints, 1e9),
+        major_axis=np.zeros(npoints),
+        minor_axis=np.zeros(npoints),
+        orientation=np.zeros(npoints),
+    )
+    points_vis = predict_visibilities(
+        uvw=uvw, freqs=freqs, source_list=points, ra0=ra0, dec0=dec0
+    )
+
+    # Make sure the test is meaningful, i.e. the Gaussian is resolved
+    assert np.min(np.abs(gaussian_vis)) < 0.8
+    assert np.allclose(gaussian_vis, points_vis, atol=2e-3)
+
+
+def test_predict_model_into_ms(ms_example, tmpdir):
+    """Predict into a simulated MS and compare against the expected visibilities"""
+    source_list_path = _write_source_list(
+        ms_path=ms_example, output_path=Path(tmpdir) / "model.txt"
+    )
+    predict_options = PredictOptions(row_chunk_size=300, max_workers=2)
+
+    predict_result = predict_model_into_ms(
+        ms=ms_example,
+        source_list_path=source_list_path,
+        predict_options=predict_options,
+    )
+    assert predict_result.ms.model_column == "MODEL_DATA"
+    assert predict_result.components == 2
+    assert predict_result.throughput > 0
+
+    freqs = get_freqs_from_ms(ms=ms_example)
+    phase_dir = get_phase_dir_from_ms(ms=ms_example)
+    source_list = load_wsclean_source_list(source_list_path=source_list_path)
+
+    with table(str(ms_example), ack=False) as tab:
+        model = tab.getcol("MODEL_DATA")
+        uvw = tab.getcol("UVW")
+        assert model.dtype == tab.getcol("DATA").dtype
+
+    assert predict_result.visibilities == model.shape[0] * model.shape[1]
+    expected = predict_visibilities(
+        uvw=uvw,
+        freqs=freqs,
+        source_list=source_list,
+        ra0=phase_dir.ra.rad,
+        dec0=phase_dir.dec.rad,
+    )
+    assert np.allclose(model[..., 0], expected, atol=1e-5)
+    assert np.allclose(model[..., 3], expected, atol=1e-5)
+    assert np.all(model[..., 1:3] == 0)
+
+    # The point source at the phase centre alone is a constant
+    point_only = predict_visibilities(
+        uvw=uvw,
+        freqs=freqs,
+        source_list=source_list.subset(slice(0, 1)),
+        ra0=phase_dir.ra.rad,
+        dec0=phase_dir.dec.rad,
+    )
+    assert np.allclose(point_only, 2.0, atol=1e-4)
+
+    # Adding the model again should double it
+    predict_model_into_ms(
+        ms=ms_example,
+        source_list_path=source_list_path,
+        predict_options=PredictOptions(mode="a"),
+    )
+    with table(str(ms_example), ack=False) as tab:
+        doubled = tab.getcol("MODEL_DATA")
+    assert np.allclose(doubled, 2 * model, atol=1e-5)
+
+
+def test_predict_model_into_ms_add_missing_column(ms_example, tmpdir):
+    source_list_path = _write_source_list(
+        ms_path=ms_example, output_path=Path(tmpdir) / "model.txt"
+    )
+
+    with pytest.raises(MSError):
+        predict_model_into_ms(
+            ms=ms_example,
+            source_list_path=source_list_path,
+            predict_options=PredictOptions(model_column="JACK_DATA", mode="a"),
+        )
+
+
+def test_predict_throughput_benchmark(ms_example, tmpdir):
+    """Report the number of component-visibility evaluations per second"""
+    phase_dir = get_phase_dir_from_ms(ms=ms_example)
+    rng = np.random.default_rng(42)
+    ncomponents = 64
+    ras = phase_dir.ra.deg + rng.uniform(-1, 1, ncomponents)
+    decs = phase_dir.dec.deg + rng.uniform(-1, 1, ncomponents)
+
+    source_list_path = Path(tmpdir) / "benchmark.txt"
+    with open(source_list_path, "w") as out_file:
+        out_file.write(
+            "Format = Name, Type, Ra, Dec, I, SpectralIndex, LogarithmicSI, "
+            "ReferenceFrequency='888500000.0', MajorAxis, MinorAxis, Orientation\n"
+        )
+        for idx, (ra, dec) in enumerate(zip(ras, decs)):
+            ra_str, dec_str = (
+                SkyCoord(ra, dec, unit="deg")
+                .to_string(style="hmsdms", sep=":", precision=4)
+                .split()
+            )
+            comp_type, shape = ("GAUSSIAN", "30,20,45") if idx % 2 else ("POINT", ",,")
+            out_file.write(
+                f"s{idx},{comp_type},{ra_str},{dec_str.replace(':', '.')},1.0,[-0.7,0.1],true,888500000.0,{shape}\n"
+            )
+
+    predict_result = predict_model_into_ms(
+        ms=ms_example, source_list_path=source_list_path
+    )
+    print(
+        f"Native predict throughput: {predict_result.throughput:.3e} component-visibilities per second "
+        f"({predict_result.components} components, {predict_result.visibilities} visibilities, "
+        f"{predict_result.elapsed_seconds:.2f}s)"
+    )
+
+    assert predict_result.components == ncomponents
+    assert predict_result.throughput > 0
@@ -2,13 +2,27 @@
 
 from __future__ import annotations
 
+import os
 from pathlib import Path
 
 import pytest
 import yaml
 from prefect_dask import DaskTaskRunner
-
-from flint.prefect.clusters import get_cluster_spec, get_dask_runner
+from threadpoolctl import threadpool_limits
+
+import flint.sclient
+from flint.prefect.clusters import (
+    WORKER_PRELOAD_MODULE,
+    dask_setup,
+    dask_teardown,
+    get_cluster_spec,
+    get_dask_runner,
+)
+from flint.sclient import (
+    INSTANCE_POOL_ENVIRONMENT_VARIABLE,
+    SingularityInstancePool,
+    get_instance_pool,
+)
 
 
 def test_example_yaml_from_file(tmpdir):
@@ -41,6 +55,38 @@ def test_get_dask_task_runner():
     assert isinstance(dask_task_runner, DaskTaskRunner)
 
 
+def test_get_dask_runner_preload():
+    """Workers are started with the module applying the thread budget"""
+    dask_task_runner = get_dask_runner(
+        cluster="example_slurm",
+        extra_cluster_kwargs={"worker_extra_args": ["--nthreads", "1"]},
+    )
+    assert dask_task_runner.cluster_kwargs["worker_extra_args"] == [
+        "--nthreads",
+        "1",
+        "--preload",
+        WORKER_PRELOAD_MODULE,
+    ]
+
+
+def test_dask_setup():
+    """The thread budget is applied as a worker starts"""
+    original = {
+        k: os.environ.get(k) for k in ("OMP_NUM_THREADS", "SLURM_CPUS_PER_TASK")
+    }
+    try:
+        os.environ["SLURM_CPUS_PER_TASK"] = "3"
+        # Restores the limits of the thread pools on exit
+        with threadpool_limits(limits=None):
+            dask_setup(worker=None)
+        assert os.environ["OMP_NUM_THREADS"] == "3"
+    finally:
+        for k, v in original.items():
+            os.environ.pop(k, None)
+            if v is not None:
+                os.environ[k] = v
+
+
 def test_example_cluster_condif(tmpdir):
     """Load in a passable cluster configuration."""
     data = get_cluster_spec(cluster="example_slurm")
@@ -52,3 +98,26 @@ def test_example_cluster_no_exists():
 
     with pytest.raises(ValueError):
         get_cluster_spec(cluster="Jack-be-sneaky")
+
+
+def test_dask_setup_instance_pool():
+    """Workers hold an instance pool for their lifetime when requested"""
+    try:
+        os.environ[INSTANCE_POOL_ENVIRONMENT_VARIABLE] = "True"
+        with threadpool_limits(limits=None):
+            dask_setup(worker=None)
+        pool = flint.sclient._INSTANCE_POOL
+        assert isinstance(pool, SingularityInstancePool)
+        assert get_instance_pool() is pool
+
+        dask_teardown(worker=None)
+        assert flint.sclient._INSTANCE_POOL is None
+    finally:
+        os.environ.pop(INSTANCE_POOL_ENVIRONMENT_VARIABLE, None)
+        flint.sclient._INSTANCE_POOL = None
+
+    # Without the request no pool is made
+    with threadpool_limits(limits=None):
+        dask_setup(worker=None)
+    assert flint.sclient._INSTANCE_POOL is None
+    dask_teardown(worker=None)
@@ -2,10 +2,60 @@
 
 from __future__ import annotations
 
-from flint.prefect.flows.subtract_cube_pipeline import get_parser
+from pathlib import Path
+
+import pytest
+
+from flint.options import MS
+from flint.prefect.flows.subtract_cube_pipeline import (
+    get_channel_block_wsclean_options,
+    get_channel_blocks,
+    get_linmos_cube_names,
+    get_parser,
+)
 
 
 def test_get_parser():
     """Make sure the parser can actually be builts"""
     # This is a silly one but I was bitten by it not working, arrrrhh matey
     _ = get_parser()
+
+
+def test_get_channel_blocks():
+    assert get_channel_blocks(channels=4) == [(0, 1), (1, 2), (2, 3), (3, 4)]
+    assert get_channel_blocks(channels=288, block_size=32)[-1] == (256, 288)
+    assert get_channel_blocks(channels=10, block_size=4) == [(0, 4), (4, 8), (8, 10)]
+
+    with pytest.raises(ValueError):
+        get_channel_blocks(channels=10, block_size=0)
+
+
+def test_get_channel_block_wsclean_options():
+    wsclean_options = dict(size=1024, channels_out=1, join_channels=True)
+
+    block_options = get_channel_block_wsclean_options(
+        wsclean_options=wsclean_options, channel_block=(8, 16)
+    )
+    assert block_options["channels_out"] == 8
+    assert block_options["join_channels"] is False
+    assert block_options["size"] == 1024
+    assert wsclean_options["channels_out"] == 1
+
+    block_options = get_channel_block_wsclean_options(
+        wsclean_options=wsclean_options, channel_block=(16, 17)
+    )
+    assert block_options == wsclean_options
+
+
+def test_get_linmos_cube_names():
+    science_mss = tuple(
+        MS(path=Path(f"/jack/sparrow/SB39400.RACS_0635-31.beam{beam:02d}.ms"))
+        for beam in range(3)
+    )
+    image_cube, weight_cube = get_linmos_cube_names(science_mss=science_mss)
+    assert image_cube == Path(
+        "/jack/sparrow/SB39400.RACS_0635-31.i.contsub.linmos.cube.fits"
+    )
+    assert weight_cube == Path(
+        "/jack/sparrow/SB39400.RACS_0635-31.i.contsub.weight.cube.fits"
+    )
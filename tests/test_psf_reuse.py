@@ -0,0 +1,172 @@
+"""Tests around reusing the PSF images between rounds of imaging"""
+
+from __future__ import annotations
+
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+from casacore.tables import table
+
+from flint.imager.psf_reuse import (
+    check_psf_reuse,
+    get_psf_metadata_path,
+    get_visibility_token,
+    load_psf_products,
+    record_psf_products,
+    remove_psf_products,
+)
+from flint.imager.wsclean import (
+    WSCleanOptions,
+    create_wsclean_cmd,
+    wsclean_cleanup_files,
+)
+from flint.ms import MS
+from flint.utils import get_packaged_resource_path
+
+
+@pytest.fixture
+def ms_example(tmpdir):
+    ms_zip = Path(
+        get_packaged_resource_path(
+            package="flint.data.tests",
+            filename="SB39400.RACS_0635-31.beam0.small.ms.zip",
+        )
+    )
+    outpath = Path(tmpdir) / "39400"
+
+    shutil.unpack_archive(ms_zip, outpath)
+
+    ms_path = Path(outpath) / "SB39400.RACS_0635-31.beam0.small.ms"
+
+    return ms_path
+
+
+def _make_psf_images(prefix: Path, channels_out: int) -> None:
+    for subband in [f"{i:04}" for i in range(channels_out)] + ["MFS"]:
+        Path(f"{prefix}-{subband}-psf.fits").write_text("psf")
+
+
+def test_get_visibility_token(ms_example):
+    token = get_visibility_token(ms=ms_example)
+    assert token == get_visibility_token(ms=ms_example, chunk_size=100)
+
+    # A copy of the measurement set, as made by each round of self-calibration
+    copy_ms = ms_example.parent / "copy.ms"
+    shutil.copytree(ms_example, copy_ms)
+    assert token == get_visibility_token(ms=copy_ms)
+
+    # Changing the data does not change the PSF
+    with table(str(copy_ms), readonly=False, ack=False) as tab:
+        tab.putcol("DATA", tab.getcol("DATA") * 2)
+    assert token == get_visibility_token(ms=copy_ms)
+
+    with table(str(copy_ms), readonly=False, ack=False) as tab:
+        flags = tab.getcol("FLAG")
+        flags[10, 4, :] = ~flags[10, 4, :]
+        tab.putcol("FLAG", flags)
+    assert token != get_visibility_token(ms=copy_ms)
+
+
+def test_get_visibility_token_any_row(ms_example):
+    """A change to the flags of any single row changes the token"""
+    token = get_visibility_token(ms=ms_example, chunk_size=100)
+
+    for row in (1000, 1550):
+        with table(str(ms_example), readonly=False, ack=False) as tab:
+            flags = tab.getcol("FLAG")
+            flags[row, 100, 0] = ~flags[row, 100, 0]
+            tab.putcol("FLAG", flags)
+        new_token = get_visibility_token(ms=ms_example, chunk_size=100)
+        assert new_token != token
+        assert new_token == get_visibility_token(ms=ms_example)
+        token = new_token
+
+
+def test_record_and_check_psf_reuse(ms_example, tmpdir):
+    prefix = Path(tmpdir) / "SB39400.RACS_0635-31.beam0.round1.i"
+    wsclean_options = WSCleanOptions(channels_out=2, size=1024)
+
+    assert (
+        record_psf_products(
+            prefix=prefix, ms=ms_example, wsclean_options=wsclean_options
+        )
+        is None
+    )
+
+    _make_psf_images(prefix=prefix, channels_out=2)
+    metadata_path = record_psf_products(
+        prefix=prefix, ms=ms_example, wsclean_options=wsclean_options
+    )
+    assert metadata_path == get_psf_metadata_path(prefix=prefix)
+
+    psf_products = load_psf_products(metadata_path=metadata_path)
+    assert psf_products is not None
+    assert psf_products.prefix == str(prefix)
+    assert len(psf_products.psf_images) == 3
+    assert psf_products.key_options["size"] == 1024
+
+    assert check_psf_reuse(
+        psf_products=psf_products, ms=ms_example, wsclean_options=wsclean_options
+    )
+    # Options unrelated to the PSF may change between rounds
+    assert check_psf_reuse(
+        psf_products=psf_products,
+        ms=ms_example,
+        wsclean_options=wsclean_options.with_options(nmiter=4, auto_mask=2.0),
+    )
+    assert not check_psf_reuse(
+        psf_products=psf_products,
+        ms=ms_example,
+        wsclean_options=wsclean_options.with_options(size=2048),
+    )
+    assert not check_psf_reuse(
+        psf_products=psf_products,
+        ms=ms_example,
+        wsclean_options=wsclean_options.with_options(weight="briggs 0.0"),
+    )
+    assert not check_psf_reuse(
+        psf_products=psf_products,
+        ms=ms_example,
+        wsclean_options=wsclean_options,
+        visibility_token="jack",
+    )
+
+    removed = remove_psf_products(metadata_path=metadata_path)
+    assert len(removed) == 4
+    assert not check_psf_reuse(
+        psf_products=psf_products, ms=ms_example, wsclean_options=wsclean_options
+    )
+    assert load_psf_products(metadata_path=metadata_path) is None
+
+
+def test_create_wsclean_cmd_reuse_psf(ms_example, tmpdir):
+    psf_prefix = Path(tmpdir) / "psfs" / "SB39400.RACS_0635-31.beam0.i"
+    ms = MS(path=ms_example, column="DATA")
+    wsclean_options = WSCleanOptions(
+        data_column="DATA", reuse_psf=psf_prefix, flint_reuse_psf=True
+    )
+
+    wsclean_result = create_wsclean_cmd(ms=ms, wsclean_options=wsclean_options)
+    assert f"-reuse-psf {psf_prefix}" in wsclean_result.cmd
+    assert "flint-reuse-psf" not in wsclean_result.cmd
+    assert psf_prefix.parent in wsclean_result.bind_dirs
+
+    wsclean_result = create_wsclean_cmd(
+        ms=ms, wsclean_options=WSCleanOptions(data_column="DATA")
+    )
+    assert "-reuse-psf" not in wsclean_result.cmd
+    assert wsclean_result.psf_metadata is None
+
+
+def test_wsclean_cleanup_keeps_psf(tmpdir):
+    prefix = Path(tmpdir) / "SB39400.RACS_0635-31.beam0.i"
+    _make_psf_images(prefix=prefix, channels_out=2)
+    Path(f"{prefix}-0000-dirty.fits").write_text("dirty")
+
+    rm_files = wsclean_cleanup_files(prefix=prefix, output_types=("dirty",))
+    assert rm_files == (Path(f"{prefix}-0000-dirty.fits"),)
+    assert np.all(
+        [Path(f"{prefix}-{subband}-psf.fits").exists() for subband in ("0000", "0001")]
+    )
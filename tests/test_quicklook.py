@@ -0,0 +1,203 @@
+"""Tests around the native quick-look imager"""
+
+from __future__ import annotations
+
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+from astropy.coordinates import SkyCoord
+from astropy.io import fits
+from astropy.wcs import WCS
+from casacore.tables import table
+
+from flint.exceptions import MSError
+from flint.imager.quicklook import (
+    QuickLookOptions,
+    create_quicklook_image,
+    get_quicklook_cell_arcsec,
+    get_quicklook_image_path,
+    grid_visibilities,
+)
+from flint.ms import get_phase_dir_from_ms
+from flint.predict import predict_model_into_ms
+from flint.utils import get_packaged_resource_path
+
+
+@pytest.fixture
+def ms_example(tmpdir):
+    ms_zip = Path(
+        get_packaged_resource_path(
+            package="flint.data.tests",
+            filename="SB39400.RACS_0635-31.beam0.small.ms.zip",
+        )
+    )
+    outpath = Path(tmpdir) / "39400"
+
+    shutil.unpack_archive(ms_zip, outpath)
+
+    ms_path = Path(outpath) / "SB39400.RACS_0635-31.beam0.small.ms"
+
+    return ms_path
+
+
+def _simulate_uvw(ms_path: Path) -> None:
+    """The packaged MS has no UVW coordinates and is entirely flagged. Generate
+    some UVWs from the antenna positions, treating the ITRF frame as equatorial
+    and using the time of each row as an hour angle, and unflag everything."""
+    phase_dir = get_phase_dir_from_ms(ms=ms_path)
+    dec = phase_dir.dec.rad
+
+    with table(str(ms_path / "ANTENNA"), ack=False) as tab:
+        positions = tab.getcol("POSITION")
+
+    with table(str(ms_path), readonly=False, ack=False) as tab:
+        ant1, ant2 = tab.getcol("ANTENNA1"), tab.getcol("ANTENNA2")
+        times = tab.getcol("TIME")
+        hour_angle = 2 * np.pi * (times - times.min()) / 86164.0 + 0.3
+        bx, by, bz = (positions[ant2] - positions[ant1]).T
+        sin_h, cos_h = np.sin(hour_angle), np.cos(hour_angle)
+        uvw = np.stack(
+            [
+                sin_h * bx + cos_h * by,
+                -np.sin(dec) * cos_h * bx + np.sin(dec) * sin_h * by + np.cos(dec) * bz,
+                np.cos(dec) * cos_h * bx - np.cos(dec) * sin_h * by + np.sin(dec) * bz,
+            ],
+            axis=1,
+        )
+        tab.putcol("UVW", uvw)
+        tab.putcol("FLAG", np.zeros_like(tab.getcol("FLAG")))
+
+
+@pytest.fixture
+def ms_with_point_source(ms_example, tmpdir):
+    """Predict a point source offset from the phase centre into MODEL_DATA"""
+    _simulate_uvw(ms_path=ms_example)
+
+    phase_dir = get_phase_dir_from_ms(ms=ms_example)
+    source = SkyCoord(
+        phase_dir.ra.deg + 0.15 / np.cos(phase_dir.dec.rad),
+        phase_dir.dec.deg + 0.1,
+        unit="deg",
+    )
+    ra_str, dec_str = source.to_string(style="hmsdms", sep=":", precision=4).split()
+
+    source_list_path = Path(tmpdir) / "point.txt"
+    with open(source_list_path, "w") as out_file:
+        out_file.write(
+            "Format = Name, Type, Ra, Dec, I, SpectralIndex, LogarithmicSI, "
+            "ReferenceFrequency='888500000.0', MajorAxis, MinorAxis, Orientation\n"
+        )
+        out_file.write(
+            f"s0,POINT,{ra_str},{dec_str.replace(':', '.')},2.0,[],true,,,,\n"
+        )
+
+    predict_model_into_ms(ms=ms_example, source_list_path=source_list_path)
+
+    return ms_example, source
+
+
+def test_get_quicklook_image_path():
+    ms_path = Path("SB39400.RACS_0635-31.beam0.small.ms")
+    assert get_quicklook_image_path(ms_path) == Path(
+        "SB39400.RACS_0635-31.beam0.small.quicklook.fits"
+    )
+
+
+def test_get_quicklook_cell_arcsec():
+    cell = get_quicklook_cell_arcsec(max_uv_lambda=1.0 / np.deg2rad(1 / 3600))
+    assert np.isclose(cell, 1 / 3)
+
+
+def test_grid_visibilities_hermitian():
+    """A single visibility and its conjugate make a real-valued image"""
+    grid = np.zeros((64, 64), dtype=complex)
+    cell_rad = np.deg2rad(30 / 3600)
+    delta_uv = 1 / (64 * cell_rad)
+
+    count, weight = grid_visibilities(
+        grid=grid,
+        u_lambda=np.array([3 * delta_uv, 100 * delta_uv]),
+        v_lambda=np.array([2 * delta_uv, 0.0]),
+        vis=np.array([1.0 + 1.0j, 1.0]),
+        weights=np.array([1.0, 1.0]),
+        cell_rad=cell_rad,
+    )
+
+    # The second visibility falls off the grid
+    assert count == 1
+    assert weight == 2.0
+    assert grid[32 + 2, 32 - 3] == 1.0 + 1.0j
+    assert grid[32 - 2, 32 + 3] == 1.0 - 1.0j
+    image = np.fft.fftshift(np.fft.ifft2(np.fft.ifftshift(grid)))
+    assert np.allclose(image.imag, 0.0)
+
+
+def test_create_quicklook_image_point_source(ms_with_point_source, tmpdir):
+    """The peak of the dirty image should be at the position of the source"""
+    ms_path, source = ms_with_point_source
+
+    output_path = Path(tmpdir) / "quicklook.fits"
+    quicklook_result = create_quicklook_image(
+        ms=ms_path,
+        quicklook_options=QuickLookOptions(
+            data_column="MODEL_DATA", size=256, channel_average=8
+        ),
+        output_path=output_path,
+    )
+
+    assert quicklook_result.image_path == output_path
+    assert output_path.exists()
+    assert quicklook_result.gridded_visibilities > 0
+    # Pixelisation and nearest neighbour gridding lower the peak a little
+    assert 1.6 < quicklook_result.peak < 2.05
+
+    with fits.open(output_path) as hdul:
+        header = hdul[0].header
+        data = hdul[0].data
+
+    assert data.shape == (1, 1, 256, 256)
+    assert header["BUNIT"] == "Jy/beam"
+
+    wcs = WCS(header).celestial
+    phase_dir = get_phase_dir_from_ms(ms=ms_path)
+    centre = wcs.pixel_to_world(128, 128)
+    assert centre.separation(phase_dir).arcsec < 0.1
+
+    peak_y, peak_x = np.unravel_index(np.argmax(data[0, 0]), data[0, 0].shape)
+    peak_position = wcs.pixel_to_world(peak_x, peak_y)
+    assert peak_position.separation(source).arcsec < 1.5 * quicklook_result.cell_arcsec
+
+
+def test_create_quicklook_image_subsample(ms_with_point_source, tmpdir):
+    ms_path, _ = ms_with_point_source
+
+    full_result = create_quicklook_image(
+        ms=ms_path,
+        quicklook_options=QuickLookOptions(data_column="MODEL_DATA", size=128),
+        output_path=Path(tmpdir) / "full.fits",
+    )
+    subsampled_result = create_quicklook_image(
+        ms=ms_path,
+        quicklook_options=QuickLookOptions(
+            data_column="MODEL_DATA",
+            size=128,
+            row_stride=4,
+            channel_average=32,
+            chunk_size=100,
+            cell_arcsec=full_result.cell_arcsec,
+        ),
+        output_path=Path(tmpdir) / "subsampled.fits",
+    )
+
+    assert subsampled_result.cell_arcsec == full_result.cell_arcsec
+    assert subsampled_result.gridded_visibilities < full_result.gridded_visibilities / 4
+    assert subsampled_result.peak > 1.2
+
+
+def test_create_quicklook_image_missing_column(ms_example):
+    with pytest.raises(MSError):
+        create_quicklook_image(
+            ms=ms_example, quicklook_options=QuickLookOptions(data_column="JACK_DATA")
+        )
@@ -0,0 +1,316 @@
+"""Tests around the cache of wsclean reorder files"""
+
+from __future__ import annotations
+
+import os
+import shutil
+from pathlib import Path
+
+import pytest
+from casacore.tables import table
+
+from flint.imager.reorder import (
+    REORDER_CACHE_ENVIRONMENT_VARIABLE,
+    REORDER_DIGEST_NAME,
+    clear_reorder_cache,
+    get_column_token,
+    get_reorder_cache_directory,
+    get_reorder_columns,
+    lookup_reorder_cache,
+    record_reorder_cache_entry,
+)
+from flint.imager.wsclean import WSCleanOptions, WSCleanResult, create_wsclean_cmd
+from flint.ms import MS
+from flint.naming import get_selfcal_ms_name
+from flint.selfcal.utils import create_passthrough_selfcal_ms
+from flint.utils import get_packaged_resource_path
+
+
+@pytest.fixture
+def ms_example(tmpdir):
+    ms_zip = Path(
+        get_packaged_resource_path(
+            package="flint.data.tests",
+            filename="SB39400.RACS_0635-31.beam0.small.ms.zip",
+        )
+    )
+    outpath = Path(tmpdir) / "39400"
+
+    shutil.unpack_archive(ms_zip, outpath)
+
+    ms_path = Path(outpath) / "SB39400.RACS_0635-31.beam0.small.ms"
+
+    return ms_path
+
+
+def _rewrite_column(ms_path: Path, column: str = "DATA") -> None:
+    with table(str(ms_path), readonly=False, ack=False) as tab:
+        data = tab.getcol(column)
+        tab.putcol(column, data * 2 + 1)
+        tab.flush()
+
+
+def test_get_reorder_cache_directory(tmpdir):
+    os.environ.pop(REORDER_CACHE_ENVIRONMENT_VARIABLE, None)
+    assert get_reorder_cache_directory() is None
+    assert get_reorder_cache_directory(reorder_cache=Path(tmpdir)) == Path(tmpdir)
+
+    os.environ[REORDER_CACHE_ENVIRONMENT_VARIABLE] = str(tmpdir)
+    try:
+        assert get_reorder_cache_directory() == Path(tmpdir)
+        assert get_reorder_cache_directory(
+            reorder_cache=f"${REORDER_CACHE_ENVIRONMENT_VARIABLE}"
+        ) == Path(tmpdir)
+    finally:
+        os.environ.pop(REORDER_CACHE_ENVIRONMENT_VARIABLE)
+
+
+def test_get_column_token(ms_example):
+    columns = get_reorder_columns(ms=ms_example, data_column="DATA")
+    assert columns == ("DATA", "FLAG", "WEIGHT")
+    assert get_reorder_columns(ms=ms_example, data_column="JACK_DATA") == (
+        "FLAG",
+        "WEIGHT",
+    )
+
+    token = get_column_token(ms=ms_example, columns=columns)
+    assert token == get_column_token(ms=ms_example, columns=columns)
+
+    _rewrite_column(ms_path=ms_example)
+    assert token != get_column_token(ms=ms_example, columns=columns)
+
+
+def _set_same_mtimes(ms_path: Path, reference_ms_path: Path) -> None:
+    for path in reference_ms_path.rglob("*"):
+        stat = path.stat()
+        os.utime(
+            ms_path / path.relative_to(reference_ms_path),
+            ns=(stat.st_atime_ns, stat.st_mtime_ns),
+        )
+
+
+def test_column_token_of_beams(ms_example, tmpdir):
+    """Measurement sets of the same shape and with identical modification
+    times, like the beams of an observation, have different tokens"""
+    columns = get_reorder_columns(ms=ms_example, data_column="DATA")
+    for path in ms_example.rglob("*"):
+        os.utime(path, ns=(0, 1_000_000_000))
+
+    other_ms = ms_example.parent / "SB39400.RACS_0635-31.beam1.small.ms"
+    shutil.copytree(ms_example, other_ms)
+    _rewrite_column(ms_path=other_ms)
+    _set_same_mtimes(ms_path=other_ms, reference_ms_path=ms_example)
+
+    token = get_column_token(ms=ms_example, columns=columns)
+    other_token = get_column_token(ms=other_ms, columns=columns)
+    assert token != other_token
+
+    # The digests are kept within each measurement set
+    assert (ms_example / REORDER_DIGEST_NAME).exists()
+    assert get_column_token(ms=ms_example, columns=columns) == token
+    assert get_column_token(ms=other_ms, columns=columns) == other_token
+
+    cache_directory = Path(tmpdir) / "reorder_cache"
+    wsclean_options = WSCleanOptions(data_column="DATA")
+    lookup = lookup_reorder_cache(
+        cache_directory=cache_directory, ms=ms_example, wsclean_options=wsclean_options
+    )
+    record_reorder_cache_entry(
+        entry_directory=lookup.directory,
+        ms=ms_example,
+        wsclean_options=wsclean_options,
+    )
+    other_lookup = lookup_reorder_cache(
+        cache_directory=cache_directory, ms=other_ms, wsclean_options=wsclean_options
+    )
+    assert not other_lookup.reuse
+    assert other_lookup.directory != lookup.directory
+
+
+def test_lookup_reorder_cache(ms_example, tmpdir):
+    cache_directory = Path(tmpdir) / "reorder_cache"
+    wsclean_options = WSCleanOptions(data_column="DATA")
+
+    lookup = lookup_reorder_cache(
+        cache_directory=cache_directory, ms=ms_example, wsclean_options=wsclean_options
+    )
+    assert not lookup.reuse
+    assert lookup.directory.is_dir()
+    assert lookup.directory.parent == cache_directory
+
+    # Until wsclean has run successfully the entry is not valid
+    again = lookup_reorder_cache(
+        cache_directory=cache_directory, ms=ms_example, wsclean_options=wsclean_options
+    )
+    assert not again.reuse
+
+    # Pretend wsclean wrote some reorder files
+    (lookup.directory / "reordered-part0.tmp").write_text("jack")
+    entry = record_reorder_cache_entry(
+        entry_directory=lookup.directory,
+        ms=ms_example,
+        wsclean_options=wsclean_options,
+    )
+    assert entry.key_options["data_column"] == "DATA"
+
+    reuse = lookup_reorder_cache(
+        cache_directory=cache_directory, ms=ms_example, wsclean_options=wsclean_options
+    )
+    assert reuse.reuse
+    assert reuse.directory == lookup.directory
+    assert (reuse.directory / "reordered-part0.tmp").exists()
+
+    # A different selection is a different entry
+    other_pol = lookup_reorder_cache(
+        cache_directory=cache_directory,
+        ms=ms_example,
+        wsclean_options=wsclean_options.with_options(pol="v"),
+    )
+    assert not other_pol.reuse
+    assert other_pol.directory != lookup.directory
+
+    # Rewriting the imaged column invalidates the entry
+    _rewrite_column(ms_path=ms_example)
+    invalidated = lookup_reorder_cache(
+        cache_directory=cache_directory, ms=ms_example, wsclean_options=wsclean_options
+    )
+    assert not invalidated.reuse
+    assert invalidated.directory != lookup.directory
+
+    # The stale entry is replaced once the new one is recorded
+    record_reorder_cache_entry(
+        entry_directory=invalidated.directory,
+        ms=ms_example,
+        wsclean_options=wsclean_options,
+    )
+    assert not lookup.directory.exists()
+    assert other_pol.directory.exists()
+
+
+def test_reorder_cache_across_selfcal_rounds(ms_example, tmpdir):
+    """The measurement set of each self-calibration round has a new name,
+    which should not stop unchanged data from being reused"""
+    cache_directory = Path(tmpdir) / "reorder_cache"
+    wsclean_options = WSCleanOptions(
+        data_column="DATA", flint_reorder_cache=cache_directory
+    )
+
+    def _image(ms: MS) -> WSCleanResult:
+        wsclean_result = create_wsclean_cmd(ms=ms, wsclean_options=wsclean_options)
+        assert wsclean_result.reorder_cache_directory is not None
+        record_reorder_cache_entry(
+            entry_directory=wsclean_result.reorder_cache_directory,
+            ms=ms,
+            wsclean_options=wsclean_options,
+        )
+        return wsclean_result
+
+    round1_ms = MS(path=ms_example, column="DATA")
+    round1_result = _image(ms=round1_ms)
+    assert "-save-reordered" in round1_result.cmd
+
+    # A skipped round links to the previous measurement set
+    round2_ms = create_passthrough_selfcal_ms(ms=round1_ms, round=2)
+    round2_result = _image(ms=round2_ms)
+    assert "-reuse-reordered" in round2_result.cmd
+    assert (
+        round2_result.reorder_cache_directory == round1_result.reorder_cache_directory
+    )
+
+    # As does a measurement set renamed for the next round
+    round3_path = get_selfcal_ms_name(in_ms_path=ms_example, round=3)
+    round2_ms.path.unlink()
+    ms_example.rename(round3_path)
+    round3_ms = round1_ms.with_options(path=round3_path)
+    round3_result = _image(ms=round3_ms)
+    assert "-reuse-reordered" in round3_result.cmd
+    assert (
+        round3_result.reorder_cache_directory == round1_result.reorder_cache_directory
+    )
+
+    # Applying new gains means the round is reordered again
+    _rewrite_column(ms_path=round3_path)
+    round4_result = _image(ms=round3_ms)
+    assert "-save-reordered" in round4_result.cmd
+    assert round1_result.reorder_cache_directory
+    assert not round1_result.reorder_cache_directory.exists()
+    assert [path.name for path in cache_directory.iterdir() if path.is_dir()] == [
+        round4_result.reorder_cache_directory.name  # type: ignore
+    ]
+
+
+def test_create_wsclean_cmd_reorder_cache(ms_example, tmpdir):
+    cache_directory = Path(tmpdir) / "reorder_cache"
+    hold_directory = Path(tmpdir) / "hold"
+    ms = MS(path=ms_example, column="DATA")
+    wsclean_options = WSCleanOptions(
+        data_column="DATA",
+        temp_dir=hold_directory,
+        flint_reorder_cache=cache_directory,
+    )
+
+    wsclean_result = create_wsclean_cmd(ms=ms, wsclean_options=wsclean_options)
+    entry_directory = wsclean_result.reorder_cache_directory
+    assert entry_directory is not None
+    assert entry_directory.parent == cache_directory
+    assert f"-temp-dir {entry_directory}" in wsclean_result.cmd
+    assert f"-temp-dir {hold_directory}" not in wsclean_result.cmd
+    assert "-save-reordered" in wsclean_result.cmd
+    assert "-reuse-reordered" not in wsclean_result.cmd
+    assert "flint-reorder-cache" not in wsclean_result.cmd
+    # Images are still written to the hold directory
+    assert wsclean_result.move_hold_directories[1] == hold_directory
+    assert entry_directory in wsclean_result.bind_dirs
+
+    record_reorder_cache_entry(
+        entry_directory=entry_directory, ms=ms, wsclean_options=wsclean_options
+    )
+    wsclean_result = create_wsclean_cmd(ms=ms, wsclean_options=wsclean_options)
+    assert "-reuse-reordered" in wsclean_result.cmd
+    assert "-save-reordered" not in wsclean_result.cmd
+
+    no_reorder_result = create_wsclean_cmd(
+        ms=ms, wsclean_options=wsclean_options.with_options(no_reorder=True)
+    )
+    assert no_reorder_result.reorder_cache_directory is None
+    assert "reordered" not in no_reorder_result.cmd
+    assert f"-temp-dir {hold_directory}" in no_reorder_result.cmd
+
+
+def test_clear_reorder_cache(ms_example, tmpdir):
+    cache_directory = Path(tmpdir) / "reorder_cache"
+    wsclean_options = WSCleanOptions(data_column="DATA")
+
+    lookup = lookup_reorder_cache(
+        cache_directory=cache_directory, ms=ms_example, wsclean_options=wsclean_options
+    )
+    record_reorder_cache_entry(
+        entry_directory=lookup.directory,
+        ms=ms_example,
+        wsclean_options=wsclean_options,
+    )
+    in_progress = lookup_reorder_cache(
+        cache_directory=cache_directory,
+        ms=ms_example,
+        wsclean_options=wsclean_options.with_options(pol="v"),
+    )
+
+    # Entries of other fields are kept
+    assert (
+        clear_reorder_cache(
+            cache_directory=cache_directory, ms_parent=Path(tmpdir) / "other"
+        )
+        == []
+    )
+
+    removed = clear_reorder_cache(
+        cache_directory=cache_directory, ms_parent=ms_example.parent
+    )
+    assert removed == [lookup.directory]
+    assert in_progress.directory.exists()
+
+    removed = clear_reorder_cache(cache_directory=cache_directory)
+    assert removed == [in_progress.directory]
+    assert clear_reorder_cache(cache_directory=Path(tmpdir) / "missing") == []
+
+    assert not in_progress.directory.exists()
@@ -0,0 +1,414 @@
+"""Tests around running commands in containers"""
+
+from __future__ import annotations
+
+import fcntl
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+import flint.sclient
+from flint.exceptions import AttemptRerunException
+from flint.sclient import (
+    INSTANCE_POOL_ENVIRONMENT_VARIABLE,
+    NATIVE_TOOLS_ENVIRONMENT_VARIABLE,
+    ResourceUsage,
+    SingularityInstancePool,
+    StreamedOutputHandler,
+    _take_usage_snapshot,
+    append_resource_usage,
+    evict_container_cache,
+    get_execution_backend,
+    get_instance_pool,
+    get_resource_usage,
+    run_singularity_command,
+    singularity_instance_pool,
+    stage_container,
+)
+
+
+def test_singularity_instance_pool_context():
+    """The pool should only be active within the context"""
+    os.environ.pop(INSTANCE_POOL_ENVIRONMENT_VARIABLE, None)
+    assert get_instance_pool() is None
+
+    with singularity_instance_pool(prefix="jack") as pool:
+        assert isinstance(pool, SingularityInstancePool)
+        assert get_instance_pool() is pool
+        assert pool.prefix == f"jack_{os.getpid()}"
+
+    assert get_instance_pool() is None
+
+
+def test_singularity_instance_pool_environment():
+    """The pool may be enabled through an environment variable"""
+    try:
+        os.environ[INSTANCE_POOL_ENVIRONMENT_VARIABLE] = "no"
+        assert get_instance_pool() is None
+
+        os.environ[INSTANCE_POOL_ENVIRONMENT_VARIABLE] = "True"
+        pool = get_instance_pool()
+        assert isinstance(pool, SingularityInstancePool)
+        assert get_instance_pool() is pool
+    finally:
+        os.environ.pop(INSTANCE_POOL_ENVIRONMENT_VARIABLE, None)
+        flint.sclient._INSTANCE_POOL = None
+
+
+def test_singularity_instance_pool_key(tmpdir):
+    """Instances are unique to the container and set of binds"""
+    image = Path(tmpdir) / "jack.sif"
+    image.write_text("sparrow")
+
+    key_a = SingularityInstancePool._key(image=image, bind=["/b", "/a", "/a"])
+    key_b = SingularityInstancePool._key(image=image, bind=["/a", "/b"])
+    key_c = SingularityInstancePool._key(image=image, bind=None)
+
+    assert key_a == key_b
+    assert key_a != key_c
+    assert key_c[1] == ()
+
+    # Nothing should happen when there is nothing to stop
+    pool = SingularityInstancePool()
+    pool.discard(image=image, bind=None)
+    pool.stop_all()
+
+
+def test_get_resource_usage(tmpdir):
+    """Resources used by a child process are recorded"""
+    out_file = Path(tmpdir) / "jack.bin"
+    command = (
+        f"import time; open('{out_file}', 'wb').write(b'a' * 1000000); "
+        "t0 = time.process_time()\n"
+        "while time.process_time() - t0 < 0.2: pass"
+    )
+
+    usage_snapshot = _take_usage_snapshot()
+    subprocess.run([sys.executable, "-c", command], check=True)
+    resource_usage = get_resource_usage(
+        command="python", image=Path("jack.sif"), usage_snapshot=usage_snapshot
+    )
+
+    assert isinstance(resource_usage, ResourceUsage)
+    assert resource_usage.command == "python"
+    assert resource_usage.wall_time >= 0.2
+    assert resource_usage.user_time + resource_usage.system_time >= 0.15
+    assert resource_usage.max_rss_kb > 0
+    if resource_usage.read_bytes is not None:
+        assert resource_usage.read_bytes >= 0
+        assert resource_usage.write_bytes >= 0
+
+
+def test_append_resource_usage(tmpdir):
+    """Records are appended as JSON lines"""
+    resource_usage = ResourceUsage(
+        command="wsclean -size 100 100",
+        image=Path("/containers/wsclean.sif"),
+        hostname="sparrow",
+        start_time=0.0,
+        wall_time=1.0,
+        user_time=2.0,
+        system_time=0.5,
+        max_rss_kb=1024,
+    )
+    output_path = Path(tmpdir) / "usage" / "usage.jsonl"
+
+    append_resource_usage(resource_usage=resource_usage, output_path=output_path)
+    append_resource_usage(resource_usage=resource_usage, output_path=output_path)
+
+    records = [json.loads(line) for line in output_path.read_text().splitlines()]
+    assert len(records) == 2
+    assert records[0]["image"] == "/containers/wsclean.sif"
+    assert records[0]["user_time"] == 2.0
+    assert records[0]["read_bytes"] is None
+
+
+def test_stage_container(tmpdir):
+    """Containers are copied once, and restaged when the original changes"""
+    image = Path(tmpdir) / "shared" / "jack.sif"
+    image.parent.mkdir()
+    image.write_bytes(b"a" * 1000)
+    cache_directory = Path(tmpdir) / "cache"
+
+    staged = stage_container(image=image, cache_directory=cache_directory)
+    assert staged != image
+    assert staged.parent == cache_directory
+    assert staged.read_bytes() == image.read_bytes()
+
+    staged_mtime = staged.stat().st_mtime_ns
+    assert stage_container(image=image, cache_directory=cache_directory) == staged
+    assert staged.stat().st_mtime_ns == staged_mtime
+
+    image.write_bytes(b"b" * 2000)
+    os.utime(image, (0, 0))
+    staged = stage_container(image=image, cache_directory=cache_directory)
+    assert staged.read_bytes() == image.read_bytes()
+
+
+def test_container_cache_eviction(tmpdir):
+    """The least recently used container is evicted when over budget"""
+    cache_directory = Path(tmpdir) / "cache"
+    images = []
+    for idx in range(3):
+        image = Path(tmpdir) / f"image_{idx}.sif"
+        image.write_bytes(b"a" * 1000)
+        images.append(image)
+
+    staged_0 = stage_container(image=images[0], cache_directory=cache_directory)
+    staged_1 = stage_container(image=images[1], cache_directory=cache_directory)
+    # Make the first the most recently used
+    os.utime(staged_1.with_suffix(".sif.json"), (0, 0))
+
+    staged_2 = stage_container(
+        image=images[2], cache_directory=cache_directory, max_cache_size=2500
+    )
+    assert staged_0.exists()
+    assert not staged_1.exists()
+    assert staged_2.exists()
+
+    removed = evict_container_cache(
+        cache_directory=cache_directory, max_cache_size=0, keep=[staged_2]
+    )
+    assert removed == [staged_0]
+    assert staged_2.exists()
+
+    # The container being staged is kept, even when it alone is over budget
+    staged_0 = stage_container(
+        image=images[0], cache_directory=cache_directory, max_cache_size=500
+    )
+    assert staged_0.exists()
+    assert staged_0.with_suffix(".sif.json").exists()
+    assert not staged_2.exists()
+
+
+def test_stage_container_copy_outside_lock(tmpdir, monkeypatch):
+    """The cache lock is not held while a container is copied"""
+    image = Path(tmpdir) / "jack.sif"
+    image.write_bytes(b"a" * 1000)
+    cache_directory = Path(tmpdir) / "cache"
+
+    copy_with_checksum = flint.sclient._copy_with_checksum
+    lock_held = []
+
+    def _copy_with_checksum(source, destination):
+        with open(cache_directory / ".flint_container_cache.lock", "a") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                lock_held.append(False)
+            except BlockingIOError:
+                lock_held.append(True)
+        return copy_with_checksum(source=source, destination=destination)
+
+    monkeypatch.setattr(flint.sclient, "_copy_with_checksum", _copy_with_checksum)
+
+    staged = stage_container(image=image, cache_directory=cache_directory)
+    assert lock_held == [False]
+    assert staged.read_bytes() == image.read_bytes()
+    assert list(cache_directory.glob("*.tmp")) == []
+
+
+def _make_stub_executable(directory: Path, name: str, script: str) -> Path:
+    stub = directory / name
+    stub.write_text(f"#!/bin/sh\n{script}\n")
+    stub.chmod(0o755)
+    return stub
+
+
+def test_get_execution_backend():
+    """Tools may be nominated to run natively"""
+    try:
+        os.environ.pop(NATIVE_TOOLS_ENVIRONMENT_VARIABLE, None)
+        assert get_execution_backend(command="wsclean -size 100 100") == "singularity"
+        assert (
+            get_execution_backend(command="wsclean", execution_backend="native")
+            == "native"
+        )
+
+        os.environ[NATIVE_TOOLS_ENVIRONMENT_VARIABLE] = "aoflagger, wsclean"
+        assert get_execution_backend(command="/usr/bin/wsclean -j 4") == "native"
+        assert get_execution_backend(command="casa -c jack.py") == "singularity"
+        assert (
+            get_execution_backend(command="wsclean", execution_backend="singularity")
+            == "singularity"
+        )
+
+        os.environ[NATIVE_TOOLS_ENVIRONMENT_VARIABLE] = "all"
+        assert get_execution_backend(command="casa -c jack.py") == "native"
+    finally:
+        os.environ.pop(NATIVE_TOOLS_ENVIRONMENT_VARIABLE, None)
+
+    with pytest.raises(ValueError):
+        get_execution_backend(command="wsclean", execution_backend="docker")
+
+
+def test_run_native_command(tmpdir):
+    """Commands are executed on the host with their output streamed"""
+    tmpdir = Path(tmpdir)
+    output = tmpdir / "output.txt"
+    stub = _make_stub_executable(
+        directory=tmpdir, name="jack", script=f'echo "sparrow $1"\ntouch {output}'
+    )
+
+    lines = []
+    resource_usage = run_singularity_command(
+        image=None,
+        command=f"{stub} pearl",
+        stream_callback_func=lines.append,
+        expected_outputs=output,
+        execution_backend="native",
+    )
+    assert lines == ["sparrow pearl\n"]
+    assert output.exists()
+    assert resource_usage.image is None
+    assert resource_usage.command == f"{stub} pearl"
+
+
+def test_run_native_command_failures(tmpdir):
+    """Errors and reruns behave the same as in a container"""
+    tmpdir = Path(tmpdir)
+    failing = _make_stub_executable(
+        directory=tmpdir, name="fail", script="echo broken\nexit 3"
+    )
+    with pytest.raises(subprocess.CalledProcessError):
+        run_singularity_command(
+            image=None,
+            command=str(failing),
+            expected_outputs=[],
+            execution_backend="native",
+        )
+
+    with pytest.raises(FileNotFoundError):
+        run_singularity_command(
+            image=None,
+            command="not_a_real_flint_tool",
+            expected_outputs=[],
+            execution_backend="native",
+        )
+    with pytest.raises(FileNotFoundError):
+        run_singularity_command(
+            image=None, command="wsclean", execution_backend="singularity"
+        )
+
+    counter = tmpdir / "counter"
+    flaky = _make_stub_executable(
+        directory=tmpdir, name="flaky", script=f"echo deadlock\necho run >> {counter}"
+    )
+
+    def _callback(line: str) -> None:
+        if "deadlock" in line:
+            raise AttemptRerunException("jack")
+
+    with pytest.raises(ValueError):
+        run_singularity_command(
+            image=None,
+            command=str(flaky),
+            stream_callback_func=_callback,
+            expected_outputs=[],
+            max_retries=2,
+            execution_backend="native",
+        )
+
+
+def test_run_native_command_rerun_stops_command(tmpdir):
+    """A command whose output is abandoned for a rerun is stopped before
+    the rerun starts"""
+    tmpdir = Path(tmpdir)
+    pids = tmpdir / "pids"
+    done = tmpdir / "done"
+    stub = _make_stub_executable(
+        directory=tmpdir,
+        name="hang",
+        script=(
+            f"echo $$ >> {pids}\n"
+            f"if [ -f {done} ]; then echo finished; exit 0; fi\n"
+            f"touch {done}\n"
+            "while true; do echo deadlock; sleep 0.1; done"
+        ),
+    )
+
+    first_alive_at_rerun = []
+
+    def _callback(line: str) -> None:
+        if "deadlock" in line:
+            raise AttemptRerunException("jack")
+        first_pid = int(pids.read_text().split()[0])
+        try:
+            os.kill(first_pid, 0)
+            first_alive_at_rerun.append(True)
+        except ProcessLookupError:
+            first_alive_at_rerun.append(False)
+
+    run_singularity_command(
+        image=None,
+        command=str(stub),
+        stream_callback_func=_callback,
+        expected_outputs=[],
+        max_retries=2,
+        execution_backend="native",
+    )
+    assert len(pids.read_text().split()) == 2
+    assert first_alive_at_rerun == [False]
+
+
+def test_streamed_output_handler(tmpdir):
+    """The full output is written to file, with only a summary logged"""
+    log_path = Path(tmpdir) / "logs" / "wsclean.log"
+    lines = [f"Iteration {idx}\n" for idx in range(1000)]
+    lines[500] = "ERROR: something went wrong\n"
+
+    handler = StreamedOutputHandler(
+        log_path=log_path, head_lines=5, tail_lines=5, progress_interval=3600
+    )
+    for line in lines:
+        handler(line)
+    handler.close()
+    # Closing twice is fine
+    handler.close()
+
+    assert log_path.read_text() == "".join(lines)
+    assert handler.total_lines == 1000
+    # The head, the error and the tail
+    assert handler.logged_lines == 11
+
+
+def test_run_native_command_output_log(tmpdir):
+    """The callback sees every line when the output is offloaded to file"""
+    tmpdir = Path(tmpdir)
+    stub = _make_stub_executable(directory=tmpdir, name="verbose", script="seq 1 200")
+    log_path = tmpdir / "verbose.log"
+
+    lines = []
+    run_singularity_command(
+        image=None,
+        command=str(stub),
+        stream_callback_func=lines.append,
+        expected_outputs=[],
+        execution_backend="native",
+        output_log_path=log_path,
+    )
+    assert len(lines) == 200
+    assert log_path.read_text() == "".join(lines)
+
+
+def test_run_native_command_threads(tmpdir):
+    """The thread environment is set for the command"""
+    tmpdir = Path(tmpdir)
+    stub = _make_stub_executable(
+        directory=tmpdir, name="threads", script="echo $OMP_NUM_THREADS"
+    )
+
+    lines = []
+    run_singularity_command(
+        image=None,
+        command=str(stub),
+        stream_callback_func=lines.append,
+        expected_outputs=[],
+        execution_backend="native",
+        threads=3,
+    )
+    assert lines == ["3\n"]
@@ -0,0 +1,212 @@
+"""Tests around assessing the convergence of self-calibration"""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+import numpy as np
+import pytest
+from astropy.io import fits
+from casacore.tables import makearrcoldesc, maketabdesc, table
+
+from flint.imager.wsclean import ImageSet, WSCleanOptions, WSCleanResult
+from flint.options import MS
+from flint.selfcal.convergence import (
+    ConvergenceMetrics,
+    SelfcalConvergenceOptions,
+    assess_selfcal_convergence,
+    check_round_converged,
+    find_gain_solutions,
+    get_phase_scatter,
+    read_gain_solutions,
+)
+from flint.selfcal.native import GainSolutions
+from flint.utils import zip_folder
+
+
+def _make_wsclean_result(
+    tmpdir: Path, selfcal_round: int, rms: float, peak: float
+) -> WSCleanResult:
+    """Images with a given noise and peak for a round of self-calibration"""
+    rng = np.random.default_rng(selfcal_round)
+    prefix = Path(tmpdir) / f"SB39400.RACS_0635-31.beam0.round{selfcal_round}.i"
+
+    residual = rng.normal(scale=rms, size=(1, 1, 200, 200)).astype(np.float32)
+    image = residual.copy()
+    image[0, 0, 100, 100] = peak
+    fits.writeto(f"{prefix}.MFS.residual.fits", residual, overwrite=True)
+    fits.writeto(f"{prefix}.MFS.image.fits", image, overwrite=True)
+
+    return WSCleanResult(
+        cmd="wsclean",
+        options=WSCleanOptions(),
+        ms=MS(
+            path=Path(tmpdir) / f"SB39400.RACS_0635-31.beam0.round{selfcal_round}.ms"
+        ),
+        bind_dirs=(),
+        move_hold_directories=(Path(tmpdir), Path(tmpdir)),
+        image_prefix_str=str(prefix),
+        image_set=ImageSet(
+            prefix=str(prefix),
+            image=[Path(f"{prefix}.MFS.image.fits")],
+            residual=[Path(f"{prefix}.MFS.residual.fits")],
+        ),
+    )
+
+
+def _make_casa_caltable(cal_table: Path, phase_scatter_deg: float) -> None:
+    rng = np.random.default_rng(42)
+    phases = np.radians(rng.normal(scale=phase_scatter_deg, size=(36, 1, 2)))
+
+    table_desc = maketabdesc(
+        [
+            makearrcoldesc("CPARAM", 0j, ndim=2, valuetype="complex"),
+            makearrcoldesc("FLAG", False, ndim=2),
+        ]
+    )
+    with table(str(cal_table), table_desc, nrow=36, ack=False) as tab:
+        tab.putcol("CPARAM", np.exp(1j * phases))
+        tab.putcol("FLAG", np.zeros(phases.shape, dtype=bool))
+
+
+def test_get_phase_scatter():
+    rng = np.random.default_rng(1)
+    phases = np.radians(rng.normal(scale=3.0, size=10000))
+    gains = 2.0 * np.exp(1j * phases)
+    assert get_phase_scatter(gains=gains) == pytest.approx(3.0, rel=0.05)
+
+    # Unsolved and flagged gains are ignored
+    gains[:100] = np.nan
+    masked_gains = np.ma.masked_array(gains, mask=np.zeros(gains.shape, dtype=bool))
+    masked_gains[100] = 1e6 * np.exp(1j * 1.0)
+    masked_gains.mask[100] = True
+    assert get_phase_scatter(gains=masked_gains) == pytest.approx(3.0, rel=0.05)
+
+    assert get_phase_scatter(gains=np.array([np.nan + 0j])) is None
+
+
+def test_find_and_read_gain_solutions(tmpdir):
+    ms = MS(path=Path(tmpdir) / "SB39400.RACS_0635-31.beam0.round1.ms")
+    assert find_gain_solutions(ms=ms) == ()
+
+    cal_table = ms.path.with_suffix(".caltable.ch0000-0287")
+    _make_casa_caltable(cal_table=cal_table, phase_scatter_deg=4.0)
+    assert find_gain_solutions(ms=ms) == (cal_table,)
+    gains = read_gain_solutions(solutions_path=cal_table)
+    assert gains.shape == (36, 1, 2)
+
+    # Tables are archived after they are applied
+    archive = Path(f"{zip_folder(in_path=cal_table)}.tar")
+    assert find_gain_solutions(ms=ms) == (archive,)
+    assert np.allclose(read_gain_solutions(solutions_path=archive), gains)
+
+    # The native solutions are preferred
+    native_path = GainSolutions(
+        path=ms.path.with_suffix(".gains.npz"),
+        gains=np.ones((2, 1, 36, 2), dtype=complex),
+        times=np.zeros((2, 2)),
+        channel_ranges=np.array([[0, 287]]),
+        calmode="p",
+    ).save()
+    assert find_gain_solutions(ms=ms) == (native_path,)
+    assert read_gain_solutions(solutions_path=native_path).shape == (2, 1, 36, 2)
+
+
+def test_check_round_converged():
+    options = SelfcalConvergenceOptions(
+        residual_rms_fraction=0.05, peak_flux_fraction=0.05, phase_scatter_deg=5.0
+    )
+    previous = ConvergenceMetrics(selfcal_round=1, residual_rms=1e-4, peak_flux=1.0)
+
+    assert not check_round_converged(
+        metrics=previous, previous_metrics=None, convergence_options=options
+    )
+    assert check_round_converged(
+        metrics=ConvergenceMetrics(
+            selfcal_round=2, residual_rms=1.02e-4, peak_flux=1.01, phase_scatter_deg=2.0
+        ),
+        previous_metrics=previous,
+        convergence_options=options,
+    )
+    assert not check_round_converged(
+        metrics=ConvergenceMetrics(
+            selfcal_round=2, residual_rms=0.8e-4, peak_flux=1.01, phase_scatter_deg=2.0
+        ),
+        previous_metrics=previous,
+        convergence_options=options,
+    )
+    assert not check_round_converged(
+        metrics=ConvergenceMetrics(
+            selfcal_round=2, residual_rms=1.0e-4, peak_flux=1.0, phase_scatter_deg=10.0
+        ),
+        previous_metrics=previous,
+        convergence_options=options,
+    )
+    # Nothing to compare against
+    assert not check_round_converged(
+        metrics=ConvergenceMetrics(selfcal_round=2),
+        previous_metrics=previous,
+        convergence_options=options,
+    )
+
+
+def test_assess_selfcal_convergence(tmpdir):
+    options = SelfcalConvergenceOptions(
+        early_stop=True, residual_rms_fraction=0.05, peak_flux_fraction=0.05
+    )
+    rounds = ((0, 2e-3, 1.0), (1, 1e-3, 1.5), (2, 1.01e-3, 1.51), (3, 1.0e-3, 1.5))
+
+    convergence = None
+    for selfcal_round, rms, peak in rounds[:2]:
+        convergence = assess_selfcal_convergence(
+            wsclean_result=_make_wsclean_result(tmpdir, selfcal_round, rms, peak),
+            selfcal_round=selfcal_round,
+            previous_convergence=convergence,
+            convergence_options=options,
+        )
+        assert not convergence.converged
+
+    assert convergence is not None
+    assert convergence.metrics[0].residual_rms == pytest.approx(2e-3, rel=0.05)
+    assert convergence.metrics[1].peak_flux == pytest.approx(1.5)
+
+    # Has to stay converged for two rounds
+    patient_options = options.with_options(patience=2)
+    patient = assess_selfcal_convergence(
+        wsclean_result=_make_wsclean_result(tmpdir, *rounds[2]),
+        selfcal_round=2,
+        previous_convergence=convergence,
+        convergence_options=patient_options,
+    )
+    assert patient.metrics[-1].converged
+    assert not patient.converged
+
+    convergence = assess_selfcal_convergence(
+        wsclean_result=_make_wsclean_result(tmpdir, *rounds[2]),
+        selfcal_round=2,
+        previous_convergence=convergence,
+        convergence_options=options,
+    )
+    assert convergence.converged
+    assert len(convergence.metrics) == 3
+
+    # A converged beam is not assessed again
+    assert (
+        assess_selfcal_convergence(
+            wsclean_result=_make_wsclean_result(tmpdir, *rounds[3]),
+            selfcal_round=3,
+            previous_convergence=convergence,
+            convergence_options=options,
+        )
+        == convergence
+    )
+
+    # Without early stopping the metrics are collected but never converge
+    no_stop = assess_selfcal_convergence(
+        wsclean_result=_make_wsclean_result(tmpdir, *rounds[2]),
+        selfcal_round=2,
+        previous_convergence=convergence._replace(converged=False),
+        convergence_options=options.with_options(early_stop=False),
+    )
+    assert no_stop.metrics[-1].converged
+    assert not no_stop.converged
@@ -0,0 +1,227 @@
+"""Tests around the native gain solver used for self-calibration"""
+
+from __future__ import annotations
+
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+from casacore.tables import makearrcoldesc, maketabdesc, table
+
+from flint.exceptions import GainCalError
+from flint.naming import get_selfcal_ms_name
+from flint.options import MS
+from flint.selfcal.casa import GainCalOptions, gaincal_applycal_ms
+from flint.selfcal.convergence import find_gain_solutions, read_gain_solutions
+from flint.selfcal.native import (
+    GainSolutions,
+    solint_to_seconds,
+    solve_and_apply_gains_ms,
+    solve_antenna_gains,
+    uvrange_to_limits,
+)
+from flint.utils import get_packaged_resource_path
+
+
+@pytest.fixture
+def ms_example(tmpdir):
+    ms_zip = Path(
+        get_packaged_resource_path(
+            package="flint.data.tests",
+            filename="SB39400.RACS_0635-31.beam0.small.ms.zip",
+        )
+    )
+    outpath = Path(tmpdir) / "39400"
+
+    shutil.unpack_archive(ms_zip, outpath)
+
+    ms_path = Path(outpath) / "SB39400.RACS_0635-31.beam0.small.ms"
+
+    return ms_path
+
+
+@pytest.fixture
+def simulated_ms(ms_example):
+    """Corrupt a random model with per-integration antenna phases"""
+    rng = np.random.default_rng(1234)
+
+    with table(str(ms_example / "ANTENNA"), ack=False) as ant_tab:
+        nant = len(ant_tab)
+
+    with table(str(ms_example), readonly=False, ack=False) as tab:
+        data = tab.getcol("DATA")
+        nrow, nchan, _ = data.shape
+        ant1 = tab.getcol("ANTENNA1")
+        ant2 = tab.getcol("ANTENNA2")
+        time_idx = np.unique(tab.getcol("TIME"), return_inverse=True)[1]
+        ntime = time_idx.max() + 1
+
+        model = rng.normal(size=(nrow, nchan, 4)) + 1j * rng.normal(
+            size=(nrow, nchan, 4)
+        )
+        phases = np.exp(1j * rng.uniform(-np.pi, np.pi, (ntime, nant, 2)))
+        # Independently referencing X and Y leaves the cross-hands with
+        # the X-Y phase of the reference antenna, so keep that zero
+        phases[:, 0, :] = 1.0
+        gains_p = phases[time_idx, ant1][:, None, (0, 0, 1, 1)]
+        gains_q = phases[time_idx, ant2][:, None, (0, 1, 0, 1)]
+        corrupted = gains_p * model * np.conj(gains_q)
+
+        coldesc = tab.getdminfo("DATA")
+        coldesc["NAME"] = "MODEL_DATA"
+        tab.addcols(
+            maketabdesc(makearrcoldesc("MODEL_DATA", 0.0 + 0j, ndim=2)), coldesc
+        )
+        tab.putcol("MODEL_DATA", model.astype(data.dtype))
+        tab.putcol("DATA", corrupted.astype(data.dtype))
+        tab.putcol("FLAG", np.zeros(data.shape, dtype=bool))
+        tab.flush()
+
+    return ms_example, phases
+
+
+def test_solint_to_seconds():
+    assert solint_to_seconds("inf") is None
+    assert solint_to_seconds("int") == 0.0
+    assert solint_to_seconds("60s") == 60.0
+    assert solint_to_seconds("2min") == 120.0
+    assert solint_to_seconds("0.5h") == 1800.0
+    assert solint_to_seconds("10") == 10.0
+
+    with pytest.raises(ValueError):
+        solint_to_seconds("jack")
+
+
+def test_uvrange_to_limits():
+    assert uvrange_to_limits(">200m") == (200.0, None)
+    assert uvrange_to_limits("<2km") == (None, 2000.0)
+    assert uvrange_to_limits("100~300m") == (100.0, 300.0)
+    assert uvrange_to_limits("") == (None, None)
+
+    with pytest.raises(ValueError):
+        uvrange_to_limits(">100~200m")
+
+
+def test_solve_antenna_gains():
+    """Recover known gains from a simple set of statistics"""
+    rng = np.random.default_rng(42)
+    nant = 6
+    gains = rng.uniform(0.5, 2, nant) * np.exp(1j * rng.uniform(-np.pi, np.pi, nant))
+    model = rng.normal(size=(nant, nant)) + 1j * rng.normal(size=(nant, nant))
+    model = model + np.conj(model.T)
+    np.fill_diagonal(model, 0)
+    vis = gains[:, None] * model * np.conj(gains[None, :])
+
+    solved = solve_antenna_gains(
+        vis_model=vis * np.conj(model),
+        model_model=np.abs(model) ** 2,
+        calmode="ap",
+        tolerance=1e-10,
+        max_iterations=200,
+    )
+    expected = gains * np.conj(gains[0]) / np.abs(gains[0])
+    assert np.allclose(solved, expected, atol=1e-6)
+
+    phase_only = solve_antenna_gains(
+        vis_model=vis * np.conj(model), model_model=np.abs(model) ** 2, calmode="p"
+    )
+    assert np.allclose(np.abs(phase_only), 1.0)
+
+    with pytest.raises(ValueError):
+        solve_antenna_gains(
+            vis_model=vis, model_model=np.abs(model) ** 2, calmode="jack"
+        )
+
+
+@pytest.mark.parametrize("chunk_size", [100, 20000])
+def test_solve_and_apply_gains_ms(simulated_ms, chunk_size):
+    """Solve per integration, and make sure the corrected data matches the model"""
+    ms_path, phases = simulated_ms
+
+    gain_cal_options = GainCalOptions(solint="int", uvrange="", calmode="p")
+    gain_solutions = solve_and_apply_gains_ms(
+        ms=ms_path, gain_cal_options=gain_cal_options, chunk_size=chunk_size
+    )
+
+    ntime, nant, _ = phases.shape
+    assert gain_solutions.gains.shape == (ntime, 1, nant, 2)
+    assert gain_solutions.path.exists()
+
+    assert np.allclose(gain_solutions.gains[:, 0], phases, atol=1e-4)
+
+    with table(str(ms_path), ack=False) as tab:
+        corrected = tab.getcol("CORRECTED_DATA")
+        model = tab.getcol("MODEL_DATA")
+    assert np.allclose(corrected, model, atol=1e-3)
+
+    loaded = GainSolutions.load(path=gain_solutions.path)
+    assert np.allclose(loaded.gains, gain_solutions.gains)
+    assert loaded.calmode == "p"
+
+
+def test_solve_and_apply_gains_ms_nspw(simulated_ms):
+    """Solutions are derived per channel range"""
+    ms_path, _ = simulated_ms
+
+    gain_cal_options = GainCalOptions(solint="inf", nspw=4)
+    gain_solutions = solve_and_apply_gains_ms(
+        ms=ms_path, gain_cal_options=gain_cal_options
+    )
+
+    assert gain_solutions.gains.shape[:2] == (1, 4)
+    assert gain_solutions.channel_ranges.shape == (4, 2)
+    assert gain_solutions.channel_ranges[-1, 1] == 287
+
+
+def test_gaincal_applycal_ms_native(simulated_ms, monkeypatch):
+    """The native solver honours the archiving and error options of a round"""
+    ms_path, _ = simulated_ms
+    # The simulated visibilities have no UVW and a random Stokes-V, and
+    # would be entirely flagged before the solve
+    monkeypatch.setattr(
+        "flint.selfcal.casa.nan_zero_extreme_flag_ms", lambda ms, **kwargs: ms
+    )
+    gain_cal_options = GainCalOptions(
+        solver="native", solint="int", uvrange="", calmode="p"
+    )
+
+    cal_ms = gaincal_applycal_ms(
+        ms=MS(path=ms_path, column="DATA"),
+        casa_container=Path("casa.sif"),
+        gain_cal_options=gain_cal_options,
+        archive_cal_table=True,
+        rename_ms=True,
+    )
+    assert cal_ms.column == "CORRECTED_DATA"
+    solutions = find_gain_solutions(ms=cal_ms)
+    assert solutions == (cal_ms.path.with_suffix(".gains.npz.tar"),)
+    assert not cal_ms.path.with_suffix(".gains.npz").exists()
+    assert read_gain_solutions(solutions_path=solutions[0]).ndim == 4
+
+
+def test_gaincal_applycal_ms_native_fail(ms_example):
+    """Without a model the native solver fails"""
+    ms = MS(path=ms_example, column="DATA")
+    gain_cal_options = GainCalOptions(solver="native")
+
+    with pytest.raises(GainCalError):
+        gaincal_applycal_ms(
+            ms=ms,
+            casa_container=Path("casa.sif"),
+            gain_cal_options=gain_cal_options,
+            rename_ms=True,
+        )
+
+    ms = MS(path=get_selfcal_ms_name(in_ms_path=ms_example, round=1), column="DATA")
+    assert (
+        gaincal_applycal_ms(
+            ms=ms,
+            round=2,
+            casa_container=Path("casa.sif"),
+            gain_cal_options=gain_cal_options,
+            raise_error_on_fail=False,
+            rename_ms=True,
+        )
+        == ms
+    )
@@ -3,18 +3,25 @@
 from __future__ import annotations
 
 import shutil
+import time
 from pathlib import Path
 
 import pytest
 
 from flint.options import MS
+from flint.selfcal.casa import (
+    GainCalOptions,
+    gaincal_applycal_ms,
+    gaincal_channel_ranges,
+)
 from flint.selfcal.utils import (
     consider_skip_selfcal_on_round,
     create_and_check_caltable_path,
+    create_passthrough_selfcal_ms,
     get_channel_ranges_given_nspws,
     get_channel_ranges_given_nspws_for_ms,
 )
-from flint.utils import get_packaged_resource_path
+from flint.utils import get_packaged_resource_path, remove_files_folders, zip_folder
 
 
 def test_create_solution_path():
@@ -138,3 +145,103 @@ def test_consider_skip_selfcal():
     assert res
     res = consider_skip_selfcal_on_round(current_round=2, skip_selfcal_on_rounds=2)
     assert res
+
+
+def _make_fake_ms(tmpdir) -> Path:
+    ms_path = Path(tmpdir) / "SB1234.JACK.beam00.round1.ms"
+    ms_path.mkdir(parents=True)
+    (ms_path / "table.dat").write_text("Arrrr")
+    return ms_path
+
+
+def test_create_passthrough_selfcal_ms(tmpdir):
+    """A skipped round should link to the previous measurement set"""
+    ms_path = _make_fake_ms(tmpdir=tmpdir)
+    ms = MS(path=ms_path, column="CORRECTED_DATA")
+
+    round2_ms = create_passthrough_selfcal_ms(ms=ms, round=2)
+    assert round2_ms.path == ms_path.parent / "SB1234.JACK.beam00.round2.ms"
+    assert round2_ms.path.is_symlink()
+    assert round2_ms.column == "CORRECTED_DATA"
+    assert (round2_ms.path / "table.dat").read_text() == "Arrrr"
+
+    # Consecutive skipped rounds should not chain links
+    round3_ms = create_passthrough_selfcal_ms(ms=round2_ms, round=3)
+    assert round3_ms.path.resolve() == ms_path.resolve()
+    assert Path(round3_ms.path.readlink()) == Path(ms_path.name)
+
+    # Removing the link leaves the measurement set alone
+    remove_files_folders(round3_ms.path)
+    assert not round3_ms.path.is_symlink()
+    assert ms_path.exists()
+
+
+def test_gaincal_applycal_ms_passthrough(tmpdir):
+    """No container is needed when a round is skipped and passed through"""
+    ms_path = _make_fake_ms(tmpdir=tmpdir)
+    ms = MS(path=ms_path, column="CORRECTED_DATA")
+
+    cal_ms = gaincal_applycal_ms(
+        ms=ms,
+        casa_container=Path("/jack/sparrow/casa.sif"),
+        round=2,
+        skip_selfcal=True,
+        passthrough_skip=True,
+    )
+    assert cal_ms.path.is_symlink()
+    assert cal_ms.column == "CORRECTED_DATA"
+
+
+def test_zip_folder_passthrough_link(tmpdir):
+    """Archiving a link archives the measurement set it points to"""
+    ms_path = _make_fake_ms(tmpdir=tmpdir)
+    round2_ms = create_passthrough_selfcal_ms(ms=MS(path=ms_path), round=2)
+
+    zip_folder(in_path=round2_ms.path)
+    assert not round2_ms.path.is_symlink()
+    assert not ms_path.exists()
+    assert ms_path.with_suffix(".ms.tar").exists()
+
+
+def test_gaincal_channel_ranges(tmpdir, monkeypatch):
+    """The concurrent gaincal tasks split the thread budget and their
+    results are returned in channel order"""
+    monkeypatch.setenv("FLINT_THREAD_BUDGET", "8")
+    ms = MS.cast(Path(tmpdir) / "SB39400.RACS_0635-31.beam0.ms")
+    channel_ranges = get_channel_ranges_given_nspws(num_channels=288, nspws=4)
+
+    calls = []
+
+    def fake_gaincal(**kwargs):
+        calls.append(kwargs)
+        # Have the earlier channel ranges finish last
+        start_channel = int(kwargs["spw"].split(":")[1].split("~")[0])
+        time.sleep(0.1 * (len(channel_ranges) - start_channel // 72))
+        Path(kwargs["caltable"]).mkdir()
+
+    monkeypatch.setattr("flint.selfcal.casa.gaincal", fake_gaincal)
+
+    gain_cal_options = GainCalOptions(nspw=4, max_workers=2)
+    spw_and_cal_tables = gaincal_channel_ranges(
+        ms=ms,
+        casa_container=Path("casa.sif"),
+        gain_cal_options=gain_cal_options,
+        channel_ranges=channel_ranges,
+    )
+
+    assert len(calls) == 4
+    assert all(call["threads"] == 4 for call in calls)
+    assert {call["spw"] for call in calls} == {
+        "0:0~71",
+        "0:72~143",
+        "0:144~215",
+        "0:216~287",
+    }
+    assert spw_and_cal_tables == [
+        (
+            f"0:{start}~{end}",
+            create_and_check_caltable_path(ms=ms, channel_range=(start, end)),
+        )
+        for start, end in channel_ranges
+    ]
+    assert all(cal_table.exists() for _, cal_table in spw_and_cal_tables)
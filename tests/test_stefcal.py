@@ -0,0 +1,177 @@
+"""Tests around the native StEFCal bandpass solver"""
+
+from __future__ import annotations
+
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+from casacore.tables import makearrcoldesc, maketabdesc, table
+
+from flint.calibrate.aocalibrate import AOSolutions
+from flint.calibrate.stefcal import (
+    StefcalOptions,
+    accumulate_stefcal_statistics,
+    get_parser,
+    solve_stefcal,
+    stefcal_bandpass_ms,
+)
+from flint.exceptions import MSError
+from flint.utils import get_packaged_resource_path
+
+
+@pytest.fixture
+def ms_example(tmpdir):
+    ms_zip = Path(
+        get_packaged_resource_path(
+            package="flint.data.tests",
+            filename="SB39400.RACS_0635-31.beam0.small.ms.zip",
+        )
+    )
+    outpath = Path(tmpdir) / "39400"
+
+    shutil.unpack_archive(ms_zip, outpath)
+
+    ms_path = Path(outpath) / "SB39400.RACS_0635-31.beam0.small.ms"
+
+    return ms_path
+
+
+def _random_jones(rng, nant: int, nchan: int) -> np.ndarray:
+    """Make a set of well-behaved random Jones matrices"""
+    jones = np.zeros((nant, nchan, 2, 2), dtype=np.complex128)
+    jones[..., 0, 0] = rng.uniform(0.5, 1.5, (nant, nchan))
+    jones[..., 1, 1] = rng.uniform(0.5, 1.5, (nant, nchan))
+    jones *= np.exp(1j * rng.uniform(-np.pi, np.pi, (nant, nchan, 2, 2)))
+    leakage = 0.05 * (
+        rng.normal(size=(nant, nchan)) + 1j * rng.normal(size=(nant, nchan))
+    )
+    jones[..., 0, 1] = leakage
+    jones[..., 1, 0] = -leakage
+    return jones
+
+
+@pytest.fixture
+def simulated_ms(ms_example):
+    """Insert a random model and corrupted data with known Jones matrices"""
+    rng = np.random.default_rng(42)
+
+    with table(str(ms_example / "ANTENNA"), ack=False) as ant_tab:
+        nant = len(ant_tab)
+
+    with table(str(ms_example), readonly=False, ack=False) as tab:
+        data = tab.getcol("DATA")
+        nrow, nchan, _ = data.shape
+        ant1 = tab.getcol("ANTENNA1")
+        ant2 = tab.getcol("ANTENNA2")
+
+        model = (
+            rng.normal(size=(nrow, nchan, 4)) + 1j * rng.normal(size=(nrow, nchan, 4))
+        ).reshape(nrow, nchan, 2, 2)
+        jones = _random_jones(rng=rng, nant=nant, nchan=nchan)
+        jones_p = jones[ant1]
+        jones_q_h = np.conj(np.swapaxes(jones[ant2], -1, -2))
+        corrupted = np.matmul(np.matmul(jones_p, model), jones_q_h)
+
+        coldesc = tab.getdminfo("DATA")
+        coldesc["NAME"] = "MODEL_DATA"
+        tab.addcols(
+            maketabdesc(makearrcoldesc("MODEL_DATA", 0.0 + 0j, ndim=2)), coldesc
+        )
+        tab.putcol("MODEL_DATA", model.reshape(nrow, nchan, 4).astype(data.dtype))
+        tab.putcol("DATA", corrupted.reshape(nrow, nchan, 4).astype(data.dtype))
+        tab.putcol("FLAG", np.zeros(data.shape, dtype=bool))
+        tab.flush()
+
+    return ms_example, jones
+
+
+def _reference_jones(jones: np.ndarray, ref_ant: int = 0) -> np.ndarray:
+    """Remove the unitary ambiguity of full-Jones solutions by
+    right-multiplying by the inverse of the reference antenna"""
+    return np.matmul(jones, np.linalg.inv(jones[ref_ant])[None, ...])
+
+
+def test_stefcal_missing_model_column(ms_example):
+    """The model column needs to be present"""
+    with pytest.raises(MSError):
+        accumulate_stefcal_statistics(ms=ms_example)
+
+
+def test_stefcal_recovers_jones(simulated_ms):
+    """Solve for the known Jones matrices from the simulated MS"""
+    ms_path, true_jones = simulated_ms
+
+    stats = accumulate_stefcal_statistics(
+        ms=ms_path, stefcal_options=StefcalOptions(chunk_size=500)
+    )
+    assert stats.nant == true_jones.shape[0]
+    assert stats.nchan == true_jones.shape[1]
+
+    result = solve_stefcal(stefcal_statistics=stats, tolerance=1e-8)
+    assert result.converged
+
+    assert np.allclose(
+        _reference_jones(result.jones), _reference_jones(true_jones), atol=1e-4
+    )
+
+
+def test_stefcal_chunking_consistent(simulated_ms):
+    """The accumulated statistics should not depend on the chunk size"""
+    ms_path, _ = simulated_ms
+
+    stats_small = accumulate_stefcal_statistics(
+        ms=ms_path, stefcal_options=StefcalOptions(chunk_size=97)
+    )
+    stats_large = accumulate_stefcal_statistics(
+        ms=ms_path, stefcal_options=StefcalOptions(chunk_size=100000)
+    )
+    assert stats_small.nrows == stats_large.nrows
+    assert np.allclose(stats_small.vis_model, stats_large.vis_model)
+    assert np.allclose(stats_small.model_model, stats_large.model_model)
+
+
+def test_stefcal_bandpass_ms_writes_aosolutions(simulated_ms, tmpdir):
+    """Ensure the solutions round trip through the ao-style binary format"""
+    ms_path, true_jones = simulated_ms
+    solution_path = Path(tmpdir) / "solutions" / "stefcal.bin"
+
+    ao_sols = stefcal_bandpass_ms(
+        ms=ms_path,
+        solution_path=solution_path,
+        update_stefcal_options=dict(tolerance=1e-8),
+    )
+    assert solution_path.exists()
+
+    loaded = AOSolutions.load(path=solution_path)
+    assert loaded.bandpass.shape == (1, true_jones.shape[0], true_jones.shape[1], 4)
+    assert np.allclose(loaded.bandpass, ao_sols.bandpass, equal_nan=True)
+
+    jones = loaded.bandpass[0].reshape(true_jones.shape)
+    assert np.allclose(_reference_jones(jones), _reference_jones(true_jones), atol=1e-4)
+
+
+def test_stefcal_flagged_antenna_is_nan(simulated_ms):
+    """An antenna without any valid data should be NaN"""
+    ms_path, _ = simulated_ms
+
+    with table(str(ms_path), readonly=False, ack=False) as tab:
+        flags = tab.getcol("FLAG")
+        ant1 = tab.getcol("ANTENNA1")
+        ant2 = tab.getcol("ANTENNA2")
+        flags[(ant1 == 5) | (ant2 == 5)] = True
+        tab.putcol("FLAG", flags)
+
+    stats = accumulate_stefcal_statistics(ms=ms_path)
+    result = solve_stefcal(stefcal_statistics=stats, max_iterations=20)
+
+    assert np.all(np.isnan(result.jones[5]))
+    assert np.all(np.isfinite(result.jones[0]))
+
+
+def test_stefcal_parser_uv_range():
+    """Both ends of the baseline range are exposed on the command line"""
+    args = get_parser().parse_args("some.ms --minuv 10 --maxuv 5000".split())
+    assert args.minuv == 10.0
+    assert args.maxuv == 5000.0
@@ -15,26 +15,34 @@ import pytest
 from astropy.coordinates import SkyCoord
 from astropy.io import fits
 from astropy.wcs import WCS
+from threadpoolctl import threadpool_limits
 
 from flint.convol import BeamShape
 from flint.exceptions import TimeLimitException
 from flint.logging import logger
 from flint.utils import (
+    THREAD_BUDGET_ENVIRONMENT_VARIABLE,
     SlurmInfo,
+    apply_thread_budget,
     copy_directory,
     estimate_skycoord_centre,
     flatten_items,
     generate_strict_stub_wcs_header,
     generate_stub_wcs_header,
+    get_allocated_cores,
     get_beam_shape,
     get_environment_variable,
     get_packaged_resource_path,
+    get_path_size,
     get_pixels_per_beam,
     get_slurm_info,
+    get_thread_budget,
+    get_thread_environment,
     hold_then_move_into,
     log_job_environment,
     temporarily_move_into,
     timelimit_on_context,
+    wait_for_paths,
 )
 
 
@@ -266,6 +274,62 @@ def test_get_environment_variable(set_env):
     assert val3 is None
 
 
+def test_get_allocated_cores():
+    """The slurm allocation should be preferred over the CPU affinity"""
+    original = os.environ.pop("SLURM_CPUS_PER_TASK", None)
+    try:
+        assert get_allocated_cores() >= 1
+
+        os.environ["SLURM_CPUS_PER_TASK"] = "3"
+        assert get_allocated_cores() == 3
+
+        os.environ["SLURM_CPUS_PER_TASK"] = "jack"
+        assert get_allocated_cores() >= 1
+    finally:
+        os.environ.pop("SLURM_CPUS_PER_TASK", None)
+        if original is not None:
+            os.environ["SLURM_CPUS_PER_TASK"] = original
+
+
+def test_get_thread_budget():
+    """The thread budget follows the allocation, and may be overridden"""
+    original = os.environ.pop("SLURM_CPUS_PER_TASK", None)
+    try:
+        os.environ["SLURM_CPUS_PER_TASK"] = "8"
+        assert get_thread_budget() == 8
+        assert get_thread_budget(share=3) == 2
+        assert get_thread_budget(share=16) == 1
+        assert get_thread_budget(max_threads=4) == 4
+
+        os.environ[THREAD_BUDGET_ENVIRONMENT_VARIABLE] = "2"
+        assert get_thread_budget() == 2
+    finally:
+        os.environ.pop("SLURM_CPUS_PER_TASK", None)
+        os.environ.pop(THREAD_BUDGET_ENVIRONMENT_VARIABLE, None)
+        if original is not None:
+            os.environ["SLURM_CPUS_PER_TASK"] = original
+
+
+def test_apply_thread_budget():
+    """The thread environment variables are set for the process"""
+    thread_environment = get_thread_environment(threads=3)
+    assert thread_environment["OMP_NUM_THREADS"] == "3"
+    assert thread_environment["OPENBLAS_NUM_THREADS"] == "3"
+
+    original = {k: os.environ.get(k) for k in thread_environment}
+    try:
+        # Restores the limits of the thread pools on exit
+        with threadpool_limits(limits=None):
+            applied = apply_thread_budget(threads=3)
+        assert applied == thread_environment
+        assert all(os.environ[k] == "3" for k in thread_environment)
+    finally:
+        for k, v in original.items():
+            os.environ.pop(k, None)
+            if v is not None:
+                os.environ[k] = v
+
+
 @pytest.fixture
 def ms_example(tmpdir):
     ms_zip = Path(
@@ -585,3 +649,28 @@ def test_estimate_skycoord_centre_wrap():
 
     assert np.isclose(mean_pos.ra.deg, 359.54349533)
     assert np.isclose(mean_pos.dec.deg, -40.51255648)
+
+
+def test_get_path_size(tmpdir):
+    """Sizes of files and directories"""
+    base = Path(tmpdir) / "size"
+    (base / "nested").mkdir(parents=True)
+    (base / "a.txt").write_bytes(b"a" * 10)
+    (base / "nested" / "b.txt").write_bytes(b"b" * 5)
+
+    assert get_path_size(path=base / "a.txt") == 10
+    assert get_path_size(path=base) == 15
+
+
+def test_wait_for_paths(tmpdir):
+    """Wait for outputs to appear, or time out when they never do"""
+    base = Path(tmpdir) / "wait"
+    base.mkdir()
+    present = base / "present.txt"
+    present.write_text("jack")
+
+    assert wait_for_paths(paths=present, timeout=2)
+    assert wait_for_paths(paths=[present, base], timeout=2)
+    assert not wait_for_paths(
+        paths=[present, base / "missing.txt"], timeout=0.3, poll_interval=0.05
+    )
@@ -31,6 +31,7 @@ from flint.imager.wsclean import (
     rename_wsclean_prefix_in_image_set,
     split_and_get_image_set,
     split_image_set,
+    split_wsclean_result_by_channel,
 )
 from flint.logging import logger
 from flint.naming import create_imaging_name_prefix
@@ -378,6 +379,25 @@ def test_create_wsclean_command(ms_example):
     assert isinstance(command, WSCleanResult)
 
 
+def test_create_wsclean_command_threads(ms_example):
+    """The thread budget is used unless the number of threads is set"""
+    command = create_wsclean_cmd(
+        ms=MS.cast(ms_example), wsclean_options=WSCleanOptions(), threads=4
+    )
+    assert " -j 4 " in command.cmd
+    assert command.options.j == 4
+
+    command = create_wsclean_cmd(
+        ms=MS.cast(ms_example), wsclean_options=WSCleanOptions(j=2), threads=4
+    )
+    assert " -j 2 " in command.cmd
+
+    command = create_wsclean_cmd(
+        ms=MS.cast(ms_example), wsclean_options=WSCleanOptions()
+    )
+    assert " -j " not in command.cmd
+
+
 def test_create_wsclean_command_with_environment(ms_example):
     """Test whether WSCleanOptions can be correctly cast to a command string"""
     wsclean_options = WSCleanOptions(temp_dir="$LOCALDIR")
@@ -390,6 +410,97 @@ def test_create_wsclean_command_with_environment(ms_example):
     assert command.cmd.startswith("wsclean ")
 
 
+def test_create_wsclean_command_multiple_ms(ms_example, tmpdir):
+    """Multiple measurement sets are imaged in a single wsclean call"""
+    other_ms = ms_example.parent / "SB39401.RACS_0635-31.beam0.small.ms"
+    shutil.copytree(ms_example, other_ms)
+    mss = (MS.cast(ms_example), MS.cast(other_ms))
+
+    name_argument_path = create_wsclean_name_argument(
+        wsclean_options=WSCleanOptions(), ms=mss
+    )
+    assert name_argument_path == ms_example.parent / "RACS_0635-31.beam00.i"
+
+    command = create_wsclean_cmd(
+        ms=mss,
+        wsclean_options=WSCleanOptions(flint_reorder_cache=Path(tmpdir) / "cache"),
+    )
+    assert command.cmd.endswith(f"{ms_example} {other_ms} ")
+    assert command.image_prefix_str == str(name_argument_path)
+    assert isinstance(command.ms, tuple)
+    assert [ms.path for ms in command.ms] == [ms_example, other_ms]
+    assert all(ms.model_column == "MODEL_DATA" for ms in command.ms)
+    assert command.reorder_cache_directory is None
+    assert "-save-reordered" not in command.cmd
+
+    # A single measurement set in a collection behaves as before
+    command = create_wsclean_cmd(ms=mss[:1], wsclean_options=WSCleanOptions())
+    assert isinstance(command.ms, MS)
+    assert command.image_prefix_str == str(
+        ms_example.parent / "SB39400.RACS_0635-31.beam0.small.i"
+    )
+
+    with pytest.raises(ValueError):
+        create_wsclean_cmd(ms=(), wsclean_options=WSCleanOptions())
+
+
+def test_split_wsclean_result_by_channel(tmpdir):
+    """A block of channels imaged together is split into the same names
+    as imaging each channel on its own would produce"""
+    prefix = Path(tmpdir) / "SB39400.RACS_0635-31.beam0.i.ch0008-0011"
+    image_set = get_wsclean_output_names(
+        prefix=str(prefix), subbands=3, output_types=("image", "residual")
+    )
+    for image in image_set.image + image_set.residual:  # type: ignore[operator]
+        image.write_text("jack")
+    image_set = rename_wsclean_prefix_in_image_set(input_image_set=image_set)
+
+    wsclean_result = WSCleanResult(
+        cmd="wsclean",
+        options=WSCleanOptions(channel_range=(8, 11), channels_out=3),
+        ms=MS(path=Path(tmpdir) / "SB39400.RACS_0635-31.beam0.ms"),
+        bind_dirs=(),
+        move_hold_directories=(Path(tmpdir), Path(tmpdir)),
+        image_prefix_str=str(prefix),
+        image_set=image_set,
+    )
+    channel_results = split_wsclean_result_by_channel(wsclean_result=wsclean_result)
+    assert len(channel_results) == 3
+
+    for channel, channel_result in zip(range(8, 11), channel_results):
+        channel_prefix = create_imaging_name_prefix(
+            ms_path=Path("SB39400.RACS_0635-31.beam0.ms"),
+            pol="i",
+            channel_range=(channel, channel + 1),
+        )
+        assert channel_result.options.channel_range == (channel, channel + 1)
+        assert channel_result.options.channels_out == 1
+        assert channel_result.image_prefix_str == str(Path(tmpdir) / channel_prefix)
+        assert channel_result.image_set is not None
+        assert channel_result.image_set.image == [
+            Path(tmpdir) / f"{channel_prefix}.image.fits"
+        ]
+        assert channel_result.image_set.residual == [
+            Path(tmpdir) / f"{channel_prefix}.residual.fits"
+        ]
+        assert channel_result.image_set.image[0].exists()
+
+    # The MFS images over the block are removed
+    assert not list(Path(tmpdir).glob("*MFS*"))
+
+    single_result = channel_results[0]
+    assert split_wsclean_result_by_channel(wsclean_result=single_result) == [
+        single_result
+    ]
+
+    with pytest.raises(ValueError):
+        split_wsclean_result_by_channel(
+            wsclean_result=wsclean_result.with_options(
+                options=WSCleanOptions(channel_range=(8, 11), channels_out=4)
+            )
+        )
+
+
 def test_wsclean_divergence():
     """Make sure the wsclean call back function picks up divergence and raises appropriate errors"""
     good = (
@@ -0,0 +1,131 @@
+"""Tests around parsing the progress of wsclean from its output"""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+from flint.exceptions import CleanDivergenceError
+from flint.imager.progress import WSCleanProgressParser, load_wsclean_progress
+from flint.imager.wsclean import _create_wsclean_stream_callback
+
+WSCLEAN_OUTPUT = """
+WSClean version 3.5 (2024-05-22)
+Reordering SB39400.RACS_0635-31.beam0.small.ms into 4 x 1 parts.
+ == Constructing PSF ==
+Precalculating weights for Briggs'(-0.5) weighting...
+ == Constructing image ==
+Estimated standard deviation of background noise: 1.23 mJy
+ == Deconvolving (1) ==
+Iteration 0, scale 0 px : 1.52 Jy at 5080,5061
+Iteration 1000, scale 0 px : 12.3 mJy at 4000,2061
+Stopped on peak 9.87 mJy, because maximum number of iterations was reached.
+ == Converting model image to visibilities ==
+ == Constructing image ==
+ == Deconvolving (2) ==
+Iteration 1540: 850 µJy at 123,456
+Stopped on peak 700 µJy, because the major threshold was reached.
+Rendering sources to restored image (beam=10.2''-9.1'', PA=12.1 deg)... DONE
+Inversion: 00:01:12.5, prediction: 00:00:30.25, deconvolution: 00:02:00.0
+"""
+
+
+class StepClock:
+    """Advances by one second every time it is read"""
+
+    def __init__(self) -> None:
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        self.now += 1.0
+        return self.now
+
+
+def _parse(parser: WSCleanProgressParser) -> WSCleanProgressParser:
+    for line in WSCLEAN_OUTPUT.splitlines():
+        parser(f"{line}\n")
+    parser.close()
+    return parser
+
+
+def test_wsclean_progress_parser():
+    parser = _parse(WSCleanProgressParser(clock=StepClock()))
+    timeline = parser.timeline
+
+    phases = [event.phase for event in timeline if event.kind == "phase_start"]
+    assert phases == [
+        "reordering",
+        "psf",
+        "inversion",
+        "deconvolution",
+        "prediction",
+        "inversion",
+        "deconvolution",
+        "restoring",
+    ]
+    # Every phase is ended, including the last one on close
+    assert len([event for event in timeline if event.kind == "phase_end"]) == 8
+
+    majors = [event for event in timeline if event.kind == "major_iteration"]
+    assert [event.major_iteration for event in majors] == [1, 2]
+    assert majors[0].component_count is None
+    assert majors[1].component_count == 1000
+
+    clean = [event for event in timeline if event.kind == "clean_iteration"]
+    assert [event.component_count for event in clean] == [0, 1000, 1000, 1540, 1540]
+    assert clean[0].peak_residual_jy == pytest.approx(1.52)
+    assert clean[2].peak_residual_jy == pytest.approx(9.87e-3)
+    assert clean[3].peak_residual_jy == pytest.approx(850e-6)
+    assert clean[3].major_iteration == 2
+    assert all(event.phase == "deconvolution" for event in clean)
+
+    summary = {
+        event.phase: event.duration_seconds
+        for event in timeline
+        if event.kind == "summary"
+    }
+    assert summary == pytest.approx(
+        dict(inversion=72.5, prediction=30.25, deconvolution=120.0)
+    )
+
+    durations = parser.phase_durations()
+    # The clock ticks once per line, the inversion phase is entered twice
+    assert durations["psf"] == 2.0
+    assert durations["inversion"] == 2.0 + 1.0
+    assert durations["deconvolution"] == 4.0 + 3.0
+    assert sum(durations.values()) == (
+        timeline[-1].elapsed_seconds - timeline[0].elapsed_seconds
+    )
+
+
+def test_wsclean_progress_jsonl(tmpdir):
+    jsonl_path = Path(tmpdir) / "progress" / "beam0.wsclean.progress.jsonl"
+    parser = _parse(WSCleanProgressParser(jsonl_path=jsonl_path, clock=StepClock()))
+
+    assert jsonl_path.exists()
+    assert load_wsclean_progress(jsonl_path=jsonl_path) == parser.timeline
+
+
+def test_wsclean_progress_no_events(tmpdir):
+    jsonl_path = Path(tmpdir) / "empty.jsonl"
+    parser = WSCleanProgressParser(jsonl_path=jsonl_path)
+    parser("WSClean version 3.5 (2024-05-22)")
+    parser.close()
+
+    assert parser.timeline == ()
+    assert parser.phase_durations() == {}
+    assert not jsonl_path.exists()
+
+
+def test_wsclean_stream_callback_divergence():
+    """Progress is recorded before divergence is raised"""
+    parser = WSCleanProgressParser(clock=StepClock())
+    stream_callback = _create_wsclean_stream_callback(progress_parser=parser)
+
+    stream_callback(" == Deconvolving (1) ==")
+    with pytest.raises(CleanDivergenceError):
+        stream_callback("Iteration 5000, scale 0 px : 1.2 KJy at 10,20")
+
+    assert parser.timeline[-1].peak_residual_jy == pytest.approx(1200.0)
+    assert parser.timeline[-1].component_count == 5000